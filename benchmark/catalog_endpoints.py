@@ -0,0 +1,108 @@
+"""
+measures requests per second of /services/ and /services/{service_id}/info.
+
+    python -m benchmark.catalog_endpoints [--services 50] [--requests 2000]
+
+"pydantic" serves the routes as before the catalog responses, the descriptions are serialized through the
+response model on every request. "serialized" serves the json of the catalog version, "not_modified" sends the
+etag of the previous response as If-None-Match and gets 304 without a body.
+"""
+import time
+import asyncio
+import argparse
+from unittest.mock import patch, MagicMock
+
+from benchmark.common import setup_bench_config, latency_summary, write_report, BENCH_HEADERS
+
+setup_bench_config()
+
+import httpx  # noqa: E402
+from fastapi import FastAPI, Depends  # noqa: E402
+
+import middlelayer.service_api as service_api_mod  # noqa: E402
+from middlelayer.asset import AssetCatalog, StaticAssetLoader  # noqa: E402
+from middlelayer.models import ServiceDescription  # noqa: E402
+
+
+def create_catalog(services: int) -> AssetCatalog:
+    dummy = StaticAssetLoader(static_asset_directory="./config/assets").get_assets_description("dummy")
+    descriptions = {}
+    asset_info = {}
+    for i in range(services):
+        service_id = f"service-{i}"
+        descriptions[service_id] = dummy.model_copy(update={"service_id": service_id})
+        asset_info[service_id] = {"id": service_id}
+    return AssetCatalog(version=1, descriptions=descriptions, asset_info=asset_info)
+
+
+def create_pydantic_api(catalog: AssetCatalog) -> FastAPI:
+    app = FastAPI(dependencies=[Depends(service_api_mod.get_api_key)])
+
+    @app.get("/services/")
+    async def get_services():
+        return list(catalog.asset_info.values())
+
+    @app.get("/services/{service_id}/info", response_model=ServiceDescription, response_model_exclude_none=True)
+    async def get_service_info(service_id: str):
+        return catalog.descriptions[service_id]
+
+    return app
+
+
+async def run_mode(app, mode: str, path: str, requests: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http_client:
+        headers = dict(BENCH_HEADERS)
+        if mode == "not_modified":
+            response = await http_client.get(path, headers=headers)
+            headers["If-None-Match"] = response.headers["ETag"]
+
+        durations = []
+        started = time.perf_counter()
+        for _ in range(requests):
+            request_started = time.perf_counter()
+            response = await http_client.get(path, headers=headers)
+            durations.append(time.perf_counter() - request_started)
+            assert response.status_code == (304 if mode == "not_modified" else 200)
+        duration = time.perf_counter() - started
+
+    return {"requests_per_s": requests / duration,
+            "response_bytes": len(response.content),
+            "latency": latency_summary(durations)}
+
+
+async def run_benchmark(args) -> dict:
+    catalog = create_catalog(args.services)
+    asset_store = MagicMock()
+    asset_store.get_catalog.return_value = catalog
+
+    with patch("middlelayer.service_api.ImlaMinio"),\
+            patch("middlelayer.service_api.K8sWorkflowBackend"),\
+            patch("middlelayer.service_api.StaticAssetLoader", return_value=asset_store):
+        await service_api_mod.startup()
+
+        results = {"service_count": args.services}
+        for name, path in [("services", "/services/"), ("info", "/services/service-0/info")]:
+            results[name] = {
+                "pydantic": await run_mode(create_pydantic_api(catalog), "pydantic", path, args.requests),
+                "serialized": await run_mode(service_api_mod.service_api, "serialized", path, args.requests),
+                "not_modified": await run_mode(service_api_mod.service_api, "not_modified", path, args.requests)}
+
+        await service_api_mod.shutdown()
+        service_api_mod.client.io_executor.shutdown()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--services", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    write_report("catalog_endpoints", asyncio.run(run_benchmark(args)), args.output)
+
+
+if __name__ == "__main__":
+    main()
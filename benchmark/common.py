@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+import tempfile
+import platform
+from datetime import datetime
+from typing import Dict, List
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+BENCH_CONFIG = """
+[workflow_api]
+workflow_api_user = bench
+workflow_api_access_token = bench
+workflow_api_instant_removal = True
+workflow_backend = kubernetes
+workflow_backend_namespace = bench
+workflow_api_registry_path = :memory:
+
+[minio]
+endpoint = localhost:9000
+access_key = bench
+secret_key = bench
+secure = False
+"""
+
+BENCH_HEADERS = {"access-token": "bench"}
+
+
+def setup_bench_config(extra_options: Dict[str, str] = None) -> str:
+    """
+    writes a workflow-api config for benchmarks and points CONFIG_FILE_PATH to it,
+    must be called before middlelayer.service_api is imported.
+    """
+    config = BENCH_CONFIG
+    if extra_options:
+        config = config.replace("[minio]", "".join(
+            f"{key} = {value}\n" for key, value in extra_options.items()) + "\n[minio]")
+
+    with tempfile.NamedTemporaryFile("w", suffix=".cfg", delete=False) as config_file:
+        config_file.write(config)
+
+    os.environ["CONFIG_FILE_PATH"] = config_file.name
+    return config_file.name
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    return {"count": len(values),
+            "p50_ms": percentile(values, 50) * 1000,
+            "p90_ms": percentile(values, 90) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": max(values, default=0.0) * 1000}
+
+
+def write_report(name: str, results: Dict, output: str = None):
+    """
+    prints the benchmark result as json and optionally writes it into a file
+    """
+    report = {"benchmark": name,
+              "timestamp": datetime.now().isoformat(),
+              "python": platform.python_version(),
+              "results": results}
+    report_json = json.dumps(report, indent=2)
+    print(report_json)
+    if output:
+        with open(output, "w", encoding="utf-8") as report_file:
+            report_file.write(report_json)
@@ -0,0 +1,110 @@
+"""
+measures how environment inputs with thousands of keys become the data of a config map.
+
+    python -m benchmark.env_input [--keys 5000] [--runs 5]
+
+"dotenv" reads the whole object and parses it with dotenv.dotenv_values(StringIO(...)), which was the
+behaviour before the streaming parser. "stream" feeds the parser with the 64KB chunks of the object
+stream. Peak memory is traced with tracemalloc for one parse. An oversized input (~8x max_bytes) is only
+given to the stream parser, which rejects it after max_bytes, dotenv would read and parse all of it.
+"""
+import time
+import argparse
+import tracemalloc
+from io import StringIO
+
+from benchmark.common import latency_summary, write_report
+
+import dotenv  # noqa: E402
+
+from middlelayer.env_parser import EnvironmentInputError, parse_env_stream, CONFIG_MAP_MAX_BYTES  # noqa: E402
+
+CHUNK_SIZE = 64*1024
+
+
+def create_env_file(keys: int) -> bytes:
+    lines = ["# generated environment input"]
+    for i in range(keys):
+        if i % 10 == 0:
+            lines.append(f'QUOTED_{i}="value {i} with spaces"')
+        else:
+            lines.append(f"KEY_{i}=value-{i}")
+    return "\n".join(lines).encode()
+
+
+def chunks(data: bytes):
+    for i in range(0, len(data), CHUNK_SIZE):
+        yield data[i:i+CHUNK_SIZE]
+
+
+def parse(mode: str, data: bytes, max_bytes: int):
+    if mode == "dotenv":
+        return dict(dotenv.dotenv_values(stream=StringIO(b"".join(chunks(data)).decode())))
+    return parse_env_stream(chunks(data), max_bytes=max_bytes)
+
+
+def run_mode(mode: str, data: bytes, runs: int, max_bytes: int) -> dict:
+    durations = []
+    keys = 0
+    for _ in range(runs):
+        started = time.perf_counter()
+        keys = len(parse(mode, data, max_bytes))
+        durations.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    parse(mode, data, max_bytes)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"keys": keys,
+            "input_bytes": len(data),
+            "keys_per_s": keys * runs / sum(durations),
+            "peak_memory_kb": peak / 1024,
+            "parse": latency_summary(durations)}
+
+
+def reject(data: bytes, max_bytes: int) -> bool:
+    try:
+        parse("stream", data, max_bytes)
+    except EnvironmentInputError:
+        return True
+    return False
+
+
+def run_oversized(data: bytes, max_bytes: int) -> dict:
+    started = time.perf_counter()
+    rejected = reject(data, max_bytes)
+    duration = time.perf_counter() - started
+
+    tracemalloc.start()
+    reject(data, max_bytes)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"input_bytes": len(data),
+            "rejected": rejected,
+            "duration_ms": duration * 1000,
+            "peak_memory_kb": peak / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-bytes", type=int, default=CONFIG_MAP_MAX_BYTES)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    data = create_env_file(args.keys)
+    # an input of ~8x the limit, e.g. a data file uploaded as environment input
+    oversized = create_env_file(max(args.keys, 1) * (8 * args.max_bytes // max(len(data), 1) + 1))
+
+    results = {"dotenv": run_mode("dotenv", data, args.runs, args.max_bytes),
+               "stream": run_mode("stream", data, args.runs, args.max_bytes),
+               "stream_oversized": run_oversized(oversized, args.max_bytes)}
+
+    write_report("env_input", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
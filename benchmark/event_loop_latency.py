@@ -0,0 +1,128 @@
+"""
+measures the latency of /services/ while slow uploads and log reads are in flight.
+
+    python -m benchmark.event_loop_latency [--inline] [--uploads 8] [--log-reads 8]
+
+--inline executes the blocking calls directly on the event loop, which reproduces
+the behaviour before the BlockingIOExecutor was introduced.
+"""
+import time
+import asyncio
+import argparse
+from unittest.mock import patch, MagicMock
+
+from benchmark.common import setup_bench_config, latency_summary, write_report, BENCH_HEADERS
+
+setup_bench_config()
+
+import httpx  # noqa: E402
+
+import middlelayer.service_api as service_api_mod  # noqa: E402
+from middlelayer.asset import StaticAssetLoader  # noqa: E402
+
+
+class InlineExecutor():
+    """
+    runs blocking calls on the event loop
+    """
+
+    async def run(self, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def fake_storage(upload_delay: float):
+    storage = MagicMock()
+    storage.put_file.side_effect = lambda **_: time.sleep(upload_delay)
+    return storage
+
+
+def fake_backend(log_delay: float):
+    backend = MagicMock()
+
+    def get_status(workflow_id, verbose_level):
+        time.sleep(log_delay)
+        return "log line\n" * 100
+
+    backend.get_status.side_effect = get_status
+    return backend
+
+
+async def run_benchmark(args) -> dict:
+    with patch("middlelayer.service_api.ImlaMinio", return_value=fake_storage(args.upload_delay)),\
+            patch("middlelayer.service_api.K8sWorkflowBackend", return_value=fake_backend(args.log_delay)),\
+            patch("middlelayer.service_api.StaticAssetLoader",
+                  side_effect=lambda **kwargs: StaticAssetLoader(static_asset_directory="./config/assets",
+                                                                 **kwargs)),\
+            patch.object(service_api_mod.ServiceApi, "workflow_exists", return_value=True):
+
+        await service_api_mod.startup()
+        if args.inline:
+            service_api_mod.client.io_executor.shutdown()
+            service_api_mod.client.io_executor = InlineExecutor()
+
+        transport = httpx.ASGITransport(app=service_api_mod.service_api)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http_client:
+            stop = asyncio.Event()
+
+            async def upload_loop():
+                while not stop.is_set():
+                    await http_client.put("/services/dummy/input/env",
+                                          headers=BENCH_HEADERS,
+                                          files={"input_file": b"KEY=VALUE"})
+                    await asyncio.sleep(0)
+
+            async def log_loop():
+                while not stop.is_set():
+                    await http_client.get("/services/dummy/workflow/status/bench",
+                                          params={"verbose_level": 2},
+                                          headers=BENCH_HEADERS)
+                    await asyncio.sleep(0)
+
+            background = [asyncio.ensure_future(upload_loop()) for _ in range(args.uploads)]
+            background += [asyncio.ensure_future(log_loop()) for _ in range(args.log_reads)]
+            await asyncio.sleep(0.1)
+
+            # latency is measured from the planned send time, so time spent waiting
+            # for a blocked event loop is part of the result
+            latencies = []
+            probe_start = time.perf_counter()
+            for i in range(args.requests):
+                planned = probe_start + i * args.interval
+                await asyncio.sleep(max(0.0, planned - time.perf_counter()))
+                response = await http_client.get("/services/", headers=BENCH_HEADERS)
+                latencies.append(time.perf_counter() - planned)
+                assert response.status_code == 200
+
+            stop.set()
+            await asyncio.gather(*background)
+
+        service_api_mod.client.io_executor.shutdown()
+
+    return {"mode": "inline" if args.inline else "executor",
+            "uploads_in_flight": args.uploads,
+            "log_reads_in_flight": args.log_reads,
+            "upload_delay_s": args.upload_delay,
+            "log_delay_s": args.log_delay,
+            "services_latency": latency_summary(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inline", action="store_true")
+    parser.add_argument("--uploads", type=int, default=8)
+    parser.add_argument("--log-reads", type=int, default=8)
+    parser.add_argument("--upload-delay", type=float, default=0.2)
+    parser.add_argument("--log-delay", type=float, default=0.1)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.01)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    write_report("event_loop_latency", asyncio.run(run_benchmark(args)), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,468 @@
+"""
+in-process stand-in of the CoreV1 api of a kubernetes api server for benchmarks.
+
+Pods, config maps, secrets, persistent volume claims and services of all namespaces are kept in memory and served
+with the rest paths of the api (create, read, list with label selectors and pages, delete, delete collection).
+Pods can be watched (chunked json lines from a resource version) and their log read. The lifecycle of every created
+pod is simulated: scheduled after schedule_delay, containers running after start_delay and the worker container
+terminated after run_delay, the data-side-car keeps running until the pod is deleted, which takes delete_delay.
+Port-forwards are websocket upgrades, which this server does not implement, see FakePortForward.
+"""
+import json
+import time
+import heapq
+import socket
+import tempfile
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Condition
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import urlparse, parse_qs
+from uuid import uuid4
+
+# path segment -> kind of the objects and of their list
+RESOURCES = {"pods": ("Pod", "PodList"),
+             "configmaps": ("ConfigMap", "ConfigMapList"),
+             "secrets": ("Secret", "SecretList"),
+             "persistentvolumeclaims": ("PersistentVolumeClaim", "PersistentVolumeClaimList"),
+             "services": ("Service", "ServiceList")}
+
+# threads of the fake servers are named with this prefix, so they can be told apart from the threads of the api
+FAKE_THREAD_PREFIX = "fake-"
+
+
+def now_rfc3339() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def split_selector(label_selector: str) -> List[str]:
+    # commas inside "in (a,b)" do not separate requirements
+    requirements, depth, current = [], 0, ""
+    for char in label_selector:
+        if char == "," and depth == 0:
+            requirements.append(current.strip())
+            current = ""
+            continue
+        depth += {"(": 1, ")": -1}.get(char, 0)
+        current += char
+    if current.strip():
+        requirements.append(current.strip())
+    return requirements
+
+
+def match_labels(label_selector: str, labels: Dict[str, str]) -> bool:
+    """
+    equality (=, ==, !=), set based (in, notin) and existence (key, !key) requirements
+    """
+    for requirement in split_selector(label_selector or ""):
+        if " notin " in requirement or " in " in requirement:
+            negated = " notin " in requirement
+            key, values = requirement.split(" notin " if negated else " in ", 1)
+            values = {x.strip() for x in values.strip().strip("()").split(",")}
+            if (labels.get(key.strip()) in values) == (not negated):
+                continue
+            return False
+        if "!=" in requirement:
+            key, value = requirement.split("!=", 1)
+            if labels.get(key.strip()) == value.strip():
+                return False
+        elif "=" in requirement:
+            key, value = requirement.replace("==", "=").split("=", 1)
+            if labels.get(key.strip()) != value.strip():
+                return False
+        elif requirement.startswith("!"):
+            if requirement[1:] in labels:
+                return False
+        elif requirement not in labels:
+            return False
+    return True
+
+
+class FakeThreadingHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # all workflows of a benchmark connect at once
+    request_queue_size = 1024
+
+    def __init__(self, server_address, handler_class, name: str):
+        super().__init__(server_address, handler_class)
+        self.name = name
+        self.thread_count = 0
+
+    def process_request(self, request, client_address):
+        self.thread_count += 1
+        Thread(target=self.process_request_thread,
+               args=(request, client_address),
+               name=f"{FAKE_THREAD_PREFIX}{self.name}-{self.thread_count}",
+               daemon=True).start()
+
+    def start(self) -> Tuple[str, int]:
+        Thread(target=self.serve_forever, name=f"{FAKE_THREAD_PREFIX}{self.name}", daemon=True).start()
+        return self.server_address
+
+
+class FakeKubernetesApi():
+    """
+    objects, watch events and simulated pod lifecycles of the fake api server
+    """
+
+    def __init__(self,
+                 schedule_delay: float = 0.05,
+                 start_delay: float = 0.2,
+                 run_delay: float = 0.5,
+                 delete_delay: float = 0.1,
+                 log_lines: int = 20):
+        self.schedule_delay = schedule_delay
+        self.start_delay = start_delay
+        self.run_delay = run_delay
+        self.delete_delay = delete_delay
+        self.log_lines = log_lines
+
+        self.condition = Condition()
+        # (namespace, resource) -> name -> object
+        self.objects: Dict[Tuple[str, str], Dict[str, dict]] = {}
+        self.resource_version = 0
+        # (resource_version, namespace, type, pod), all events are kept, a watch never expires
+        self.pod_events: List[Tuple[int, str, str, dict]] = []
+        # (due, sequence, transition)
+        self.timers: List[Tuple[float, int, Callable[[], None]]] = []
+        self.timer_sequence = 0
+        self.running = True
+        self.requests: Dict[str, int] = {}
+
+        self.server: FakeThreadingHTTPServer = None
+        self.timer_thread = Thread(target=self.__run_timers, name=f"{FAKE_THREAD_PREFIX}k8s-lifecycle", daemon=True)
+        self.timer_thread.start()
+
+    def start(self) -> str:
+        api = self
+
+        class Handler(FakeKubernetesHandler):
+            fake_api = api
+
+        self.server = FakeThreadingHTTPServer(("127.0.0.1", 0), Handler, "k8s")
+        host, port = self.server.start()
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def write_kubeconfig(self, url: str) -> str:
+        kubeconfig = {"apiVersion": "v1",
+                      "kind": "Config",
+                      "clusters": [{"name": "fake", "cluster": {"server": url}}],
+                      "users": [{"name": "fake", "user": {"token": "fake"}}],
+                      "contexts": [{"name": "fake", "context": {"cluster": "fake", "user": "fake"}}],
+                      "current-context": "fake"}
+        with tempfile.NamedTemporaryFile("w", suffix=".kubeconfig", delete=False) as kubeconfig_file:
+            json.dump(kubeconfig, kubeconfig_file)
+        return kubeconfig_file.name
+
+    def count(self, resource: str) -> int:
+        with self.condition:
+            return sum(len(objects) for (_, kind), objects in self.objects.items() if kind == resource)
+
+    # object store, called with the condition held
+
+    def create(self, namespace: str, resource: str, body: dict) -> Tuple[int, dict]:
+        kind, _ = RESOURCES[resource]
+        objects = self.objects.setdefault((namespace, resource), {})
+        name = body.get("metadata", {}).get("name")
+        if name in objects:
+            return 409, self.status(409, "AlreadyExists", f"{resource} {name} already exists")
+
+        self.resource_version += 1
+        body["kind"] = kind
+        body["apiVersion"] = "v1"
+        body["metadata"].update({"namespace": namespace,
+                                 "uid": str(uuid4()),
+                                 "resourceVersion": str(self.resource_version),
+                                 "creationTimestamp": now_rfc3339()})
+        objects[name] = body
+        if resource == "pods":
+            body["status"] = {"phase": "Pending"}
+            self.__add_pod_event(namespace, "ADDED", body)
+            self.__schedule(self.schedule_delay, lambda: self.__set_containers(namespace, name, "waiting"))
+        return 201, body
+
+    def delete(self, namespace: str, resource: str, name: str):
+        found = self.objects.get((namespace, resource), {}).get(name)
+        if found is None:
+            return
+        if resource != "pods":
+            self.objects[(namespace, resource)].pop(name)
+            return
+        pod = found
+        if "deletionTimestamp" in pod["metadata"]:
+            return
+        pod["metadata"]["deletionTimestamp"] = now_rfc3339()
+        self.__update_pod(namespace, pod)
+        self.__schedule(self.delete_delay, lambda: self.__remove_pod(namespace, name))
+
+    def list(self, namespace: str, resource: str, label_selector: str) -> List[dict]:
+        return [x for x in self.objects.get((namespace, resource), {}).values()
+                if match_labels(label_selector, x["metadata"].get("labels") or {})]
+
+    def get_pod_log(self, namespace: str, name: str, timestamps: bool, tail_lines: int) -> str:
+        pod = self.objects.get((namespace, "pods"), {}).get(name)
+        if pod is None:
+            return None
+        lines = [f"{now_rfc3339() + ' ' if timestamps else ''}step {i} of {name}" for i in range(self.log_lines)]
+        if tail_lines:
+            lines = lines[-tail_lines:]
+        return "".join(f"{x}\n" for x in lines)
+
+    def get_pod_events(self, namespace: str, label_selector: str, after: int) -> List[Tuple[int, str, dict]]:
+        # the events are ordered by resource version
+        index = len(self.pod_events)
+        while index > 0 and self.pod_events[index - 1][0] > after:
+            index -= 1
+        return [(version, event_type, pod) for version, event_namespace, event_type, pod in self.pod_events[index:]
+                if event_namespace == namespace and match_labels(label_selector, pod["metadata"].get("labels") or {})]
+
+    @staticmethod
+    def status(code: int, reason: str, message: str = "") -> dict:
+        return {"kind": "Status", "apiVersion": "v1", "metadata": {},
+                "status": "Success" if code < 400 else "Failure", "code": code, "reason": reason, "message": message}
+
+    # pod lifecycle
+
+    def __add_pod_event(self, namespace: str, event_type: str, pod: dict):
+        # a snapshot, the stored pod changes with the next transition
+        self.pod_events.append((self.resource_version, namespace, event_type, json.loads(json.dumps(pod))))
+        self.condition.notify_all()
+
+    def __update_pod(self, namespace: str, pod: dict):
+        self.resource_version += 1
+        pod["metadata"]["resourceVersion"] = str(self.resource_version)
+        self.__add_pod_event(namespace, "MODIFIED", pod)
+
+    def __remove_pod(self, namespace: str, name: str):
+        pod = self.objects.get((namespace, "pods"), {}).pop(name, None)
+        if pod is None:
+            return
+        self.resource_version += 1
+        pod["metadata"]["resourceVersion"] = str(self.resource_version)
+        self.__add_pod_event(namespace, "DELETED", pod)
+
+    def __set_containers(self, namespace: str, name: str, state: str):
+        pod = self.objects.get((namespace, "pods"), {}).get(name)
+        if pod is None or "deletionTimestamp" in pod["metadata"]:
+            return
+
+        statuses = []
+        for container in pod["spec"]["containers"]:
+            container_state = state
+            if state == "terminated" and container["name"] != "worker":
+                container_state = "running"
+            statuses.append({"name": container["name"],
+                             "image": container.get("image", ""),
+                             "imageID": "",
+                             "ready": container_state == "running",
+                             "restartCount": 0,
+                             "state": self.__get_container_state(container_state)})
+        pod["status"] = {"phase": "Pending" if state == "waiting" else "Running",
+                         "conditions": [{"type": "PodScheduled", "status": "True"}],
+                         "containerStatuses": statuses}
+        self.__update_pod(namespace, pod)
+
+        if state == "waiting":
+            self.__schedule(self.start_delay, lambda: self.__set_containers(namespace, name, "running"))
+        elif state == "running":
+            self.__schedule(self.run_delay, lambda: self.__set_containers(namespace, name, "terminated"))
+
+    @staticmethod
+    def __get_container_state(state: str) -> dict:
+        if state == "waiting":
+            return {"waiting": {"reason": "ContainerCreating"}}
+        if state == "running":
+            return {"running": {"startedAt": now_rfc3339()}}
+        return {"terminated": {"exitCode": 0, "reason": "Completed", "finishedAt": now_rfc3339()}}
+
+    def __schedule(self, delay: float, transition: Callable[[], None]):
+        self.timer_sequence += 1
+        heapq.heappush(self.timers, (time.monotonic() + delay, self.timer_sequence, transition))
+        self.condition.notify_all()
+
+    def __run_timers(self):
+        with self.condition:
+            while self.running:
+                now = time.monotonic()
+                while self.timers and self.timers[0][0] <= now:
+                    _, _, transition = heapq.heappop(self.timers)
+                    transition()
+                timeout = self.timers[0][0] - now if self.timers else None
+                self.condition.wait(timeout=timeout)
+
+
+class FakeKubernetesHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    fake_api: FakeKubernetesApi = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def parse_path(self):
+        """
+        /api/v1/namespaces/{namespace}/{resource}[/{name}[/{subresource}]]
+        """
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = url.path.strip("/").split("/")
+        if len(parts) < 5 or parts[:3] != ["api", "v1", "namespaces"] or parts[4] not in RESOURCES:
+            return None
+        name = parts[5] if len(parts) > 5 else None
+        subresource = parts[6] if len(parts) > 6 else None
+        with self.fake_api.condition:
+            self.fake_api.requests[self.command] = self.fake_api.requests.get(self.command, 0) + 1
+        return parts[3], parts[4], name, subresource, query
+
+    def do_POST(self):
+        parsed = self.parse_path()
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if parsed is None or parsed[2] is not None:
+            return self.send_json(404, FakeKubernetesApi.status(404, "NotFound"))
+        namespace, resource, _, _, _ = parsed
+        with self.fake_api.condition:
+            status, created = self.fake_api.create(namespace, resource, body)
+            data = json.dumps(created).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_DELETE(self):
+        parsed = self.parse_path()
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if parsed is None:
+            return self.send_json(404, FakeKubernetesApi.status(404, "NotFound"))
+        namespace, resource, name, _, query = parsed
+        with self.fake_api.condition:
+            if name is None:
+                names = [x["metadata"]["name"] for x in self.fake_api.list(namespace, resource,
+                                                                          query.get("labelSelector"))]
+            else:
+                names = [name] if name in self.fake_api.objects.get((namespace, resource), {}) else []
+                if not names:
+                    return self.send_json(404, FakeKubernetesApi.status(404, "NotFound"))
+            for x in names:
+                self.fake_api.delete(namespace, resource, x)
+        self.send_json(200, FakeKubernetesApi.status(200, ""))
+
+    def do_GET(self):
+        parsed = self.parse_path()
+        if parsed is None:
+            return self.send_json(404, FakeKubernetesApi.status(404, "NotFound"))
+        namespace, resource, name, subresource, query = parsed
+
+        if name is not None and subresource == "log":
+            return self.send_log(namespace, name, query)
+        if name is not None:
+            with self.fake_api.condition:
+                found = self.fake_api.objects.get((namespace, resource), {}).get(name)
+                data = json.dumps(found).encode() if found else None
+            if data is None:
+                return self.send_json(404, FakeKubernetesApi.status(404, "NotFound"))
+            return self.send_json(200, json.loads(data))
+        if query.get("watch") in ("true", "1"):
+            return self.send_watch(namespace, query)
+        self.send_list(namespace, resource, query)
+
+    def send_list(self, namespace: str, resource: str, query: Dict[str, str]):
+        _, list_kind = RESOURCES[resource]
+        offset = int(query.get("continue") or 0)
+        limit = int(query.get("limit") or 0)
+        with self.fake_api.condition:
+            items = self.fake_api.list(namespace, resource, query.get("labelSelector"))
+            resource_version = str(self.fake_api.resource_version)
+            metadata = {"resourceVersion": resource_version}
+            if limit and offset + limit < len(items):
+                metadata["continue"] = str(offset + limit)
+            items = items[offset:offset + limit] if limit else items[offset:]
+            data = json.dumps({"kind": list_kind, "apiVersion": "v1", "metadata": metadata, "items": items})
+        body = data.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_log(self, namespace: str, name: str, query: Dict[str, str]):
+        with self.fake_api.condition:
+            log = self.fake_api.get_pod_log(namespace, name,
+                                            timestamps=query.get("timestamps") == "true",
+                                            tail_lines=int(query["tailLines"]) if "tailLines" in query else None)
+        if log is None:
+            return self.send_json(404, FakeKubernetesApi.status(404, "NotFound"))
+        # a followed log ends with the current lines
+        data = log.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_watch(self, namespace: str, query: Dict[str, str]):
+        label_selector = query.get("labelSelector")
+        after = int(query.get("resourceVersion") or 0)
+        deadline = time.monotonic() + float(query.get("timeoutSeconds") or 300)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            while True:
+                with self.fake_api.condition:
+                    events = self.fake_api.get_pod_events(namespace, label_selector, after)
+                    while not events and self.fake_api.running and time.monotonic() < deadline:
+                        self.fake_api.condition.wait(timeout=max(0.0, deadline - time.monotonic()))
+                        events = self.fake_api.get_pod_events(namespace, label_selector, after)
+                    if not self.fake_api.running:
+                        break
+                if not events:
+                    break
+                data = b"".join(json.dumps({"type": event_type, "object": pod}).encode() + b"\n"
+                                for _, event_type, pod in events)
+                after = events[-1][0]
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+
+class FakePortForward():
+    """
+    port-forward to a pod, connected to a local server (e.g. the data-side-car) after the websocket handshake,
+    which takes handshake_delay
+    """
+
+    def __init__(self, address: Tuple[str, int], handshake_delay: float = 0.02):
+        time.sleep(handshake_delay)
+        self.sock = socket.create_connection(address)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connected = True
+
+    def socket(self, port):
+        return self.sock
+
+    def close(self):
+        self.connected = False
+        self.sock.close()
@@ -0,0 +1,208 @@
+"""
+in-process stand-in of an s3 compatible storage (path style, e.g. minio) for benchmarks.
+
+Buckets and objects are kept in memory. Supported are the requests of ImlaMinio outside of multipart uploads:
+bucket location, exists and creation, put (with x-amz-meta-* metadata), copy (x-amz-copy-source), head, get,
+delete, multi-object delete and list v2. Signatures are not checked.
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler
+from threading import Lock
+from typing import Dict, Tuple
+from urllib.parse import urlparse, parse_qs, unquote
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from benchmark.fake_kubernetes import FakeThreadingHTTPServer
+
+S3_NAMESPACE = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+def to_iso8601(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+class FakeObject():
+
+    def __init__(self, data: bytes, metadata: Dict[str, str]):
+        self.data = data
+        self.metadata = metadata
+        self.etag = hashlib.md5(data).hexdigest()
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+class FakeS3():
+
+    def __init__(self):
+        self.lock = Lock()
+        # bucket -> key -> object
+        self.buckets: Dict[str, Dict[str, FakeObject]] = {}
+        self.requests: Dict[str, int] = {}
+        self.server: FakeThreadingHTTPServer = None
+
+    def start(self) -> str:
+        """
+        returns the endpoint (host:port) of the server
+        """
+        storage = self
+
+        class Handler(FakeS3Handler):
+            fake_s3 = storage
+
+        self.server = FakeThreadingHTTPServer(("127.0.0.1", 0), Handler, "s3")
+        host, port = self.server.start()
+        return f"{host}:{port}"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def put(self, bucket: str, key: str, data: bytes, metadata: Dict[str, str] = None) -> FakeObject:
+        with self.lock:
+            stored = FakeObject(data, metadata or {})
+            self.buckets.setdefault(bucket, {})[key] = stored
+            return stored
+
+    def get(self, bucket: str, key: str) -> FakeObject:
+        with self.lock:
+            return self.buckets.get(bucket, {}).get(key)
+
+    def count(self, bucket: str) -> int:
+        with self.lock:
+            return len(self.buckets.get(bucket, {}))
+
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    fake_s3: FakeS3 = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def parse_path(self) -> Tuple[str, str, Dict[str, str]]:
+        url = urlparse(self.path)
+        bucket, _, key = url.path.lstrip("/").partition("/")
+        with self.fake_s3.lock:
+            self.fake_s3.requests[self.command] = self.fake_s3.requests.get(self.command, 0) + 1
+        query = {k: v[0] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        return unquote(bucket), unquote(key), query
+
+    def read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def send(self, status: int, body: bytes = b"", headers: Dict[str, str] = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def send_xml(self, status: int, xml: str):
+        self.send(status, ('<?xml version="1.0" encoding="UTF-8"?>' + xml).encode(),
+                  {"Content-Type": "application/xml"})
+
+    def send_error_code(self, status: int, code: str, bucket: str, key: str = ""):
+        if self.command == "HEAD":
+            return self.send(status)
+        self.send_xml(status, f"<Error><Code>{code}</Code><Message>{code}</Message>"
+                              f"<Resource>/{escape(bucket)}/{escape(key)}</Resource><RequestId>fake</RequestId>"
+                              f"<HostId>fake</HostId><BucketName>{escape(bucket)}</BucketName>"
+                              f"<Key>{escape(key)}</Key></Error>")
+
+    def object_headers(self, stored: FakeObject) -> Dict[str, str]:
+        headers = {"ETag": f'"{stored.etag}"',
+                   "Last-Modified": format_datetime(stored.last_modified, usegmt=True),
+                   "Content-Type": "application/octet-stream"}
+        headers.update(stored.metadata)
+        return headers
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        bucket, key, query = self.parse_path()
+        if "location" in query:
+            return self.send_xml(200, f'<LocationConstraint xmlns="{S3_NAMESPACE}"></LocationConstraint>')
+
+        with self.fake_s3.lock:
+            objects = self.fake_s3.buckets.get(bucket)
+            if objects is None:
+                return self.send_error_code(404, "NoSuchBucket", bucket)
+            if not key and query.get("list-type") == "2":
+                prefix = query.get("prefix", "")
+                listed = sorted((k, v) for k, v in objects.items() if k.startswith(prefix))
+                return self.send_xml(200, f'<ListBucketResult xmlns="{S3_NAMESPACE}"><Name>{escape(bucket)}</Name>'
+                                          f"<Prefix>{escape(prefix)}</Prefix><KeyCount>{len(listed)}</KeyCount>"
+                                          "<MaxKeys>1000</MaxKeys><IsTruncated>false</IsTruncated>"
+                                          + "".join(f"<Contents><Key>{escape(k)}</Key>"
+                                                    f"<LastModified>{to_iso8601(v.last_modified)}</LastModified>"
+                                                    f'<ETag>"{v.etag}"</ETag><Size>{len(v.data)}</Size>'
+                                                    "<StorageClass>STANDARD</StorageClass></Contents>"
+                                                    for k, v in listed)
+                                          + "</ListBucketResult>")
+            if not key:
+                return self.send(200)
+            stored = objects.get(key)
+
+        if stored is None:
+            return self.send_error_code(404, "NoSuchKey", bucket, key)
+        self.send(200, stored.data, self.object_headers(stored))
+
+    def do_PUT(self):
+        bucket, key, query = self.parse_path()
+        body = self.read_body()
+        if not key:
+            with self.fake_s3.lock:
+                self.fake_s3.buckets.setdefault(bucket, {})
+            return self.send(200)
+        if "uploadId" in query:
+            return self.send_error_code(501, "NotImplemented", bucket, key)
+
+        copy_source = self.headers.get("x-amz-copy-source")
+        if copy_source:
+            source_bucket, _, source_key = unquote(copy_source).lstrip("/").partition("/")
+            source = self.fake_s3.get(source_bucket, source_key)
+            if source is None:
+                return self.send_error_code(404, "NoSuchKey", source_bucket, source_key)
+            metadata = source.metadata
+            if self.headers.get("x-amz-metadata-directive") == "REPLACE":
+                metadata = self.get_metadata()
+            stored = self.fake_s3.put(bucket, key, source.data, metadata)
+            return self.send_xml(200, f'<CopyObjectResult xmlns="{S3_NAMESPACE}">'
+                                      f"<LastModified>{to_iso8601(stored.last_modified)}</LastModified>"
+                                      f'<ETag>"{stored.etag}"</ETag></CopyObjectResult>')
+
+        if bucket not in self.fake_s3.buckets:
+            return self.send_error_code(404, "NoSuchBucket", bucket, key)
+        stored = self.fake_s3.put(bucket, key, body, self.get_metadata())
+        self.send(200, headers={"ETag": f'"{stored.etag}"'})
+
+    def do_POST(self):
+        bucket, key, query = self.parse_path()
+        body = self.read_body()
+        if "delete" not in query:
+            return self.send_error_code(501, "NotImplemented", bucket, key)
+
+        keys = [x.text for x in ElementTree.fromstring(body).iter() if x.tag.endswith("Key")]
+        with self.fake_s3.lock:
+            objects = self.fake_s3.buckets.get(bucket, {})
+            for deleted in keys:
+                objects.pop(deleted, None)
+        # quiet mode, only errors are reported
+        self.send_xml(200, f'<DeleteResult xmlns="{S3_NAMESPACE}"></DeleteResult>')
+
+    def do_DELETE(self):
+        bucket, key, _ = self.parse_path()
+        self.read_body()
+        with self.fake_s3.lock:
+            self.fake_s3.buckets.get(bucket, {}).pop(key, None)
+        self.send(204)
+
+    def get_metadata(self) -> Dict[str, str]:
+        return {name.lower(): value for name, value in self.headers.items() if name.lower().startswith("x-amz-meta-")}
@@ -0,0 +1,136 @@
+"""
+measures the per-call overhead of kubernetes api calls against a local fake api server.
+
+    python -m benchmark.k8s_api_client [--tls] [--calls 500] [--threads 4]
+
+"fresh" builds a new CoreV1Api (ApiClient, connection pool) for every call, which was the behaviour of
+all k8sClient functions before the shared client. "shared" uses k8s_core_api().
+With --tls the fake server uses a self-signed certificate (requires the openssl cli), so every new
+connection includes a TLS handshake.
+"""
+import os
+import ssl
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+
+from benchmark.common import latency_summary, write_report
+
+from kubernetes import client  # noqa: E402
+
+import middlelayer.k8sClient as k8s_client_mod  # noqa: E402
+from middlelayer.models import K8sBackendConfig  # noqa: E402
+
+
+POD = json.dumps({"kind": "Pod",
+                  "apiVersion": "v1",
+                  "metadata": {"name": "bench", "namespace": "bench", "resourceVersion": "1"},
+                  "status": {"phase": "Running"}}).encode()
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # like the api server, otherwise delayed acks dominate on reused connections
+    disable_nagle_algorithm = True
+    connections = 0
+    lock = Lock()
+
+    def setup(self):
+        super().setup()
+        with FakeApiHandler.lock:
+            FakeApiHandler.connections += 1
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(POD)))
+        # headers and body in one segment
+        self._headers_buffer.append(b"\r\n" + POD)
+        self.flush_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_certificate(directory: str):
+    cert_file = os.path.join(directory, "cert.pem")
+    key_file = os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-subj", "/CN=127.0.0.1", "-keyout", key_file, "-out", cert_file],
+                   check=True, capture_output=True)
+    return cert_file, key_file
+
+
+def start_server(tls: bool, directory: str) -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeApiHandler)
+    scheme = "http"
+    if tls:
+        cert_file, key_file = create_certificate(directory)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_file, key_file)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    Thread(target=server.serve_forever, daemon=True).start()
+    return f"{scheme}://127.0.0.1:{server.server_address[1]}"
+
+
+def run_mode(mode: str, calls: int, threads: int) -> dict:
+    if mode == "fresh":
+        def get_api():
+            return client.CoreV1Api()
+    else:
+        k8s_client_mod.k8s_close_api_client()
+        get_api = k8s_client_mod.k8s_core_api
+
+    def call(_):
+        started = time.perf_counter()
+        get_api().read_namespaced_pod(name="bench", namespace="bench")
+        return time.perf_counter() - started
+
+    FakeApiHandler.connections = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(call, range(calls)))
+    duration = time.perf_counter() - started
+
+    return {"calls": calls,
+            "threads": threads,
+            "calls_per_s": calls / duration,
+            "connections": FakeApiHandler.connections,
+            "latency": latency_summary(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tls", action="store_true")
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--pool-size", type=int, default=32)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        configuration = client.Configuration()
+        configuration.host = start_server(args.tls, tmp_dir)
+        configuration.verify_ssl = False
+        client.Configuration.set_default(configuration)
+        k8s_client_mod.K8S_BACKEND_CONFIG = K8sBackendConfig(api_connection_pool_size=args.pool_size)
+
+        # warm up imports and the fake server
+        run_mode("fresh", 10, 1)
+
+        results = {"tls": args.tls,
+                   "fresh": run_mode("fresh", args.calls, args.threads),
+                   "shared": run_mode("shared", args.calls, args.threads)}
+        k8s_client_mod.k8s_close_api_client()
+
+    write_report("k8s_api_client", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+overhead of the prometheus metrics on the hot path.
+
+    python -m benchmark.metrics_overhead [--calls 200000] [--requests 5000]
+
+"call" compares a function without and with the timed decorator (ns per call), "request" compares requests
+per second of a route without and with the RequestMetricsMiddleware.
+"""
+import time
+import asyncio
+import argparse
+
+from benchmark.common import latency_summary, write_report
+
+import httpx
+from fastapi import FastAPI
+from prometheus_client import Histogram, CollectorRegistry
+
+from middlelayer.decorators import timed
+from middlelayer.metrics import RequestMetricsMiddleware
+
+
+def measure_call(func, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        func("default")
+    return (time.perf_counter() - started) / calls * 1e9
+
+
+def run_calls(calls: int) -> dict:
+    histogram = Histogram("bench_call_seconds", "bench", ["function"], registry=CollectorRegistry())
+
+    def k8s_pod_exists(namespace):
+        return namespace
+
+    timed_call = timed(histogram)(k8s_pod_exists)
+    # warm up
+    measure_call(k8s_pod_exists, calls // 10)
+    measure_call(timed_call, calls // 10)
+
+    plain_ns = measure_call(k8s_pod_exists, calls)
+    timed_ns = measure_call(timed_call, calls)
+    return {"plain_ns": plain_ns,
+            "timed_ns": timed_ns,
+            "overhead_ns": timed_ns - plain_ns}
+
+
+def create_app(with_metrics: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/services/{service_id}/info")
+    async def get_service_info(service_id: str):
+        return {"service_id": service_id}
+
+    if with_metrics:
+        app.add_middleware(RequestMetricsMiddleware)
+    return app
+
+
+async def run_requests(with_metrics: bool, requests: int) -> dict:
+    transport = httpx.ASGITransport(app=create_app(with_metrics))
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http_client:
+        for _ in range(requests // 10):
+            await http_client.get("/services/dummy/info")
+
+        durations = []
+        started = time.perf_counter()
+        for _ in range(requests):
+            request_started = time.perf_counter()
+            response = await http_client.get("/services/dummy/info")
+            durations.append(time.perf_counter() - request_started)
+            assert response.status_code == 200
+        duration = time.perf_counter() - started
+
+    return {"requests_per_s": requests / duration,
+            "latency": latency_summary(durations)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    results = {"call": run_calls(args.calls),
+               "request": {"plain": asyncio.run(run_requests(False, args.requests)),
+                           "metrics": asyncio.run(run_requests(True, args.requests))}}
+    write_report("metrics_overhead", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+measures how many pod manifests per second are built and serialized for the request body.
+
+    python -m benchmark.pod_manifest [--manifests 20000]
+
+"models" builds the V1Pod object tree with create_pod_manifest for every workflow, which was the
+behaviour before the manifest templates. "template" renders the dict manifest from the precompiled
+template of the service. Both are serialized with ApiClient.sanitize_for_serialization, like the
+kubernetes client does for the body of create_namespaced_pod.
+"""
+import os
+import time
+import argparse
+from uuid import uuid4
+from typing import List
+
+from benchmark.common import write_report
+
+from kubernetes import client  # noqa: E402
+
+import middlelayer.k8sClient as k8s_client_mod  # noqa: E402
+from middlelayer.k8sClient import k8s_create_pod_manifest_template, k8s_render_pod_manifest  # noqa: E402
+from middlelayer.models import (WorkflowResource, WorkflowInputResource, InputServiceResource,  # noqa: E402
+                                ServiceResourceType, K8sBackendConfig)
+
+
+JOB_CONFIG = WorkflowResource(worker_image="registry.example.com/worker:latest",
+                              worker_image_output_directory="/output",
+                              worker_image_command=["python3"],
+                              worker_image_args=["train.py", "--epochs", "10"],
+                              gpu=True)
+
+SERVICE_INPUTS = [InputServiceResource(resource_name=f"data-{i}",
+                                       type=ServiceResourceType.data,
+                                       mount_path="/data/in",
+                                       description="data") for i in range(4)]
+
+INPUT_RESOURCES = [WorkflowInputResource(resource_name=x.resource_name,
+                                         type=x.type,
+                                         storage_source=f"bench/inputs/{x.resource_name}",
+                                         mount_path=x.mount_path,
+                                         description=x.description) for x in SERVICE_INPUTS]
+
+
+def create_pod_manifest(job_uuid,
+                        job_config: WorkflowResource,
+                        config_map_ref: List[str] = None,
+                        input_config_ref: str = None,
+                        input_resources: List[WorkflowInputResource] = None,
+                        job_namespace="default",
+                        persistent_volume_claim_id: str = None,
+                        labels=None,
+                        store_secret_ref: str = None) -> client.V1Pod:
+    """
+    the V1Pod object tree of a workflow, as it was built for every workflow before the manifest templates
+    """
+    JOB_VOLUME_NAME = "workflow-job-volume"
+
+    data_init_container = None
+    containers = []
+    worker_container_volume_mounts = []
+    pod_spec_volumes = []
+    pod_spec_init_containers = []
+
+    workflow_job_volume = None
+    if persistent_volume_claim_id:
+        workflow_job_volume = client.V1Volume(
+            name=JOB_VOLUME_NAME,
+            persistent_volume_claim=client.V1PersistentVolumeClaimVolumeSource(
+                claim_name=persistent_volume_claim_id)
+        )
+
+    # if no workflow_job_volume use EmptyDir as fallback
+    if not workflow_job_volume:
+        workflow_job_volume = client.V1Volume(
+            name=JOB_VOLUME_NAME,
+            empty_dir=client.V1EmptyDirVolumeSource(
+                size_limit=k8s_client_mod.K8S_BACKEND_CONFIG.job_storage_size)
+        )
+
+    pod_spec_volumes.append(
+        workflow_job_volume
+    )
+
+    if input_config_ref:
+
+        pod_spec_volumes.append(
+            client.V1Volume(
+                name="workflow-api-config",
+                secret=client.V1SecretVolumeSource(
+                    secret_name="workflow-api-config"
+                )
+            )
+        )
+
+        pod_spec_volumes.append(
+            client.V1Volume(
+                name="input-init-config",
+                config_map=client.V1ConfigMapVolumeSource(
+                    name=input_config_ref,
+                    items=[client.V1KeyToPath(key="input-init.json", path="input-init.json")])
+            )
+        )
+
+        data_init_container = client.V1Container(
+            name="data-input-init",
+            image=k8s_client_mod.DATA_SIDE_CAR_IMAGE,
+            image_pull_policy="Always",
+            command=["python3"],
+            args=["init.py"],
+            env=[
+                client.V1EnvVar(name="INPUT_INIT_CONFIG", value="/opt/config/input-init.json"),
+                client.V1EnvVar(name="DATA_DESTINATION", value="/data/"),
+                client.V1EnvVar(name="CONFIG_FILE_PATH", value="/opt/config/workflow-api.cfg")
+            ],
+
+            volume_mounts=[
+                client.V1VolumeMount(
+                    mount_path="/opt/config/input-init.json",
+                    sub_path="input-init.json",
+                    name="input-init-config"
+                ),
+                client.V1VolumeMount(
+                    mount_path="/opt/config/workflow-api.cfg",
+                    sub_path="workflow-api.cfg",
+                    name="workflow-api-config"
+                ),
+                client.V1VolumeMount(
+                    mount_path="/data/",
+                    name=JOB_VOLUME_NAME
+                )
+            ]
+        )
+
+        for resource in input_resources:
+            if resource.type is ServiceResourceType.environment:
+                continue
+
+            sub_path = None
+            mount_path = resource.mount_path
+
+            if resource.type is ServiceResourceType.data:
+                sub_path = resource.resource_name
+                mount_path = os.path.join(resource.mount_path, resource.resource_name)
+
+            worker_container_volume_mounts.append(
+                client.V1VolumeMount(
+                    mount_path=mount_path,
+                    sub_path=sub_path,
+                    name=JOB_VOLUME_NAME
+                )
+            )
+
+        pod_spec_init_containers.append(data_init_container)
+
+    if job_config.worker_image_output_directory:
+        worker_container_volume_mounts.append(
+            client.V1VolumeMount(
+                mount_path=job_config.worker_image_output_directory,
+                name=JOB_VOLUME_NAME
+            )
+        )
+
+        side_car = client.V1Container(
+            name="data-side-car",
+            image=k8s_client_mod.DATA_SIDE_CAR_IMAGE,
+            image_pull_policy="Always"
+        )
+
+        side_car.volume_mounts = [
+            client.V1VolumeMount(
+                mount_path="/output",
+                name=JOB_VOLUME_NAME)]
+
+        if store_secret_ref:
+            side_car.env_from = [client.V1EnvFromSource(secret_ref=client.V1SecretEnvSource(name=store_secret_ref))]
+
+        containers.append(side_car)
+
+    worker_container = client.V1Container(
+        name="worker",
+        image=job_config.worker_image,
+        image_pull_policy="Always",
+        command=job_config.worker_image_command,
+        args=job_config.worker_image_args,
+        volume_mounts=worker_container_volume_mounts
+    )
+
+    if job_config.gpu:
+        worker_container.resources = client.V1ResourceRequirements(
+            limits={"nvidia.com/gpu": "1"})
+
+    if config_map_ref:
+        env_from = [client.V1EnvFromSource(config_map_ref=client.V1ConfigMapEnvSource(name=ref))
+                    for ref in config_map_ref]
+        worker_container.env_from = env_from
+
+    containers.append(worker_container)
+
+    pod_spec = client.V1PodSpec(restart_policy="Never",
+                                containers=containers,
+                                image_pull_secrets=[
+                                    client.V1LocalObjectReference(name=k8s_client_mod.IMAGE_PULL_SECRET)],
+                                init_containers=pod_spec_init_containers,
+                                volumes=pod_spec_volumes)
+
+    pod = client.V1Pod(
+        api_version="v1",
+        kind="Pod",
+        metadata=client.V1ObjectMeta(name=job_uuid,
+                                     namespace=job_namespace,
+                                     labels=labels),
+        spec=pod_spec)
+    return pod
+
+
+def get_workflow_args() -> dict:
+    job_id = str(uuid4())
+    return dict(job_uuid=job_id,
+                config_map_ref=[str(uuid4()), str(uuid4())],
+                input_config_ref=str(uuid4()),
+                input_resources=INPUT_RESOURCES,
+                job_namespace="bench",
+                persistent_volume_claim_id=str(uuid4()),
+                labels={"app": "gx4ki-demo", "workflow-id": str(uuid4()), "job-id": job_id})
+
+
+def run_mode(mode: str, manifests: int) -> dict:
+    api_client = client.ApiClient()
+    workflow_args = [get_workflow_args() for _ in range(manifests)]
+
+    started = time.perf_counter()
+    if mode == "models":
+        for kwargs in workflow_args:
+            api_client.sanitize_for_serialization(create_pod_manifest(job_config=JOB_CONFIG, **kwargs))
+    else:
+        template = k8s_create_pod_manifest_template(JOB_CONFIG, SERVICE_INPUTS)
+        for kwargs in workflow_args:
+            api_client.sanitize_for_serialization(k8s_render_pod_manifest(template, **kwargs))
+    duration = time.perf_counter() - started
+
+    return {"manifests": manifests,
+            "manifests_per_s": manifests / duration,
+            "us_per_manifest": duration / manifests * 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--manifests", type=int, default=20000)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    k8s_client_mod.K8S_BACKEND_CONFIG = K8sBackendConfig()
+
+    # warm up
+    run_mode("models", 100)
+    run_mode("template", 100)
+
+    results = {"models": run_mode("models", args.manifests),
+               "template": run_mode("template", args.manifests)}
+
+    write_report("pod_manifest", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
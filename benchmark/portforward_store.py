@@ -0,0 +1,143 @@
+"""
+throughput and latency of storing results through port-forward channels under parallel completions.
+
+    python -m benchmark.portforward_store [--completions 100] [--requests-per-pod 1] [--handshake-ms 20]
+
+The data-side-cars are simulated by one local http server, the port-forward websocket by a tcp
+connection which is opened after handshake-ms (api server round trips of the websocket upgrade).
+
+"legacy" replaces urllib3.util.connection.create_connection and posts with requests, with a new
+port-forward for every request (the behaviour before the PodPortForwardPool). "fresh" uses the pool
+without idle channels, "pooled" reuses the channel of a pod for its following requests
+(e.g. several requests to the side-car of the same workflow).
+"""
+import time
+import socket
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+
+import requests
+import urllib3
+
+from benchmark.common import latency_summary, write_report
+
+from middlelayer.portforward import PodPortForwardPool  # noqa: E402
+
+
+class SideCarHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    store_delay = 0.0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(self.store_delay)
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeForward():
+    opened = 0
+    lock = Lock()
+
+    def __init__(self, address, handshake_delay: float):
+        time.sleep(handshake_delay)
+        with FakeForward.lock:
+            FakeForward.opened += 1
+        self.sock = socket.create_connection(address)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connected = True
+
+    def socket(self, port):
+        return self.sock
+
+    def close(self):
+        self.connected = False
+        self.sock.close()
+
+
+class SideCarServer(ThreadingHTTPServer):
+    # all completions connect at once
+    request_queue_size = 256
+
+
+def legacy_store(open_forward, data: bytes, name: str, namespace: str) -> int:
+    socket_create_connection = urllib3.util.connection.create_connection
+
+    def kubernetes_create_connection(address, *args, **kwargs):
+        dns_name = address[0].split(".")
+        if dns_name[-1] != 'kubernetes':
+            return socket_create_connection(address, *args, **kwargs)
+        return open_forward().socket(address[1])
+
+    urllib3.util.connection.create_connection = kubernetes_create_connection
+    response = requests.post(f"http://{name}.pod.{namespace}.kubernetes:9999/store", data=data)
+    response.close()
+    return response.status_code
+
+
+def run_mode(mode: str, address, completions: int, requests_per_pod: int, handshake_delay: float) -> dict:
+    def open_forward(**_):
+        return FakeForward(address, handshake_delay)
+
+    pool = PodPortForwardPool(max_idle_per_pod=0 if mode == "fresh" else 2,
+                              open_handle=open_forward)
+    socket_create_connection = urllib3.util.connection.create_connection
+
+    def complete(index):
+        latencies = []
+        for _ in range(requests_per_pod):
+            started = time.perf_counter()
+            if mode == "legacy":
+                status_code = legacy_store(open_forward, b"{}", f"pod-{index}", "bench")
+            else:
+                status_code, _ = pool.request("POST", f"pod-{index}", "bench", 9999, "/store", body=b"{}")
+            assert status_code == 200
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    FakeForward.opened = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=completions) as executor:
+        latencies = [x for result in executor.map(complete, range(completions)) for x in result]
+    duration = time.perf_counter() - started
+
+    pool.close()
+    urllib3.util.connection.create_connection = socket_create_connection
+
+    return {"completions": completions,
+            "requests_per_pod": requests_per_pod,
+            "requests_per_s": len(latencies) / duration,
+            "port_forwards": FakeForward.opened,
+            "latency": latency_summary(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--completions", type=int, default=100)
+    parser.add_argument("--requests-per-pod", type=int, default=1)
+    parser.add_argument("--handshake-ms", type=float, default=20)
+    parser.add_argument("--store-ms", type=float, default=5)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    SideCarHandler.store_delay = args.store_ms / 1000
+    server = SideCarServer(("127.0.0.1", 0), SideCarHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    results = {mode: run_mode(mode, server.server_address, args.completions, args.requests_per_pod,
+                              args.handshake_ms / 1000)
+               for mode in ["legacy", "fresh", "pooled"]}
+    server.shutdown()
+
+    write_report("portforward_store", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
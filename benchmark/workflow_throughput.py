@@ -0,0 +1,272 @@
+"""
+end-to-end throughput of ServiceApi and K8sWorkflowBackend against a fake kubernetes api server and a fake s3.
+
+    python -m benchmark.workflow_throughput [--concurrency 10 100 1000] [--run-ms 500] [--baseline report.json]
+
+For every concurrency level the api is started with workflow_api_max_workflows = concurrency, the input of the
+dummy service is uploaded and all workflows are submitted at once through /services/dummy/workflow/execute.
+The fake api server (benchmark.fake_kubernetes) simulates the pods, the data-side-car is a local http server which
+writes the result files into the fake s3 (benchmark.fake_s3) when the backend requests /store over the fake
+port-forward. Reported are submissions per second, time to RUNNING and to FINISHED from the submission, finished
+workflows per minute, the peak number of threads of the api (without the threads of the fakes), the rss of the
+process (fakes included, memory is not returned between the levels, run one level per process for a clean
+rss) and the requests sent to the fakes per workflow.
+With --baseline the ratios of the main metrics to a previous report are added, e.g. for regression tracking.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import threading
+from http.server import BaseHTTPRequestHandler
+from threading import Lock
+from typing import Dict
+from unittest.mock import patch
+
+from benchmark.common import setup_bench_config, latency_summary, write_report, BENCH_HEADERS
+
+setup_bench_config()
+
+import httpx  # noqa: E402
+
+import middlelayer.service_api as service_api_mod  # noqa: E402
+from middlelayer.events import WorkflowEventHub  # noqa: E402
+from middlelayer.models import WorkflowJobPhase  # noqa: E402
+
+from benchmark.fake_kubernetes import (FakeKubernetesApi, FakePortForward, FakeThreadingHTTPServer,  # noqa: E402
+                                       FAKE_THREAD_PREFIX)
+from benchmark.fake_s3 import FakeS3  # noqa: E402
+
+DONE_PHASES = (WorkflowJobPhase.FINISHED, WorkflowJobPhase.CANCELED)
+# metrics compared with --baseline, a ratio > 1 is better for the first ones and worse for the others
+BASELINE_METRICS = {"submissions_per_s": "higher",
+                    "workflows_per_minute": "higher",
+                    "time_to_running.p50_ms": "lower",
+                    "time_to_running.p99_ms": "lower",
+                    "time_to_finished.p50_ms": "lower",
+                    "time_to_finished.p99_ms": "lower",
+                    "peak_api_threads": "lower",
+                    "peak_rss_mb": "lower"}
+
+
+class RecordingEventHub(WorkflowEventHub):
+    """
+    records when every workflow reached a phase for the first time
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timeline_lock = Lock()
+        self.timeline: Dict[str, Dict[WorkflowJobPhase, float]] = {}
+
+    def publish(self, workflow_id, state):
+        now = time.perf_counter()
+        with self.timeline_lock:
+            self.timeline.setdefault(workflow_id, {}).setdefault(state.phase, now)
+        return super().publish(workflow_id, state)
+
+    def get_timeline(self, workflow_id: str) -> Dict[WorkflowJobPhase, float]:
+        with self.timeline_lock:
+            return dict(self.timeline.get(workflow_id, {}))
+
+
+class SideCarHandler(BaseHTTPRequestHandler):
+    """
+    data-side-car of all pods, stores the result files of /store into the fake s3
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    fake_s3: FakeS3 = None
+    store_delay = 0.0
+
+    def do_POST(self):
+        store_info = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.store_delay)
+        for result_file in store_info["result_files"]:
+            self.fake_s3.put(store_info["destination_bucket"],
+                             f"{store_info['destination_path']}/{result_file}",
+                             b"result")
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def get_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # peak instead of current rss, in KB on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def count_api_threads() -> int:
+    return sum(1 for x in threading.enumerate() if not x.name.startswith(FAKE_THREAD_PREFIX))
+
+
+def get_value(results: dict, path: str):
+    for key in path.split("."):
+        results = results.get(key) if isinstance(results, dict) else None
+    return results
+
+
+def compare_baseline(results: dict, baseline_path: str) -> dict:
+    with open(baseline_path, encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)["results"]["levels"]
+
+    comparison = {}
+    for level, level_results in results["levels"].items():
+        if level not in baseline:
+            continue
+        comparison[level] = {}
+        for metric, better in BASELINE_METRICS.items():
+            current, previous = get_value(level_results, metric), get_value(baseline[level], metric)
+            if not current or not previous:
+                continue
+            comparison[level][metric] = {"ratio": current / previous, "better": better}
+    return comparison
+
+
+async def run_level(args, concurrency: int) -> dict:
+    fake_api = FakeKubernetesApi(schedule_delay=args.schedule_ms / 1000,
+                                 start_delay=args.start_ms / 1000,
+                                 run_delay=args.run_ms / 1000,
+                                 delete_delay=args.delete_ms / 1000)
+    kubeconfig = fake_api.write_kubeconfig(fake_api.start())
+    fake_s3 = FakeS3()
+    s3_endpoint = fake_s3.start()
+
+    class Handler(SideCarHandler):
+        pass
+    Handler.fake_s3 = fake_s3
+    Handler.store_delay = args.store_ms / 1000
+    side_car = FakeThreadingHTTPServer(("127.0.0.1", 0), Handler, "side-car")
+    side_car_address = side_car.start()
+
+    workflow_api_config = {"workflow_backend_kubeconfig": kubeconfig,
+                           "workflow_k8s_backend_job_storage_type": args.storage_type}
+    minio_config = {"endpoint": s3_endpoint}
+
+    started_threads = count_api_threads()
+    rss_start = get_rss_bytes()
+
+    with patch.dict(service_api_mod.WORKFLOW_API_CONFIG, workflow_api_config),\
+            patch.dict(service_api_mod.MINIO_CONFIG, minio_config),\
+            patch.object(service_api_mod, "WORKFLOW_API_MAX_WORKFLOWS", concurrency),\
+            patch.object(service_api_mod, "WorkflowEventHub", RecordingEventHub):
+
+        await service_api_mod.startup()
+        api = service_api_mod.client
+        api.workflow_backend.port_forward_pool.open_handle = \
+            lambda **_: FakePortForward(side_car_address, args.handshake_ms / 1000)
+
+        transport = httpx.ASGITransport(app=service_api_mod.service_api)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http_client:
+            response = await http_client.put("/services/dummy/input/env",
+                                             headers=BENCH_HEADERS,
+                                             files={"input_file": ("env", b"KEY=VALUE\nOTHER=${KEY}\n")})
+            assert response.status_code == 200, response.text
+
+            submitted_at: Dict[str, float] = {}
+
+            async def submit():
+                started = time.perf_counter()
+                response = await http_client.post("/services/dummy/workflow/execute", headers=BENCH_HEADERS)
+                assert response.status_code == 200, response.text
+                submitted_at[response.json()["workflow_id"]] = started
+
+            submit_started = time.perf_counter()
+            await asyncio.gather(*[submit() for _ in range(concurrency)])
+            submit_duration = time.perf_counter() - submit_started
+
+            # threads and rss are sampled until every workflow is finished or canceled
+            peak_threads, peak_rss = 0, 0
+            deadline = time.perf_counter() + args.timeout
+            while True:
+                peak_threads = max(peak_threads, count_api_threads())
+                peak_rss = max(peak_rss, get_rss_bytes())
+                timelines = {x: api.event_hub.get_timeline(x) for x in submitted_at}
+                done = [x for x, timeline in timelines.items() if any(phase in timeline for phase in DONE_PHASES)]
+                if len(done) == concurrency or time.perf_counter() > deadline:
+                    break
+                await asyncio.sleep(args.sample_interval)
+
+        await service_api_mod.shutdown()
+        api.io_executor.shutdown()
+
+    fake_api.stop()
+    fake_s3.stop()
+    side_car.shutdown()
+    side_car.server_close()
+
+    time_to_running = [timeline[WorkflowJobPhase.RUNNING] - submitted_at[x]
+                       for x, timeline in timelines.items() if WorkflowJobPhase.RUNNING in timeline]
+    finished_at = {x: timeline[WorkflowJobPhase.FINISHED]
+                   for x, timeline in timelines.items() if WorkflowJobPhase.FINISHED in timeline}
+    time_to_finished = [finished_at[x] - submitted_at[x] for x in finished_at]
+    duration = max(finished_at.values(), default=submit_started) - submit_started
+
+    return {"concurrency": concurrency,
+            "submissions_per_s": concurrency / submit_duration,
+            "finished": len(finished_at),
+            "canceled": sum(1 for x in timelines.values() if WorkflowJobPhase.CANCELED in x),
+            "unfinished": concurrency - len(done),
+            "workflows_per_minute": len(finished_at) / duration * 60 if duration > 0 else 0.0,
+            "time_to_running": latency_summary(time_to_running),
+            "time_to_finished": latency_summary(time_to_finished),
+            "threads_before": started_threads,
+            "peak_api_threads": peak_threads,
+            "rss_before_mb": rss_start / 1024 ** 2,
+            "peak_rss_mb": peak_rss / 1024 ** 2,
+            "k8s_requests_per_workflow": {method: count / concurrency for method, count in fake_api.requests.items()},
+            "s3_requests_per_workflow": {method: count / concurrency for method, count in fake_s3.requests.items()}}
+
+
+async def run_benchmark(args) -> dict:
+    results = {"config": {"schedule_ms": args.schedule_ms,
+                          "start_ms": args.start_ms,
+                          "run_ms": args.run_ms,
+                          "delete_ms": args.delete_ms,
+                          "handshake_ms": args.handshake_ms,
+                          "store_ms": args.store_ms,
+                          "storage_type": args.storage_type},
+               "levels": {}}
+    for concurrency in args.concurrency:
+        results["levels"][str(concurrency)] = await run_level(args, concurrency)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--schedule-ms", type=float, default=50)
+    parser.add_argument("--start-ms", type=float, default=200)
+    parser.add_argument("--run-ms", type=float, default=500)
+    parser.add_argument("--delete-ms", type=float, default=100)
+    parser.add_argument("--handshake-ms", type=float, default=20)
+    parser.add_argument("--store-ms", type=float, default=20)
+    parser.add_argument("--storage-type", default="EMPTY_DIR", choices=["EMPTY_DIR", "PERSISTENT_VOLUME_CLAIM"])
+    parser.add_argument("--sample-interval", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    # the debug logs of the api would dominate the output and the measured time
+    logging.disable(getattr(logging, args.log_level) - 1)
+
+    results = asyncio.run(run_benchmark(args))
+    if args.baseline:
+        results["baseline"] = compare_baseline(results, args.baseline)
+    write_report("workflow_throughput", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,196 @@
 
 import os
+import sys
 import json
+import hashlib
+import logging
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from functools import cached_property
+from threading import Thread, Condition, Lock
+from typing import List, Dict, Any, Callable, NamedTuple, Tuple
+
+from pydantic_core import to_json
 
 from middlelayer.models import ServiceDescription
 
+formatter = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+stdout_handle = logging.StreamHandler(sys.stdout)
+stdout_handle.setFormatter(formatter)
+
+asset_logger = logging.getLogger("asset_loader")
+asset_logger.setLevel(level=logging.DEBUG)
+asset_logger.addHandler(stdout_handle)
+
+
+class SerializedResponse(NamedTuple):
+    body: bytes
+    # strong etag of the body, the same for every replica and restart of the api
+    etag: str
+
+
+def serialize_response(body: bytes) -> SerializedResponse:
+    return SerializedResponse(body=body, etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+
+class AssetCatalog():
+    """
+    one loaded version of the asset directory, it is never modified but replaced as a whole
+    """
+
+    def __init__(self,
+                 version: int = 0,
+                 descriptions: Dict[str, ServiceDescription] = None,
+                 asset_info: Dict[str, Dict[str, Any]] = None,
+                 file_signatures: Dict[str, Tuple[int, int]] = None):
+        self.version = version
+        self.descriptions: Dict[str, ServiceDescription] = descriptions or {}
+        self.asset_info: Dict[str, Dict[str, Any]] = asset_info or {}
+        # file name -> (mtime_ns, size), a file is only parsed again if its signature changed
+        self.file_signatures: Dict[str, Tuple[int, int]] = file_signatures or {}
+
+    # the json of the catalog endpoints is serialized once per version, on the first request
+    @cached_property
+    def assets_response(self) -> SerializedResponse:
+        return serialize_response(to_json(list(self.asset_info.values())))
+
+    @cached_property
+    def description_responses(self) -> Dict[str, SerializedResponse]:
+        return {service_id: serialize_response(description.model_dump_json(exclude_none=True).encode())
+                for service_id, description in self.descriptions.items()}
+
 
 class StaticAssetLoader():
+    """
+    loads the service descriptions of the asset directory (<service_id>.json).
+
+    With reload_interval > 0 a thread started by start() compares mtime and size of the json files every interval
+    seconds and loads a new catalog if a file was added, changed or removed, so services are added without a restart
+    of the api. Only changed files are parsed, asset_loaded_handle is called with each of them before the new
+    catalog replaces the previous one. A file which can not be parsed on reload keeps its previous description.
+    """
 
     def __init__(self, **kwargs):
-        kwargs.get("static_asset_directory")
         self.static_asset_directory = kwargs.get("static_asset_directory", "./config/assets")
-        self.asset_info = list()
-        self.assets_descriptions: Dict[str, ServiceDescription] = dict()
-        self.__read_json_files()
+        # called with every loaded ServiceDescription
+        self.asset_loaded_handle: Callable[[ServiceDescription], None] = kwargs.get("asset_loaded_handle")
+        # seconds between the checks of the asset directory, 0 disables the reload
+        self.reload_interval: float = kwargs.get("reload_interval", 0)
 
-    def __read_json_files(self):
-        json_files = [file for file in os.listdir(self.static_asset_directory) if file.endswith('.json')]
+        self.catalog = AssetCatalog()
+        self.reload_lock = Lock()
+        self.condition = Condition()
+        self.running = False
+        self.worker: Thread = None
 
-        for file_name in json_files:
-            file_path = os.path.join(self.static_asset_directory, file_name)
-            (asset_id, _) = file_name.split(".")
-            with open(file_path) as json_file:
-                data = json.load(json_file)
-                # Process the data from the JSON file
+        self.reload(strict=True)
 
-                self.asset_info.append({
+    @property
+    def asset_info(self) -> List[Dict[str, Any]]:
+        return list(self.catalog.asset_info.values())
+
+    @property
+    def assets_descriptions(self) -> Dict[str, ServiceDescription]:
+        return self.catalog.descriptions
+
+    def start(self):
+        with self.condition:
+            if self.running or self.reload_interval <= 0:
+                return
+            self.running = True
+        self.worker = Thread(target=self.__run_loop,
+                             name="asset_loader",
+                             daemon=True)
+        self.worker.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def reload(self, strict: bool = False) -> bool:
+        """
+        loads a new catalog if the asset directory changed, returns False if nothing changed.
+        With strict a file which can not be parsed raises, e.g. at the start of the api.
+        """
+        with self.reload_lock:
+            previous = self.catalog
+            file_signatures = self.__scan()
+            if file_signatures == previous.file_signatures:
+                return False
+
+            descriptions = {}
+            asset_info = {}
+            loaded = []
+            for file_name, signature in file_signatures.items():
+                asset_id = os.path.splitext(file_name)[0]
+                if previous.file_signatures.get(file_name) == signature and asset_id in previous.descriptions:
+                    descriptions[asset_id] = previous.descriptions[asset_id]
+                    asset_info[asset_id] = previous.asset_info[asset_id]
+                    continue
+
+                try:
+                    description = self.__read_json_file(file_name)
+                except Exception:
+                    if strict:
+                        raise
+                    asset_logger.exception("asset %s not loaded", file_name)
+                    if asset_id in previous.descriptions:
+                        descriptions[asset_id] = previous.descriptions[asset_id]
+                        asset_info[asset_id] = previous.asset_info[asset_id]
+                    continue
+
+                descriptions[asset_id] = description
+                asset_info[asset_id] = {
                     "id": asset_id,
                     "start_date": datetime.now(),
-                    "end_date:": datetime.now() + timedelta(days=7)})
+                    "end_date:": datetime.now() + timedelta(days=7)}
+                loaded.append(description)
 
-                self.assets_descriptions[asset_id] = ServiceDescription(**data)
+            # the service is prepared before requests can see its new description
+            if self.asset_loaded_handle:
+                for description in loaded:
+                    self.asset_loaded_handle(description)
 
-    def get_assets(self) -> Dict[str, Dict]:
+            self.catalog = AssetCatalog(version=previous.version + 1,
+                                        descriptions=descriptions,
+                                        asset_info=asset_info,
+                                        file_signatures=file_signatures)
+
+        removed = previous.descriptions.keys() - descriptions.keys()
+        asset_logger.info("asset catalog version %d: %d services, %d loaded, %d removed",
+                          self.catalog.version, len(descriptions), len(loaded), len(removed))
+        return True
+
+    def get_catalog(self) -> AssetCatalog:
+        return self.catalog
+
+    def get_assets(self) -> List[Dict[str, Any]]:
         return self.asset_info
 
     def get_assets_description(self, asset_id):
-        return self.assets_descriptions.get(asset_id)
+        return self.catalog.descriptions.get(asset_id)
+
+    def __scan(self) -> Dict[str, Tuple[int, int]]:
+        file_signatures = {}
+        with os.scandir(self.static_asset_directory) as entries:
+            for entry in entries:
+                if entry.name.endswith('.json') and entry.is_file():
+                    stat = entry.stat()
+                    file_signatures[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return dict(sorted(file_signatures.items()))
+
+    def __read_json_file(self, file_name: str) -> ServiceDescription:
+        with open(os.path.join(self.static_asset_directory, file_name)) as json_file:
+            return ServiceDescription(**json.load(json_file))
+
+    def __run_loop(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: not self.running, timeout=self.reload_interval)
+                if not self.running:
+                    return
+            try:
+                self.reload()
+            except Exception:
+                asset_logger.exception("reload of %s failed", self.static_asset_directory)
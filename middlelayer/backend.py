@@ -1,27 +1,36 @@
-from typing import List, Dict, Union, Callable
-from threading import Thread, Event
+from typing import AsyncIterator, List, Dict, Union, Callable
+from threading import Event, Condition, Thread
+from concurrent.futures import ThreadPoolExecutor
 from uuid import uuid4
-from io import StringIO
-from enum import Enum
 
 import sys
+import time
 import logging
 import json
 
-import dotenv
 
 
 from middlelayer.models import (
     ServiceResourceType, WorkflowResource, BaseModel, WorkflowStoreInfo, WorkflowInputResource,
-    K8sBackendConfig, K8sStorageType)
-
+    K8sBackendConfig, K8sStorageType, WorkflowJobPhase, ServiceDescription, WorkflowCallbackInfo,
+    WorkflowStoreProgress, WorkflowTimelineEntry)
+
+from middlelayer.registry import WorkflowRegistry, WorkflowRecord
+from middlelayer.env_parser import parse_env_stream
+from middlelayer.reconciler import ResourceReconciler, ReconcilerMetrics
+from middlelayer.log_stream import PodLogStreamer
+from middlelayer.executor import BlockingIOExecutor
+from middlelayer.informer import PodInformer
+from middlelayer.portforward import PodPortForwardPool
 from middlelayer.k8sClient import K8sPodStateData
-from middlelayer.k8sClient import k8s_create_config_map, k8s_delete_config_map,\
-    k8s_create_pod_manifest, k8s_create_pod, k8s_delete_pod, \
+from middlelayer.k8sClient import k8s_create_config_map, k8s_delete_config_maps,\
+    k8s_create_pod_manifest_template, k8s_render_pod_manifest, K8sPodManifestTemplate, \
+    k8s_create_pod, k8s_delete_pods, \
     k8s_setup_config,\
-    k8s_watch_pod_events, k8s_get_pod_log, \
-    k8s_portforward, \
-    k8s_create_persistent_volume_claim, k8s_delete_persistent_volume_claim
+    k8s_get_pod_log, k8s_pod_exists, \
+    k8s_create_persistent_volume_claim, k8s_delete_persistent_volume_claims, \
+    k8s_create_secret, k8s_delete_secrets, \
+    k8s_list_resource_labels, k8s_close_api_client
 
 formatter = logging.Formatter(
     '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -37,17 +46,21 @@ workflow_backend_logger.addHandler(stdout_handle)
 # workflow_backend_logger.addHandler(stderr_hanlde)
 
 
-class WorkflowJobPhase(str, Enum):
-    PREPARING = "PREPARING"
-    RUNNING = "RUNNING"
-    STORING = "STORING"
-    FINISHED = "FINISHED"
-    CANCELED = "CANCELED"
+DATA_SIDE_CAR_PORT = 9999
+# workflow ids per set based label selector, long selectors are rejected by the api server
+LABEL_SELECTOR_CHUNK_SIZE = 20
 
 
 class WorkflowJobState(BaseModel):
     phase: WorkflowJobPhase = WorkflowJobPhase.PREPARING
     worker_state: Union[K8sPodStateData, None] = None
+    queue_position: Union[int, None] = None
+    # seconds from the start of the cleanup until all resources of the workflow were gone
+    cleanup_seconds: Union[float, None] = None
+    # reported by the data-side-car while it stores the result
+    store_progress: Union[WorkflowStoreProgress, None] = None
+    # phase transitions and pod events with their times, in the status response
+    timeline: Union[List[WorkflowTimelineEntry], None] = None
 
     class Config:
         json_encoders = {WorkflowJobPhase: lambda p: p.name}
@@ -59,7 +72,9 @@ class WorkflowInputConfig(BaseModel):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.id = str(uuid4())
+        # keep the id of restored input configs
+        if self.id is None:
+            self.id = str(uuid4())
 
 
 class K8sJobData(BaseModel):
@@ -78,11 +93,27 @@ class K8sData(BaseModel):
     data: Union[Dict[str, K8sJobData], None]
 
 
+class MonitorMetrics(BaseModel):
+    # workflows whose pod is watched by the informer
+    monitored_workflows: int = 0
+    # busy threads storing the results of finished workflows and the results waiting for one of them
+    monitor_threads: int = 0
+    monitor_queue_depth: int = 0
+    # workflows whose resources are deleted but not yet gone
+    pending_cleanups: int = 0
+    # idle port-forward channels to the data-side-cars
+    idle_port_forwards: int = 0
+
+
 class WorkflowBackend():
 
     def __init__(self):
         pass
 
+    def prepare_service(self,
+                        service_description: ServiceDescription):
+        pass
+
     def handle_input(self,
                      workflow_id: str,
                      input_resource: WorkflowInputResource,
@@ -92,7 +123,10 @@ class WorkflowBackend():
     def commit_workflow(self,
                         workflow_id: str,
                         workflow_resource: WorkflowResource,
-                        workflow_finished_handle: Callable):
+                        workflow_finished_handle: Callable,
+                        service_id: str = None,
+                        workflow_store_info: WorkflowStoreInfo = None,
+                        callback_info: WorkflowCallbackInfo = None):
         pass
 
     def stop_workflow(self,
@@ -104,81 +138,180 @@ class WorkflowBackend():
                      workflow_store_info: WorkflowStoreInfo) -> None:
         pass
 
+    def set_store_progress(self,
+                           workflow_id: str,
+                           store_progress: WorkflowStoreProgress) -> Union[WorkflowJobState, None]:
+        pass
+
+    def stream_log(self,
+                   workflow_id: str,
+                   after: str = None,
+                   follow: bool = True,
+                   tail_lines: int = None) -> AsyncIterator[bytes]:
+        pass
+
     def get_status(self,
                    workflow_id: str,
                    verbose_level: int) -> Union[WorkflowJobState, str]:
         pass
 
     def cleanup(self,
-                workflow_id: str):
+                workflow_id: str,
+                phase: WorkflowJobPhase = WorkflowJobPhase.FINISHED):
+        pass
+
+    def cleanup_workflows(self,
+                          workflow_ids: List[str],
+                          phase: WorkflowJobPhase = WorkflowJobPhase.FINISHED):
+        for workflow_id in workflow_ids:
+            self.cleanup(workflow_id=workflow_id, phase=phase)
+
+    def recover_workflow(self,
+                         workflow_id: str,
+                         workflow_finished_handle: Callable) -> bool:
+        pass
+
+    def start_reconciler(self,
+                         adopt_handle: Callable[[WorkflowRecord], bool]):
+        pass
+
+    def get_reconciler_metrics(self) -> Union[ReconcilerMetrics, None]:
+        pass
+
+    def get_monitor_metrics(self) -> Union[MonitorMetrics, None]:
+        pass
+
+    def close(self):
         pass
 
 
 class SimpleDB():
-    def __init__(self):
+    """
+    in-memory cache of the job data, every change is written through to the workflow_registry
+    and job data of a previous run is loaded from it on a cache miss
+    """
+
+    def __init__(self, workflow_registry: WorkflowRegistry = None):
         self.data: Dict[str, K8sJobData] = dict()
+        self.workflow_registry = workflow_registry
+
+    def __contains__(self, key: str) -> bool:
+        if key in self.data:
+            return True
+        if self.workflow_registry is None:
+            return False
+
+        record = self.workflow_registry.get(key)
+        if record is None or record.backend_data is None:
+            return False
+        self.data[key] = K8sJobData.model_validate(record.backend_data)
+        return True
+
+    def persist(self, key: str, phase: WorkflowJobPhase = None):
+        """
+        writes the job data through, the phase of the registry record only if the backend changed it,
+        e.g. a workflow canceled by the api stays canceled
+        """
+        if self.workflow_registry is None or key not in self.data:
+            return
+        fields = {"backend_data": self.data[key].model_dump(mode="json", exclude={"job_monitor_event"})}
+        if phase is not None:
+            fields["phase"] = phase
+        self.workflow_registry.update(key, **fields)
 
     def append_config_map(self, key: str, data):
-        if key not in self.data:
+        if key not in self:
             self.data[key] = K8sJobData()
         self.data[key].config_maps.append(data)
+        self.persist(key)
 
     def insert_input_resource(self, key: str, input_resource: WorkflowInputResource) -> None:
-        if key not in self.data:
+        if key not in self:
             self.data[key] = K8sJobData()
         if not self.data[key].input_config:
             self.data[key].input_config = WorkflowInputConfig()
         self.data[key].input_config.inputs.append(input_resource)
+        self.persist(key)
 
     def get_config_maps(self, key):
-        if key not in self.data:
+        if key not in self:
             return []
         return self.data[key].config_maps
 
     def get_input_config(self, key: str) -> WorkflowInputConfig:
-        if key not in self.data:
+        if key not in self:
             return None
         return self.data[key].input_config
 
     def get_job_data(self, key: str) -> K8sJobData:
-        if key not in self.data:
+        if key not in self:
             return None
         return self.data.get(key)
 
     def set_job_volume_claim_id(self, key: str, volume_claim_id: str):
-        if key not in self.data:
+        if key not in self:
             self.data[key] = K8sJobData()
         self.data.get(key).volume_claim_id = volume_claim_id
+        self.persist(key)
 
     def insert_job_id(self, key: str, value: str):
-        if key not in self.data:
+        if key not in self:
             self.data[key] = K8sJobData()
         self.data.get(key).job_id = value
+        self.persist(key)
 
     def insert_job_monitor_event(self, key, event: Event):
-        if key not in self.data:
+        if key not in self:
             self.data[key] = K8sJobData()
         self.data.get(key).job_monitor_event = event
 
     def get_job_monitor_event(self, key) -> Event:
-        if key not in self.data:
+        if key not in self:
             return None
         return self.data.get(key).job_monitor_event
 
     def insert_workflow_state(self, workflow_id: str, job_state: WorkflowJobState):
-        if workflow_id not in self.data:
+        if workflow_id not in self:
             self.data[workflow_id] = K8sJobData()
         self.data.get(workflow_id).job_state = job_state
+        self.persist(workflow_id, phase=job_state.phase)
 
     def get_workflow_state(self, workflow_id: str) -> WorkflowJobState:
-        if workflow_id not in self.data:
+        if workflow_id not in self:
             return None
         return self.data.get(workflow_id).job_state
 
-    def set_workflow_job_finished(self, workflow_id: str):
-        if workflow_id not in self.data:
+    def get_registry_state(self, workflow_id: str) -> Union[WorkflowJobState, None]:
+        """
+        state of a workflow without job data, e.g. canceled while queued or not yet dispatched
+        """
+        if self.workflow_registry is None:
+            return None
+        record = self.workflow_registry.get(workflow_id)
+        if record is None:
+            return None
+        return WorkflowJobState(phase=record.phase)
+
+    def set_workflow_job_phase(self, workflow_id: str, phase: WorkflowJobPhase):
+        if workflow_id not in self:
             return None
-        self.data.get(workflow_id).job_state.phase = WorkflowJobPhase.FINISHED
+        self.data.get(workflow_id).job_state.phase = phase
+        self.persist(workflow_id, phase=phase)
+
+    def set_cleanup_seconds(self, workflow_id: str, cleanup_seconds: float):
+        if workflow_id not in self:
+            return None
+        self.data.get(workflow_id).job_state.cleanup_seconds = cleanup_seconds
+        self.persist(workflow_id)
+
+    def set_store_progress(self, workflow_id: str, store_progress: WorkflowStoreProgress):
+        if workflow_id not in self:
+            return None
+        job_state = self.data.get(workflow_id).job_state
+        job_state.phase = WorkflowJobPhase.STORING
+        job_state.store_progress = store_progress
+        self.persist(workflow_id, phase=WorkflowJobPhase.STORING)
+        return job_state
 
     def delete_entry(self, key):
         if key not in self.data:
@@ -193,9 +326,13 @@ class K8sWorkflowBackend(WorkflowBackend):
                  kubeconfig=None,
                  image_pull_secret=None,
                  data_side_car_image=None,
-                 k8s_backend_config: K8sBackendConfig = None):
-        self.dummy_db = SimpleDB()
+                 k8s_backend_config: K8sBackendConfig = None,
+                 workflow_registry: WorkflowRegistry = None,
+                 workflow_state_handle: Callable[[str, WorkflowJobState], None] = None):
+        self.dummy_db = SimpleDB(workflow_registry=workflow_registry)
         self.namespace = namespace
+        # receives every state observed by the workflow monitors
+        self.workflow_state_handle = workflow_state_handle
 
         if k8s_backend_config:
             self.k8s_backend_config = K8sBackendConfig.model_validate(k8s_backend_config.model_dump(exclude_unset=True,
@@ -204,12 +341,52 @@ class K8sWorkflowBackend(WorkflowBackend):
         else:
             self.k8s_backend_config = K8sBackendConfig()
 
+        self.log_streamer = PodLogStreamer(buffer_lines=self.k8s_backend_config.log_buffer_lines,
+                                           max_follows=self.k8s_backend_config.log_stream_workers,
+                                           read_workers=self.k8s_backend_config.log_read_workers)
+
+        # requests to the data-side-car of the pods
+        self.port_forward_pool = PodPortForwardPool(
+            connect_timeout=self.k8s_backend_config.port_forward_connect_timeout,
+            read_timeout=self.k8s_backend_config.port_forward_read_timeout,
+            idle_timeout=self.k8s_backend_config.port_forward_idle_timeout)
+
+        # one watch for the pods of all workflows, started with the first monitored workflow
+        self.informer = PodInformer(namespace=self.namespace,
+                                    label_selector=self.__get_label_selector())
+        # counts its running and queued tasks for the monitor metrics
+        self.monitor_executor = BlockingIOExecutor(max_workers=self.k8s_backend_config.monitor_workers,
+                                                   name="workflow_finished")
+
+        # the delete requests of the resource kinds are sent in parallel
+        self.cleanup_executor = ThreadPoolExecutor(max_workers=4,
+                                                   thread_name_prefix="workflow_cleanup")
+        # workflow_id -> start of the cleanup, until all resources of the workflow are gone
+        self.pending_cleanups: Dict[str, float] = {}
+        self.cleanup_condition = Condition()
+        self.cleanup_confirmer: Thread = None
+        self.running = True
+
+        self.reconciler: ResourceReconciler = None
+
+        # service_id -> precompiled parts of the pod manifests of the service
+        self.manifest_templates: Dict[str, K8sPodManifestTemplate] = {}
+
         k8s_setup_config(
             k8s_backend_config=self.k8s_backend_config,
             config_file=kubeconfig,
             image_pull_secret=image_pull_secret,
             data_side_car_image=data_side_car_image)
 
+    def prepare_service(self,
+                        service_description: ServiceDescription):
+        """
+        compiles the pod manifest template of a service, called when the service description is loaded
+        """
+        self.manifest_templates[service_description.service_id] = k8s_create_pod_manifest_template(
+            job_config=service_description.workflow_resource,
+            input_resources=service_description.inputs)
+
     def handle_input(self,
                      workflow_id: str,
                      input_resource: WorkflowInputResource,
@@ -217,12 +394,17 @@ class K8sWorkflowBackend(WorkflowBackend):
         """
         In case for environment data create a config_map.
         For data create a list which will be downloaded by the init container
+
+        get_data_handle(max_bytes) returns the chunks of an environment input, the config map is built while
+        they are parsed and an input larger than config_map_max_bytes is rejected (EnvironmentInputError)
         """
 
         if input_resource.type is ServiceResourceType.environment:
             config_map_id = str(uuid4())
-            config_map_data = dict(dotenv.dotenv_values(
-                stream=StringIO(get_data_handle())))
+            max_bytes = self.k8s_backend_config.config_map_max_bytes
+            config_map_data = parse_env_stream(get_data_handle(max_bytes=max_bytes),
+                                               max_bytes=max_bytes,
+                                               name=f"environment input {input_resource.resource_name}")
 
             k8s_create_config_map(
                 name=config_map_id,
@@ -236,7 +418,15 @@ class K8sWorkflowBackend(WorkflowBackend):
 
     def commit_workflow(self, workflow_id,
                         workflow_resource: WorkflowResource,
-                        workflow_finished_handle: Callable):
+                        workflow_finished_handle: Callable,
+                        service_id: str = None,
+                        workflow_store_info: WorkflowStoreInfo = None,
+                        callback_info: WorkflowCallbackInfo = None):
+        """
+        creates the pod of the workflow. With callback_info the data-side-car gets the store info and the
+        callback of the workflow at creation (a secret as environment), it stores the result on its own
+        and reports to the callback instead of waiting for store_result.
+        """
         job_id = str(uuid4())
 
         workflow_lables = self.__get_lable(
@@ -266,15 +456,27 @@ class K8sWorkflowBackend(WorkflowBackend):
             else:
                 raise ValueError("unknown k8s storage type")
 
-        pod_manifest = k8s_create_pod_manifest(
+        store_secret_id = None
+        if callback_info and workflow_store_info and workflow_resource.worker_image_output_directory:
+            store_secret_id = str(uuid4())
+            k8s_create_secret(
+                name=store_secret_id,
+                namespace=self.namespace,
+                data={"WORKFLOW_STORE_INFO": workflow_store_info.json(),
+                      "WORKFLOW_CALLBACK_URL": callback_info.url,
+                      "WORKFLOW_CALLBACK_TOKEN": callback_info.token},
+                labels=workflow_lables)
+
+        pod_manifest = k8s_render_pod_manifest(
+            template=self.__get_manifest_template(service_id, workflow_resource),
             job_uuid=job_id,
-            job_config=workflow_resource,
             config_map_ref=config_map_ids,
             input_config_ref=input_config_id,
             input_resources=input_resources,
             job_namespace=self.namespace,
             persistent_volume_claim_id=persistent_volume_claim_id,
-            labels=workflow_lables
+            labels=workflow_lables,
+            store_secret_ref=store_secret_id
         )
 
         k8s_create_pod(
@@ -287,56 +489,170 @@ class K8sWorkflowBackend(WorkflowBackend):
 
         # TODO if workflow_resource.type is BATCH
         # difference between interactive and long running job
-        self.__create_monitor_thread(
+        self.__create_monitor(
             workflow_id=workflow_id,
             workflow_finished_handle=workflow_finished_handle
         )
 
-    def cleanup(self, workflow_id):
+    def cleanup(self, workflow_id, phase: WorkflowJobPhase = WorkflowJobPhase.FINISHED):
         """
-        removes all k8s resources (pod and configmaps) for a specific workflow
+        removes all k8s resources (pod, configmaps, secrets and volume claim) of a specific workflow.
+        Every resource kind is deleted by the workflow-id label with one request, the requests run
+        in parallel. The removal is confirmed in the background, see cleanup_seconds of the job state.
+        The workflow ends in the given phase, CANCELED if it was stopped.
         """
-        job_data = self.dummy_db.get_job_data(workflow_id)
+        self.cleanup_workflows([workflow_id], phase=phase)
 
-        if job_data is None:
+    def cleanup_workflows(self, workflow_ids: List[str], phase: WorkflowJobPhase = WorkflowJobPhase.FINISHED):
+        """
+        cleanup of several workflows, e.g. the deferred cleanups due at the same time.
+        Every resource kind is deleted with one request per LABEL_SELECTOR_CHUNK_SIZE workflows
+        (set based label selector).
+        """
+        workflow_ids = [x for x in workflow_ids if self.dummy_db.get_job_data(x) is not None]
+        if not workflow_ids:
             return
 
-        for config_map_id in job_data.config_maps:
-            k8s_delete_config_map(config_map_id,
-                                  self.namespace)
-
-        if job_data.input_config:
-            k8s_delete_config_map(
-                name=job_data.input_config.id,
-                namespace=self.namespace
-            )
+        started = time.perf_counter()
+        for workflow_id in workflow_ids:
+            job_data = self.dummy_db.get_job_data(workflow_id)
+            if job_data.job_monitor_event:
+                self._cleanup_monitor(
+                    workflow_id=workflow_id)
+            if job_data.job_id:
+                self.port_forward_pool.close_pod(pod_name=job_data.job_id,
+                                                 namespace=self.namespace)
+
+        if len(workflow_ids) == 1:
+            self.delete_resources(workflow_ids[0])
+        else:
+            self.__delete_resources(*self.__get_workflows_label_selectors(workflow_ids))
 
-        if job_data.volume_claim_id:
-            k8s_delete_persistent_volume_claim(name=job_data.volume_claim_id,
-                                               namespace=self.namespace)
+        for workflow_id in workflow_ids:
+            self.dummy_db.set_workflow_job_phase(workflow_id, phase)
+            self.__confirm_cleanup(workflow_id, started)
 
-        if job_data.job_id:
-            k8s_delete_pod(
-                name=job_data.job_id,
-                namespace=self.namespace)
+    def delete_resources(self, workflow_id: str):
+        """
+        deletes all resources labelled with the workflow_id, also those of workflows without job data
+        """
+        self.__delete_resources(self.__get_label_selector(workflow_id=workflow_id))
+
+    def __delete_resources(self, *label_selectors: str):
+        deletions = [self.cleanup_executor.submit(delete_handle,
+                                                  namespace=self.namespace,
+                                                  label_selector=label_selector)
+                     for label_selector in label_selectors
+                     for delete_handle in (k8s_delete_pods,
+                                           k8s_delete_config_maps,
+                                           k8s_delete_persistent_volume_claims,
+                                           k8s_delete_secrets)]
+        for deletion in deletions:
+            deletion.result()
+
+    def is_monitored(self, workflow_id: str) -> bool:
+        """
+        True if this process monitors the pod of the workflow or still holds its resources
+        """
+        # only the in-memory data, job data restored from the registry has no monitor
+        job_data = self.dummy_db.data.get(workflow_id)
+        return job_data is not None \
+            and job_data.job_monitor_event is not None \
+            and not job_data.job_monitor_event.is_set()
+
+    def start_reconciler(self,
+                         adopt_handle: Callable[[WorkflowRecord], bool]):
+        if self.dummy_db.workflow_registry is None or self.reconciler is not None:
+            return
 
-        if job_data.job_monitor_event:
-            self._cleanup_monitor(
-                workflow_id=workflow_id)
+        self.reconciler = ResourceReconciler(
+            namespace=self.namespace,
+            label_selector=self.__get_label_selector(),
+            workflow_registry=self.dummy_db.workflow_registry,
+            delete_handle=self.delete_resources,
+            adopt_handle=adopt_handle,
+            is_monitored_handle=self.is_monitored,
+            interval=self.k8s_backend_config.reconcile_interval,
+            orphan_grace_period=self.k8s_backend_config.reconcile_orphan_grace_period,
+            finished_grace_period=self.k8s_backend_config.reconcile_finished_grace_period,
+            page_size=self.k8s_backend_config.reconcile_page_size)
+        self.reconciler.start()
+
+    def get_reconciler_metrics(self) -> Union[ReconcilerMetrics, None]:
+        if self.reconciler is None:
+            return None
+        return self.reconciler.get_metrics()
+
+    def get_monitor_metrics(self) -> MonitorMetrics:
+        with self.cleanup_condition:
+            pending_cleanups = len(self.pending_cleanups)
+        monitor_stats = self.monitor_executor.get_stats()
+        return MonitorMetrics(monitored_workflows=self.informer.get_handler_count(),
+                              monitor_threads=monitor_stats["running"],
+                              monitor_queue_depth=monitor_stats["queued"],
+                              pending_cleanups=pending_cleanups,
+                              idle_port_forwards=self.port_forward_pool.get_idle_count())
+
+    def recover_workflow(self,
+                         workflow_id: str,
+                         workflow_finished_handle: Callable) -> bool:
+        """
+        reattaches the monitor to the pod of a workflow started before a restart of the api.
+        Returns False if the workflow has no pod (anymore).
+        """
+        job_data = self.dummy_db.get_job_data(workflow_id)
+        if job_data is None or job_data.job_id is None:
+            return False
+
+        if not k8s_pod_exists(name=job_data.job_id,
+                              namespace=self.namespace):
+            workflow_backend_logger.info("pod %s of workflow %s is gone",
+                                         job_data.job_id, workflow_id)
+            return False
+
+        workflow_backend_logger.info("reattach monitor to pod %s of workflow %s",
+                                     job_data.job_id, workflow_id)
+        # the watch starts with the current state of the pod, a terminated worker is stored right away
+        self.__create_monitor(
+            workflow_id=workflow_id,
+            workflow_finished_handle=workflow_finished_handle
+        )
+        return True
 
-        self.dummy_db.set_workflow_job_finished(workflow_id)
+    def close(self):
+        """
+        stops the pod informer and closes the connections to the api server
+        """
+        self.informer.stop()
+        if self.reconciler is not None:
+            self.reconciler.stop()
+        self.monitor_executor.shutdown(wait=False)
+        self.cleanup_executor.shutdown(wait=False)
+        self.log_streamer.close()
+        self.port_forward_pool.close()
+        with self.cleanup_condition:
+            self.running = False
+            self.cleanup_condition.notify_all()
+        k8s_close_api_client()
 
     def stop_workflow(self,
                       workflow_id: str):
 
         stop_event = self.dummy_db.get_job_monitor_event(key=workflow_id)
         stop_event.wait()
-        self.cleanup(workflow_id=workflow_id)
+        self.cleanup(workflow_id=workflow_id, phase=WorkflowJobPhase.CANCELED)
 
     def get_status(self,
                    workflow_id: str,
                    verbose_level: int) -> Union[WorkflowJobState, str]:
         job_data = self.dummy_db.get_job_data(workflow_id)
+        if job_data is None:
+            job_state = self.dummy_db.get_registry_state(workflow_id)
+            if job_state is None:
+                raise KeyError(f"invalid workflow_id: {workflow_id}")
+            if verbose_level > 0:
+                return f"workflow has no worker, its phase is {job_state.phase.value}"
+            return job_state
 
         if verbose_level == 1:
             return k8s_get_pod_log(
@@ -352,6 +668,26 @@ class K8sWorkflowBackend(WorkflowBackend):
 
         return job_data.job_state
 
+    def stream_log(self,
+                   workflow_id: str,
+                   after: str = None,
+                   follow: bool = True,
+                   tail_lines: int = None) -> AsyncIterator[bytes]:
+        """
+        incremental log of the worker container, every line starts with its timestamp,
+        which is the resume token `after` of the next request
+        """
+        job_data = self.dummy_db.get_job_data(workflow_id)
+        if job_data is None or job_data.job_id is None:
+            raise KeyError(f"workflow has no worker: {workflow_id}")
+
+        return self.log_streamer.read(pod_name=job_data.job_id,
+                                      container="worker",
+                                      namespace=self.namespace,
+                                      after=after,
+                                      follow=follow,
+                                      tail_lines=tail_lines)
+
     def store_result(self,
                      workflow_id,
                      workflow_store_info: WorkflowStoreInfo) -> None:
@@ -367,9 +703,12 @@ class K8sWorkflowBackend(WorkflowBackend):
                         \tworkflow_store_info: %s""",
                                       workflow_id, workflow_store_info.json())
 
-        status_code = k8s_portforward(data=workflow_store_info.json(),
-                                      name=job_data.job_id,
-                                      namespace=self.namespace)
+        status_code, _ = self.port_forward_pool.request(method="POST",
+                                                        pod_name=job_data.job_id,
+                                                        namespace=self.namespace,
+                                                        port=DATA_SIDE_CAR_PORT,
+                                                        path="/store",
+                                                        body=workflow_store_info.json().encode())
         if status_code >= 400:
             workflow_backend_logger.error("request to data-side-car failed %s",
                                           status_code)
@@ -378,10 +717,25 @@ class K8sWorkflowBackend(WorkflowBackend):
         workflow_backend_logger.info("store result successful %s",
                                      status_code)
 
+    def set_store_progress(self,
+                           workflow_id: str,
+                           store_progress: WorkflowStoreProgress) -> Union[WorkflowJobState, None]:
+        """
+        progress reported by the data-side-car, the workflow is in the STORING phase from now on
+        """
+        job_state = self.dummy_db.set_store_progress(workflow_id, store_progress)
+        if job_state is not None and self.workflow_state_handle:
+            self.workflow_state_handle(workflow_id, job_state)
+        return job_state
+
     def _cleanup_monitor(self, workflow_id: str):
         stop_event = self.dummy_db.get_job_monitor_event(workflow_id)
         stop_event.set()
 
+        job_id = self.dummy_db.get_job_data(workflow_id).job_id
+        if job_id:
+            self.informer.remove_handler(job_id)
+
     def __create_input_config_ref(self,
                                   workflow_id: str,
                                   labels: dict = None):
@@ -400,20 +754,32 @@ class K8sWorkflowBackend(WorkflowBackend):
 
         return (input_config.id, input_config.inputs)
 
-    def __create_monitor_thread(self,
-                                workflow_id: str,
-                                workflow_finished_handle: Callable):
+    def __get_manifest_template(self,
+                                service_id: Union[str, None],
+                                workflow_resource: WorkflowResource) -> K8sPodManifestTemplate:
+        template = self.manifest_templates.get(service_id)
+        if template is None:
+            # service not prepared, e.g. added after the assets were loaded
+            template = k8s_create_pod_manifest_template(job_config=workflow_resource)
+            if service_id is not None:
+                self.manifest_templates[service_id] = template
+        return template
+
+    def __create_monitor(self,
+                         workflow_id: str,
+                         workflow_finished_handle: Callable):
         stop_event = Event()
-        monitor = Thread(target=self.__monitor_workflow,
-                         args=(workflow_id, stop_event, workflow_finished_handle))
-        monitor.start()
-
         self.dummy_db.insert_job_monitor_event(workflow_id, stop_event)
 
-    def __monitor_workflow(self,
-                           workflow_id: str,
-                           stop_event: Event,
-                           workflow_finished_handle: Callable[[], None]):
+        job_id = self.dummy_db.get_job_data(key=workflow_id).job_id
+        # called by the informer for every event of the pod, until it returns True
+        self.informer.add_handler(job_id,
+                                  self.__get_pod_state_handle(workflow_id, stop_event, workflow_finished_handle))
+
+    def __get_pod_state_handle(self,
+                               workflow_id: str,
+                               stop_event: Event,
+                               workflow_finished_handle: Callable[[], None]) -> Callable[[K8sPodStateData], bool]:
 
         def pod_state_handle(pod_state: K8sPodStateData):
             workflow_backend_logger.debug(pod_state)
@@ -433,23 +799,84 @@ class K8sWorkflowBackend(WorkflowBackend):
                 can_exit = True
                 phase = WorkflowJobPhase.STORING
 
+            previous_state = self.dummy_db.get_workflow_state(workflow_id)
+            job_state = WorkflowJobState(phase=phase,
+                                         worker_state=pod_state,
+                                         store_progress=previous_state.store_progress if previous_state else None)
             self.dummy_db.insert_workflow_state(
                 workflow_id=workflow_id,
-                job_state=WorkflowJobState(phase=phase,
-                                           worker_state=pod_state)
+                job_state=job_state
             )
+            if self.workflow_state_handle:
+                self.workflow_state_handle(workflow_id, job_state)
+
+            if can_exit and not stop_event.is_set():
+                # storing the result blocks, the informer thread has to continue with the next event
+                self.monitor_executor.submit(self.__run_finished_handle, workflow_id, workflow_finished_handle)
 
             return can_exit
 
-        job_id = self.dummy_db.get_job_data(key=workflow_id).job_id
-        # loops until pod_state_handle returns True
-        k8s_watch_pod_events(pod_name=job_id,
-                             pod_state_handle=pod_state_handle,
-                             namespace=self.namespace)
-        if stop_event.is_set():
-            return
+        return pod_state_handle
+
+    def __confirm_cleanup(self, workflow_id: str, started: float):
+        with self.cleanup_condition:
+            self.pending_cleanups[workflow_id] = started
+            if self.cleanup_confirmer is None or not self.cleanup_confirmer.is_alive():
+                self.cleanup_confirmer = Thread(target=self.__confirm_cleanup_loop,
+                                                name="workflow_cleanup_confirmer",
+                                                daemon=True)
+                self.cleanup_confirmer.start()
+            self.cleanup_condition.notify_all()
 
-        workflow_finished_handle()
+    def __confirm_cleanup_loop(self):
+        """
+        one request per resource kind covers all workflows waiting for their confirmation
+        """
+        while True:
+            with self.cleanup_condition:
+                self.cleanup_condition.wait_for(lambda: not self.running or self.pending_cleanups)
+                if not self.running:
+                    return
+                pending = dict(self.pending_cleanups)
+
+            try:
+                remaining = self.__get_remaining_workflow_ids(pending)
+            except Exception:
+                workflow_backend_logger.exception("confirmation of the cleanup failed")
+                remaining = set(pending)
+
+            now = time.perf_counter()
+            for workflow_id, started in pending.items():
+                if workflow_id in remaining:
+                    if now - started > self.k8s_backend_config.cleanup_timeout:
+                        workflow_backend_logger.warning("resources of workflow %s not removed after %ds",
+                                                        workflow_id, self.k8s_backend_config.cleanup_timeout)
+                        self.__pop_pending_cleanup(workflow_id)
+                    continue
+
+                workflow_backend_logger.info("cleanup of workflow %s took %.3fs", workflow_id, now - started)
+                self.dummy_db.set_cleanup_seconds(workflow_id, now - started)
+                self.__pop_pending_cleanup(workflow_id)
+
+            with self.cleanup_condition:
+                self.cleanup_condition.wait_for(lambda: not self.running,
+                                                timeout=self.k8s_backend_config.cleanup_poll_interval)
+
+    def __get_remaining_workflow_ids(self, workflow_ids) -> set:
+        return {labels.get("workflow-id")
+                for label_selector in self.__get_workflows_label_selectors(workflow_ids)
+                for labels in k8s_list_resource_labels(namespace=self.namespace,
+                                                       label_selector=label_selector)}
+
+    def __pop_pending_cleanup(self, workflow_id: str):
+        with self.cleanup_condition:
+            self.pending_cleanups.pop(workflow_id, None)
+
+    def __run_finished_handle(self, workflow_id: str, workflow_finished_handle: Callable[[], None]):
+        try:
+            workflow_finished_handle()
+        except Exception:
+            workflow_backend_logger.exception("finished handle of workflow %s failed", workflow_id)
 
     def __get_lable(self, workflow_id=None, job_id=None):
         lable = {"app": "gx4ki-demo"}
@@ -459,3 +886,13 @@ class K8sWorkflowBackend(WorkflowBackend):
             lable["job-id"] = job_id
 
         return lable
+
+    def __get_label_selector(self, workflow_id=None, job_id=None) -> str:
+        return ",".join(f"{key}={value}"
+                        for key, value in self.__get_lable(workflow_id=workflow_id, job_id=job_id).items())
+
+    def __get_workflows_label_selectors(self, workflow_ids) -> List[str]:
+        workflow_ids = sorted(workflow_ids)
+        lable = [f"{key}={value}" for key, value in self.__get_lable().items()]
+        return [",".join(lable + [f"workflow-id in ({','.join(workflow_ids[i:i + LABEL_SELECTOR_CHUNK_SIZE])})"])
+                for i in range(0, len(workflow_ids), LABEL_SELECTOR_CHUNK_SIZE)]
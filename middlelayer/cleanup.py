@@ -0,0 +1,139 @@
+import sys
+import heapq
+import logging
+from datetime import datetime, timedelta
+from threading import Thread, Condition
+from typing import Callable, Dict, List, Tuple
+
+from middlelayer.registry import WorkflowRegistry
+
+formatter = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+stdout_handle = logging.StreamHandler(sys.stdout)
+stdout_handle.setFormatter(formatter)
+
+cleanup_logger = logging.getLogger("deferred_cleanup")
+cleanup_logger.setLevel(level=logging.DEBUG)
+cleanup_logger.addHandler(stdout_handle)
+
+
+class DeferredCleanupScheduler():
+    """
+    cleans up finished workflows after their retention.
+
+    The deadlines are kept in a heap, one thread sleeps until the earliest deadline and hands all workflows
+    which are due within batch_window seconds to cleanup_handle as one batch (at most max_batch_size).
+    Every deadline is stored as cleanup_at of the workflow record, so scheduled cleanups survive a restart
+    and are restored by start(). A failed batch is retried after retry_delay seconds.
+    """
+
+    def __init__(self,
+                 workflow_registry: WorkflowRegistry,
+                 cleanup_handle: Callable[[List[str]], None],
+                 batch_window: float = 5.0,
+                 max_batch_size: int = 50,
+                 retry_delay: float = 60.0):
+        self.workflow_registry = workflow_registry
+        self.cleanup_handle = cleanup_handle
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.retry_delay = retry_delay
+
+        self.condition = Condition()
+        # (deadline, workflow_id), entries of canceled or rescheduled workflows stay until they are popped
+        self.heap: List[Tuple[datetime, str]] = []
+        self.deadlines: Dict[str, datetime] = {}
+        self.running = False
+        self.worker: Thread = None
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+            for record in self.workflow_registry.list_pending_cleanups():
+                self.__push(record.workflow_id, record.cleanup_at)
+            cleanup_logger.info("%d deferred cleanups restored", len(self.deadlines))
+
+        self.worker = Thread(target=self.__run_loop,
+                             name="deferred_cleanup",
+                             daemon=True)
+        self.worker.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def schedule(self, workflow_id: str, delay_seconds: float):
+        cleanup_at = datetime.now() + timedelta(seconds=delay_seconds)
+        self.workflow_registry.update(workflow_id, cleanup_at=cleanup_at)
+        with self.condition:
+            self.__push(workflow_id, cleanup_at)
+            self.condition.notify_all()
+
+    def cancel(self, workflow_id: str) -> bool:
+        """
+        removes the scheduled cleanup of a workflow, returns False if none is scheduled
+        """
+        with self.condition:
+            if self.deadlines.pop(workflow_id, None) is None:
+                return False
+        self.workflow_registry.update(workflow_id, cleanup_at=None)
+        return True
+
+    def is_scheduled(self, workflow_id: str) -> bool:
+        with self.condition:
+            return workflow_id in self.deadlines
+
+    def get_pending_count(self) -> int:
+        with self.condition:
+            return len(self.deadlines)
+
+    def __push(self, workflow_id: str, cleanup_at: datetime):
+        self.deadlines[workflow_id] = cleanup_at
+        heapq.heappush(self.heap, (cleanup_at, workflow_id))
+
+    def __pop_due(self) -> List[str]:
+        due_until = datetime.now() + timedelta(seconds=self.batch_window)
+        batch = []
+        while self.heap and self.heap[0][0] <= due_until and len(batch) < self.max_batch_size:
+            cleanup_at, workflow_id = heapq.heappop(self.heap)
+            if self.deadlines.get(workflow_id) != cleanup_at:
+                # canceled or rescheduled
+                continue
+            self.deadlines.pop(workflow_id)
+            batch.append(workflow_id)
+        return batch
+
+    def __get_timeout(self) -> float:
+        # stale entries are skipped by __pop_due, an early wake-up is harmless
+        if not self.heap:
+            return None
+        return max(0.0, (self.heap[0][0] - datetime.now()).total_seconds())
+
+    def __run_loop(self):
+        while True:
+            with self.condition:
+                batch = []
+                while self.running and not batch:
+                    batch = self.__pop_due()
+                    if not batch:
+                        self.condition.wait(timeout=self.__get_timeout())
+                if not self.running:
+                    return
+
+            try:
+                self.cleanup_handle(batch)
+            except Exception:
+                cleanup_logger.exception("deferred cleanup of %d workflows failed, retry in %ss",
+                                         len(batch), self.retry_delay)
+                retry_at = datetime.now() + timedelta(seconds=self.retry_delay)
+                with self.condition:
+                    for workflow_id in batch:
+                        self.__push(workflow_id, retry_at)
+                continue
+
+            for workflow_id in batch:
+                self.workflow_registry.update(workflow_id, cleanup_at=None)
+            cleanup_logger.debug("deferred cleanup of %d workflows", len(batch))
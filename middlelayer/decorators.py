@@ -17,3 +17,23 @@ def retry(max_retries, delay=1, _backoff=2):
             raise Exception(f"Method {func.__name__} failed after {max_retries} retries.")
         return wrapper
     return decorator
+
+
+def timed(histogram, *label_values):
+    """
+    observes the duration of every call of the function in histogram (prometheus_client),
+    failed calls included. Without label_values the function name is the label value.
+    """
+    def decorator(func):
+        # the labeled child is resolved once, not on every call
+        observe = histogram.labels(*(label_values or (func.__name__,))).observe
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
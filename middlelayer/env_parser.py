@@ -0,0 +1,148 @@
+import re
+import codecs
+from typing import Dict, Iterable, List, Tuple, Union
+
+# data of a config map, the limit of the whole object depends on the etcd of the cluster (~1MB)
+CONFIG_MAP_MAX_BYTES = 1024*1024
+CONFIG_MAP_KEY_PATTERN = re.compile(r"[-._a-zA-Z0-9]{1,253}")
+# ${NAME} and ${NAME:-default} like python-dotenv
+VARIABLE_PATTERN = re.compile(r"\$\{(?P<name>[^\}:]*)(?::-(?P<default>[^\}]*))?\}")
+DOUBLE_QUOTED_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "\"": "\"", "\\": "\\", "$": "$"}
+
+
+class EnvironmentInputError(ValueError):
+    """
+    environment input which can not become a config map, e.g. too large or malformed
+    """
+
+
+class EnvStreamParser():
+    """
+    parses an env file (KEY=VALUE lines like dotenv) chunk by chunk into the data of a config map.
+
+    The config map is built line by line, neither the file nor a line is read into memory as a whole
+    beyond max_bytes, which bounds the read bytes as well as the size of keys and values. Comments,
+    blank lines, the export prefix, single and double quoted (also multi-line) values and ${NAME}
+    references to keys defined above are supported like python-dotenv, but the environment of the api
+    is not expanded.
+    """
+
+    def __init__(self, max_bytes: int = CONFIG_MAP_MAX_BYTES, name: str = "environment input"):
+        self.max_bytes = max_bytes
+        self.name = name
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.data: Dict[str, str] = {}
+        self.read_bytes = 0
+        self.data_bytes = 0
+        self.line_number = 0
+        self.pending = ""
+        # key, quote and characters of a quoted value which is not closed yet
+        self.open_value: Union[Tuple[str, str, List[str]], None] = None
+
+    def feed(self, chunk: bytes):
+        self.read_bytes += len(chunk)
+        if self.read_bytes > self.max_bytes:
+            raise EnvironmentInputError(f"{self.name} exceeds {self.max_bytes} bytes")
+        try:
+            text = self.pending + self.decoder.decode(chunk)
+        except UnicodeDecodeError as e:
+            raise EnvironmentInputError(f"{self.name} is not utf-8 encoded") from e
+
+        lines = text.split("\n")
+        self.pending = lines.pop()
+        for line in lines:
+            self.__parse_line(line)
+
+    def close(self) -> Dict[str, str]:
+        try:
+            self.pending += self.decoder.decode(b"", final=True)
+        except UnicodeDecodeError as e:
+            raise EnvironmentInputError(f"{self.name} is not utf-8 encoded") from e
+        if self.pending:
+            self.__parse_line(self.pending)
+            self.pending = ""
+        if self.open_value is not None:
+            raise EnvironmentInputError(f"{self.name} line {self.line_number}: quoted value is not closed")
+        return self.data
+
+    def __error(self, message: str) -> EnvironmentInputError:
+        return EnvironmentInputError(f"{self.name} line {self.line_number}: {message}")
+
+    def __parse_line(self, line: str):
+        self.line_number += 1
+        line = line.rstrip("\r")
+
+        if self.open_value is not None:
+            self.__parse_quoted("\n" + line)
+            return
+
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            return
+        if stripped.startswith("export "):
+            stripped = stripped[len("export "):].lstrip()
+
+        key, separator, value = stripped.partition("=")
+        key = key.strip()
+        if not separator:
+            raise self.__error("expected KEY=VALUE")
+        if not CONFIG_MAP_KEY_PATTERN.fullmatch(key):
+            raise self.__error(f"invalid key {key[:64]!r} (only letters, digits, '-', '_' and '.')")
+
+        value = value.lstrip()
+        if value[:1] in ("'", "\""):
+            self.open_value = (key, value[0], [])
+            self.__parse_quoted(value[1:])
+            return
+
+        # inline comments are separated by whitespace
+        value = re.split(r"\s+#", value, maxsplit=1)[0].rstrip()
+        self.__set(key, self.__expand(value))
+
+    def __parse_quoted(self, text: str):
+        # continues the open quoted value with the text, a value spanning several lines is scanned once
+        key, quote, chars = self.open_value
+        index = 0
+        while index < len(text):
+            char = text[index]
+            if quote == "\"" and char == "\\" and index + 1 < len(text):
+                chars.append(DOUBLE_QUOTED_ESCAPES.get(text[index + 1], char + text[index + 1]))
+                index += 2
+                continue
+            if char == quote:
+                rest = text[index + 1:].strip()
+                if rest and not rest.startswith("#"):
+                    raise self.__error(f"unexpected characters after the quoted value of {key}")
+                self.open_value = None
+                value = "".join(chars)
+                self.__set(key, self.__expand(value))
+                return
+            chars.append(char)
+            index += 1
+
+    def __expand(self, value: str) -> str:
+        if "${" not in value:
+            return value
+        return VARIABLE_PATTERN.sub(lambda match: self.data.get(match.group("name"), match.group("default") or ""),
+                                    value)
+
+    def __set(self, key: str, value: str):
+        previous = self.data.get(key)
+        if previous is not None:
+            self.data_bytes -= len(key.encode()) + len(previous.encode())
+        self.data_bytes += len(key.encode()) + len(value.encode())
+        if self.data_bytes > self.max_bytes:
+            raise self.__error(f"config map data exceeds {self.max_bytes} bytes")
+        self.data[key] = value
+
+
+def parse_env_stream(chunks: Iterable[bytes],
+                     max_bytes: int = CONFIG_MAP_MAX_BYTES,
+                     name: str = "environment input") -> Dict[str, str]:
+    """
+    data of a config map from the chunks of an env file, see EnvStreamParser
+    """
+    parser = EnvStreamParser(max_bytes=max_bytes, name=name)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
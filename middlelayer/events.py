@@ -0,0 +1,140 @@
+import sys
+import json
+import asyncio
+import logging
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, NamedTuple, Tuple, Union
+from uuid import uuid4
+
+from middlelayer.models import WorkflowJobPhase
+from middlelayer.backend import WorkflowJobState
+
+formatter = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+stdout_handle = logging.StreamHandler(sys.stdout)
+stdout_handle.setFormatter(formatter)
+
+events_logger = logging.getLogger("workflow_events")
+events_logger.setLevel(level=logging.DEBUG)
+events_logger.addHandler(stdout_handle)
+
+
+class WorkflowEvent(NamedTuple):
+    workflow_id: str
+    version: int
+    phase: WorkflowJobPhase
+    # the serialized WorkflowJobState, shared by all subscribers
+    data: bytes
+    etag: str
+
+    def to_sse(self) -> bytes:
+        return f"id: {self.etag}\nevent: status\ndata: ".encode() + self.data + b"\n\n"
+
+
+def get_transition(state: WorkflowJobState) -> Tuple:
+    container_states = ()
+    if state.worker_state is not None and state.worker_state.container_statuses:
+        container_states = tuple(sorted((name, status.state)
+                                        for name, status in state.worker_state.container_statuses.items()))
+    return (state.phase, container_states)
+
+
+class WorkflowEventHub():
+    """
+    Publishes status changes of workflows to waiting clients (server-sent events and long-poll requests).
+
+    Only transitions of the phase or of a container state create a new version of a workflow state,
+    other pod events (e.g. condition updates) are dropped. publish is called from the monitor threads
+    of the backend, waiters are resumed in their own event loop.
+    """
+
+    def __init__(self, max_workflows: int = 10000):
+        self.max_workflows = max_workflows
+        # versions of a previous process never match
+        self.epoch = uuid4().hex[:8]
+
+        self.lock = Lock()
+        self.events: Dict[str, WorkflowEvent] = OrderedDict()
+        self.transitions: Dict[str, Tuple] = {}
+        self.waiters: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {}
+
+    def publish(self, workflow_id: str, state: WorkflowJobState) -> Union[WorkflowEvent, None]:
+        """
+        stores a new version of the workflow state, returns None if the state is no transition
+        """
+        transition = get_transition(state)
+        with self.lock:
+            if self.transitions.get(workflow_id) == transition:
+                return None
+
+            previous = self.events.pop(workflow_id, None)
+            version = previous.version + 1 if previous else 1
+            event = WorkflowEvent(workflow_id=workflow_id,
+                                  version=version,
+                                  phase=state.phase,
+                                  data=json.dumps({"workflow_id": workflow_id,
+                                                   "version": version,
+                                                   "workflow_status": state.model_dump(mode="json")}).encode(),
+                                  etag=f"\"{self.epoch}-{version}\"")
+            self.events[workflow_id] = event
+            self.transitions[workflow_id] = transition
+
+            while len(self.events) > self.max_workflows:
+                evicted, _ = self.events.popitem(last=False)
+                self.transitions.pop(evicted, None)
+
+            waiters = self.waiters.pop(workflow_id, [])
+
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(self.__resolve, future, event)
+
+        events_logger.debug("workflow %s version %d: %s", workflow_id, version, state.phase.value)
+        return event
+
+    def get(self, workflow_id: str) -> Union[WorkflowEvent, None]:
+        with self.lock:
+            return self.events.get(workflow_id)
+
+    def get_version(self, etag: Union[str, None]) -> int:
+        """
+        version of an etag (If-None-Match or Last-Event-ID), 0 for unknown or foreign etags
+        """
+        if not etag:
+            return 0
+        epoch, _, version = etag.strip().strip("\"").partition("-")
+        if epoch != self.epoch or not version.isdigit():
+            return 0
+        return int(version)
+
+    async def wait(self, workflow_id: str, after_version: int, timeout: float) -> Union[WorkflowEvent, None]:
+        """
+        returns the first version of the workflow state newer than after_version,
+        None if there is no new version within timeout seconds
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            event = self.events.get(workflow_id)
+            if event is not None and event.version > after_version:
+                return event
+            if timeout <= 0:
+                return None
+            future = loop.create_future()
+            self.waiters.setdefault(workflow_id, []).append((loop, future))
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self.lock:
+                waiters = self.waiters.get(workflow_id)
+                if waiters and (loop, future) in waiters:
+                    waiters.remove((loop, future))
+                    if not waiters:
+                        self.waiters.pop(workflow_id)
+
+    @staticmethod
+    def __resolve(future: asyncio.Future, event: WorkflowEvent):
+        if not future.done():
+            future.set_result(event)
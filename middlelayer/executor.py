@@ -0,0 +1,97 @@
+import sys
+import time
+import asyncio
+import logging
+from functools import partial
+from threading import Lock
+from typing import Callable, Dict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+formatter = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+stdout_handle = logging.StreamHandler(sys.stdout)
+stdout_handle.setFormatter(formatter)
+
+executor_logger = logging.getLogger("executor")
+executor_logger.setLevel(level=logging.DEBUG)
+executor_logger.addHandler(stdout_handle)
+
+
+class BlockingIOExecutor():
+    """
+    Bounded thread pool which runs blocking storage (minio) and kubernetes calls
+    outside of the event loop, so a slow backend call does not stall other requests.
+    """
+
+    def __init__(self, max_workers: int = 16, name: str = "blocking-io"):
+        self.max_workers = max_workers
+        self.name = name
+        self.pool = ThreadPoolExecutor(max_workers=max_workers,
+                                       thread_name_prefix=name)
+
+        self._lock = Lock()
+        self._submitted = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._run_time_total = 0.0
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """
+        run func(*args, **kwargs) in the pool and await its result,
+        exceptions (e.g. HTTPException) are raised in the calling coroutine.
+        """
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """
+        run func(*args, **kwargs) in the pool without awaiting it, e.g. a long-running reader
+        """
+        with self._lock:
+            self._submitted += 1
+
+        return self.pool.submit(partial(self._call, func, time.perf_counter(), args, kwargs))
+
+    def _call(self, func: Callable, submitted_at: float, args, kwargs):
+        started_at = time.perf_counter()
+        wait_time = started_at - submitted_at
+        with self._lock:
+            self._running += 1
+            self._wait_time_total += wait_time
+            self._wait_time_max = max(self._wait_time_max, wait_time)
+
+        failed = False
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            run_time = time.perf_counter() - started_at
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+                self._run_time_total += run_time
+                if failed:
+                    self._failed += 1
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            finished = self._completed or 1
+            return {
+                "max_workers": self.max_workers,
+                "submitted": self._submitted,
+                "running": self._running,
+                "queued": self._submitted - self._completed - self._running,
+                "completed": self._completed,
+                "failed": self._failed,
+                "wait_time_avg": self._wait_time_total / finished,
+                "wait_time_max": self._wait_time_max,
+                "run_time_avg": self._run_time_total / finished,
+            }
+
+    def shutdown(self, wait: bool = True):
+        executor_logger.debug("shutdown executor %s: %s", self.name, self.get_stats())
+        self.pool.shutdown(wait=wait)
@@ -0,0 +1,146 @@
+"""
+helpers to serve byte ranges and conditional requests (RFC 9110) of objects in the user storage
+"""
+from typing import Callable, Iterator, List, NamedTuple, Tuple, Union
+from datetime import datetime
+from email.utils import format_datetime
+
+# more ranges in one request are not served as multipart response
+MAX_RANGES = 16
+
+
+class ByteRange(NamedTuple):
+    start: int
+    end: int
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start + 1
+
+    def content_range(self, size: int) -> str:
+        return f"bytes {self.start}-{self.end}/{size}"
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range_header(range_header: str, size: int) -> Union[List[ByteRange], None]:
+    """
+    parses a `Range: bytes=...` header for an object of the given size.
+
+    Returns None if the header should be ignored (invalid syntax, unknown unit, too many ranges),
+    so the whole object is served. Overlapping or adjacent ranges are merged.
+    Raises RangeNotSatisfiable if no range overlaps the object.
+    """
+    unit, _, range_set = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not range_set.strip():
+        return None
+
+    specs = [spec.strip() for spec in range_set.split(",") if spec.strip()]
+    if not specs or len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        first, sep, last = spec.partition("-")
+        if not sep:
+            return None
+        first, last = first.strip(), last.strip()
+        if (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+
+        if first == "":
+            # suffix range, the last n bytes
+            if last == "":
+                return None
+            suffix_length = int(last)
+            if suffix_length == 0 or size == 0:
+                continue
+            ranges.append(ByteRange(max(size - suffix_length, 0), size - 1))
+            continue
+
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            continue
+        end = int(last) if last else size - 1
+        ranges.append(ByteRange(start, min(end, size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for byte_range in ranges[1:]:
+        if byte_range.start <= merged[-1].end + 1:
+            merged[-1] = ByteRange(merged[-1].start, max(merged[-1].end, byte_range.end))
+        else:
+            merged.append(byte_range)
+    return merged
+
+
+def format_etag(etag: str) -> str:
+    return '"' + etag.strip('"') + '"'
+
+
+def if_range_matches(if_range: str, etag: str, last_modified: Union[datetime, None]) -> bool:
+    """
+    If-Range holds either a strong etag or the http date of the last modification
+    """
+    if_range = if_range.strip()
+    if if_range.startswith("W/"):
+        return False
+    if if_range.startswith("\""):
+        return if_range == format_etag(etag)
+    if last_modified is None:
+        return False
+    return if_range == format_datetime(last_modified, usegmt=True)
+
+
+def if_none_match(if_none_match: Union[str, None], etag: str) -> bool:
+    """
+    If-None-Match holds * or a list of etags, compared weakly (a W/ prefix is ignored)
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    etag = format_etag(etag)
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def multipart_byteranges(ranges: List[ByteRange],
+                         size: int,
+                         content_type: str,
+                         boundary: str,
+                         read_range: Callable[[ByteRange], Iterator[bytes]]) -> Tuple[int, Iterator[bytes]]:
+    """
+    builds a multipart/byteranges body, returns its content length and an iterator
+    which reads every range with read_range on demand.
+    """
+    part_headers = [(f"--{boundary}\r\n"
+                     f"Content-Type: {content_type}\r\n"
+                     f"Content-Range: {byte_range.content_range(size)}\r\n\r\n").encode()
+                    for byte_range in ranges]
+    closing = f"\r\n--{boundary}--\r\n".encode()
+
+    content_length = sum(len(header) + byte_range.length for header, byte_range in zip(part_headers, ranges))
+    content_length += 2 * (len(ranges) - 1) + len(closing)
+
+    def iter_body():
+        for index, (header, byte_range) in enumerate(zip(part_headers, ranges)):
+            if index:
+                yield b"\r\n"
+            yield header
+            yield from read_range(byte_range)
+        yield closing
+
+    return content_length, iter_body()
@@ -1,6 +1,12 @@
 
+import io
+from typing import Dict, List
+
 from minio import Minio
+from minio.commonconfig import ComposeSource
+from minio.datatypes import Part
 from minio.deleteobjects import DeleteObject
+from minio.error import S3Error
 # maybe use aws-s3 lib
 # 1. verbindung nur öffnen wenn benötigt
 # try&error replace return statements with yield
@@ -8,6 +14,8 @@ from minio.deleteobjects import DeleteObject
 # - close & open if needed
 # - keep it open
 
+from middlelayer.decorators import timed
+from middlelayer.metrics import MINIO_CALL_SECONDS
 from middlelayer.models import MinioStoreInfo
 from datetime import timedelta
 
@@ -31,6 +39,17 @@ class ImlaMinio():
             secret_key=self.store_info.secret_key,
             secure=self.store_info.secure
         )
+        # presigned urls are handed out to clients, so they are signed for the public endpoint,
+        # a fixed region avoids a region lookup request for every signature
+        self.presign_client = self.client
+        if minio_config.get('public_endpoint'):
+            self.presign_client = Minio(
+                endpoint=minio_config.get('public_endpoint'),
+                access_key=self.store_info.access_key,
+                secret_key=self.store_info.secret_key,
+                secure=minio_config.getboolean('public_secure', self.store_info.secure),
+                region=minio_config.get('region', 'us-east-1')
+            )
         self.result_bucket = result_bucket
         self._init_result_bucket()
 
@@ -41,10 +60,12 @@ class ImlaMinio():
     def get_store_info(self) -> MinioStoreInfo:
         return self.store_info
 
+    @timed(MINIO_CALL_SECONDS)
     def get_bucket_names(self):
         buckets = self.client.list_buckets()
         return [b.name for b in buckets]
 
+    @timed(MINIO_CALL_SECONDS)
     def list_job_result(self, job_id):
         objects = self.client.list_objects(
             bucket_name=self.result_bucket,
@@ -56,13 +77,16 @@ class ImlaMinio():
             f"{job_id}/", "") for o in objects]
         return object_list
 
+    @timed(MINIO_CALL_SECONDS)
     def get_object(self, job_id, object_name):
         return self.client.get_object(self.result_bucket,
                                       f"{job_id}/{object_name}",)
 
+    @timed(MINIO_CALL_SECONDS)
     def create_bucket(self, bucket_name):
         self.client.make_bucket(bucket_name=bucket_name)
 
+    @timed(MINIO_CALL_SECONDS)
     def remove_bucket(self, bucket_name, force=False):
         if force:
             delete_object_list = [DeleteObject(x.object_name) for x in self.client.list_objects(bucket_name=bucket_name,
@@ -73,9 +97,11 @@ class ImlaMinio():
 
         self.client.remove_bucket(bucket_name=bucket_name)
 
+    @timed(MINIO_CALL_SECONDS)
     def bucket_exists(self, bucket_name):
         return self.client.bucket_exists(bucket_name=bucket_name)
 
+    @timed(MINIO_CALL_SECONDS)
     def put_job_result(self, job_id, object_name, content, content_length):
         '''
         for testing purpose, put a file into a specific bucket/directory
@@ -87,6 +113,7 @@ class ImlaMinio():
         print(response)
         return True
 
+    @timed(MINIO_CALL_SECONDS)
     def check_object_content(self, job_id, object_name, content):
         result = False
         try:
@@ -99,6 +126,7 @@ class ImlaMinio():
 
         return result
 
+    @timed(MINIO_CALL_SECONDS)
     def get_resource_data(self, bucket, resource):
         try:
             response = self.client.get_object(bucket_name=bucket,
@@ -111,6 +139,7 @@ class ImlaMinio():
             response.close()
             response.release_conn()
 
+    @timed(MINIO_CALL_SECONDS)
     def put_file(self,
                  bucket,
                  resource,
@@ -123,16 +152,117 @@ class ImlaMinio():
             length=-1,
             part_size=64*MB)
 
+    @timed(MINIO_CALL_SECONDS)
+    def put_data(self,
+                 bucket,
+                 resource,
+                 data: bytes,
+                 metadata: Dict[str, str] = None):
+
+        self.client.put_object(
+            bucket_name=bucket,
+            object_name=resource,
+            data=io.BytesIO(data),
+            length=len(data),
+            metadata=metadata)
+
+    @timed(MINIO_CALL_SECONDS)
+    def copy_file(self, bucket, source, resource):
+        """
+        server side copy, compose also copies objects larger than the 5GB limit of a single copy request
+        """
+        self.client.compose_object(
+            bucket_name=bucket,
+            object_name=resource,
+            sources=[ComposeSource(bucket_name=bucket, object_name=source)])
+
+    @timed(MINIO_CALL_SECONDS)
+    def remove_file(self, bucket, resource):
+        self.client.remove_object(
+            bucket_name=bucket,
+            object_name=resource)
+
+    @timed(MINIO_CALL_SECONDS)
+    def remove_files(self, bucket, resources: List[str]):
+        """
+        removes several objects with one request, returns the errors
+        """
+        return list(self.client.remove_objects(
+            bucket_name=bucket,
+            delete_object_list=[DeleteObject(x) for x in resources]))
+
+    @timed(MINIO_CALL_SECONDS)
+    def create_multipart_upload(self, bucket, resource) -> str:
+        return self.client._create_multipart_upload(
+            bucket_name=bucket,
+            object_name=resource,
+            headers={"Content-Type": "application/octet-stream"})
+
+    @timed(MINIO_CALL_SECONDS)
+    def upload_part(self, bucket, resource, upload_id: str, part_number: int, data: bytes) -> str:
+        return self.client._upload_part(
+            bucket_name=bucket,
+            object_name=resource,
+            data=data,
+            headers=None,
+            upload_id=upload_id,
+            part_number=part_number)
+
+    @timed(MINIO_CALL_SECONDS)
+    def complete_multipart_upload(self, bucket, resource, upload_id: str, parts: List[Part]):
+        self.client._complete_multipart_upload(
+            bucket_name=bucket,
+            object_name=resource,
+            upload_id=upload_id,
+            parts=sorted(parts, key=lambda part: part.part_number))
+
+    @timed(MINIO_CALL_SECONDS)
+    def abort_multipart_upload(self, bucket, resource, upload_id: str):
+        self.client._abort_multipart_upload(
+            bucket_name=bucket,
+            object_name=resource,
+            upload_id=upload_id)
+
+    @timed(MINIO_CALL_SECONDS)
     def get_file(self,
                  bucket,
-                 resource):
+                 resource,
+                 offset: int = 0,
+                 length: int = 0):
+        """
+        returns the streaming response of an object,
+        with offset and length only the given byte range is requested
+        """
 
         response = self.client.get_object(
             bucket_name=bucket,
-            object_name=resource)
+            object_name=resource,
+            offset=offset,
+            length=length)
 
         return response
 
+    @timed(MINIO_CALL_SECONDS)
+    def stat_file(self, bucket, resource):
+        return self.client.stat_object(
+            bucket_name=bucket,
+            object_name=resource)
+
+    def stat_file_if_exists(self, bucket, resource):
+        """
+        stat of the object or None if it does not exist, a single request independent of the number of objects
+        """
+        try:
+            return self.stat_file(bucket, resource)
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchObject"):
+                return None
+            raise
+
+    def object_exists(self, bucket, resource) -> bool:
+        return self.stat_file_if_exists(bucket, resource) is not None
+
+    @timed(MINIO_CALL_SECONDS)
     def get_objects_list(self, bucket, prefix=None):
         objects = self.client.list_objects(bucket_name=bucket,
                                            prefix=prefix,
@@ -143,12 +273,14 @@ class ImlaMinio():
             object_list.append(str(obj.object_name).replace(prefix, "", 1))
         return object_list
 
-    def get_download_url(self, bucket, resource):
-        return self.client.presigned_get_object(bucket_name=bucket,
-                                                object_name=resource,
-                                                expires=timedelta(hours=1, minutes=30))
+    @timed(MINIO_CALL_SECONDS)
+    def get_download_url(self, bucket, resource, expires: timedelta = timedelta(hours=1, minutes=30)):
+        return self.presign_client.presigned_get_object(bucket_name=bucket,
+                                                        object_name=resource,
+                                                        expires=expires)
 
-    def get_upload_url(self, bucket_name, response_name):
-        return self.client.presigned_put_object(bucket_name=bucket_name,
-                                                object_name=response_name,
-                                                expires=timedelta(hours=1, minutes=30))
+    @timed(MINIO_CALL_SECONDS)
+    def get_upload_url(self, bucket_name, response_name, expires: timedelta = timedelta(hours=1, minutes=30)):
+        return self.presign_client.presigned_put_object(bucket_name=bucket_name,
+                                                        object_name=response_name,
+                                                        expires=expires)
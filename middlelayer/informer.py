@@ -0,0 +1,175 @@
+import sys
+import time
+import logging
+from threading import Thread, Lock, RLock
+from typing import Callable, Dict, Union
+
+from kubernetes.client.exceptions import ApiException
+
+from middlelayer.k8sClient import K8sPodStateData, k8s_get_pod_state, k8s_list_pods, k8s_watch_pods
+
+formatter = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+stdout_handle = logging.StreamHandler(sys.stdout)
+stdout_handle.setFormatter(formatter)
+
+informer_logger = logging.getLogger("pod_informer")
+informer_logger.setLevel(level=logging.DEBUG)
+informer_logger.addHandler(stdout_handle)
+
+
+# returns True if no further events of the pod are needed
+PodStateHandle = Callable[[K8sPodStateData], bool]
+
+
+class PodInformer():
+    """
+    One watch on all pods of a namespace matching label_selector, instead of one watch per workflow.
+
+    The informer keeps the latest state of every pod in a local cache and dispatches each event to the
+    handler registered for the pod. Handlers are called one at a time on the informer thread and must not
+    block, long running work (e.g. storing the results) has to be handed to a worker pool.
+    After a disconnect the watch resumes at the last resource_version, if that is expired the pods are
+    listed again and pods deleted in the meantime are dispatched as DELETED.
+    """
+
+    def __init__(self,
+                 namespace: str,
+                 label_selector: str,
+                 watch_timeout: int = 300,
+                 retry_delay: float = 1.0,
+                 list_handle: Callable = k8s_list_pods,
+                 watch_handle: Callable = k8s_watch_pods):
+        self.namespace = namespace
+        self.label_selector = label_selector
+        self.watch_timeout = watch_timeout
+        self.retry_delay = retry_delay
+        self.list_handle = list_handle
+        self.watch_handle = watch_handle
+
+        self.lock = Lock()
+        # handlers are never called concurrently, so the events of a pod are handled in order
+        self.dispatch_lock = RLock()
+        self.cache: Dict[str, K8sPodStateData] = {}
+        self.handlers: Dict[str, PodStateHandle] = {}
+        self.resource_version: Union[str, None] = None
+        self.running = False
+        self.watcher: Thread = None
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+        self.watcher = Thread(target=self.__watch_loop,
+                              name=f"pod_informer_{self.namespace}",
+                              daemon=True)
+        self.watcher.start()
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+
+    def add_handler(self, pod_name: str, pod_state_handle: PodStateHandle):
+        """
+        registers the handler of a pod, a cached state of the pod is dispatched right away
+        """
+        self.start()
+        with self.dispatch_lock:
+            with self.lock:
+                self.handlers[pod_name] = pod_state_handle
+                pod_state = self.cache.get(pod_name)
+            if pod_state is not None:
+                self.__dispatch(pod_name, pod_state)
+
+    def remove_handler(self, pod_name: str):
+        with self.lock:
+            self.handlers.pop(pod_name, None)
+
+    def get_pod_state(self, pod_name: str) -> Union[K8sPodStateData, None]:
+        with self.lock:
+            return self.cache.get(pod_name)
+
+    def get_handler_count(self) -> int:
+        with self.lock:
+            return len(self.handlers)
+
+    def __watch_loop(self):
+        while self.running:
+            try:
+                if self.resource_version is None:
+                    self.__relist()
+
+                for event in self.watch_handle(namespace=self.namespace,
+                                               label_selector=self.label_selector,
+                                               resource_version=self.resource_version,
+                                               timeout_seconds=self.watch_timeout):
+                    if not self.running:
+                        return
+                    self.resource_version = event["object"].metadata.resource_version
+                    if event["type"] == "BOOKMARK":
+                        continue
+                    self.__handle(event["type"], event["object"])
+
+            except ApiException as e:
+                if e.status == 410:
+                    informer_logger.info("resource_version %s expired, list pods again", self.resource_version)
+                    self.resource_version = None
+                    continue
+                informer_logger.exception("watch of namespace %s failed", self.namespace)
+                time.sleep(self.retry_delay)
+            except Exception:
+                informer_logger.exception("watch of namespace %s failed", self.namespace)
+                self.resource_version = None
+                time.sleep(self.retry_delay)
+
+    def __relist(self):
+        pod_list = self.list_handle(namespace=self.namespace,
+                                    label_selector=self.label_selector)
+
+        listed = set()
+        for pod in pod_list.items:
+            listed.add(pod.metadata.name)
+            with self.lock:
+                event_type = "MODIFIED" if pod.metadata.name in self.cache else "ADDED"
+            self.__handle(event_type, pod)
+
+        with self.lock:
+            deleted = [(name, pod_state) for name, pod_state in self.cache.items() if name not in listed]
+        for name, pod_state in deleted:
+            self.__update(name, pod_state.model_copy(update={"event_type": "DELETED"}))
+
+        self.resource_version = pod_list.metadata.resource_version
+
+    def __handle(self, event_type: str, pod):
+        self.__update(pod.metadata.name, k8s_get_pod_state(event_type, pod))
+
+    def __update(self, pod_name: str, pod_state: K8sPodStateData):
+        with self.dispatch_lock:
+            with self.lock:
+                if pod_state.event_type == "DELETED":
+                    self.cache.pop(pod_name, None)
+                else:
+                    self.cache[pod_name] = pod_state
+            self.__dispatch(pod_name, pod_state)
+
+    def __dispatch(self, pod_name: str, pod_state: K8sPodStateData):
+        with self.lock:
+            pod_state_handle = self.handlers.get(pod_name)
+        if pod_state_handle is None:
+            return
+
+        try:
+            done = pod_state_handle(pod_state)
+        except Exception:
+            informer_logger.exception("handler of pod %s failed", pod_name)
+            done = False
+
+        if not done and pod_state.event_type == "DELETED":
+            informer_logger.warning("pod %s was deleted", pod_name)
+            done = True
+
+        if done:
+            with self.lock:
+                if self.handlers.get(pod_name) is pod_state_handle:
+                    self.handlers.pop(pod_name)
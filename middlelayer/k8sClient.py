@@ -1,18 +1,19 @@
 from typing import List, Dict, Union
+from datetime import datetime
 
 import os
 import sys
 import logging
-import urllib3
-import requests
+from threading import Lock
 
 from kubernetes import client, config, watch
 from kubernetes.stream import portforward
 from kubernetes.client.exceptions import ApiException
 
-from middlelayer.decorators import retry
+from middlelayer.decorators import timed
+from middlelayer.metrics import K8S_CALL_SECONDS
 from middlelayer.models import (WorkflowResource, BaseModel, WorkflowInputResource, ServiceResourceType,
-                                K8sBackendConfig)
+                                K8sBackendConfig, InputServiceResource)
 
 formatter = logging.Formatter(
     '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -29,6 +30,10 @@ k8sclient_logger.addHandler(stdout_handle)
 class K8sContainerStateDate(BaseModel):
     state: str
     details: str
+    # reason of a waiting or terminated container, e.g. ContainerCreating, ErrImagePull, Completed
+    reason: Union[str, None] = None
+    started_at: Union[datetime, None] = None
+    finished_at: Union[datetime, None] = None
 
 
 class K8sPodStateData(BaseModel):
@@ -36,6 +41,10 @@ class K8sPodStateData(BaseModel):
     pod_phase: str
     pod_state_condition: Union[List[str], None]
     container_statuses: Union[Dict[str, K8sContainerStateDate], None]
+    # type of the true pod conditions -> their last transition, e.g. PodScheduled, Initialized, ContainersReady
+    condition_times: Union[Dict[str, datetime], None] = None
+    # e.g. data-input-init, which downloads the inputs
+    init_container_statuses: Union[Dict[str, K8sContainerStateDate], None] = None
 
 
 NAMESPACE = "default"
@@ -45,6 +54,11 @@ DATA_SIDE_CAR_IMAGE = "imlahso/data-side-car:latest"
 
 K8S_BACKEND_CONFIG: K8sBackendConfig = None
 
+# one ApiClient (connection pool) shared by all calls, created on first use
+API_CLIENT: client.ApiClient = None
+CORE_V1_API: client.CoreV1Api = None
+API_CLIENT_LOCK = Lock()
+
 
 def k8s_setup_config(k8s_backend_config: K8sBackendConfig,
                      config_file=None,
@@ -70,198 +84,263 @@ def k8s_setup_config(k8s_backend_config: K8sBackendConfig,
         global DATA_SIDE_CAR_IMAGE
         DATA_SIDE_CAR_IMAGE = data_side_car_image
 
+    # the next call creates a client with the loaded config
+    k8s_close_api_client()
 
-def k8s_get_healthz():
-    return client.ApiClient().call_api(resource_path="/healthz",
-                                       method="GET",
-                                       #  query_params={"verbose": "true"},
-                                       response_type=str)
 
+def k8s_api_client() -> client.ApiClient:
+    """
+    returns the shared ApiClient, its connection pool keeps the connections (and TLS sessions)
+    to the api server alive between calls
+    """
+    global API_CLIENT, CORE_V1_API
 
-def k8s_create_pod_manifest(job_uuid,
-                            job_config: WorkflowResource,
-                            config_map_ref: List[str] = None,
-                            input_config_ref: str = None,
-                            input_resources: List[WorkflowInputResource] = None,
-                            job_namespace=NAMESPACE,
-                            persistent_volume_claim_id: str = None,
-                            labels=None) -> client.V1Pod:
+    with API_CLIENT_LOCK:
+        if API_CLIENT is None:
+            configuration = client.Configuration.get_default_copy()
+            if K8S_BACKEND_CONFIG is not None:
+                configuration.connection_pool_maxsize = K8S_BACKEND_CONFIG.api_connection_pool_size
+                configuration.keep_alive = K8S_BACKEND_CONFIG.api_keep_alive
+            API_CLIENT = client.ApiClient(configuration=configuration)
+            CORE_V1_API = client.CoreV1Api(api_client=API_CLIENT)
+        return API_CLIENT
 
-    JOB_VOLUME_NAME = "workflow-job-volume"
 
-    data_init_container = None
-    containers = []
-    worker_container_volume_mounts = []
-    pod_spec_volumes = []
-    pod_spec_init_containers = []
+def k8s_core_api() -> client.CoreV1Api:
+    k8s_api_client()
+    return CORE_V1_API
 
-    workflow_job_volume = None
-    if persistent_volume_claim_id:
-        workflow_job_volume = client.V1Volume(
-            name=JOB_VOLUME_NAME,
-            persistent_volume_claim=client.V1PersistentVolumeClaimVolumeSource(
-                claim_name=persistent_volume_claim_id)
-        )
-
-    # if no workflow_job_volume use EmptyDir as fallback
-    if not workflow_job_volume:
-        workflow_job_volume = client.V1Volume(
-            name=JOB_VOLUME_NAME,
-            empty_dir=client.V1EmptyDirVolumeSource(
-                size_limit=K8S_BACKEND_CONFIG.job_storage_size)
-        )
-
-    pod_spec_volumes.append(
-        workflow_job_volume
-    )
 
-    if input_config_ref:
+def k8s_stream_core_api() -> client.CoreV1Api:
+    """
+    websocket calls (kubernetes.stream) replace call_api of their ApiClient while they run,
+    so they get an own client with the configuration of the shared one, the caller closes it
+    """
+    return client.CoreV1Api(api_client=client.ApiClient(configuration=k8s_api_client().configuration))
 
-        pod_spec_volumes.append(
-            client.V1Volume(
-                name="workflow-api-config",
-                secret=client.V1SecretVolumeSource(
-                    secret_name="workflow-api-config"
-                )
-            )
-        )
-
-        pod_spec_volumes.append(
-            client.V1Volume(
-                name="input-init-config",
-                config_map=client.V1ConfigMapVolumeSource(
-                    name=input_config_ref,
-                    items=[client.V1KeyToPath(key="input-init.json", path="input-init.json")])
-            )
-        )
-
-        data_init_container = client.V1Container(
-            name="data-input-init",
-            image=DATA_SIDE_CAR_IMAGE,
-            image_pull_policy="Always",
-            command=["python3"],
-            args=["init.py"],
-            env=[
-                client.V1EnvVar(name="INPUT_INIT_CONFIG", value="/opt/config/input-init.json"),
-                client.V1EnvVar(name="DATA_DESTINATION", value="/data/"),
-                client.V1EnvVar(name="CONFIG_FILE_PATH", value="/opt/config/workflow-api.cfg")
-            ],
-
-            volume_mounts=[
-                client.V1VolumeMount(
-                    mount_path="/opt/config/input-init.json",
-                    sub_path="input-init.json",
-                    name="input-init-config"
-                ),
-                client.V1VolumeMount(
-                    mount_path="/opt/config/workflow-api.cfg",
-                    sub_path="workflow-api.cfg",
-                    name="workflow-api-config"
-                ),
-                client.V1VolumeMount(
-                    mount_path="/data/",
-                    name=JOB_VOLUME_NAME
-                )
-            ]
-        )
 
-        for resource in input_resources:
-            if resource.type is ServiceResourceType.environment:
-                continue
+def k8s_close_api_client():
+    """
+    closes the connections of the shared ApiClient, a later call creates a new one
+    """
+    global API_CLIENT, CORE_V1_API
 
-            sub_path = None
-            mount_path = resource.mount_path
+    with API_CLIENT_LOCK:
+        api_client = API_CLIENT
+        API_CLIENT = None
+        CORE_V1_API = None
+    if api_client is not None:
+        api_client.close()
 
-            if resource.type is ServiceResourceType.data:
-                sub_path = resource.resource_name
-                mount_path = os.path.join(resource.mount_path, resource.resource_name)
 
-            worker_container_volume_mounts.append(
-                client.V1VolumeMount(
-                    mount_path=mount_path,
-                    sub_path=sub_path,
-                    name=JOB_VOLUME_NAME
-                )
-            )
+@timed(K8S_CALL_SECONDS)
+def k8s_get_healthz():
+    return k8s_api_client().call_api(resource_path="/healthz",
+                                     method="GET",
+                                     #  query_params={"verbose": "true"},
+                                     response_type=str)
 
-        pod_spec_init_containers.append(data_init_container)
 
-    if job_config.worker_image_output_directory:
-        worker_container_volume_mounts.append(
-            client.V1VolumeMount(
-                mount_path=job_config.worker_image_output_directory,
-                name=JOB_VOLUME_NAME
-            )
-        )
-
-        side_car = client.V1Container(
-            name="data-side-car",
-            image=DATA_SIDE_CAR_IMAGE,
-            image_pull_policy="Always"
-        )
-
-        side_car.volume_mounts = [
-            client.V1VolumeMount(
-                mount_path="/output",
-                name=JOB_VOLUME_NAME)]
-
-        containers.append(side_car)
-
-    worker_container = client.V1Container(
-        name="worker",
-        image=job_config.worker_image,
-        image_pull_policy="Always",
-        command=job_config.worker_image_command,
-        args=job_config.worker_image_args,
-        volume_mounts=worker_container_volume_mounts
-    )
+class K8sPodManifestTemplate(BaseModel):
+    """
+    the parts of a pod manifest which only depend on the service, as plain dicts in the format of the api
+    """
+    worker_container: Dict
+    side_car_containers: List[Dict]
+    data_init_container: Dict
+    output_volume_mounts: List[Dict]
+    # volume mount of an input resource by (resource_name, type, mount_path)
+    input_volume_mounts: Dict[tuple, Union[Dict, None]] = {}
+    empty_dir_volume: Dict
+    config_secret_volume: Dict
+    pod_spec: Dict
 
+
+JOB_VOLUME_NAME = "workflow-job-volume"
+
+
+def k8s_get_input_volume_mount(resource: Union[WorkflowInputResource, InputServiceResource]) -> Union[Dict, None]:
+    if resource.type is ServiceResourceType.environment:
+        return None
+
+    if resource.type is ServiceResourceType.data:
+        return {"mountPath": os.path.join(resource.mount_path, resource.resource_name),
+                "name": JOB_VOLUME_NAME,
+                "subPath": resource.resource_name}
+    return {"mountPath": resource.mount_path,
+            "name": JOB_VOLUME_NAME}
+
+
+def k8s_create_pod_manifest_template(job_config: WorkflowResource,
+                                     input_resources: List[InputServiceResource] = None) -> K8sPodManifestTemplate:
+    """
+    compiles the parts of the pod manifest which only depend on the service (worker, data-side-car and
+    data-input-init containers, volumes), once per service instead of once per workflow.
+    Depends on the config of k8s_setup_config (side car image, image pull secret, storage size)
+    """
+    worker_container = {"name": "worker",
+                        "image": job_config.worker_image,
+                        "imagePullPolicy": "Always"}
+    if job_config.worker_image_command is not None:
+        worker_container["command"] = job_config.worker_image_command
+    if job_config.worker_image_args is not None:
+        worker_container["args"] = job_config.worker_image_args
     if job_config.gpu:
-        worker_container.resources = client.V1ResourceRequirements(
-            limits={"nvidia.com/gpu": "1"})
+        worker_container["resources"] = {"limits": {"nvidia.com/gpu": "1"}}
+
+    side_car_containers = []
+    output_volume_mounts = []
+    if job_config.worker_image_output_directory:
+        output_volume_mounts.append({"mountPath": job_config.worker_image_output_directory,
+                                     "name": JOB_VOLUME_NAME})
+        side_car_containers.append({"name": "data-side-car",
+                                    "image": DATA_SIDE_CAR_IMAGE,
+                                    "imagePullPolicy": "Always",
+                                    "volumeMounts": [{"mountPath": "/output",
+                                                      "name": JOB_VOLUME_NAME}]})
+
+    data_init_container = {
+        "name": "data-input-init",
+        "image": DATA_SIDE_CAR_IMAGE,
+        "imagePullPolicy": "Always",
+        "command": ["python3"],
+        "args": ["init.py"],
+        "env": [{"name": "INPUT_INIT_CONFIG", "value": "/opt/config/input-init.json"},
+                {"name": "DATA_DESTINATION", "value": "/data/"},
+                {"name": "CONFIG_FILE_PATH", "value": "/opt/config/workflow-api.cfg"}],
+        "volumeMounts": [{"mountPath": "/opt/config/input-init.json",
+                          "name": "input-init-config",
+                          "subPath": "input-init.json"},
+                         {"mountPath": "/opt/config/workflow-api.cfg",
+                          "name": "workflow-api-config",
+                          "subPath": "workflow-api.cfg"},
+                         {"mountPath": "/data/",
+                          "name": JOB_VOLUME_NAME}]}
+
+    empty_dir = {}
+    if K8S_BACKEND_CONFIG is not None and K8S_BACKEND_CONFIG.job_storage_size is not None:
+        empty_dir["sizeLimit"] = K8S_BACKEND_CONFIG.job_storage_size
+
+    return K8sPodManifestTemplate(
+        worker_container=worker_container,
+        side_car_containers=side_car_containers,
+        data_init_container=data_init_container,
+        output_volume_mounts=output_volume_mounts,
+        input_volume_mounts={(x.resource_name, x.type, x.mount_path): k8s_get_input_volume_mount(x)
+                             for x in input_resources or []},
+        empty_dir_volume={"name": JOB_VOLUME_NAME,
+                          "emptyDir": empty_dir},
+        config_secret_volume={"name": "workflow-api-config",
+                              "secret": {"secretName": "workflow-api-config"}},
+        pod_spec={"restartPolicy": "Never",
+                  "imagePullSecrets": [{"name": IMAGE_PULL_SECRET}]})
+
+
+def k8s_render_pod_manifest(template: K8sPodManifestTemplate,
+                            job_uuid,
+                            config_map_ref: List[str] = None,
+                            input_config_ref: str = None,
+                            input_resources: List[WorkflowInputResource] = None,
+                            job_namespace=NAMESPACE,
+                            persistent_volume_claim_id: str = None,
+                            labels=None,
+                            store_secret_ref: str = None) -> Dict:
+    """
+    pod manifest of a workflow in the format of the api (dict), the workflow specific parts (name, labels,
+    config maps, input volumes, storage secret) are added to the template of its service.
+    The manifest shares unchanged parts with the template and must not be modified.
+    """
+    if persistent_volume_claim_id:
+        volumes = [{"name": JOB_VOLUME_NAME,
+                    "persistentVolumeClaim": {"claimName": persistent_volume_claim_id}}]
+    else:
+        volumes = [template.empty_dir_volume]
 
+    init_containers = []
+    worker_volume_mounts = []
+    if input_config_ref:
+        volumes.append(template.config_secret_volume)
+        volumes.append({"name": "input-init-config",
+                        "configMap": {"name": input_config_ref,
+                                      "items": [{"key": "input-init.json", "path": "input-init.json"}]}})
+        init_containers.append(template.data_init_container)
+
+        for resource in input_resources:
+            key = (resource.resource_name, resource.type, resource.mount_path)
+            if key in template.input_volume_mounts:
+                volume_mount = template.input_volume_mounts[key]
+            else:
+                volume_mount = k8s_get_input_volume_mount(resource)
+            if volume_mount is not None:
+                worker_volume_mounts.append(volume_mount)
+
+    worker_container = {**template.worker_container,
+                        "volumeMounts": worker_volume_mounts + template.output_volume_mounts}
     if config_map_ref:
-        env_from = [client.V1EnvFromSource(config_map_ref=client.V1ConfigMapEnvSource(name=ref))
-                    for ref in config_map_ref]
-        worker_container.env_from = env_from
+        worker_container["envFrom"] = [{"configMapRef": {"name": ref}} for ref in config_map_ref]
 
-    containers.append(worker_container)
+    side_car_containers = template.side_car_containers
+    if store_secret_ref:
+        side_car_containers = [{**x, "envFrom": [{"secretRef": {"name": store_secret_ref}}]}
+                               for x in side_car_containers]
 
-    pod_spec = client.V1PodSpec(restart_policy="Never",
-                                containers=containers,
-                                image_pull_secrets=[
-                                    client.V1LocalObjectReference(name=IMAGE_PULL_SECRET)],
-                                init_containers=pod_spec_init_containers,
-                                volumes=pod_spec_volumes)
+    metadata = {"name": job_uuid,
+                "namespace": job_namespace}
+    if labels is not None:
+        metadata["labels"] = labels
 
-    pod = client.V1Pod(
-        api_version="v1",
-        kind="Pod",
-        metadata=client.V1ObjectMeta(name=job_uuid,
-                                     namespace=job_namespace,
-                                     labels=labels),
-        spec=pod_spec)
-    return pod
+    return {"apiVersion": "v1",
+            "kind": "Pod",
+            "metadata": metadata,
+            "spec": {**template.pod_spec,
+                     "containers": side_car_containers + [worker_container],
+                     "initContainers": init_containers,
+                     "volumes": volumes}}
 
 
+@timed(K8S_CALL_SECONDS)
 def k8s_create_pod(manifest, namespace=NAMESPACE):
-    return client.CoreV1Api().create_namespaced_pod(namespace=namespace,
-                                                    body=manifest)
+    return k8s_core_api().create_namespaced_pod(namespace=namespace,
+                                                body=manifest)
 
 
+@timed(K8S_CALL_SECONDS)
 def k8s_delete_pod(name, namespace=NAMESPACE):
 
-    client.CoreV1Api().delete_namespaced_pod(name=name,
-                                             namespace=namespace)
+    k8s_core_api().delete_namespaced_pod(name=name,
+                                         namespace=namespace)
 
 
+@timed(K8S_CALL_SECONDS)
+def k8s_delete_pods(namespace=NAMESPACE, label_selector: str = None):
+    """
+    deletes all pods matching the label_selector with one request, the pods terminate asynchronously
+    """
+    k8s_core_api().delete_collection_namespaced_pod(namespace=namespace,
+                                                    label_selector=label_selector)
+
+
+@timed(K8S_CALL_SECONDS)
+def k8s_pod_exists(name, namespace=NAMESPACE) -> bool:
+    try:
+        k8s_core_api().read_namespaced_pod(name=name,
+                                           namespace=namespace)
+    except ApiException as e:
+        if e.status == 404:
+            return False
+        raise
+    return True
+
+
+@timed(K8S_CALL_SECONDS)
 def k8s_list_pod_names(namespace=NAMESPACE):
 
-    pod_list = client.CoreV1Api().list_namespaced_pod(namespace=namespace)
+    pod_list = k8s_core_api().list_namespaced_pod(namespace=namespace)
 
     return [x.metadata.name for x in pod_list.items]
 
 
+@timed(K8S_CALL_SECONDS)
 def k8s_create_service(name: str,
                        namespace: str,
                        job_id: str):
@@ -278,18 +357,20 @@ def k8s_create_service(name: str,
             selector={"gx4ki-job-uuid": job_id}),
         metadata=client.V1ObjectMeta(name=name,
                                      labels={"gx4ki-app": "gx4ki-demo"}))
-    client.CoreV1Api().create_namespaced_service(namespace=namespace,
-                                                 body=service_body)
+    k8s_core_api().create_namespaced_service(namespace=namespace,
+                                             body=service_body)
 
 
+@timed(K8S_CALL_SECONDS)
 def k8s_delte_service(name: str,
                       namespace: str):
 
-    client.CoreV1Api().delete_namespaced_service(
+    k8s_core_api().delete_namespaced_service(
         name=name,
         namespace=namespace)
 
 
+@timed(K8S_CALL_SECONDS)
 def k8s_create_config_map(data, name: str, namespace=NAMESPACE, labels=None):
 
     config_map = client.V1ConfigMap(data=data,
@@ -298,141 +379,140 @@ def k8s_create_config_map(data, name: str, namespace=NAMESPACE, labels=None):
                                         namespace=namespace,
                                         labels=labels
                                     ))
-    client.CoreV1Api().create_namespaced_config_map(body=config_map,
-                                                    namespace=namespace)
+    k8s_core_api().create_namespaced_config_map(body=config_map,
+                                                namespace=namespace)
 
 
+@timed(K8S_CALL_SECONDS)
 def k8s_list_config_maps_names(namespace=NAMESPACE):
-    config_maps = client.CoreV1Api().list_namespaced_config_map(namespace=namespace)
+    config_maps = k8s_core_api().list_namespaced_config_map(namespace=namespace)
 
     return [x.metadata.name for x in config_maps.items]
 
 
+@timed(K8S_CALL_SECONDS)
 def k8s_delete_config_map(name, namespace=NAMESPACE):
 
     try:
-        client.CoreV1Api().delete_namespaced_config_map(name=name,
-                                                        namespace=namespace)
-    except ApiException as exc:
-        print(exc)
+        k8s_core_api().delete_namespaced_config_map(name=name,
+                                                    namespace=namespace)
+    except ApiException:
+        k8sclient_logger.exception("delete of config map %s failed", name)
+
+
+@timed(K8S_CALL_SECONDS)
+def k8s_delete_config_maps(namespace=NAMESPACE, label_selector: str = None):
+    """
+    deletes all config maps matching the label_selector with one request
+    """
+    k8s_core_api().delete_collection_namespaced_config_map(namespace=namespace,
+                                                           label_selector=label_selector)
 
 
-def k8s_watch_pod_events(pod_name, pod_state_handle, namespace=NAMESPACE):
-    # TODO currently unused in favor of k8s_get_job_info
+@timed(K8S_CALL_SECONDS)
+def k8s_create_secret(data: Dict[str, str], name: str, namespace=NAMESPACE, labels=None):
+    """
+    creates an opaque secret, data holds the plain (not base64 encoded) values
+    """
+    secret = client.V1Secret(string_data=data,
+                             type="Opaque",
+                             metadata=client.V1ObjectMeta(
+                                 name=name,
+                                 namespace=namespace,
+                                 labels=labels
+                             ))
+    k8s_core_api().create_namespaced_secret(body=secret,
+                                            namespace=namespace)
+
+
+@timed(K8S_CALL_SECONDS)
+def k8s_delete_secrets(namespace=NAMESPACE, label_selector: str = None):
+    """
+    deletes all secrets matching the label_selector with one request
+    """
+    k8s_core_api().delete_collection_namespaced_secret(namespace=namespace,
+                                                       label_selector=label_selector)
+
+
+def k8s_get_pod_state(event_type: str, pod) -> K8sPodStateData:
+
+    def get_container_state(status):
+        if status.running is not None:
+            return {"state": "running",
+                    "details": status.running.to_str(),
+                    "started_at": status.running.started_at}
+        elif status.terminated is not None:
+            return {"state": "terminated",
+                    "details": status.terminated.to_str(),
+                    "reason": status.terminated.reason,
+                    "started_at": status.terminated.started_at,
+                    "finished_at": status.terminated.finished_at}
+        else:
+            return {"state": "waiting",
+                    "details": status.waiting.to_str(),
+                    "reason": status.waiting.reason}
+
+    def get_container_states(statuses):
+        if statuses is None:
+            return None
+        return {x.name: get_container_state(x.state) for x in statuses}
+
+    conditions = pod.status.conditions or []
+    return K8sPodStateData(
+        event_type=event_type,
+        pod_phase=pod.status.phase,
+        pod_state_condition=[condition.to_str() for condition in conditions],
+        container_statuses=get_container_states(pod.status.container_statuses),
+        condition_times={x.type: x.last_transition_time for x in conditions
+                         if x.status == "True" and x.last_transition_time is not None},
+        init_container_statuses=get_container_states(pod.status.init_container_statuses))
+
+
+@timed(K8S_CALL_SECONDS)
+def k8s_list_pods(namespace=NAMESPACE, label_selector: str = None):
+    """
+    returns the V1PodList, its resource_version is the starting point of a watch
+    """
+    return k8s_core_api().list_namespaced_pod(namespace=namespace,
+                                              label_selector=label_selector)
+
 
+def k8s_watch_pods(namespace=NAMESPACE,
+                   label_selector: str = None,
+                   resource_version: str = None,
+                   timeout_seconds: int = 300):
+    """
+    yields the watch events of all pods matching the label_selector after resource_version,
+    raises an ApiException with status 410 if the resource_version is too old
+    """
     event_watch = watch.Watch()
     try:
-        for event in event_watch.stream(
-                client.CoreV1Api().list_namespaced_pod,
-                namespace=namespace,
-                field_selector=f"metadata.name={pod_name}"):
-
-            def get_container_state(status):
-                if status.running is not None:
-                    return {"state": "running",
-                            "details": status.running.to_str()}
-                elif status.terminated is not None:
-                    return {"state": "terminated",
-                            "details": status.terminated.to_str()}
-                else:
-                    return {"state": "waiting",
-                            "details": status.waiting.to_str()}
-
-            container_states = None
-            if event['object'].status.container_statuses is not None:
-                container_states = dict()
-                for x in event['object'].status.container_statuses:
-                    container_states[x.name] = get_container_state(x.state)
-
-            # TODO add pod state condition
-            pod_state = K8sPodStateData(
-                event_type=event['type'],
-                pod_phase=event['object'].status.phase,
-                pod_state_condition=[condition.to_str() for condition in event['object'].status.conditions],
-                container_statuses=container_states)
-
-            can_exit = pod_state_handle(pod_state)
-            if can_exit:
-                break
-
+        yield from event_watch.stream(k8s_core_api().list_namespaced_pod,
+                                      namespace=namespace,
+                                      label_selector=label_selector,
+                                      resource_version=resource_version,
+                                      allow_watch_bookmarks=True,
+                                      timeout_seconds=timeout_seconds)
     finally:
         event_watch.stop()
 
 
-@retry(max_retries=5)
-def k8s_portforward(data, name, namespace=NAMESPACE) -> int:
-
-    # Monkey patch socket.create_connection which is used by http.client and
-    # urllib.request. The same can be done with urllib3.util.connection.create_connection
-    # if the "requests" package is used.
-    # socket_create_connection = socket.create_connection
-    socket_create_connection = urllib3.util.connection.create_connection
-
-    def kubernetes_create_connection(address, *args, **kwargs):
-        dns_name = address[0]
-        if isinstance(dns_name, bytes):
-            dns_name = dns_name.decode()
-        dns_name = dns_name.split(".")
-        if dns_name[-1] != 'kubernetes':
-            return socket_create_connection(address, *args, **kwargs)
-        if len(dns_name) not in (3, 4):
-            raise RuntimeError("Unexpected kubernetes DNS name.")
-        namespace = dns_name[-2]
-        name = dns_name[0]
-        port = address[1]
-        if len(dns_name) == 4:
-            if dns_name[1] in ('svc', 'service'):
-                service = client.CoreV1Api().read_namespaced_service(name, namespace)
-                for service_port in service.spec.ports:
-                    if service_port.port == port:
-                        port = service_port.target_port
-                        break
-                else:
-                    raise RuntimeError(
-                        "Unable to find service port: %s" % port)
-                label_selector = []
-                for key, value in service.spec.selector.items():
-                    label_selector.append("%s=%s" % (key, value))
-                pods = client.CoreV1Api().list_namespaced_pod(
-                    namespace, label_selector=",".join(label_selector)
-                )
-                if not pods.items:
-                    raise RuntimeError("Unable to find service pods.")
-                name = pods.items[0].metadata.name
-                if isinstance(port, str):
-                    for container in pods.items[0].spec.containers:
-                        for container_port in container.ports:
-                            if container_port.name == port:
-                                port = container_port.container_port
-                                break
-                        else:
-                            continue
-                        break
-                    else:
-                        raise RuntimeError(
-                            "Unable to find service port name: %s" % port)
-            elif dns_name[1] != 'pod':
-                raise RuntimeError(
-                    "Unsupported resource type: %s" %
-                    dns_name[1])
-        pf = portforward(client.CoreV1Api().connect_get_namespaced_pod_portforward,
-                         name, namespace, ports=str(port))
-        return pf.socket(port)
-    # socket.create_connection = kubernetes_create_connection
-
-    urllib3.util.connection.create_connection = kubernetes_create_connection
-
-    # Access the nginx http server using the
-    # "<pod-name>.pod.<namespace>.kubernetes" dns name.
-    response = requests.post(
-        f"http://{name}.pod.{namespace}.kubernetes:9999/store",
-        data=data
-    )
-
-    response.close()
-    return response.status_code
+@timed(K8S_CALL_SECONDS)
+def k8s_open_portforward(name: str, namespace=NAMESPACE, port: int = 9999):
+    """
+    opens a port-forward websocket to a port of a pod, .socket(port) is connected to the port.
+    See middlelayer.portforward for http requests over it.
+    """
+    stream_api = k8s_stream_core_api()
+    try:
+        return portforward(stream_api.connect_get_namespaced_pod_portforward,
+                           name, namespace, ports=str(port))
+    finally:
+        # the port-forward keeps only its websocket, the connection pool of the client is not used again
+        stream_api.api_client.close()
 
 
+@timed(K8S_CALL_SECONDS)
 def k8s_get_pod_log(pod_name: str,
                     container: str = None,
                     namespace: str = "default",
@@ -441,13 +521,36 @@ def k8s_get_pod_log(pod_name: str,
     make request against k8s api to retrieve logs from the specified container
     """
 
-    response = client.CoreV1Api().read_namespaced_pod_log(name=pod_name,
-                                                          container=container,
-                                                          namespace=namespace,
-                                                          tail_lines=tail_lines)
+    response = k8s_core_api().read_namespaced_pod_log(name=pod_name,
+                                                      container=container,
+                                                      namespace=namespace,
+                                                      tail_lines=tail_lines)
     return response
 
 
+@timed(K8S_CALL_SECONDS)
+def k8s_open_pod_log_stream(pod_name: str,
+                            container: str = None,
+                            namespace: str = "default",
+                            follow: bool = True,
+                            since_seconds: int = None,
+                            tail_lines: int = None):
+    """
+    opens the log of a container as raw http response, every line starts with its RFC3339 timestamp.
+    The caller reads the response with stream() and has to close it.
+    """
+
+    return k8s_core_api().read_namespaced_pod_log(name=pod_name,
+                                                  container=container,
+                                                  namespace=namespace,
+                                                  follow=follow,
+                                                  timestamps=True,
+                                                  since_seconds=since_seconds,
+                                                  tail_lines=tail_lines,
+                                                  _preload_content=False)
+
+
+@timed(K8S_CALL_SECONDS)
 def k8s_create_persistent_volume_claim(name: str,
                                        namespace: str,
                                        storage_size_in_Gi: str,
@@ -464,12 +567,62 @@ def k8s_create_persistent_volume_claim(name: str,
         spec=pvc_spec
     )
 
-    client.CoreV1Api().create_namespaced_persistent_volume_claim(body=pvc_manifest,
-                                                                 namespace=namespace)
+    k8s_core_api().create_namespaced_persistent_volume_claim(body=pvc_manifest,
+                                                             namespace=namespace)
 
 
+@timed(K8S_CALL_SECONDS)
 def k8s_delete_persistent_volume_claim(name,
                                        namespace):
-    resonse = client.CoreV1Api().delete_namespaced_persistent_volume_claim(name=name,
-                                                                           namespace=namespace)
-    print(resonse)
+    resonse = k8s_core_api().delete_namespaced_persistent_volume_claim(name=name,
+                                                                       namespace=namespace)
+    k8sclient_logger.debug(resonse)
+
+
+@timed(K8S_CALL_SECONDS)
+def k8s_delete_persistent_volume_claims(namespace=NAMESPACE, label_selector: str = None):
+    """
+    deletes all persistent volume claims matching the label_selector with one request
+    """
+    k8s_core_api().delete_collection_namespaced_persistent_volume_claim(namespace=namespace,
+                                                                        label_selector=label_selector)
+
+
+@timed(K8S_CALL_SECONDS)
+def k8s_list_resource_page(kind: str,
+                           namespace=NAMESPACE,
+                           label_selector: str = None,
+                           limit: int = 100,
+                           continue_token: str = None):
+    """
+    returns one page of the pods, config maps, persistent volume claims or secrets (kind) matching the
+    label_selector,
+    the next page starts at metadata._continue of the returned list
+    """
+    api = k8s_core_api()
+    list_handle = {"pod": api.list_namespaced_pod,
+                   "config_map": api.list_namespaced_config_map,
+                   "persistent_volume_claim": api.list_namespaced_persistent_volume_claim,
+                   "secret": api.list_namespaced_secret}[kind]
+    return list_handle(namespace=namespace,
+                       label_selector=label_selector,
+                       limit=limit,
+                       _continue=continue_token)
+
+
+@timed(K8S_CALL_SECONDS)
+def k8s_list_resource_labels(namespace=NAMESPACE, label_selector: str = None) -> List[Dict[str, str]]:
+    """
+    returns the labels of all pods, config maps, persistent volume claims and secrets matching the label_selector,
+    one request per resource kind
+    """
+    api = k8s_core_api()
+    labels = []
+    for list_handle in (api.list_namespaced_pod,
+                        api.list_namespaced_config_map,
+                        api.list_namespaced_persistent_volume_claim,
+                        api.list_namespaced_secret):
+        resource_list = list_handle(namespace=namespace,
+                                    label_selector=label_selector)
+        labels.extend(x.metadata.labels or {} for x in resource_list.items)
+    return labels
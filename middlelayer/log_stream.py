@@ -0,0 +1,351 @@
+import sys
+import math
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from itertools import islice
+from threading import Lock
+from typing import AsyncIterator, Callable, Deque, Dict, Iterator, List, NamedTuple, Tuple, Union
+
+from middlelayer.executor import BlockingIOExecutor
+from middlelayer.k8sClient import k8s_open_pod_log_stream
+
+formatter = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+stdout_handle = logging.StreamHandler(sys.stdout)
+stdout_handle.setFormatter(formatter)
+
+log_stream_logger = logging.getLogger("log_stream")
+log_stream_logger.setLevel(level=logging.DEBUG)
+log_stream_logger.addHandler(stdout_handle)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class LogLine(NamedTuple):
+    # normalized timestamp of the line, used as resume token
+    token: str
+    # the line as sent by kubernetes, starting with its timestamp
+    data: bytes
+
+
+def normalize_timestamp(timestamp: str) -> str:
+    """
+    kubernetes trims trailing zeros of RFC3339Nano timestamps, padded to 9 digits they compare as strings
+    """
+    timestamp = timestamp.strip().rstrip("Z")
+    base, _, fraction = timestamp.partition(".")
+    return f"{base}.{fraction:0<9}Z"
+
+
+def get_since_seconds(token: str) -> int:
+    """
+    the log api accepts only whole seconds, lines up to the token are dropped by the reader
+    """
+    since = datetime.strptime(token.split(".")[0], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+    return max(math.ceil((datetime.now(timezone.utc) - since).total_seconds()) + 1, 1)
+
+
+def to_log_line(line: bytes) -> LogLine:
+    return LogLine(normalize_timestamp(line.split(b" ", 1)[0].decode()), line + b"\n")
+
+
+def iter_log_batches(response) -> Iterator[List[LogLine]]:
+    """
+    the complete lines of every chunk of the response as one batch
+    """
+    pending = b""
+    for chunk in response.stream(CHUNK_SIZE):
+        pending += chunk
+        *complete, pending = pending.split(b"\n")
+        batch = [to_log_line(x) for x in complete if x]
+        if batch:
+            yield batch
+    if pending:
+        yield [to_log_line(pending)]
+
+
+class PodLogStream():
+    """
+    one follow request against the log api of a container, shared by all readers.
+    The last buffer_lines lines are kept, readers address lines by their absolute index.
+    """
+
+    def __init__(self,
+                 pod_name: str,
+                 container: str,
+                 namespace: str,
+                 open_handle: Callable,
+                 buffer_lines: int,
+                 executor: BlockingIOExecutor,
+                 since: str = None):
+        self.pod_name = pod_name
+        self.container = container
+        self.namespace = namespace
+        self.open_handle = open_handle
+        self.executor = executor
+        # the stream holds every line after since, without since only the tail of the log
+        self.since = since
+
+        self.lock = Lock()
+        self.lines: Deque[LogLine] = deque(maxlen=buffer_lines)
+        self.offset = 0
+        self.closed = False
+        self.readers = 0
+        self.response = None
+        self.waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def start(self):
+        # the follow request blocks a thread of the executor until the container terminates or the last reader left
+        self.executor.submit(self.__read_loop)
+
+    def stop(self):
+        with self.lock:
+            self.closed = True
+            response = self.response
+        if response is not None:
+            response.close()
+
+    def covers(self, token: str) -> bool:
+        """
+        True if every line after token is in the buffer
+        """
+        with self.lock:
+            if self.offset == 0 and self.since is not None and token >= self.since:
+                return True
+            return bool(self.lines) and token >= self.lines[0].token
+
+    def read(self, index: int) -> Tuple[List[LogLine], int, bool]:
+        """
+        returns the lines from the absolute index on, the index of the next line and if the stream is closed
+        """
+        with self.lock:
+            start = max(index, self.offset) - self.offset
+            return list(islice(self.lines, start, None)), self.offset + len(self.lines), self.closed
+
+    def get_tail_index(self, tail_lines: Union[int, None]) -> int:
+        with self.lock:
+            if tail_lines is None:
+                return self.offset
+            return max(self.offset + len(self.lines) - tail_lines, self.offset)
+
+    async def wait(self, index: int):
+        """
+        waits until a line at index exists or the stream is closed
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if self.closed or self.offset + len(self.lines) > index:
+                return
+            future = loop.create_future()
+            self.waiters.append((loop, future))
+        try:
+            await future
+        finally:
+            with self.lock:
+                if (loop, future) in self.waiters:
+                    self.waiters.remove((loop, future))
+
+    def __read_loop(self):
+        try:
+            response = self.open_handle(pod_name=self.pod_name,
+                                        container=self.container,
+                                        namespace=self.namespace,
+                                        follow=True,
+                                        since_seconds=get_since_seconds(self.since) if self.since else None,
+                                        tail_lines=None if self.since else self.lines.maxlen)
+            with self.lock:
+                self.response = response
+                closed = self.closed
+            if closed:
+                response.close()
+                return
+
+            for batch in iter_log_batches(response):
+                self.__append(batch)
+        except Exception:
+            if not self.closed:
+                log_stream_logger.exception("log stream of pod %s failed", self.pod_name)
+        finally:
+            with self.lock:
+                self.closed = True
+            self.__wakeup()
+            log_stream_logger.debug("log stream of pod %s closed", self.pod_name)
+
+    def __append(self, batch: List[LogLine]):
+        with self.lock:
+            self.offset += max(len(self.lines) + len(batch) - self.lines.maxlen, 0)
+            self.lines.extend(batch)
+        self.__wakeup()
+
+    def __wakeup(self):
+        with self.lock:
+            waiters = self.waiters
+            self.waiters = []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(self.__resolve, future)
+
+    @staticmethod
+    def __resolve(future: asyncio.Future):
+        if not future.done():
+            future.set_result(None)
+
+
+class LogStreamLimitReached(Exception):
+    """
+    every thread which follows a container log is taken
+    """
+
+
+class PodLogStreamer():
+    """
+    serves the logs of containers incrementally.
+    Concurrent followers of the same container share one upstream request, a reader continues after the
+    resume token (the timestamp of the last line it received).
+    Every followed container holds a thread of the follow executor until it terminates, a follow of a further
+    container is rejected while all max_follows threads are taken. One-shot reads and the catch-up of
+    followers are read in batches by a separate executor, so they never wait for a follow.
+    """
+
+    def __init__(self,
+                 buffer_lines: int = 10000,
+                 max_follows: int = 32,
+                 read_workers: int = 8,
+                 open_handle: Callable = k8s_open_pod_log_stream):
+        self.buffer_lines = buffer_lines
+        self.max_follows = max_follows
+        self.open_handle = open_handle
+        self.follow_executor = BlockingIOExecutor(max_workers=max_follows, name="log-follow")
+        self.read_executor = BlockingIOExecutor(max_workers=read_workers, name="log-read")
+
+        self.lock = Lock()
+        self.streams: Dict[Tuple[str, str, str], PodLogStream] = {}
+
+    def get_stream_count(self) -> int:
+        with self.lock:
+            return len(self.streams)
+
+    def close(self):
+        """
+        closes the followed logs, their readers end
+        """
+        with self.lock:
+            streams = list(self.streams.values())
+            self.streams.clear()
+        for stream in streams:
+            stream.stop()
+        self.follow_executor.shutdown(wait=False)
+        self.read_executor.shutdown(wait=False)
+
+    def read(self,
+             pod_name: str,
+             container: str,
+             namespace: str,
+             after: str = None,
+             follow: bool = True,
+             tail_lines: int = None) -> AsyncIterator[bytes]:
+        """
+        yields the log lines after the resume token `after`, without token the last tail_lines lines.
+        With follow the iterator ends when the container terminates.
+        Raises LogStreamLimitReached if a further container cannot be followed.
+        """
+        last_token = normalize_timestamp(after) if after else None
+
+        if not follow:
+            return self.__read(pod_name, container, namespace, last_token, tail_lines)
+
+        with self.lock:
+            stream = self.streams.get((namespace, pod_name, container))
+            if (stream is None or stream.closed) and len(self.streams) >= self.max_follows:
+                raise LogStreamLimitReached(f"{len(self.streams)} container logs are followed already")
+        return self.__follow(pod_name, container, namespace, last_token, tail_lines)
+
+    async def __read(self,
+                     pod_name: str,
+                     container: str,
+                     namespace: str,
+                     last_token: Union[str, None],
+                     tail_lines: Union[int, None]) -> AsyncIterator[bytes]:
+        async for line in self.__read_once(pod_name, container, namespace, last_token, tail_lines):
+            yield line.data
+
+    async def __follow(self,
+                       pod_name: str,
+                       container: str,
+                       namespace: str,
+                       last_token: Union[str, None],
+                       tail_lines: Union[int, None]) -> AsyncIterator[bytes]:
+        stream = self.__acquire(pod_name, container, namespace, last_token)
+        try:
+            if last_token is not None and not stream.covers(last_token):
+                # the shared stream started later, the lines in between are read once
+                async for line in self.__read_once(pod_name, container, namespace, last_token, None):
+                    last_token = line.token
+                    yield line.data
+
+            index = stream.get_tail_index(tail_lines) if last_token is None else 0
+            while True:
+                lines, index, closed = stream.read(index)
+                for line in lines:
+                    if last_token is not None and line.token <= last_token:
+                        continue
+                    last_token = line.token
+                    yield line.data
+                if closed and not lines:
+                    return
+                await stream.wait(index)
+        finally:
+            self.__release(stream)
+
+    async def __read_once(self,
+                          pod_name: str,
+                          container: str,
+                          namespace: str,
+                          after: Union[str, None],
+                          tail_lines: Union[int, None]) -> AsyncIterator[LogLine]:
+        response = await self.read_executor.run(self.open_handle,
+                                                pod_name=pod_name,
+                                                container=container,
+                                                namespace=namespace,
+                                                follow=False,
+                                                since_seconds=get_since_seconds(after) if after else None,
+                                                tail_lines=None if after else tail_lines)
+        batches = iter_log_batches(response)
+        try:
+            while True:
+                batch = await self.read_executor.run(next, batches, None)
+                if batch is None:
+                    return
+                for line in batch:
+                    if after is None or line.token > after:
+                        yield line
+        finally:
+            response.close()
+
+    def __acquire(self, pod_name: str, container: str, namespace: str, since: Union[str, None]) -> PodLogStream:
+        key = (namespace, pod_name, container)
+        with self.lock:
+            stream = self.streams.get(key)
+            if stream is None or stream.closed:
+                stream = PodLogStream(pod_name=pod_name,
+                                      container=container,
+                                      namespace=namespace,
+                                      open_handle=self.open_handle,
+                                      buffer_lines=self.buffer_lines,
+                                      executor=self.follow_executor,
+                                      since=since)
+                self.streams[key] = stream
+                stream.start()
+            stream.readers += 1
+            return stream
+
+    def __release(self, stream: PodLogStream):
+        key = (stream.namespace, stream.pod_name, stream.container)
+        with self.lock:
+            stream.readers -= 1
+            if stream.readers > 0:
+                return
+            if self.streams.get(key) is stream:
+                self.streams.pop(key)
+        stream.stop()
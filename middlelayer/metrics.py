@@ -0,0 +1,127 @@
+"""
+prometheus metrics of the workflow api, exported at /metrics
+"""
+import time
+from typing import Callable, Dict, Iterable, Iterator, Union
+
+from prometheus_client import Counter, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import GaugeMetricFamily, Metric
+
+# duration of the kubernetes api calls, labeled with the k8s_* function
+K8S_CALL_SECONDS = Histogram("workflow_api_k8s_call_seconds",
+                             "duration of the calls of the kubernetes client",
+                             ["function"])
+# duration of the storage calls, labeled with the ImlaMinio method
+MINIO_CALL_SECONDS = Histogram("workflow_api_minio_call_seconds",
+                               "duration of the calls of the minio client",
+                               ["method"])
+# until the response starts, the duration of a streamed body is not included
+HTTP_REQUEST_SECONDS = Histogram("workflow_api_http_request_seconds",
+                                 "latency of the http requests until the response starts",
+                                 ["method", "route", "status"])
+TRANSFER_BYTES = Counter("workflow_api_transfer_bytes",
+                         "bytes uploaded into and downloaded from the user storage through the api",
+                         ["direction"])
+TRANSFER_THROUGHPUT = Histogram("workflow_api_transfer_throughput_bytes_per_second",
+                                "throughput of the uploads and downloads through the api",
+                                ["direction"],
+                                buckets=[2**x * 1024**2 for x in range(-4, 11)])
+
+UPLOAD = "upload"
+DOWNLOAD = "download"
+
+
+def record_transfer(direction: str, size: int, duration: float):
+    TRANSFER_BYTES.labels(direction).inc(size)
+    if duration > 0:
+        TRANSFER_THROUGHPUT.labels(direction).observe(size / duration)
+
+
+def count_transfer(direction: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    passes the chunks of a streamed body through and records the transfer when the stream ends
+    """
+    started = time.perf_counter()
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        record_transfer(direction, size, time.perf_counter() - started)
+
+
+def gauge(name: str, documentation: str, values: Union[float, Dict[str, float]], label: str = None) -> Metric:
+    """
+    a gauge of one value or of one value per label value
+    """
+    if label is None:
+        return GaugeMetricFamily(name, documentation, value=values)
+    family = GaugeMetricFamily(name, documentation, labels=[label])
+    for label_value, value in values.items():
+        family.add_metric([label_value], value)
+    return family
+
+
+class StateCollector():
+    """
+    collects the gauges of the api state (workflows per phase, queues, threads) only when /metrics is scraped,
+    the request and call paths do not update them
+    """
+
+    def __init__(self):
+        self.collect_handle: Callable[[], Iterable[Metric]] = None
+
+    def describe(self) -> Iterable[Metric]:
+        return []
+
+    def collect(self) -> Iterable[Metric]:
+        if self.collect_handle is None:
+            return []
+        return self.collect_handle()
+
+
+STATE_COLLECTOR = StateCollector()
+REGISTRY.register(STATE_COLLECTOR)
+
+
+def get_metrics() -> bytes:
+    return generate_latest(REGISTRY)
+
+
+class RequestMetricsMiddleware():
+    """
+    ASGI middleware which observes HTTP_REQUEST_SECONDS, the route label is the path template of the matched route
+    (e.g. /services/{service_id}/info), so the number of label values is bounded
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        observed = False
+
+        def observe(status: int):
+            nonlocal observed
+            observed = True
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(scope["method"],
+                                        getattr(route, "path", "unmatched"),
+                                        str(status)).observe(time.perf_counter() - started)
+
+        async def send_observed(message):
+            if message["type"] == "http.response.start":
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_observed)
+        except Exception:
+            if not observed:
+                observe(500)
+            raise
+
@@ -1,6 +1,7 @@
 # pylint: disable=no-name-in-module
-from typing import List, Union
+from typing import Dict, FrozenSet, List, Union
 from datetime import datetime, timedelta
+from functools import cached_property
 from enum import IntEnum, Enum
 from pydantic import BaseModel
 
@@ -11,13 +12,22 @@ class Service():
     duration: timedelta
 
 
+class WorkflowJobPhase(str, Enum):
+    QUEUED = "QUEUED"
+    PREPARING = "PREPARING"
+    RUNNING = "RUNNING"
+    STORING = "STORING"
+    FINISHED = "FINISHED"
+    CANCELED = "CANCELED"
+
+
 class ServiceResourceType(IntEnum):
     environment = 1
     data = 2
     data_zip = 3
 
-# TODO environment type data size in k8s can only be 1MB in v1.21 and 8MB v1.22,
-# it depends on the etcd
+# environment type data becomes a config map, its size is limited by the etcd of the cluster
+# (K8sBackendConfig.config_map_max_bytes)
 
 
 class WorkflowInputResource(BaseModel):
@@ -51,6 +61,27 @@ class ServiceDescription(BaseModel):
     inputs: List[InputServiceResource]
     outputs: List[ServiceResouce]
     workflow_resource: WorkflowResource
+    # limits the number of concurrently running workflows of this service
+    max_concurrent_workflows: Union[int, None] = None
+    # seconds the resources of a finished workflow are kept, e.g. to inspect the pod (default of the api)
+    retention_seconds: Union[int, None] = None
+
+    # lookups of the resources, computed once per loaded description (a description is not modified after loading)
+    @cached_property
+    def inputs_by_name(self) -> Dict[str, InputServiceResource]:
+        return {x.resource_name: x for x in self.inputs}
+
+    @cached_property
+    def input_names(self) -> FrozenSet[str]:
+        return frozenset(self.inputs_by_name)
+
+    @cached_property
+    def outputs_by_name(self) -> Dict[str, ServiceResouce]:
+        return {x.resource_name: x for x in self.outputs}
+
+    @cached_property
+    def output_names(self) -> FrozenSet[str]:
+        return frozenset(self.outputs_by_name)
 
 
 class ContainerSpecs(BaseModel):
@@ -73,6 +104,85 @@ class WorkflowStoreInfo(BaseModel):
     result_directory: str = "/output"
     result_files: List[str]
 
+
+class WorkflowCallbackInfo(BaseModel):
+    # the data-side-car reports to {url}/progress and {url}/completed with the header callback-token
+    url: str
+    token: str
+
+
+class WorkflowStoreProgress(BaseModel):
+    stored_files: int = 0
+    total_files: Union[int, None] = None
+    stored_bytes: int = 0
+
+
+class TimelineEntryKind(str, Enum):
+    PHASE = "phase"
+    CONDITION = "condition"
+    CONTAINER = "container"
+    INIT_CONTAINER = "init_container"
+
+
+class WorkflowTimelineEntry(BaseModel):
+    kind: TimelineEntryKind
+    # the phase of the workflow, the type of a pod condition (e.g. PodScheduled, Initialized) or a container name
+    name: str
+    # state of a container (waiting, running, terminated) and its reason (e.g. ContainerCreating, Completed)
+    state: Union[str, None] = None
+    reason: Union[str, None] = None
+    # from the pod for conditions and started or finished containers, otherwise when the monitor observed it
+    at: datetime
+
+
+class WorkflowStoreResult(BaseModel):
+    success: bool = True
+    stored_files: List[str] = []
+    message: Union[str, None] = None
+
+class UploadResult(BaseModel):
+    upload_file: str
+    size: int
+    parts: int
+    duration: float
+    throughput_mb_s: float
+    sha256: Union[str, None] = None
+    # the content was already stored, only the reference to it was written
+    deduplicated: bool = False
+
+
+class InputReference(BaseModel):
+    # content of an input object which refers to a content-addressed blob of the user storage
+    sha256: str
+    size: int
+
+class DataPlaneMode(str, Enum):
+    PROXY = "proxy"
+    PRESIGNED = "presigned"
+
+
+class PresignedUrl(BaseModel):
+    url: str
+    method: str
+    expires_in: int
+
+
+class ResultManifestEntry(BaseModel):
+    name: str
+    size: int
+    etag: str
+    checksum_sha256: Union[str, None] = None
+    last_modified: Union[datetime, None] = None
+
+
+class ResultManifest(BaseModel):
+    # written once the result of a workflow is stored, per workflow and as latest result of the service
+    service_id: str
+    workflow_id: str
+    storage_path: str
+    created_at: datetime
+    files: List[ResultManifestEntry] = []
+
 #####################
 # K8S SPECIFIC MODELS
 #####################
@@ -86,3 +196,31 @@ class K8sStorageType(str, Enum):
 class K8sBackendConfig(BaseModel):
     job_storage_type: Union[K8sStorageType, None] = K8sStorageType.EMPTY_DIR
     job_storage_size: Union[str, None] = "5Gi"
+    # lines of a followed container log kept for readers joining later
+    log_buffer_lines: Union[int, None] = 10000
+    # threads which follow container logs, every followed container holds one, further follows are rejected
+    log_stream_workers: Union[int, None] = 32
+    # threads which read container logs without follow and the lines a follower missed
+    log_read_workers: Union[int, None] = 8
+    # threads which store the results of finished workflows
+    monitor_workers: Union[int, None] = 8
+    # connections of the shared kubernetes api client
+    api_connection_pool_size: Union[int, None] = 32
+    api_keep_alive: Union[bool, None] = True
+    # seconds until the deletion of the resources of a workflow has to be confirmed
+    cleanup_timeout: Union[int, None] = 300
+    cleanup_poll_interval: Union[float, None] = 1.0
+    # seconds between the comparisons of the labelled resources with the workflow registry, 0 disables it
+    reconcile_interval: Union[float, None] = 300
+    # seconds after the last change before resources of unknown or unmonitored workflows are reclaimed
+    reconcile_orphan_grace_period: Union[float, None] = 600
+    # seconds after the end of a workflow before its remaining resources are reclaimed
+    reconcile_finished_grace_period: Union[float, None] = 600
+    reconcile_page_size: Union[int, None] = 100
+    # seconds to open a port-forward channel to a pod, to wait for the response of the data-side-car
+    # and until an idle channel is closed
+    port_forward_connect_timeout: Union[float, None] = 10
+    port_forward_read_timeout: Union[float, None] = 600
+    port_forward_idle_timeout: Union[float, None] = 30
+    # max. size of an environment input and of the data of its config map, ~1MB is accepted by a default etcd
+    config_map_max_bytes: Union[int, None] = 1024*1024
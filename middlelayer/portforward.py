@@ -0,0 +1,204 @@
+import sys
+import time
+import socket
+import logging
+import http.client
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from threading import Thread, Lock
+from typing import Callable, Dict, List, Tuple
+
+from kubernetes.client.exceptions import ApiException
+
+from middlelayer.k8sClient import k8s_open_portforward
+
+formatter = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+stdout_handle = logging.StreamHandler(sys.stdout)
+stdout_handle.setFormatter(formatter)
+
+portforward_logger = logging.getLogger("pod_portforward")
+portforward_logger.setLevel(level=logging.DEBUG)
+portforward_logger.addHandler(stdout_handle)
+
+
+class PortForwardChannel():
+    """
+    one port-forward websocket to a port of a pod with a http connection on top,
+    reusable as long as the server keeps the connection alive
+    """
+
+    def __init__(self, forward, pod_name: str, namespace: str, port: int, read_timeout: float):
+        self.forward = forward
+        self.connection = http.client.HTTPConnection(f"{pod_name}.pod.{namespace}", port, timeout=read_timeout)
+        self.connection.sock = forward.socket(port)
+        self.connection.sock.settimeout(read_timeout)
+        self.last_used = time.monotonic()
+        self.requests = 0
+
+    @property
+    def reusable(self) -> bool:
+        # http.client drops the socket if the server closes the connection
+        return self.connection.sock is not None and self.forward.connected
+
+    def request(self, method: str, path: str, body: bytes, headers: Dict[str, str]) -> Tuple[int, bytes]:
+        self.requests += 1
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        data = response.read()
+        self.last_used = time.monotonic()
+        return response.status, data
+
+    def close(self):
+        try:
+            self.connection.close()
+        finally:
+            self.forward.close()
+
+
+class PodPortForwardPool():
+    """
+    http requests to pods through port-forward channels of the kubernetes api.
+
+    Unlike the urllib3 monkeypatch this replaced, nothing process-wide is changed: every channel belongs
+    to one pod and port, idle channels are reused for the next request to the same pod and closed after
+    idle_timeout. Opening a channel is bounded by connect_timeout, every read by read_timeout.
+    A failed request on a reused channel is repeated on a new channel, because the server may have closed
+    it in the meantime. Requests on new channels are retried up to retries times (e.g. the server in the
+    pod is not listening yet), timeouts are not retried.
+    """
+
+    def __init__(self,
+                 connect_timeout: float = 10.0,
+                 read_timeout: float = 600.0,
+                 idle_timeout: float = 30.0,
+                 max_idle_per_pod: int = 2,
+                 retries: int = 2,
+                 retry_delay: float = 1.0,
+                 open_handle: Callable = k8s_open_portforward):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.idle_timeout = idle_timeout
+        self.max_idle_per_pod = max_idle_per_pod
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.open_handle = open_handle
+
+        self.lock = Lock()
+        self.idle: Dict[Tuple[str, str, int], List[PortForwardChannel]] = {}
+
+    def request(self,
+                method: str,
+                pod_name: str,
+                namespace: str,
+                port: int,
+                path: str,
+                body: bytes = None,
+                headers: Dict[str, str] = None) -> Tuple[int, bytes]:
+        """
+        returns status code and body of the response
+        """
+        key = (namespace, pod_name, port)
+        channel = self.__acquire(key)
+        attempt = 0
+
+        while True:
+            reused = channel is not None
+            try:
+                if channel is None:
+                    channel = self.__open_channel(key)
+                status, data = channel.request(method, path, body, headers or {})
+            except (TimeoutError, socket.timeout):
+                if channel is not None:
+                    channel.close()
+                raise
+            except (OSError, http.client.HTTPException, ApiException) as e:
+                if channel is not None:
+                    channel.close()
+                    channel = None
+                if reused:
+                    portforward_logger.debug("reused channel to pod %s failed, open a new one", pod_name)
+                    continue
+                if attempt >= self.retries:
+                    raise
+                attempt += 1
+                portforward_logger.warning("request to pod %s failed: %s, retry in %ss",
+                                           pod_name, e, self.retry_delay)
+                time.sleep(self.retry_delay)
+                continue
+
+            self.__release(key, channel)
+            return status, data
+
+    def close_pod(self, pod_name: str, namespace: str):
+        """
+        closes the idle channels of a pod, e.g. before it is deleted
+        """
+        with self.lock:
+            keys = [key for key in self.idle if key[0] == namespace and key[1] == pod_name]
+            channels = [channel for key in keys for channel in self.idle.pop(key)]
+        for channel in channels:
+            channel.close()
+
+    def get_idle_count(self) -> int:
+        with self.lock:
+            return sum(len(channels) for channels in self.idle.values())
+
+    def close(self):
+        with self.lock:
+            channels = [channel for channels in self.idle.values() for channel in channels]
+            self.idle = {}
+        for channel in channels:
+            channel.close()
+
+    def __acquire(self, key) -> PortForwardChannel:
+        expired = []
+        channel = None
+        now = time.monotonic()
+        with self.lock:
+            channels = self.idle.get(key, [])
+            while channels:
+                candidate = channels.pop()
+                if now - candidate.last_used < self.idle_timeout and candidate.reusable:
+                    channel = candidate
+                    break
+                expired.append(candidate)
+            if not channels:
+                self.idle.pop(key, None)
+
+        for candidate in expired:
+            candidate.close()
+        return channel
+
+    def __release(self, key, channel: PortForwardChannel):
+        with self.lock:
+            channels = self.idle.setdefault(key, [])
+            if channel.reusable and len(channels) < self.max_idle_per_pod:
+                channels.append(channel)
+                return
+            if not channels:
+                self.idle.pop(key)
+        channel.close()
+
+    def __open_channel(self, key) -> PortForwardChannel:
+        namespace, pod_name, port = key
+        forward = self.__open_forward(pod_name, namespace, port)
+        return PortForwardChannel(forward, pod_name, namespace, port, self.read_timeout)
+
+    def __open_forward(self, pod_name: str, namespace: str, port: int):
+        # the websocket handshake has no timeout option, it is bounded from the outside
+        future = Future()
+
+        def open_forward():
+            try:
+                future.set_result(self.open_handle(name=pod_name, namespace=namespace, port=port))
+            except Exception as e:
+                future.set_exception(e)
+
+        Thread(target=open_forward, name=f"portforward_{pod_name}", daemon=True).start()
+        try:
+            return future.result(timeout=self.connect_timeout)
+        except FutureTimeoutError:
+            # a late channel is closed right away
+            future.add_done_callback(lambda x: x.exception() is None and x.result().close())
+            raise TimeoutError(f"port-forward to pod {pod_name} not established "
+                               f"within {self.connect_timeout}s")
@@ -0,0 +1,248 @@
+import sys
+import time
+import logging
+from datetime import datetime, timezone
+from decimal import Decimal
+from threading import Thread, Condition, Lock
+from typing import Callable, Dict, Iterator, List, Union
+
+from kubernetes.utils import parse_quantity
+
+from middlelayer.models import BaseModel, WorkflowJobPhase
+from middlelayer.registry import WorkflowRegistry, WorkflowRecord, TERMINAL_PHASES, ACTIVE_PHASES
+from middlelayer.k8sClient import k8s_list_resource_page
+
+formatter = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+stdout_handle = logging.StreamHandler(sys.stdout)
+stdout_handle.setFormatter(formatter)
+
+reconciler_logger = logging.getLogger("resource_reconciler")
+reconciler_logger.setLevel(level=logging.DEBUG)
+reconciler_logger.addHandler(stdout_handle)
+
+
+RESOURCE_KINDS = ("pod", "config_map", "persistent_volume_claim", "secret")
+GPU_RESOURCE = "nvidia.com/gpu"
+
+
+class ClusterResource(BaseModel):
+    kind: str
+    name: str
+    workflow_id: Union[str, None] = None
+    created_at: Union[datetime, None] = None
+    cpu: float = 0
+    gpu: float = 0
+    storage_bytes: int = 0
+
+
+class ReconcilerMetrics(BaseModel):
+    runs: int = 0
+    last_run_at: Union[datetime, None] = None
+    last_run_seconds: Union[float, None] = None
+    # workflows of the last run with resources, but without a running workflow
+    orphaned_workflows: int = 0
+    adopted_workflows: int = 0
+    reclaimed_workflows: int = 0
+    reclaimed_pods: int = 0
+    reclaimed_config_maps: int = 0
+    reclaimed_persistent_volume_claims: int = 0
+    reclaimed_secrets: int = 0
+    reclaimed_cpu: float = 0
+    reclaimed_gpu: float = 0
+    reclaimed_storage_bytes: int = 0
+
+
+def get_requested(resources, name: str) -> Decimal:
+    """
+    requested amount of a resource, the limit if only a limit is set (e.g. gpus)
+    """
+    if resources is None:
+        return Decimal(0)
+    for quantities in (resources.requests, resources.limits):
+        if quantities and name in quantities:
+            return parse_quantity(quantities[name])
+    return Decimal(0)
+
+
+def get_cluster_resource(kind: str, item) -> ClusterResource:
+    labels = item.metadata.labels or {}
+    resource = ClusterResource(kind=kind,
+                               name=item.metadata.name,
+                               workflow_id=labels.get("workflow-id"),
+                               created_at=item.metadata.creation_timestamp)
+
+    if kind == "pod":
+        containers = item.spec.containers or []
+        resource.cpu = float(sum(get_requested(x.resources, "cpu") for x in containers))
+        resource.gpu = float(sum(get_requested(x.resources, GPU_RESOURCE) for x in containers))
+    elif kind == "persistent_volume_claim":
+        resource.storage_bytes = int(get_requested(item.spec.resources, "storage"))
+
+    return resource
+
+
+class ResourceReconciler():
+    """
+    Periodically compares the labelled resources of the cluster with the workflow registry.
+
+    Resources of workflows which are unknown, queued or finished (a failed cleanup) are deleted,
+    resources of active workflows without monitor (e.g. after a failed recovery) are handed to
+    adopt_handle. Finished workflows are kept until their deferred cleanup (cleanup_at) is due.
+    Nothing is touched before its grace period has passed since the last change of the
+    workflow and the creation of its newest resource, so workflows in preparation are left alone.
+    The first run starts right away, which reclaims the leftovers of a previous process.
+    """
+
+    def __init__(self,
+                 namespace: str,
+                 label_selector: str,
+                 workflow_registry: WorkflowRegistry,
+                 delete_handle: Callable[[str], None],
+                 adopt_handle: Callable[[WorkflowRecord], bool],
+                 is_monitored_handle: Callable[[str], bool],
+                 interval: float = 300,
+                 orphan_grace_period: float = 600,
+                 finished_grace_period: float = 300,
+                 page_size: int = 100,
+                 list_handle: Callable = k8s_list_resource_page):
+        self.namespace = namespace
+        self.label_selector = label_selector
+        self.workflow_registry = workflow_registry
+        self.delete_handle = delete_handle
+        self.adopt_handle = adopt_handle
+        self.is_monitored_handle = is_monitored_handle
+        self.interval = interval
+        self.orphan_grace_period = orphan_grace_period
+        self.finished_grace_period = finished_grace_period
+        self.page_size = page_size
+        self.list_handle = list_handle
+
+        self.metrics_lock = Lock()
+        self.metrics = ReconcilerMetrics()
+        self.condition = Condition()
+        self.running = False
+        self.worker: Thread = None
+
+    def start(self):
+        with self.condition:
+            if self.running or self.interval <= 0:
+                return
+            self.running = True
+        self.worker = Thread(target=self.__run_loop,
+                             name="resource_reconciler",
+                             daemon=True)
+        self.worker.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def get_metrics(self) -> ReconcilerMetrics:
+        with self.metrics_lock:
+            return self.metrics.model_copy()
+
+    def reconcile(self) -> None:
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
+
+        workflows: Dict[str, List[ClusterResource]] = {}
+        for resource in self.__list_resources():
+            if resource.workflow_id is None:
+                reconciler_logger.debug("%s %s has no workflow-id label", resource.kind, resource.name)
+                continue
+            workflows.setdefault(resource.workflow_id, []).append(resource)
+
+        orphaned = 0
+        for workflow_id, resources in workflows.items():
+            try:
+                if self.__reconcile_workflow(workflow_id, resources, now):
+                    orphaned += 1
+            except Exception:
+                reconciler_logger.exception("reconciliation of workflow %s failed", workflow_id)
+
+        with self.metrics_lock:
+            self.metrics.runs += 1
+            self.metrics.last_run_at = now
+            self.metrics.last_run_seconds = time.perf_counter() - started
+            self.metrics.orphaned_workflows = orphaned
+
+    def __run_loop(self):
+        while True:
+            try:
+                self.reconcile()
+            except Exception:
+                reconciler_logger.exception("reconciliation of namespace %s failed", self.namespace)
+
+            with self.condition:
+                self.condition.wait_for(lambda: not self.running, timeout=self.interval)
+                if not self.running:
+                    return
+
+    def __list_resources(self) -> Iterator[ClusterResource]:
+        for kind in RESOURCE_KINDS:
+            continue_token = None
+            while True:
+                page = self.list_handle(kind=kind,
+                                        namespace=self.namespace,
+                                        label_selector=self.label_selector,
+                                        limit=self.page_size,
+                                        continue_token=continue_token)
+                for item in page.items:
+                    yield get_cluster_resource(kind, item)
+                continue_token = page.metadata._continue
+                if not continue_token:
+                    break
+
+    def __reconcile_workflow(self, workflow_id: str, resources: List[ClusterResource], now: datetime) -> bool:
+        """
+        returns True if the resources do not belong to a running workflow
+        """
+        record = self.workflow_registry.get(workflow_id)
+        changed_at = [x.created_at for x in resources if x.created_at is not None]
+        if record is not None and record.updated_at is not None:
+            changed_at.append(record.updated_at.astimezone(timezone.utc))
+        age = (now - max(changed_at)).total_seconds() if changed_at else float("inf")
+
+        if record is not None and record.phase in ACTIVE_PHASES:
+            if self.is_monitored_handle(workflow_id):
+                return False
+            if age < self.orphan_grace_period:
+                return True
+            if any(x.kind == "pod" for x in resources) and self.adopt_handle(record):
+                reconciler_logger.info("adopted workflow %s", workflow_id)
+                with self.metrics_lock:
+                    self.metrics.adopted_workflows += 1
+                return False
+        elif record is not None and record.phase in TERMINAL_PHASES:
+            if record.cleanup_at is not None and record.cleanup_at.astimezone(timezone.utc) > now:
+                # retained until its deferred cleanup
+                return False
+            if age < self.finished_grace_period:
+                return True
+        elif age < self.orphan_grace_period:
+            return True
+
+        reconciler_logger.info("delete %d leaked resources of workflow %s (%s)",
+                               len(resources), workflow_id,
+                               WorkflowJobPhase(record.phase).value if record else "unknown")
+        self.delete_handle(workflow_id)
+        self.__add_reclaimed(resources)
+        return True
+
+    def __add_reclaimed(self, resources: List[ClusterResource]):
+        with self.metrics_lock:
+            self.metrics.reclaimed_workflows += 1
+            for resource in resources:
+                if resource.kind == "pod":
+                    self.metrics.reclaimed_pods += 1
+                elif resource.kind == "config_map":
+                    self.metrics.reclaimed_config_maps += 1
+                elif resource.kind == "secret":
+                    self.metrics.reclaimed_secrets += 1
+                else:
+                    self.metrics.reclaimed_persistent_volume_claims += 1
+                self.metrics.reclaimed_cpu += resource.cpu
+                self.metrics.reclaimed_gpu += resource.gpu
+                self.metrics.reclaimed_storage_bytes += resource.storage_bytes
@@ -0,0 +1,318 @@
+import sys
+import sqlite3
+import logging
+from datetime import datetime
+from threading import Thread, Condition, Lock
+from typing import Dict, List, Union
+
+from middlelayer.models import BaseModel, WorkflowJobPhase
+
+formatter = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+stdout_handle = logging.StreamHandler(sys.stdout)
+stdout_handle.setFormatter(formatter)
+
+registry_logger = logging.getLogger("workflow_registry")
+registry_logger.setLevel(level=logging.DEBUG)
+registry_logger.addHandler(stdout_handle)
+
+
+TERMINAL_PHASES = (WorkflowJobPhase.FINISHED, WorkflowJobPhase.CANCELED)
+ACTIVE_PHASES = (WorkflowJobPhase.PREPARING, WorkflowJobPhase.RUNNING, WorkflowJobPhase.STORING)
+
+
+class WorkflowRecord(BaseModel):
+    workflow_id: str
+    service_id: str
+    user_id: str
+    phase: WorkflowJobPhase = WorkflowJobPhase.QUEUED
+    priority: int = 0
+    created_at: datetime = None
+    updated_at: datetime = None
+    # serialized state of the workflow backend, e.g. the k8s resources of the workflow
+    backend_data: Union[Dict, None] = None
+    # sha256 of the token the data-side-car of the workflow authenticates its callbacks with
+    callback_token_hash: Union[str, None] = None
+    # deadline of the deferred cleanup of a finished workflow
+    cleanup_at: Union[datetime, None] = None
+
+
+class WorkflowRegistry():
+    """
+    stores the state of all workflows, so they survive a restart of the api
+    """
+
+    def __init__(self):
+        pass
+
+    def put(self, record: WorkflowRecord) -> None:
+        pass
+
+    def get(self, workflow_id: str) -> Union[WorkflowRecord, None]:
+        pass
+
+    def update(self, workflow_id: str, **fields) -> Union[WorkflowRecord, None]:
+        pass
+
+    def delete(self, workflow_id: str) -> None:
+        pass
+
+    def list_by_user(self, user_id: str, phases: List[WorkflowJobPhase] = None) -> List[WorkflowRecord]:
+        pass
+
+    def list_by_service(self, service_id: str, phases: List[WorkflowJobPhase] = None) -> List[WorkflowRecord]:
+        pass
+
+    def list_by_phase(self, phases: List[WorkflowJobPhase]) -> List[WorkflowRecord]:
+        pass
+
+    def list_pending_cleanups(self) -> List[WorkflowRecord]:
+        pass
+
+    def count_by_phase(self) -> Dict[WorkflowJobPhase, int]:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteWorkflowRegistry(WorkflowRegistry):
+    """
+    WorkflowRegistry backed by a sqlite database.
+
+    Writes are collected and committed by a writer thread in one transaction, either every
+    flush_interval seconds or as soon as batch_size writes are pending. Reads see pending
+    writes, lookups by workflow_id use the primary key and the other queries use indexes.
+    The commit runs outside of the condition, so put and get do not wait for the disk.
+    A failed batch is written again with the next one after a backoff of up to max_retry_interval seconds.
+    """
+
+    def __init__(self,
+                 path: str = "./workflow-registry.db",
+                 flush_interval: float = 0.2,
+                 batch_size: int = 100,
+                 max_retry_interval: float = 10):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_retry_interval = max_retry_interval
+
+        self.db_lock = Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.__init_schema()
+
+        # workflow_id -> record or None for deleted records
+        self.pending: Dict[str, Union[WorkflowRecord, None]] = {}
+        # the batch which is committed right now, still visible to get
+        self.in_flight: Dict[str, Union[WorkflowRecord, None]] = {}
+        self.condition = Condition()
+        # batches are committed one after the other in the order of their writes
+        self.write_lock = Lock()
+        # read-modify-write of update
+        self.update_lock = Lock()
+        self.running = True
+        self.writer = Thread(target=self.__write_loop,
+                             name="workflow_registry_writer",
+                             daemon=True)
+        self.writer.start()
+
+    def __init_schema(self):
+        with self.db_lock, self.connection:
+            if self.path != ":memory:":
+                # a crash never leaves a partially written batch
+                self.connection.execute("PRAGMA journal_mode=WAL")
+                self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS workflows (
+                    workflow_id TEXT PRIMARY KEY,
+                    service_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    phase TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT,
+                    updated_at TEXT,
+                    record TEXT NOT NULL)""")
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(workflows)")]
+            if "cleanup_at" not in columns:
+                # databases of a previous version
+                self.connection.execute("ALTER TABLE workflows ADD COLUMN cleanup_at TEXT")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS workflows_service_id ON workflows (service_id)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS workflows_user_id ON workflows (user_id)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS workflows_phase ON workflows (phase)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS workflows_cleanup_at ON workflows (cleanup_at)")
+
+    def put(self, record: WorkflowRecord) -> None:
+        now = datetime.now()
+        record = record.model_copy(update={"created_at": record.created_at or now,
+                                           "updated_at": now})
+        self.__enqueue(record.workflow_id, record)
+
+    def get(self, workflow_id: str) -> Union[WorkflowRecord, None]:
+        with self.condition:
+            if workflow_id in self.pending:
+                return self.pending[workflow_id]
+            if workflow_id in self.in_flight:
+                return self.in_flight[workflow_id]
+
+        with self.db_lock:
+            row = self.connection.execute("SELECT record FROM workflows WHERE workflow_id = ?",
+                                          (workflow_id,)).fetchone()
+        if row is None:
+            return None
+        return WorkflowRecord.model_validate_json(row[0])
+
+    def update(self, workflow_id: str, **fields) -> Union[WorkflowRecord, None]:
+        """
+        updates the given fields of a record, unknown workflow_ids are ignored
+        """
+        with self.update_lock:
+            record = self.get(workflow_id)
+            if record is None:
+                return None
+            record = record.model_copy(update={**fields, "updated_at": datetime.now()})
+            self.__enqueue(workflow_id, record)
+            return record
+
+    def delete(self, workflow_id: str) -> None:
+        self.__enqueue(workflow_id, None)
+
+    def list_by_user(self, user_id: str, phases: List[WorkflowJobPhase] = None) -> List[WorkflowRecord]:
+        return self.__query("user_id = ?", (user_id,), phases)
+
+    def list_by_service(self, service_id: str, phases: List[WorkflowJobPhase] = None) -> List[WorkflowRecord]:
+        return self.__query("service_id = ?", (service_id,), phases)
+
+    def list_by_phase(self, phases: List[WorkflowJobPhase]) -> List[WorkflowRecord]:
+        return self.__query(None, (), phases)
+
+    def list_pending_cleanups(self) -> List[WorkflowRecord]:
+        """
+        workflows with a deferred cleanup, the earliest deadline first
+        """
+        return self.__query("cleanup_at IS NOT NULL", (), order_by="cleanup_at")
+
+    def count_by_phase(self) -> Dict[WorkflowJobPhase, int]:
+        """
+        number of workflows per phase, phases without workflows included
+        """
+        self.flush()
+        with self.db_lock:
+            rows = self.connection.execute("SELECT phase, COUNT(*) FROM workflows GROUP BY phase").fetchall()
+        counts = {x: 0 for x in WorkflowJobPhase}
+        counts.update({WorkflowJobPhase(phase): count for phase, count in rows})
+        return counts
+
+    def flush(self) -> None:
+        """
+        commits the pending writes, raises sqlite3.Error if they could not be written (they stay pending)
+        """
+        with self.write_lock:
+            self.__write_pending()
+
+    def close(self) -> None:
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.writer.join()
+        self.flush()
+        with self.db_lock:
+            self.connection.close()
+
+    def __query(self,
+                where: Union[str, None],
+                params: tuple,
+                phases: List[WorkflowJobPhase] = None,
+                order_by: str = "created_at"):
+        # pending writes have to be visible to the query
+        self.flush()
+
+        conditions = [where] if where else []
+        if phases:
+            conditions.append(f"phase IN ({', '.join('?' for _ in phases)})")
+            params = params + tuple(WorkflowJobPhase(x).value for x in phases)
+        sql = "SELECT record FROM workflows"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {order_by}"
+
+        with self.db_lock:
+            rows = self.connection.execute(sql, params).fetchall()
+        return [WorkflowRecord.model_validate_json(row[0]) for row in rows]
+
+    def __enqueue(self, workflow_id: str, record: Union[WorkflowRecord, None]):
+        with self.condition:
+            self.pending[workflow_id] = record
+            if len(self.pending) >= self.batch_size:
+                self.condition.notify_all()
+
+    def __write_loop(self):
+        retry_interval = None
+        while True:
+            with self.condition:
+                if retry_interval is None:
+                    self.condition.wait_for(lambda: not self.running or len(self.pending) >= self.batch_size,
+                                            timeout=self.flush_interval)
+                else:
+                    self.condition.wait_for(lambda: not self.running, timeout=retry_interval)
+                if not self.running:
+                    return
+
+            try:
+                with self.write_lock:
+                    self.__write_pending()
+                retry_interval = None
+            except sqlite3.Error:
+                retry_interval = min((retry_interval or self.flush_interval) * 2, self.max_retry_interval)
+                registry_logger.warning("workflow records written again in %.1fs", retry_interval)
+
+    def __write_pending(self):
+        with self.condition:
+            batch = self.in_flight = self.pending
+            self.pending = {}
+
+        try:
+            self.__write_batch(batch)
+        except sqlite3.Error:
+            with self.condition:
+                # newer writes of the same workflows replace the failed ones
+                self.pending = {**batch, **self.pending}
+            raise
+        finally:
+            with self.condition:
+                self.in_flight = {}
+
+    def __write_batch(self, batch: Dict[str, Union[WorkflowRecord, None]]):
+        if not batch:
+            return
+
+        upserts = [(record.workflow_id,
+                    record.service_id,
+                    record.user_id,
+                    record.phase.value,
+                    record.priority,
+                    record.created_at.isoformat() if record.created_at else None,
+                    record.updated_at.isoformat() if record.updated_at else None,
+                    record.cleanup_at.isoformat() if record.cleanup_at else None,
+                    record.model_dump_json())
+                   for record in batch.values() if record is not None]
+        deletes = [(workflow_id,) for workflow_id, record in batch.items() if record is None]
+
+        try:
+            with self.db_lock, self.connection:
+                self.connection.executemany("""
+                    INSERT INTO workflows (workflow_id, service_id, user_id, phase, priority,
+                                           created_at, updated_at, cleanup_at, record)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (workflow_id) DO UPDATE SET
+                        phase = excluded.phase,
+                        priority = excluded.priority,
+                        updated_at = excluded.updated_at,
+                        cleanup_at = excluded.cleanup_at,
+                        record = excluded.record""", upserts)
+                self.connection.executemany("DELETE FROM workflows WHERE workflow_id = ?", deletes)
+        except sqlite3.Error:
+            registry_logger.exception("write of %d workflow records failed", len(batch))
+            raise
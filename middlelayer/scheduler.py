@@ -0,0 +1,202 @@
+import sys
+import logging
+from bisect import insort
+from datetime import datetime
+from itertools import count
+from threading import Thread, Condition
+from typing import Callable, Dict, List, Union
+
+from middlelayer.models import BaseModel
+from middlelayer.executor import BlockingIOExecutor
+
+formatter = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+stdout_handle = logging.StreamHandler(sys.stdout)
+stdout_handle.setFormatter(formatter)
+
+scheduler_logger = logging.getLogger("workflow_scheduler")
+scheduler_logger.setLevel(level=logging.DEBUG)
+scheduler_logger.addHandler(stdout_handle)
+
+
+class WorkflowQueueEntry(BaseModel):
+    workflow_id: str
+    service_id: str
+    user_id: str
+    priority: int = 0
+    sequence: int = 0
+    submitted_at: datetime = None
+
+    def sort_key(self):
+        # higher priority first, FIFO within the same priority
+        return (-self.priority, self.sequence)
+
+    def __lt__(self, other: "WorkflowQueueEntry"):
+        return self.sort_key() < other.sort_key()
+
+
+class WorkflowScheduler():
+    """
+    Admission queue for workflows.
+
+    Workflows are queued by priority (FIFO within a priority) and handed to dispatch_handle
+    as soon as the global, per-user and per-service concurrency limits allow it.
+    A limit of 0 or None means unlimited. Entries blocked by a per-user or per-service limit
+    do not block entries of other users or services behind them.
+    The dispatches run on dispatch_workers threads, further admitted entries wait for a free one.
+    """
+
+    def __init__(self,
+                 dispatch_handle: Callable[[WorkflowQueueEntry], None],
+                 max_workflows: int = 10,
+                 max_workflows_per_user: int = None,
+                 max_workflows_per_service: int = None,
+                 service_limit_handle: Callable[[str], Union[int, None]] = None,
+                 dispatch_workers: int = 8):
+        self.dispatch_handle = dispatch_handle
+        self.max_workflows = max_workflows
+        self.max_workflows_per_user = max_workflows_per_user
+        self.max_workflows_per_service = max_workflows_per_service
+        self.service_limit_handle = service_limit_handle
+        self.dispatch_executor = BlockingIOExecutor(max_workers=dispatch_workers, name="commit_task")
+
+        self.condition = Condition()
+        self.queue: List[WorkflowQueueEntry] = []
+        self.active: Dict[str, WorkflowQueueEntry] = {}
+        self.sequence = count()
+        self.running = False
+        self.dispatcher: Thread = None
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.dispatcher = Thread(target=self.__dispatch_loop,
+                                 name="workflow_scheduler",
+                                 daemon=True)
+        self.dispatcher.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.dispatch_executor.shutdown(wait=False)
+
+    def restore(self,
+                queued: List[WorkflowQueueEntry],
+                active: List[WorkflowQueueEntry] = None):
+        """
+        restores the queue and the running workflows of a previous run, e.g. from the workflow registry.
+        Queued entries keep their order by priority and sequence.
+        """
+        with self.condition:
+            self.queue = sorted(self.queue + list(queued))
+            for entry in active or []:
+                self.active[entry.workflow_id] = entry
+            self.sequence = count(max((x.sequence for x in self.queue), default=-1) + 1)
+            self.condition.notify_all()
+        scheduler_logger.info("restored %d queued and %d running workflows",
+                              len(queued), len(active or []))
+
+    def submit(self, workflow_id: str, service_id: str, user_id: str, priority: int = 0) -> int:
+        """
+        queues a workflow and returns its queue position
+        """
+        with self.condition:
+            entry = WorkflowQueueEntry(workflow_id=workflow_id,
+                                       service_id=service_id,
+                                       user_id=user_id,
+                                       priority=priority,
+                                       sequence=next(self.sequence),
+                                       submitted_at=datetime.now())
+            insort(self.queue, entry)
+            self.condition.notify_all()
+            return self.queue.index(entry) + 1
+
+    def cancel(self, workflow_id: str) -> bool:
+        """
+        removes a queued workflow, returns False if the workflow is not queued
+        """
+        with self.condition:
+            for entry in self.queue:
+                if entry.workflow_id == workflow_id:
+                    self.queue.remove(entry)
+                    return True
+            return False
+
+    def release(self, workflow_id: str):
+        """
+        frees the slot of a dispatched workflow after it finished or was stopped
+        """
+        with self.condition:
+            if self.active.pop(workflow_id, None) is not None:
+                self.condition.notify_all()
+
+    def get_queue_position(self, workflow_id: str) -> Union[int, None]:
+        with self.condition:
+            for position, entry in enumerate(self.queue, start=1):
+                if entry.workflow_id == workflow_id:
+                    return position
+            return None
+
+    def is_queued(self, workflow_id: str) -> bool:
+        return self.get_queue_position(workflow_id) is not None
+
+    def get_queued_entries(self) -> List[WorkflowQueueEntry]:
+        with self.condition:
+            return list(self.queue)
+
+    def get_queue_depth(self) -> int:
+        with self.condition:
+            return len(self.queue)
+
+    def get_active_count(self) -> int:
+        with self.condition:
+            return len(self.active)
+
+    def __limit_reached(self, limit: Union[int, None], running: int) -> bool:
+        return bool(limit) and running >= limit
+
+    def __next_admissible(self) -> Union[WorkflowQueueEntry, None]:
+        if self.__limit_reached(self.max_workflows, len(self.active)):
+            return None
+
+        for entry in self.queue:
+            user_running = sum(1 for x in self.active.values() if x.user_id == entry.user_id)
+            if self.__limit_reached(self.max_workflows_per_user, user_running):
+                continue
+
+            service_running = sum(1 for x in self.active.values() if x.service_id == entry.service_id)
+            if self.__limit_reached(self.max_workflows_per_service, service_running):
+                continue
+            if self.service_limit_handle and \
+                    self.__limit_reached(self.service_limit_handle(entry.service_id), service_running):
+                continue
+
+            return entry
+        return None
+
+    def __dispatch_loop(self):
+        while True:
+            with self.condition:
+                entry = self.__next_admissible()
+                while self.running and entry is None:
+                    self.condition.wait()
+                    entry = self.__next_admissible()
+                if not self.running:
+                    return
+
+                self.queue.remove(entry)
+                self.active[entry.workflow_id] = entry
+
+            scheduler_logger.debug("dispatch workflow %s of service %s",
+                                   entry.workflow_id, entry.service_id)
+            self.dispatch_executor.submit(self.__dispatch, entry)
+
+    def __dispatch(self, entry: WorkflowQueueEntry):
+        try:
+            self.dispatch_handle(entry)
+        except Exception:
+            scheduler_logger.exception("dispatch of workflow %s failed", entry.workflow_id)
+            self.release(entry.workflow_id)
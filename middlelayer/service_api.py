@@ -1,21 +1,50 @@
 import logging
 import os
+import re
 import sys
 import time
-from typing import Dict, List, Union
+import hmac
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Iterator, List, Union
 from configparser import ConfigParser
-from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Timer
 from uuid import uuid4
 
-from fastapi import FastAPI, Depends, HTTPException, Security, UploadFile, File
-from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse, Response
+from fastapi import FastAPI, Depends, HTTPException, Security, Request
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse, Response, RedirectResponse
 from fastapi.security.api_key import APIKeyHeader
-from starlette.status import HTTP_200_OK, HTTP_403_FORBIDDEN, HTTP_404_NOT_FOUND, HTTP_400_BAD_REQUEST
-
-from middlelayer.asset import StaticAssetLoader
-from middlelayer.imla_minio import ImlaMinio
-from middlelayer.models import ServiceDescription, WorkflowStoreInfo, WorkflowInputResource, K8sBackendConfig
-from middlelayer.backend import K8sWorkflowBackend, WorkflowBackend
+from starlette.status import HTTP_200_OK, HTTP_403_FORBIDDEN, HTTP_404_NOT_FOUND, HTTP_400_BAD_REQUEST, \
+    HTTP_206_PARTIAL_CONTENT, HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, HTTP_307_TEMPORARY_REDIRECT, \
+    HTTP_304_NOT_MODIFIED, HTTP_202_ACCEPTED, HTTP_503_SERVICE_UNAVAILABLE
+from starlette.datastructures import UploadFile
+
+from minio.error import S3Error
+
+from middlelayer.asset import StaticAssetLoader, SerializedResponse
+from middlelayer.imla_minio import ImlaMinio, MB
+from middlelayer.models import (ServiceDescription, WorkflowStoreInfo, WorkflowInputResource, K8sBackendConfig,
+                                UploadResult, DataPlaneMode, PresignedUrl, WorkflowCallbackInfo,
+                                WorkflowStoreProgress, WorkflowStoreResult, ResultManifest, ResultManifestEntry,
+                                InputReference)
+from middlelayer.backend import K8sWorkflowBackend, WorkflowBackend, WorkflowJobState, WorkflowJobPhase
+from middlelayer.scheduler import WorkflowScheduler, WorkflowQueueEntry
+from middlelayer.cleanup import DeferredCleanupScheduler
+from middlelayer.registry import (WorkflowRegistry, SqliteWorkflowRegistry, WorkflowRecord, ACTIVE_PHASES,
+                                  TERMINAL_PHASES)
+from middlelayer.events import WorkflowEventHub, WorkflowEvent
+from middlelayer.timeline import WorkflowTimelineRecorder
+from middlelayer.reconciler import ReconcilerMetrics
+from middlelayer.executor import BlockingIOExecutor
+from middlelayer.upload import MultipartStreamUploader
+from middlelayer.log_stream import LogStreamLimitReached
+from middlelayer.env_parser import EnvironmentInputError
+from middlelayer.http_range import (ByteRange, RangeNotSatisfiable, parse_range_header, if_range_matches,
+                                    if_none_match, format_etag, multipart_byteranges)
+from middlelayer.metrics import (STATE_COLLECTOR, RequestMetricsMiddleware, CONTENT_TYPE_LATEST, UPLOAD, DOWNLOAD,
+                                 gauge, get_metrics, record_transfer, count_transfer)
 
 
 #########
@@ -54,6 +83,30 @@ WORKFLOW_API_USER = WORKFLOW_API_CONFIG.get("workflow_api_user")
 WORKFLOW_API_ACCESS_TOKEN = WORKFLOW_API_CONFIG.get("workflow_api_access_token")
 WORKFLOW_API_USER_STORAGE = WORKFLOW_API_USER+"-storage"
 WORKFLOW_API_INSTANT_REMOVAL = WORKFLOW_API_CONFIG.getboolean("workflow_api_instant_removal", True)
+# seconds the resources of a finished workflow are kept without instant removal, retention_seconds of a service
+# overrides it
+WORKFLOW_API_RETENTION_SECONDS = WORKFLOW_API_CONFIG.getint("workflow_api_retention_seconds", 900)
+WORKFLOW_API_IO_WORKERS = WORKFLOW_API_CONFIG.getint("workflow_api_io_workers", 16)
+WORKFLOW_API_UPLOAD_PART_SIZE = WORKFLOW_API_CONFIG.getint("workflow_api_upload_part_size_mb", 16) * MB
+WORKFLOW_API_UPLOAD_PARALLEL_PARTS = WORKFLOW_API_CONFIG.getint("workflow_api_upload_parallel_parts", 4)
+WORKFLOW_API_DATA_PLANE = DataPlaneMode(WORKFLOW_API_CONFIG.get("workflow_api_data_plane", DataPlaneMode.PROXY.value))
+WORKFLOW_API_PRESIGNED_URL_EXPIRY = timedelta(
+    seconds=WORKFLOW_API_CONFIG.getint("workflow_api_presigned_url_expiry", 900))
+WORKFLOW_API_MAX_WORKFLOWS = WORKFLOW_API_CONFIG.getint("workflow_api_max_workflows", 10)
+WORKFLOW_API_MAX_WORKFLOWS_PER_USER = WORKFLOW_API_CONFIG.getint("workflow_api_max_workflows_per_user", 0)
+WORKFLOW_API_MAX_WORKFLOWS_PER_SERVICE = WORKFLOW_API_CONFIG.getint("workflow_api_max_workflows_per_service", 0)
+WORKFLOW_API_DISPATCH_WORKERS = WORKFLOW_API_CONFIG.getint("workflow_api_dispatch_workers", 8)
+WORKFLOW_API_REGISTRY_PATH = WORKFLOW_API_CONFIG.get("workflow_api_registry_path", "./workflow-registry.db")
+WORKFLOW_API_LONG_POLL_TIMEOUT = WORKFLOW_API_CONFIG.getfloat("workflow_api_long_poll_timeout", 30)
+WORKFLOW_API_EVENTS_KEEPALIVE = WORKFLOW_API_CONFIG.getfloat("workflow_api_events_keepalive", 15)
+# url of this api reachable from the pods, enables the callbacks of the data-side-car
+WORKFLOW_API_CALLBACK_URL = WORKFLOW_API_CONFIG.get("workflow_api_callback_url", None)
+WORKFLOW_API_CALLBACK_TIMEOUT = WORKFLOW_API_CONFIG.getfloat("workflow_api_callback_timeout", 300)
+WORKFLOW_API_CALLBACK_WORKERS = WORKFLOW_API_CONFIG.getint("workflow_api_callback_workers", 8)
+WORKFLOW_API_ASSET_RELOAD_INTERVAL = WORKFLOW_API_CONFIG.getfloat("workflow_api_asset_reload_interval", 10)
+# responses of /services/ and /services/{service_id}/info may be cached (by clients and proxies) for max_age seconds
+WORKFLOW_API_CATALOG_MAX_AGE = WORKFLOW_API_CONFIG.getint("workflow_api_catalog_max_age",
+                                                          int(WORKFLOW_API_ASSET_RELOAD_INTERVAL))
 
 if not CONFIG.has_section("minio"):
     raise ValueError("config has no minio section")
@@ -76,53 +129,140 @@ async def get_api_key(api_key: str = Security(api_key_header)):
             status_code=HTTP_403_FORBIDDEN, detail="Could not validate API KEY"
         )
 
-workflow_api_logger.debug("set root_path=%s", os.getenv("FASTAPI_ROOT_PATH"))
-service_api = FastAPI(root_path=os.getenv("FASTAPI_ROOT_PATH"), dependencies=[Depends(get_api_key)])
+callback_token_header = APIKeyHeader(name="callback-token", auto_error=False)
 
-##########
-# DATABASE
-##########
 
-asset_store = StaticAssetLoader()
+def hash_callback_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
 
 
-user_workflow: Dict[str, List[str]] = {}
+# inputs refer to content-addressed blobs of the user storage, uploads are staged until their hash is known
+BLOB_PREFIX = "blobs/sha256"
+BLOB_STAGING_PREFIX = "blobs/staging"
+# user metadata of an input reference, returned as x-amz-meta-blob-sha256 by a stat
+INPUT_REFERENCE_METADATA = "blob-sha256"
+SHA256_PATTERN = re.compile("[0-9a-f]{64}")
+HASH_CHUNK_SIZE = 1*MB
+ENV_CHUNK_SIZE = 64*1024
 
 
-def remove_workflow_id(user_id: str, workflow_id: str):
-    if user_id not in user_workflow.keys():
-        user_workflow[user_id] = [workflow_id]
-    else:
-        user_workflow[user_id].remove(workflow_id)
+def get_blob_name(sha256: str) -> str:
+    return f"{BLOB_PREFIX}/{sha256}"
 
 
-def insert_workflow_id(user_id: str, workflow_id: str):
-    if user_id not in user_workflow.keys():
-        user_workflow[user_id] = [workflow_id]
-    else:
-        user_workflow[user_id].append(workflow_id)
+def get_input_storage_name(service_id: str, resource_name: str, workflow_id: str = None) -> str:
+    """
+    name of an input of the service, with workflow_id of its snapshot taken at the execution of the workflow
+    """
+    if workflow_id:
+        return f"{service_id}/workflows/{workflow_id}/inputs/{resource_name}"
+    return f"{service_id}/inputs/{resource_name}"
 
 
-def get_workflow_ids(user_id: str):
-    if user_id not in user_workflow.keys():
-        return []
-    else:
-        return user_workflow[user_id]
+def get_result_manifest_name(service_id: str, workflow_id: str = None) -> str:
+    """
+    name of the result manifest of a workflow, without workflow_id of the latest result of the service
+    """
+    return f"{service_id}/manifests/{workflow_id or 'latest'}.json"
+
+
+async def get_callback_workflow_id(workflow_id: str, callback_token: str = Security(callback_token_header)):
+    if not client.verify_callback_token(workflow_id, callback_token):
+        raise HTTPException(
+            status_code=HTTP_403_FORBIDDEN, detail="Could not validate callback token"
+        )
+    return workflow_id
+
+workflow_api_logger.debug("set root_path=%s", os.getenv("FASTAPI_ROOT_PATH"))
+service_api = FastAPI(root_path=os.getenv("FASTAPI_ROOT_PATH"), dependencies=[Depends(get_api_key)])
+
+# the data-side-cars authenticate with the token of their workflow, not with the access-token
+callback_api = FastAPI()
+service_api.mount("/callbacks", callback_api)
+# latency of every request, exported at /metrics
+service_api.add_middleware(RequestMetricsMiddleware)
+
+# documents the multipart body of PUT /services/{service_id}/input/{resource}, which parses its form itself
+INPUT_FILE_REQUEST_BODY = {"requestBody": {
+    "required": True,
+    "content": {"multipart/form-data": {"schema": {"type": "object",
+                                                   "required": ["input_file"],
+                                                   "properties": {"input_file": {"type": "string",
+                                                                                 "format": "binary"}}}}}}}
 
 
 class ServiceApi():
 
     def __init__(self):
 
-        self.asset_store = StaticAssetLoader()
-
         self.storage = ImlaMinio(MINIO_CONFIG, WORKFLOW_API_USER_STORAGE)
 
+        # blocking minio and kubernetes calls are executed in this pool
+        self.io_executor = BlockingIOExecutor(max_workers=WORKFLOW_API_IO_WORKERS)
+
+        self.stream_uploader = MultipartStreamUploader(
+            storage=self.storage,
+            executor=self.io_executor,
+            part_size=WORKFLOW_API_UPLOAD_PART_SIZE,
+            max_parts_in_flight=WORKFLOW_API_UPLOAD_PARALLEL_PARTS)
+
+        # state of all workflows, survives a restart of the api
+        self.workflow_registry: WorkflowRegistry = SqliteWorkflowRegistry(path=WORKFLOW_API_REGISTRY_PATH)
+
+        # status changes of the workflows are pushed to the clients
+        self.event_hub = WorkflowEventHub()
+        # times of the phase and pod transitions of the workflows, emitted as spans when a workflow ends
+        self.timeline_recorder = WorkflowTimelineRecorder()
+
+        # reported results are finished (cleanup) outside of the callback request
+        self.callback_executor = ThreadPoolExecutor(max_workers=WORKFLOW_API_CALLBACK_WORKERS,
+                                                    thread_name_prefix="workflow_callback")
+        # workflow_id -> fallback to store_result, if the data-side-car does not report the stored result
+        self.store_timeouts: Dict[str, Timer] = {}
+        self.finishing_workflows = set()
+        self.finish_lock = Lock()
+
+        # resources of finished workflows are removed after the retention of their service
+        self.cleanup_scheduler = DeferredCleanupScheduler(
+            workflow_registry=self.workflow_registry,
+            cleanup_handle=self.cleanup_workflows)
+
+        self.scheduler = WorkflowScheduler(
+            dispatch_handle=self.dispatch_workflow,
+            max_workflows=WORKFLOW_API_MAX_WORKFLOWS,
+            max_workflows_per_user=WORKFLOW_API_MAX_WORKFLOWS_PER_USER,
+            max_workflows_per_service=WORKFLOW_API_MAX_WORKFLOWS_PER_SERVICE,
+            service_limit_handle=self.get_service_workflow_limit,
+            dispatch_workers=WORKFLOW_API_DISPATCH_WORKERS)
+
         if WORKFLOW_API_CONFIG.get("workflow_backend") == "kubernetes":
 
             k8s_backend_config = K8sBackendConfig(
                 job_storage_type=WORKFLOW_API_CONFIG.get("workflow_k8s_backend_job_storage_type"),
-                job_storage_size=WORKFLOW_API_CONFIG.get("workflow_k8s_backend_job_storage_size")
+                job_storage_size=WORKFLOW_API_CONFIG.get("workflow_k8s_backend_job_storage_size"),
+                log_buffer_lines=WORKFLOW_API_CONFIG.getint("workflow_k8s_backend_log_buffer_lines", None),
+                log_stream_workers=WORKFLOW_API_CONFIG.getint("workflow_k8s_backend_log_stream_workers", None),
+                log_read_workers=WORKFLOW_API_CONFIG.getint("workflow_k8s_backend_log_read_workers", None),
+                monitor_workers=WORKFLOW_API_CONFIG.getint("workflow_k8s_backend_monitor_workers", None),
+                api_connection_pool_size=WORKFLOW_API_CONFIG.getint(
+                    "workflow_k8s_backend_api_connection_pool_size", None),
+                api_keep_alive=WORKFLOW_API_CONFIG.getboolean("workflow_k8s_backend_api_keep_alive", None),
+                cleanup_timeout=WORKFLOW_API_CONFIG.getint("workflow_k8s_backend_cleanup_timeout", None),
+                cleanup_poll_interval=WORKFLOW_API_CONFIG.getfloat("workflow_k8s_backend_cleanup_poll_interval",
+                                                                   None),
+                reconcile_interval=WORKFLOW_API_CONFIG.getfloat("workflow_k8s_backend_reconcile_interval", None),
+                reconcile_orphan_grace_period=WORKFLOW_API_CONFIG.getfloat(
+                    "workflow_k8s_backend_reconcile_orphan_grace_period", None),
+                reconcile_finished_grace_period=WORKFLOW_API_CONFIG.getfloat(
+                    "workflow_k8s_backend_reconcile_finished_grace_period", None),
+                reconcile_page_size=WORKFLOW_API_CONFIG.getint("workflow_k8s_backend_reconcile_page_size", None),
+                port_forward_connect_timeout=WORKFLOW_API_CONFIG.getfloat(
+                    "workflow_k8s_backend_port_forward_connect_timeout", None),
+                port_forward_read_timeout=WORKFLOW_API_CONFIG.getfloat(
+                    "workflow_k8s_backend_port_forward_read_timeout", None),
+                port_forward_idle_timeout=WORKFLOW_API_CONFIG.getfloat(
+                    "workflow_k8s_backend_port_forward_idle_timeout", None),
+                config_map_max_bytes=WORKFLOW_API_CONFIG.getint("workflow_k8s_backend_config_map_max_bytes", None)
             )
 
             workflow_api_logger.debug("provided kubernetes backend config: %s",
@@ -133,11 +273,126 @@ class ServiceApi():
                 kubeconfig=WORKFLOW_API_CONFIG.get("workflow_backend_kubeconfig"),
                 namespace=WORKFLOW_API_CONFIG.get("workflow_backend_namespace"),
                 image_pull_secret=WORKFLOW_API_CONFIG.get("workflow_backend_image_pull_secret"),
-                data_side_car_image=WORKFLOW_API_CONFIG.get("workflow_backend_data_side_car_image"))
+                data_side_car_image=WORKFLOW_API_CONFIG.get("workflow_backend_data_side_car_image"),
+                workflow_registry=self.workflow_registry,
+                workflow_state_handle=self.publish_workflow_state)
+
+        # the backend prepares every service when its description is loaded, e.g. the pod manifest templates
+        self.asset_store = StaticAssetLoader(asset_loaded_handle=self.workflow_backend.prepare_service,
+                                             reload_interval=WORKFLOW_API_ASSET_RELOAD_INTERVAL)
+
+    def start(self):
+        self.recover_workflows()
+        self.scheduler.start()
+        # deferred cleanups of the previous run are due at their original deadline
+        self.cleanup_scheduler.start()
+        # reclaims resources the registry does not know (anymore), starting with the leftovers of a previous run
+        self.workflow_backend.start_reconciler(adopt_handle=self.adopt_workflow)
+        # added and changed service descriptions are loaded without a restart
+        self.asset_store.start()
+        # the state gauges of /metrics are read from this instance
+        STATE_COLLECTOR.collect_handle = self.collect_metrics
+
+    def collect_metrics(self):
+        """
+        the gauges of /metrics which are read from the state at each scrape
+        """
+        yield gauge("workflow_api_workflows", "workflows in the registry per phase",
+                    {x.value: count for x, count in self.workflow_registry.count_by_phase().items()}, "phase")
+        yield gauge("workflow_api_queue_depth", "workflows waiting for admission", self.scheduler.get_queue_depth())
+        yield gauge("workflow_api_admitted_workflows", "workflows admitted by the scheduler",
+                    self.scheduler.get_active_count())
+
+        io_stats = self.io_executor.get_stats()
+        yield gauge("workflow_api_io_executor_running", "blocking calls running in the io executor",
+                    io_stats["running"])
+        yield gauge("workflow_api_io_executor_queued", "blocking calls waiting for a thread of the io executor",
+                    io_stats["queued"])
+
+        monitor_metrics = self.workflow_backend.get_monitor_metrics()
+        if monitor_metrics is not None:
+            for name, value in monitor_metrics.model_dump().items():
+                yield gauge(f"workflow_api_backend_{name}", name.replace("_", " "), value)
+
+        reconciler_metrics = self.workflow_backend.get_reconciler_metrics()
+        if reconciler_metrics is not None:
+            for name, value in reconciler_metrics.model_dump(exclude={"last_run_at"}).items():
+                if value is not None:
+                    yield gauge(f"workflow_api_reconciler_{name}", name.replace("_", " "), value)
+
+    def recover_workflows(self):
+        """
+        restores the workflows of a previous run from the registry.
+        Queued workflows are queued again, monitors are reattached to the pods of running workflows.
+        Running workflows without a pod are cleaned up and canceled.
+        """
+        queued = [self.__get_queue_entry(record, sequence)
+                  for sequence, record in enumerate(
+                      self.workflow_registry.list_by_phase([WorkflowJobPhase.QUEUED]))]
+
+        active = []
+        for record in self.workflow_registry.list_by_phase(ACTIVE_PHASES):
+            if self.__recover_workflow(record):
+                active.append(self.__get_queue_entry(record))
+                continue
+
+            workflow_api_logger.warning("workflow %s can not be recovered", record.workflow_id)
+            try:
+                self.workflow_backend.cleanup(workflow_id=record.workflow_id, phase=WorkflowJobPhase.CANCELED)
+            except Exception:
+                # some resources of the workflow may be gone already
+                workflow_api_logger.exception("cleanup of workflow %s failed", record.workflow_id)
+            self.set_workflow_phase(record.workflow_id, WorkflowJobPhase.CANCELED)
+
+        self.scheduler.restore(queued=queued, active=active)
+
+    def adopt_workflow(self, record: WorkflowRecord) -> bool:
+        """
+        called by the reconciler for an active workflow without monitor,
+        a workflow which can not be monitored again is canceled and its resources are reclaimed
+        """
+        if self.__recover_workflow(record):
+            # the workflow holds a slot of the concurrency limits again
+            self.scheduler.restore(queued=[], active=[self.__get_queue_entry(record)])
+            return True
+
+        self.scheduler.release(record.workflow_id)
+        self.set_workflow_phase(record.workflow_id, WorkflowJobPhase.CANCELED)
+        return False
+
+    def __recover_workflow(self, record: WorkflowRecord) -> bool:
+        service_description = self.asset_store.get_assets_description(record.service_id)
+        if service_description is None:
+            return False
+
+        return self.workflow_backend.recover_workflow(
+            workflow_id=record.workflow_id,
+            workflow_finished_handle=lambda: self.workflow_finished_handle(
+                service_description=service_description,
+                workflow_id=record.workflow_id))
+
+    def __get_queue_entry(self, record: WorkflowRecord, sequence: int = 0) -> WorkflowQueueEntry:
+        return WorkflowQueueEntry(workflow_id=record.workflow_id,
+                                  service_id=record.service_id,
+                                  user_id=record.user_id,
+                                  priority=record.priority,
+                                  sequence=sequence,
+                                  submitted_at=record.created_at)
 
     def get_assets(self):
         return self.asset_store.get_assets()
 
+    def get_assets_response(self) -> SerializedResponse:
+        return self.asset_store.get_catalog().assets_response
+
+    def get_service_description_response(self, service_id: str) -> SerializedResponse:
+        response = self.asset_store.get_catalog().description_responses.get(service_id)
+        if response is None:
+            raise HTTPException(
+                status_code=HTTP_400_BAD_REQUEST, detail="no valid service_id")
+
+        return response
+
     def get_service_description(self, service_id: str) -> ServiceDescription:
         description = self.asset_store.get_assets_description(service_id)
         if description is None:
@@ -146,43 +401,274 @@ class ServiceApi():
 
         return description
 
-    def put_resource(self, service_id: str, resource_name: str, resource_file: UploadFile):
+    def validate_input_resource(self, service_id: str, resource_name: str):
         service_description = self.get_service_description(service_id)
 
         # check resource_name is a valid input
-        if resource_name not in [x.resource_name for x in service_description.inputs]:
+        if resource_name not in service_description.input_names:
             raise HTTPException(
                 status_code=HTTP_400_BAD_REQUEST, detail="no valid resource provided")
 
-        self.storage.put_file(
+    def put_resource(self, service_id: str, resource_name: str, resource_file: UploadFile) -> UploadResult:
+        """
+        the spooled upload is hashed first, its content is only stored if no blob with the same hash exists
+        """
+        self.validate_input_resource(service_id, resource_name)
+
+        started = time.perf_counter()
+        digest = hashlib.sha256()
+        size = 0
+        resource_file.file.seek(0)
+        for chunk in iter(lambda: resource_file.file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            size += len(chunk)
+        resource_file.file.seek(0)
+
+        reference = InputReference(sha256=digest.hexdigest(), size=size)
+        deduplicated = self.storage.object_exists(
+            bucket=WORKFLOW_API_USER_STORAGE,
+            resource=get_blob_name(reference.sha256))
+        if not deduplicated:
+            self.storage.put_file(
+                bucket=WORKFLOW_API_USER_STORAGE,
+                resource=get_blob_name(reference.sha256),
+                file=resource_file)
+        self.write_input_reference(service_id, resource_name, reference)
+
+        duration = time.perf_counter() - started
+        record_transfer(UPLOAD, size, duration)
+        return UploadResult(upload_file=f"{service_id}/inputs/{resource_name}",
+                            size=size,
+                            parts=1,
+                            duration=duration,
+                            throughput_mb_s=(size / MB) / duration if duration > 0 else 0.0,
+                            sha256=reference.sha256,
+                            deduplicated=deduplicated)
+
+    async def put_resource_stream(self,
+                                  service_id: str,
+                                  resource_name: str,
+                                  stream: AsyncIterator[bytes],
+                                  sha256: str = None) -> UploadResult:
+        """
+        streams the request body directly as multipart upload into the user storage.
+        The body is staged and hashed on the way, a new content is copied to its blob (server side),
+        the input refers to the blob. With sha256 the hash of the body is verified.
+        """
+        self.validate_input_resource(service_id, resource_name)
+
+        staging_name = f"{BLOB_STAGING_PREFIX}/{uuid4()}"
+        result = await self.stream_uploader.upload(
             bucket=WORKFLOW_API_USER_STORAGE,
-            resource=f"{service_id}/inputs/{resource_name}",
-            file=resource_file)
+            resource=staging_name,
+            chunks=stream)
+        record_transfer(UPLOAD, result.size, result.duration)
+
+        try:
+            if sha256 is not None and sha256.lower() != result.sha256:
+                raise HTTPException(
+                    status_code=HTTP_400_BAD_REQUEST,
+                    detail="sha256 of the uploaded content does not match")
+            deduplicated = await self.io_executor.run(self.store_blob, staging_name, result.sha256)
+        finally:
+            await self.io_executor.run(self.storage.remove_file, WORKFLOW_API_USER_STORAGE, staging_name)
+
+        await self.io_executor.run(self.write_input_reference,
+                                   service_id,
+                                   resource_name,
+                                   InputReference(sha256=result.sha256, size=result.size))
+        return result.model_copy(update={"upload_file": f"{service_id}/inputs/{resource_name}",
+                                         "deduplicated": deduplicated})
+
+    def link_resource(self, service_id: str, resource_name: str, sha256: str) -> Union[UploadResult, None]:
+        """
+        refers the input to an already stored blob, returns None if no blob with the hash exists
+        """
+        self.validate_input_resource(service_id, resource_name)
+        sha256 = sha256.lower()
+        if not SHA256_PATTERN.fullmatch(sha256):
+            raise HTTPException(
+                status_code=HTTP_400_BAD_REQUEST, detail="invalid sha256")
 
-    def get_resource(self, service_id, resource_name):
+        blob_stat = self.storage.stat_file_if_exists(
+            bucket=WORKFLOW_API_USER_STORAGE,
+            resource=get_blob_name(sha256))
+        if blob_stat is None:
+            return None
+
+        self.write_input_reference(service_id, resource_name, InputReference(sha256=sha256, size=blob_stat.size))
+        return UploadResult(upload_file=f"{service_id}/inputs/{resource_name}",
+                            size=blob_stat.size,
+                            parts=0,
+                            duration=0.0,
+                            throughput_mb_s=0.0,
+                            sha256=sha256,
+                            deduplicated=True)
+
+    def store_blob(self, staging_name: str, sha256: str) -> bool:
+        """
+        copies a staged upload to its blob, returns True if the blob already existed
+        """
+        blob_name = get_blob_name(sha256)
+        if self.storage.object_exists(
+                bucket=WORKFLOW_API_USER_STORAGE,
+                resource=blob_name):
+            return True
+
+        self.storage.copy_file(
+            bucket=WORKFLOW_API_USER_STORAGE,
+            source=staging_name,
+            resource=blob_name)
+        return False
+
+    def write_input_reference(self, service_id: str, resource_name: str, reference: InputReference):
+        self.storage.put_data(
+            bucket=WORKFLOW_API_USER_STORAGE,
+            resource=get_input_storage_name(service_id, resource_name),
+            data=reference.model_dump_json().encode(),
+            metadata={INPUT_REFERENCE_METADATA: reference.sha256})
+
+    def resolve_input_resource(self, service_id: str, resource_name: str, workflow_id: str = None) -> str:
+        """
+        name of the object with the content of an input, the blob of a reference or the input itself
+        (e.g. uploaded to a presigned url). With workflow_id the snapshot of the workflow is resolved,
+        workflows queued before snapshots existed use the input of the service.
+        """
+        resource_storage_name = get_input_storage_name(service_id, resource_name, workflow_id)
+        object_stat = self.storage.stat_file_if_exists(
+            bucket=WORKFLOW_API_USER_STORAGE,
+            resource=resource_storage_name)
+        if object_stat is None and workflow_id:
+            resource_storage_name = get_input_storage_name(service_id, resource_name)
+            object_stat = self.storage.stat_file_if_exists(
+                bucket=WORKFLOW_API_USER_STORAGE,
+                resource=resource_storage_name)
+        sha256 = None
+        if object_stat is not None and object_stat.metadata:
+            sha256 = object_stat.metadata.get(f"x-amz-meta-{INPUT_REFERENCE_METADATA}")
+        return get_blob_name(sha256) if sha256 else resource_storage_name
+
+    def get_resource_storage_name(self, service_id, resource_name) -> str:
+        """
+        validates the requested output resource and returns its name in the user storage
+        """
+        return self.get_resource_storage_stat(service_id, resource_name)[0]
+
+    def get_resource_storage_stat(self, service_id, resource_name):
+        """
+        validates the requested output resource and returns its name in the user storage and its stat
+        """
         service_description = self.get_service_description(service_id)
         resource_storage_prefix = f"{service_id}/outputs/"
         resource_storage_name = f"{resource_storage_prefix}{resource_name}"
 
         # check resource_name is a valid input
-        if resource_name not in [x.resource_name for x in service_description.outputs]:
+        if resource_name not in service_description.output_names:
             raise HTTPException(
                 status_code=HTTP_400_BAD_REQUEST, detail="no valid resource provided")
 
-        # check if resource exists
-        if resource_name not in self.storage.get_objects_list(
-                bucket=WORKFLOW_API_USER_STORAGE,
-                prefix=resource_storage_prefix):
+        # check if resource exists, a stat instead of listing all past outputs
+        object_stat = self.storage.stat_file_if_exists(
+            bucket=WORKFLOW_API_USER_STORAGE,
+            resource=resource_storage_name)
+        if object_stat is None:
             raise HTTPException(
                 status_code=HTTP_404_NOT_FOUND,
                 detail="requested resource not exists"
             )
 
+        return resource_storage_name, object_stat
+
+    def get_resource(self, service_id, resource_name):
         return self.storage.get_file(
             bucket=WORKFLOW_API_USER_STORAGE,
-            resource=resource_storage_name
+            resource=self.get_resource_storage_name(service_id, resource_name)
         )
 
+    def get_resource_ranges(self, service_id, resource_name, range_header: str, if_range: str = None):
+        """
+        resolves the Range header of a output resource request.
+        returns (resource_storage_name, object_stat, ranges) or None if the whole resource has to be served
+        """
+        resource_storage_name, object_stat = self.get_resource_storage_stat(service_id, resource_name)
+
+        # the resource changed since the client fetched the first part
+        if if_range and not if_range_matches(if_range, object_stat.etag, object_stat.last_modified):
+            return None
+
+        try:
+            ranges = parse_range_header(range_header, object_stat.size)
+        except RangeNotSatisfiable as exc:
+            raise HTTPException(
+                status_code=HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                detail="requested range not satisfiable",
+                headers={"Content-Range": f"bytes */{object_stat.size}"}) from exc
+
+        if ranges is None:
+            return None
+        return (resource_storage_name, object_stat, ranges)
+
+    def iter_resource_range(self, resource_storage_name: str, byte_range: ByteRange):
+        response = self.storage.get_file(
+            bucket=WORKFLOW_API_USER_STORAGE,
+            resource=resource_storage_name,
+            offset=byte_range.start,
+            length=byte_range.length)
+        try:
+            yield from count_transfer(DOWNLOAD, response.stream())
+        finally:
+            response.close()
+            response.release_conn()
+
+    def check_presigned_data_plane(self):
+        if WORKFLOW_API_DATA_PLANE is not DataPlaneMode.PRESIGNED:
+            raise HTTPException(
+                status_code=HTTP_400_BAD_REQUEST,
+                detail="presigned data plane not enabled")
+
+    def get_resource_upload_url(self, service_id: str, resource_name: str) -> PresignedUrl:
+        self.check_presigned_data_plane()
+        self.validate_input_resource(service_id, resource_name)
+
+        url = self.storage.get_upload_url(
+            bucket_name=WORKFLOW_API_USER_STORAGE,
+            response_name=f"{service_id}/inputs/{resource_name}",
+            expires=WORKFLOW_API_PRESIGNED_URL_EXPIRY)
+        return PresignedUrl(url=url,
+                            method="PUT",
+                            expires_in=int(WORKFLOW_API_PRESIGNED_URL_EXPIRY.total_seconds()))
+
+    def commit_resource_upload(self, service_id: str, resource_name: str) -> Dict:
+        self.validate_input_resource(service_id, resource_name)
+
+        try:
+            object_stat = self.storage.stat_file(
+                bucket=WORKFLOW_API_USER_STORAGE,
+                resource=f"{service_id}/inputs/{resource_name}")
+        except S3Error as exc:
+            if exc.code != "NoSuchKey":
+                raise
+            raise HTTPException(
+                status_code=HTTP_404_NOT_FOUND,
+                detail="requested resource not exists") from exc
+
+        workflow_api_logger.info("input committed: %s | %s | %s bytes",
+                                 service_id, resource_name, object_stat.size)
+        return {"upload_file": resource_name,
+                "size": object_stat.size,
+                "etag": object_stat.etag}
+
+    def get_resource_download_url(self, service_id: str, resource_name: str) -> PresignedUrl:
+        self.check_presigned_data_plane()
+
+        url = self.storage.get_download_url(
+            bucket=WORKFLOW_API_USER_STORAGE,
+            resource=self.get_resource_storage_name(service_id, resource_name),
+            expires=WORKFLOW_API_PRESIGNED_URL_EXPIRY)
+        return PresignedUrl(url=url,
+                            method="GET",
+                            expires_in=int(WORKFLOW_API_PRESIGNED_URL_EXPIRY.total_seconds()))
+
     def get_workflow_result(self, service_id, workflow_id, result_file):
         resource_storage_prefix = f"{service_id}/outputs/{workflow_id}"
         resource_storage_name = f"{resource_storage_prefix}/{result_file}"
@@ -192,75 +678,346 @@ class ServiceApi():
             resource=resource_storage_name
         )
 
-    def service_inputs_exists(self, service_id: str):
-        service_description = self.get_service_description(service_id)
-        resource_storage_prefix = f"{service_id}/inputs/"
-        objects_list = self.storage.get_objects_list(
+    def iter_environment_input(self, resource_storage_name: str, max_bytes: int) -> Iterator[bytes]:
+        """
+        chunks of an environment input, an input larger than max_bytes is rejected by its stat before it is read
+        """
+        object_stat = self.storage.stat_file(
+            bucket=WORKFLOW_API_USER_STORAGE,
+            resource=resource_storage_name)
+        if object_stat.size > max_bytes:
+            raise EnvironmentInputError(f"environment input {resource_storage_name} has {object_stat.size} bytes, "
+                                        f"at most {max_bytes} bytes fit into a config map")
+
+        response = self.storage.get_file(
             bucket=WORKFLOW_API_USER_STORAGE,
-            prefix=resource_storage_prefix)
+            resource=resource_storage_name)
+        try:
+            yield from response.stream(ENV_CHUNK_SIZE)
+        finally:
+            response.close()
+            response.release_conn()
+
+    def snapshot_inputs(self, service_id: str, workflow_id: str) -> bool:
+        """
+        copies the inputs of the service for the workflow on the server side, so the next inputs can be uploaded
+        while the workflow is queued. A reference is copied with its metadata, no content passes the api.
+        Returns False if an input is missing.
+        """
+        service_description = self.get_service_description(service_id)
         for resource in service_description.inputs:
-            if f'{resource.resource_name}' not in objects_list:
+            snapshot_name = get_input_storage_name(service_id, resource.resource_name, workflow_id)
+            try:
+                self.storage.copy_file(
+                    bucket=WORKFLOW_API_USER_STORAGE,
+                    source=get_input_storage_name(service_id, resource.resource_name),
+                    resource=snapshot_name)
+            except S3Error as exc:
+                if exc.code not in ("NoSuchKey", "NoSuchObject"):
+                    raise
+                self.remove_input_snapshot(service_id, workflow_id)
                 return False
         return True
 
+    def remove_input_snapshot(self, service_id: str, workflow_id: str):
+        """
+        removes the input snapshot of a workflow by name (one request), the inputs are loaded at the start of the pod
+        """
+        service_description = self.asset_store.get_assets_description(service_id)
+        if service_description is None or not service_description.inputs:
+            return
+        try:
+            errors = self.storage.remove_files(
+                bucket=WORKFLOW_API_USER_STORAGE,
+                resources=[get_input_storage_name(service_id, x, workflow_id)
+                           for x in service_description.inputs_by_name])
+            for error in errors:
+                workflow_api_logger.warning("input snapshot of workflow %s not removed: %s", workflow_id, error)
+        except Exception:
+            workflow_api_logger.exception("input snapshot of workflow %s not removed", workflow_id)
+
     def commit_task(self, service_id, workflow_id):
         service_description = self.get_service_description(service_id)
 
         for resource in service_description.inputs:
+            resource_storage_name = self.resolve_input_resource(service_id, resource.resource_name, workflow_id)
 
             workflow_input_resource = WorkflowInputResource(
                 resource_name=resource.resource_name,
                 type=resource.type,
-                storage_source=f"{WORKFLOW_API_USER_STORAGE}/{service_id}/inputs/{resource.resource_name}",
+                storage_source=f"{WORKFLOW_API_USER_STORAGE}/{resource_storage_name}",
                 mount_path=resource.mount_path,
                 description="")
 
             self.workflow_backend.handle_input(
                 workflow_id=workflow_id,
                 input_resource=workflow_input_resource,
-                get_data_handle=lambda: self.storage.get_resource_data(
-                    bucket=WORKFLOW_API_USER_STORAGE,
-                    resource=f"{service_id}/inputs/{resource.resource_name}"))
+                get_data_handle=lambda max_bytes: self.iter_environment_input(resource_storage_name, max_bytes))
+
+        # the data-side-car gets the store info at creation and reports the stored result itself
+        workflow_store_info = None
+        callback_info = None
+        if WORKFLOW_API_CALLBACK_URL and service_description.workflow_resource.worker_image_output_directory:
+            workflow_store_info = self.get_workflow_store_info(service_description)
+            callback_info = self.create_callback_info(workflow_id)
 
         self.workflow_backend.commit_workflow(
             workflow_id=workflow_id,
+            service_id=service_id,
             workflow_resource=service_description.workflow_resource,
             workflow_finished_handle=lambda: self.workflow_finished_handle(
                 service_description=service_description,
-                workflow_id=workflow_id))
+                workflow_id=workflow_id),
+            workflow_store_info=workflow_store_info,
+            callback_info=callback_info)
 
-    def workflow_finished_handle(self, service_description: ServiceDescription, workflow_id: str):
+    def get_workflow_store_info(self, service_description: ServiceDescription) -> WorkflowStoreInfo:
+        result_files = list(service_description.outputs_by_name)
 
-        result_files = [i.resource_name for i in service_description.outputs]
-
-        workflow_store_info = WorkflowStoreInfo(
+        return WorkflowStoreInfo(
             minio=self.storage.get_store_info(),
             destination_bucket=WORKFLOW_API_USER_STORAGE,
             destination_path=f"{service_description.service_id}/outputs",
             result_files=result_files)
 
+    def create_callback_info(self, workflow_id: str) -> WorkflowCallbackInfo:
+        """
+        new callback token of the workflow, only its hash is stored in the registry
+        """
+        token = secrets.token_urlsafe(32)
+        self.workflow_registry.update(workflow_id, callback_token_hash=hash_callback_token(token))
+
+        return WorkflowCallbackInfo(url=f"{WORKFLOW_API_CALLBACK_URL.rstrip('/')}/callbacks/workflows/{workflow_id}",
+                                    token=token)
+
+    def verify_callback_token(self, workflow_id: str, token: Union[str, None]) -> bool:
+        """
+        True if the token belongs to the workflow and the workflow is still running
+        """
+        record = self.workflow_registry.get(workflow_id)
+        if token is None or record is None or record.callback_token_hash is None:
+            return False
+        if record.phase not in ACTIVE_PHASES:
+            return False
+        return hmac.compare_digest(record.callback_token_hash, hash_callback_token(token))
+
+    def workflow_finished_handle(self, service_description: ServiceDescription, workflow_id: str):
+
+        record = self.workflow_registry.get(workflow_id)
+        if record is not None and record.callback_token_hash is not None:
+            # the data-side-car stores the result on its own and reports it, see store_completed
+            self.__start_store_timeout(service_description, workflow_id)
+            return
+
+        self.store_result(service_description, workflow_id)
+        self.finish_workflow(workflow_id)
+
+    def store_result(self, service_description: ServiceDescription, workflow_id: str):
+        """
+        triggers the data-side-car of the workflow through the workflow backend
+        """
         self.workflow_backend.store_result(
             workflow_id=workflow_id,
-            workflow_store_info=workflow_store_info)
+            workflow_store_info=self.get_workflow_store_info(service_description))
 
-        if not WORKFLOW_API_INSTANT_REMOVAL:
-            workflow_api_logger.debug("WORKFLOW_API_INSTANT_REMOVAL disabled")
-            time.sleep(900)
+    def store_progress(self, workflow_id: str, store_progress: WorkflowStoreProgress) -> WorkflowJobState:
+        return self.workflow_backend.set_store_progress(workflow_id, store_progress)
 
-        self.workflow_backend.cleanup(
-            workflow_id=workflow_id)
+    def store_completed(self, workflow_id: str, store_result: WorkflowStoreResult):
+        """
+        the data-side-car has stored the result, the workflow is finished in the background
+        """
+        self.__cancel_store_timeout(workflow_id)
+        self.callback_executor.submit(self.__finish_stored_workflow, workflow_id, store_result)
+
+    def finish_workflow(self, workflow_id: str):
+        """
+        the result of the workflow is stored, its resources are removed right away or after the retention
+        of the service. Only once per workflow.
+        """
+        with self.finish_lock:
+            if workflow_id in self.finishing_workflows:
+                return
+            self.finishing_workflows.add(workflow_id)
+
+        try:
+            # the worker has terminated, the next queued workflow can be admitted
+            self.scheduler.release(workflow_id)
+
+            try:
+                self.write_result_manifest(workflow_id)
+            except Exception:
+                workflow_api_logger.exception("result manifest of workflow %s not written", workflow_id)
+
+            record = self.workflow_registry.get(workflow_id)
+            if record is not None:
+                self.remove_input_snapshot(record.service_id, workflow_id)
+
+            retention_seconds = self.get_retention_seconds(workflow_id)
+            if retention_seconds > 0:
+                workflow_api_logger.debug("resources of workflow %s are removed in %ss", workflow_id, retention_seconds)
+                self.set_workflow_phase(workflow_id, WorkflowJobPhase.FINISHED)
+                self.cleanup_scheduler.schedule(workflow_id, retention_seconds)
+                return
+
+            self.workflow_backend.cleanup(
+                workflow_id=workflow_id)
+            self.set_workflow_phase(workflow_id, WorkflowJobPhase.FINISHED)
+        finally:
+            with self.finish_lock:
+                self.finishing_workflows.discard(workflow_id)
+
+    def write_result_manifest(self, workflow_id: str) -> Union[ResultManifest, None]:
+        """
+        writes names, sizes, etags and checksums of the stored result files as manifest of the workflow
+        and as latest manifest of its service, one stat per output file
+        """
+        record = self.workflow_registry.get(workflow_id)
+        service_description = self.asset_store.get_assets_description(record.service_id) if record else None
+        if service_description is None:
+            return None
+
+        storage_path = self.get_workflow_store_info(service_description).destination_path
+        files = []
+        for resource in service_description.outputs:
+            object_stat = self.storage.stat_file_if_exists(
+                bucket=WORKFLOW_API_USER_STORAGE,
+                resource=f"{storage_path}/{resource.resource_name}")
+            if object_stat is None:
+                continue
+            metadata = object_stat.metadata or {}
+            files.append(ResultManifestEntry(
+                name=resource.resource_name,
+                size=object_stat.size,
+                etag=object_stat.etag,
+                checksum_sha256=metadata.get("x-amz-checksum-sha256") or metadata.get("x-amz-meta-sha256"),
+                last_modified=object_stat.last_modified))
+
+        manifest = ResultManifest(service_id=record.service_id,
+                                  workflow_id=workflow_id,
+                                  storage_path=storage_path,
+                                  created_at=datetime.now(),
+                                  files=files)
+        data = manifest.model_dump_json().encode()
+        for workflow_manifest_id in [workflow_id, None]:
+            self.storage.put_data(
+                bucket=WORKFLOW_API_USER_STORAGE,
+                resource=get_result_manifest_name(record.service_id, workflow_manifest_id),
+                data=data)
+        return manifest
 
-    def commit_workflow(self, service_id, workflow_id):
+    def get_result_manifest(self, service_id: str, workflow_id: str = None) -> ResultManifest:
         """
-        threaded task to to deploy workload into backend
+        manifest of the result of a workflow or without workflow_id of the latest result of the service
         """
-        commit_thread = Thread(target=self.commit_task,
-                               name="commit_task",
-                               args=[service_id, workflow_id])
-        commit_thread.start()
+        self.get_service_description(service_id)
+        try:
+            data = self.storage.get_resource_data(
+                bucket=WORKFLOW_API_USER_STORAGE,
+                resource=get_result_manifest_name(service_id, workflow_id))
+        except S3Error as exc:
+            if exc.code not in ("NoSuchKey", "NoSuchObject"):
+                raise
+            raise HTTPException(
+                status_code=HTTP_404_NOT_FOUND,
+                detail="no result manifest") from exc
 
-        insert_workflow_id(user_id=WORKFLOW_API_USER,
-                           workflow_id=workflow_id)
+        return ResultManifest.model_validate_json(data)
+
+    def get_retention_seconds(self, workflow_id: str) -> int:
+        record = self.workflow_registry.get(workflow_id)
+        service_description = self.asset_store.get_assets_description(record.service_id) if record else None
+        if service_description is not None and service_description.retention_seconds is not None:
+            return service_description.retention_seconds
+        if WORKFLOW_API_INSTANT_REMOVAL:
+            return 0
+        return WORKFLOW_API_RETENTION_SECONDS
+
+    def cleanup_workflows(self, workflow_ids: List[str]):
+        """
+        called by the cleanup scheduler with the workflows whose retention is over
+        """
+        self.workflow_backend.cleanup_workflows(workflow_ids=workflow_ids)
+
+    def __finish_stored_workflow(self, workflow_id: str, store_result: WorkflowStoreResult):
+        try:
+            if not store_result.success:
+                workflow_api_logger.error("data-side-car of workflow %s failed to store the result: %s",
+                                          workflow_id, store_result.message)
+                record = self.workflow_registry.get(workflow_id)
+                service_description = self.asset_store.get_assets_description(record.service_id)
+                if service_description is not None:
+                    self.store_result(service_description, workflow_id)
+
+            self.finish_workflow(workflow_id)
+        except Exception:
+            workflow_api_logger.exception("finishing workflow %s failed", workflow_id)
+
+    def __start_store_timeout(self, service_description: ServiceDescription, workflow_id: str):
+        timer = Timer(WORKFLOW_API_CALLBACK_TIMEOUT,
+                      self.__store_timed_out,
+                      kwargs={"service_description": service_description,
+                              "workflow_id": workflow_id})
+        timer.daemon = True
+        with self.finish_lock:
+            if workflow_id in self.finishing_workflows or workflow_id in self.store_timeouts:
+                return
+            self.store_timeouts[workflow_id] = timer
+        timer.start()
+
+    def __cancel_store_timeout(self, workflow_id: str):
+        with self.finish_lock:
+            timer = self.store_timeouts.pop(workflow_id, None)
+        if timer is not None:
+            timer.cancel()
+
+    def __store_timed_out(self, service_description: ServiceDescription, workflow_id: str):
+        with self.finish_lock:
+            if self.store_timeouts.pop(workflow_id, None) is None:
+                return
+
+        workflow_api_logger.warning("no result of the data-side-car of workflow %s after %ss, request it",
+                                    workflow_id, WORKFLOW_API_CALLBACK_TIMEOUT)
+        try:
+            self.store_result(service_description, workflow_id)
+            self.finish_workflow(workflow_id)
+        except Exception:
+            workflow_api_logger.exception("storing the result of workflow %s failed", workflow_id)
+
+    def dispatch_workflow(self, entry: WorkflowQueueEntry):
+        """
+        called by the scheduler in its own thread, as soon as the workflow is admitted
+        """
+        self.set_workflow_phase(entry.workflow_id, WorkflowJobPhase.PREPARING)
+        try:
+            self.commit_task(service_id=entry.service_id,
+                             workflow_id=entry.workflow_id)
+        except Exception:
+            self.remove_input_snapshot(entry.service_id, entry.workflow_id)
+            self.set_workflow_phase(entry.workflow_id, WorkflowJobPhase.CANCELED)
+            raise
+
+    def get_service_workflow_limit(self, service_id: str) -> Union[int, None]:
+        service_description = self.asset_store.get_assets_description(service_id)
+        if service_description is None:
+            return None
+        return service_description.max_concurrent_workflows
+
+    def commit_workflow(self, service_id, workflow_id, priority: int = 0) -> int:
+        """
+        queues the workflow for the deployment into the backend, returns its queue position
+        """
+        self.workflow_registry.put(WorkflowRecord(workflow_id=workflow_id,
+                                                  service_id=service_id,
+                                                  user_id=WORKFLOW_API_USER,
+                                                  priority=priority))
+        self.timeline_recorder.set_attributes(workflow_id, **{"service.id": service_id})
+        self.publish_workflow_state(workflow_id, WorkflowJobState(phase=WorkflowJobPhase.QUEUED))
+
+        return self.scheduler.submit(workflow_id=workflow_id,
+                                     service_id=service_id,
+                                     user_id=WORKFLOW_API_USER,
+                                     priority=priority)
 
     def get_workflow_status(self,
                             service_id: str,
@@ -272,15 +1029,95 @@ class ServiceApi():
                 status_code=HTTP_400_BAD_REQUEST,
                 detail="invalid workflow_id"
             )
-        return self.workflow_backend.get_status(
+
+        queue_position = self.scheduler.get_queue_position(workflow_id)
+        if queue_position is not None:
+            if verbose_level > 0:
+                return f"workflow is queued at position {queue_position}"
+            return WorkflowJobState(phase=WorkflowJobPhase.QUEUED,
+                                    queue_position=queue_position,
+                                    timeline=self.timeline_recorder.get(workflow_id))
+
+        workflow_status = self.workflow_backend.get_status(
             workflow_id=workflow_id,
             verbose_level=verbose_level)
+        if isinstance(workflow_status, WorkflowJobState):
+            workflow_status = workflow_status.model_copy(update={"timeline": self.timeline_recorder.get(workflow_id)})
+        return workflow_status
+
+    def get_workflow_log_stream(self,
+                                service_id: str,
+                                workflow_id: str,
+                                after: str = None,
+                                follow: bool = True,
+                                tail_lines: int = None) -> AsyncIterator[bytes]:
+        service_description = self.get_service_description(service_id)
+        if not self.workflow_exists(service_description, workflow_id):
+            raise HTTPException(
+                status_code=HTTP_400_BAD_REQUEST,
+                detail="invalid workflow_id"
+            )
+
+        try:
+            return self.workflow_backend.stream_log(workflow_id=workflow_id,
+                                                    after=after,
+                                                    follow=follow,
+                                                    tail_lines=tail_lines)
+        except KeyError:
+            raise HTTPException(
+                status_code=HTTP_404_NOT_FOUND,
+                detail="workflow has not started yet"
+            )
+        except LogStreamLimitReached:
+            raise HTTPException(
+                status_code=HTTP_503_SERVICE_UNAVAILABLE,
+                detail="too many followed logs, retry later or read without follow"
+            )
+
+    def set_workflow_phase(self, workflow_id: str, phase: WorkflowJobPhase):
+        self.workflow_registry.update(workflow_id, phase=phase)
+        self.publish_workflow_state(workflow_id, WorkflowJobState(phase=phase))
+
+    def publish_workflow_state(self, workflow_id: str, job_state: WorkflowJobState):
+        """
+        records the transitions of the state in the timeline of the workflow and pushes it to the clients
+        """
+        self.timeline_recorder.record(workflow_id, job_state)
+        self.event_hub.publish(workflow_id, job_state)
+
+    def get_workflow_event(self, service_id: str, workflow_id: str) -> WorkflowEvent:
+        """
+        latest status event of a workflow, workflows without event (e.g. of a previous run)
+        start with the phase stored in the registry
+        """
+        service_description = self.get_service_description(service_id)
+        if not self.workflow_exists(service_description, workflow_id):
+            raise HTTPException(
+                status_code=HTTP_400_BAD_REQUEST,
+                detail="invalid workflow_id"
+            )
+
+        event = self.event_hub.get(workflow_id)
+        if event is None:
+            record = self.workflow_registry.get(workflow_id)
+            self.event_hub.publish(workflow_id, WorkflowJobState(phase=record.phase))
+            event = self.event_hub.get(workflow_id)
+        return event
 
     def workflow_exists(self, service_description: ServiceDescription, workflow_id: str):
-        workflow_ids = get_workflow_ids(
-            user_id=WORKFLOW_API_USER)
+        record = self.workflow_registry.get(workflow_id)
 
-        return workflow_id in workflow_ids
+        return record is not None and record.service_id == service_description.service_id
+
+    def get_workflow_ids(self, user_id: str) -> List[str]:
+        """
+        ids of the queued and running workflows of an user
+        """
+        records = self.workflow_registry.list_by_user(
+            user_id=user_id,
+            phases=[WorkflowJobPhase.QUEUED, *ACTIVE_PHASES])
+
+        return [record.workflow_id for record in records]
 
     def stop_workflow(self, service_id: str, workflow_id: str):
         service_description = self.get_service_description(service_id)
@@ -289,13 +1126,35 @@ class ServiceApi():
                 status_code=HTTP_400_BAD_REQUEST,
                 detail="invalid workflow_id"
             )
+
+        # a queued workflow has no backend resources yet
+        if self.scheduler.cancel(workflow_id):
+            self.remove_input_snapshot(service_id, workflow_id)
+            self.set_workflow_phase(workflow_id, WorkflowJobPhase.CANCELED)
+            return
+
+        # a finished workflow in its retention stays finished
+        if self.cleanup_scheduler.cancel(workflow_id):
+            self.workflow_backend.cleanup(
+                workflow_id=workflow_id)
+            return
+
+        self.__cancel_store_timeout(workflow_id)
         self.workflow_backend.cleanup(
-            workflow_id=workflow_id)
+            workflow_id=workflow_id,
+            phase=WorkflowJobPhase.CANCELED)
+        self.remove_input_snapshot(service_id, workflow_id)
+        self.scheduler.release(workflow_id)
+        self.set_workflow_phase(workflow_id, WorkflowJobPhase.CANCELED)
 
     def list_workflow_results(self, service_id: str, workflow_id: str):
-        service_description = self.get_service_description(service_id)
-        # TODO check if workflow_id is in history or it exists as a path prefix
+        try:
+            return [x.name for x in self.get_result_manifest(service_id, workflow_id).files]
+        except HTTPException as exc:
+            if exc.status_code != HTTP_404_NOT_FOUND:
+                raise
 
+        # results stored before the manifests were introduced
         workflow_result_prefix = f"{service_id}/outputs/{workflow_id}/"
         object_list = self.storage.get_objects_list(
             bucket=WORKFLOW_API_USER_STORAGE,
@@ -312,96 +1171,259 @@ async def startup():
 
     global client
     client = ServiceApi()
+    client.start()
 
     print("STARTUP")
 
 
-@service_api.get("/services/")
-async def get_services():
+@service_api.on_event("shutdown")
+async def shutdown():
+    # pending writes of the registry are committed, the registry itself stays usable
+    client.workflow_registry.flush()
+    client.workflow_backend.close()
+    client.callback_executor.shutdown(wait=False)
+    client.cleanup_scheduler.stop()
+    client.asset_store.stop()
+    STATE_COLLECTOR.collect_handle = None
+
+
+@service_api.get("/metrics", response_class=PlainTextResponse)
+async def get_prometheus_metrics():
     """
-    list available services
+    prometheus metrics: latencies of the http routes, kubernetes and storage calls, transferred bytes,
+    workflows per phase, queue depth and threads of the workflow monitors
     """
-    return client.get_assets()
+    # the state gauges query the registry
+    metrics = await client.io_executor.run(get_metrics)
+    return Response(content=metrics, media_type=CONTENT_TYPE_LATEST)
 
 
-@service_api.get("/services/{service_id}/info", response_model=ServiceDescription, response_model_exclude_none=True)
-async def get_service_info(service_id: str):
+@service_api.get("/reconciler/metrics", response_model=ReconcilerMetrics)
+async def get_reconciler_metrics():
+    """
+    resources reclaimed by the reconciler of the workflow backend
+    """
+    metrics = client.workflow_backend.get_reconciler_metrics()
+    if metrics is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND,
+                            detail="workflow backend has no reconciler")
+    return metrics
+
+
+@callback_api.post("/workflows/{workflow_id}/progress",
+                   response_model=WorkflowJobState,
+                   response_model_exclude_none=True)
+async def report_workflow_store_progress(store_progress: WorkflowStoreProgress,
+                                         workflow_id: str = Depends(get_callback_workflow_id)):
     """
-    returns informations to a requested service
+    upload progress of the data-side-car of a workflow, authenticated with the callback-token of the workflow
     """
-    service_description = client.get_service_description(service_id)
+    job_state = client.store_progress(workflow_id, store_progress)
+    if job_state is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND,
+                            detail="workflow has not started yet")
+    return job_state
 
-    return service_description
 
-# curl -H "content-type: text/plain "  -H 'access_token: password' -XPUT $UPLOAD_URL   --data-binary @resources/test.env
+@callback_api.post("/workflows/{workflow_id}/completed", status_code=HTTP_202_ACCEPTED)
+async def report_workflow_store_completed(store_result: WorkflowStoreResult,
+                                          workflow_id: str = Depends(get_callback_workflow_id)):
+    """
+    the data-side-car of a workflow has stored the result, the workflow is finished without a request
+    through the kubernetes api server
+    """
+    client.store_completed(workflow_id, store_result)
+
+    return {"workflow_id": workflow_id}
 
 
-# @service_api.get("/services/{service_id}/input/{resource}")
-# async def get_service_input_info(service_id: str, resource: str):
-#     """
-#     return a upload url for the specified resource
-#     """
+def get_catalog_response(request: Request, serialized_response: SerializedResponse) -> Response:
+    """
+    the json serialized once per catalog version, or 304 if the client holds it already
+    """
+    headers = {"ETag": serialized_response.etag,
+               "Cache-Control": f"public, max-age={WORKFLOW_API_CATALOG_MAX_AGE}"}
+    if if_none_match(request.headers.get("If-None-Match"), serialized_response.etag):
+        return Response(status_code=HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=serialized_response.body, media_type="application/json", headers=headers)
 
-#     resource_upload = client.generate_resource_upload_url(service_id,
-#                                                           resource)
 
-#     return resource_upload
+@service_api.get("/services/")
+async def get_services(request: Request):
+    """
+    list available services
+    """
+    return get_catalog_response(request, client.get_assets_response())
 
 
-# @service_api.put("/services/{service_id}/input/{resource}")
-# async def get_service_input_info(service_id: str,
-#                                  resource: str,
-#                                  input_file: bytes = Body(..., media_type="text/plain")):
-#     # pylint: disable=W0613
+@service_api.get("/services/{service_id}/info",
+                 responses={HTTP_200_OK: {"model": ServiceDescription},
+                            HTTP_304_NOT_MODIFIED: {"description": "the catalog version of If-None-Match is current"}})
+async def get_service_info(service_id: str, request: Request):
+    """
+    returns informations to a requested service, serialized once per catalog version (fields without value omitted)
+    """
+    return get_catalog_response(request, client.get_service_description_response(service_id))
 
-#     """
-#     Uploads a file into the user storage
-#     """
 
-#     resource_upload = client.generate_resource_upload_url(service_id,
-#                                                           resource)
-#     return RedirectResponse(url=resource_upload["url"])
+@service_api.get("/services/{service_id}/input/{resource}/upload-url", response_model=PresignedUrl)
+async def get_service_input_upload_url(service_id: str, resource: str):
+    """
+    returns a short-lived presigned url to upload the input resource directly into the user storage,
+    e.g. `curl -T input.env $URL`. Afterwards the upload has to be confirmed with `/commit`.
+    """
+    return await client.io_executor.run(client.get_resource_upload_url,
+                                        service_id=service_id,
+                                        resource_name=resource)
 
 
-# @service_api.get("/services/{service_id}/output/{resource}")
-# async def get_service_output_info(service_id: str, resource: str):
-#     """
-#     return a download url for the specified resource
-#     """
+@service_api.post("/services/{service_id}/input/{resource}/commit")
+async def commit_service_input(service_id: str, resource: str):
+    """
+    confirms an upload via presigned url, checks that the resource exists in the user storage
+    """
+    return await client.io_executor.run(client.commit_resource_upload,
+                                        service_id=service_id,
+                                        resource_name=resource)
 
-#     resource_download_info = client.generate_resource_download_url(service_id,
-#                                                                    resource)
-#     return RedirectResponse(url=resource_download_info["url"])
 
-@service_api.put("/services/{service_id}/input/{resource}")
+@service_api.get("/services/{service_id}/output/download-url", response_model=PresignedUrl)
+async def get_service_output_download_url(service_id: str, resource: str):
+    """
+    returns a short-lived presigned url to download the output resource directly from the user storage
+    """
+    return await client.io_executor.run(client.get_resource_download_url,
+                                        service_id=service_id,
+                                        resource_name=resource)
+
+
+@service_api.get("/services/{service_id}/output/manifest", response_model=ResultManifest)
+async def get_service_output_manifest(service_id: str):
+    """
+    names, sizes, etags and checksums of the files of the latest result of the service
+    """
+    return await client.io_executor.run(client.get_result_manifest,
+                                        service_id=service_id)
+
+
+@service_api.put("/services/{service_id}/input/{resource}", openapi_extra=INPUT_FILE_REQUEST_BODY)
 async def put_service_input_info(service_id: str,
                                  resource: str,
-                                 input_file: UploadFile = File(...)):
-    # pylint: disable=W0613
+                                 request: Request):
+    """
+    upload service specific file (multipart form field input_file) into the user storage.
+    In the presigned data plane mode the upload is rejected before its body is read, the file is uploaded
+    with `/upload-url` or `/stream` instead.
+    """
+    if WORKFLOW_API_DATA_PLANE is DataPlaneMode.PRESIGNED:
+        raise HTTPException(
+            status_code=HTTP_400_BAD_REQUEST,
+            detail="uploads through the api are disabled, use /upload-url or /stream")
 
+    # the form is parsed here instead of by a File parameter, which would read the body before the check above
+    async with request.form() as form:
+        input_file = form.get("input_file")
+        if not isinstance(input_file, UploadFile):
+            raise HTTPException(
+                status_code=HTTP_400_BAD_REQUEST,
+                detail="input_file missing")
+
+        workflow_api_logger.info("put input: %s | %s | %s ",
+                                 service_id,
+                                 resource,
+                                 input_file.filename)
+        upload_result = await client.io_executor.run(client.put_resource,
+                                                     service_id=service_id,
+                                                     resource_name=resource,
+                                                     resource_file=input_file)
+
+    return JSONResponse(content={"upload_file": input_file.filename,
+                                 "size": upload_result.size,
+                                 "sha256": upload_result.sha256,
+                                 "deduplicated": upload_result.deduplicated})
+
+
+@service_api.put("/services/{service_id}/input/{resource}/stream", response_model=UploadResult)
+async def put_service_input_stream(service_id: str,
+                                   resource: str,
+                                   request: Request,
+                                   sha256: str = None):
     """
-    upload service specific file into the user storage
+    upload service specific file into the user storage by streaming the raw request body,
+    e.g. `curl -T rosbag.bag -H 'access-token: ...' $API/services/{service_id}/input/{resource}/stream`.
+    With the sha256 of the file the body is not read if the content is already stored, otherwise it is verified.
     """
-    workflow_api_logger.info("put input: %s | %s | %s ",
+    if sha256 is not None:
+        upload_result = await client.io_executor.run(client.link_resource,
+                                                     service_id=service_id,
+                                                     resource_name=resource,
+                                                     sha256=sha256)
+        if upload_result is not None:
+            return upload_result
+
+    if WORKFLOW_API_DATA_PLANE is DataPlaneMode.PRESIGNED:
+        # the body is not read, the client sends it again to the presigned url
+        presigned_url = await client.io_executor.run(client.get_resource_upload_url,
+                                                     service_id=service_id,
+                                                     resource_name=resource)
+        return RedirectResponse(url=presigned_url.url,
+                                status_code=HTTP_307_TEMPORARY_REDIRECT)
+
+    workflow_api_logger.info("put input stream: %s | %s | %s bytes",
                              service_id,
                              resource,
-                             input_file.filename)
-    client.put_resource(service_id=service_id,
-                        resource_name=resource,
-                        resource_file=input_file)
+                             request.headers.get("content-length", "unknown"))
+
+    return await client.put_resource_stream(service_id=service_id,
+                                            resource_name=resource,
+                                            stream=request.stream(),
+                                            sha256=sha256)
 
-    return JSONResponse(content={"upload_file": input_file.filename})
+
+@service_api.post("/services/{service_id}/input/{resource}/link", response_model=UploadResult)
+async def link_service_input(service_id: str, resource: str, sha256: str):
+    """
+    refers the input to already stored content with the given sha256 without uploading it again,
+    404 if no content with this hash is stored
+    """
+    upload_result = await client.io_executor.run(client.link_resource,
+                                                 service_id=service_id,
+                                                 resource_name=resource,
+                                                 sha256=sha256)
+    if upload_result is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND,
+                            detail="no content with this sha256 stored")
+    return upload_result
 
 
 @service_api.get("/services/{service_id}/output")
-async def get_service_result(service_id: str, resource: str):
+async def get_service_result(service_id: str, resource: str, request: Request):
     """
     download a created result file for a specific service from the user storage.
+    supports `Range` (single and multiple byte ranges) and `If-Range` requests to resume
+    or parallelize downloads.
+    In the presigned data plane mode the request is redirected to a presigned url of the user storage.
     """
-    KB = 1024
-
-    response = client.get_resource(service_id,
-                                   resource)
+    if WORKFLOW_API_DATA_PLANE is DataPlaneMode.PRESIGNED:
+        presigned_url = await client.io_executor.run(client.get_resource_download_url,
+                                                     service_id=service_id,
+                                                     resource_name=resource)
+        return RedirectResponse(url=presigned_url.url,
+                                status_code=HTTP_307_TEMPORARY_REDIRECT)
+
+    range_header = request.headers.get("range")
+    if range_header:
+        resource_range = await client.io_executor.run(client.get_resource_ranges,
+                                                      service_id,
+                                                      resource,
+                                                      range_header,
+                                                      request.headers.get("if-range"))
+        if resource_range is not None:
+            return get_service_result_range(resource, *resource_range)
+
+    response = await client.io_executor.run(client.get_resource,
+                                            service_id,
+                                            resource)
 
     # Set the Content-Disposition header so the browser
     # knows to download the file instead of displaying it
@@ -410,11 +1432,13 @@ async def get_service_result(service_id: str, resource: str):
     headers["Content-Length"] = response.headers.get("Content-Length")
     # headers["transfer-encoding"] = "chunked"
     headers["Content-Disposition"] = f"attachment; filename={resource}"
+    headers["Accept-Ranges"] = "bytes"
+    if response.headers.get("ETag"):
+        headers["ETag"] = format_etag(response.headers.get("ETag"))
 
     def iter_content():
         # Streaming the content in chunks to avoid loading everything into memory
-        for chunk in response.stream():
-            yield chunk
+        yield from count_transfer(DOWNLOAD, response.stream())
 
     # Use StreamingResponse to return the content in chunks
     return StreamingResponse(iter_content(),
@@ -424,35 +1448,68 @@ async def get_service_result(service_id: str, resource: str):
     #     headers=headers)
 
 
+def get_service_result_range(resource: str, resource_storage_name: str, object_stat, ranges: List[ByteRange]):
+    """
+    partial content response, every range is mapped onto a ranged get_object request
+    """
+    content_type = object_stat.content_type or "application/octet-stream"
+    headers = {"Accept-Ranges": "bytes",
+               "ETag": format_etag(object_stat.etag),
+               "Content-Disposition": f"attachment; filename={resource}"}
+
+    if len(ranges) == 1:
+        headers["Content-Type"] = content_type
+        headers["Content-Range"] = ranges[0].content_range(object_stat.size)
+        headers["Content-Length"] = str(ranges[0].length)
+        return StreamingResponse(client.iter_resource_range(resource_storage_name, ranges[0]),
+                                 status_code=HTTP_206_PARTIAL_CONTENT,
+                                 headers=headers)
+
+    boundary = uuid4().hex
+    content_length, body = multipart_byteranges(
+        ranges=ranges,
+        size=object_stat.size,
+        content_type=content_type,
+        boundary=boundary,
+        read_range=lambda byte_range: client.iter_resource_range(resource_storage_name, byte_range))
+
+    headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+    headers["Content-Length"] = str(content_length)
+    return StreamingResponse(body,
+                             status_code=HTTP_206_PARTIAL_CONTENT,
+                             headers=headers)
+
+
 @service_api.get("/services/{service_id}/workflow/")
 async def list_service_workflow(service_id: str):
     """
     returns a list of all running workflows and its IDs.
     """
 
-    return get_workflow_ids(
+    return client.get_workflow_ids(
         user_id=WORKFLOW_API_USER)
 
 
 @service_api.post("/services/{service_id}/workflow/execute")
-async def start_service_workflow(service_id: str):
+async def start_service_workflow(service_id: str, priority: int = 0):
     """
     triggers the creation and execution the workflow for this service.
+    the workflow is queued until the configured concurrency limits admit it,
+    workflows with a higher priority are admitted first.
     """
 
     workflow_id = str(uuid4())
 
-    # TODO check user workflow limit
-
-    # checks if provided inputs are met with service description
-    if not client.service_inputs_exists(service_id):
+    # the inputs are copied for the workflow, a missing input fails the copy
+    if not await client.io_executor.run(client.snapshot_inputs, service_id, workflow_id):
         raise HTTPException(
             status_code=HTTP_400_BAD_REQUEST,
             detail="service input not fulfilled")
 
-    client.commit_workflow(service_id, workflow_id)
+    queue_position = client.commit_workflow(service_id, workflow_id, priority)
 
-    return {"workflow_id": workflow_id}
+    return {"workflow_id": workflow_id,
+            "queue_position": queue_position}
 
 
 @service_api.post("/services/{service_id}/workflow/stop/{workflow_id}")
@@ -464,11 +1521,21 @@ async def stops_service_workflow(service_id: str, workflow_id: str):
     # check if job was executed and not already stopped
     # trigger cleanup
     #   - remove job and config maps
-    client.stop_workflow(service_id, workflow_id)
+    await client.io_executor.run(client.stop_workflow, service_id, workflow_id)
 
     return {}
 
 
+@service_api.get("/services/{service_id}/workflow/manifest/{workflow_id}", response_model=ResultManifest)
+async def get_service_workflow_manifest(service_id: str, workflow_id: str):
+    """
+    names, sizes, etags and checksums of the result files stored by a workflow
+    """
+    return await client.io_executor.run(client.get_result_manifest,
+                                        service_id=service_id,
+                                        workflow_id=workflow_id)
+
+
 @service_api.get("/services/{service_id}/workflow/status/{workflow_id}")
 async def get_service_workflow_status(service_id: str, workflow_id: str, verbose_level: int = 0):
     """
@@ -478,14 +1545,100 @@ async def get_service_workflow_status(service_id: str, workflow_id: str, verbose
     if verbose_level not in [0, 1, 2]:
         verbose_level = 0
 
-    workflow_status = client.get_workflow_status(service_id=service_id,
-                                                 workflow_id=workflow_id,
-                                                 verbose_level=verbose_level)
+    workflow_status = await client.io_executor.run(client.get_workflow_status,
+                                                   service_id=service_id,
+                                                   workflow_id=workflow_id,
+                                                   verbose_level=verbose_level)
     if verbose_level == 0:
         return JSONResponse(status_code=HTTP_200_OK,
                             content={"service_id": service_id,
                                      "workflow_id": workflow_id,
-                                     "workflow_status": workflow_status.model_dump()})
+                                     "workflow_status": workflow_status.model_dump(mode="json")})
     if verbose_level in [1, 2]:
         return PlainTextResponse(status_code=HTTP_200_OK,
                                  content=workflow_status)
+
+
+@service_api.get("/services/{service_id}/workflow/logs/{workflow_id}")
+async def get_service_workflow_logs(service_id: str,
+                                    workflow_id: str,
+                                    after: str = None,
+                                    follow: bool = True,
+                                    tail_lines: int = None):
+    """
+    streams the log of the worker, every line starts with its timestamp.
+    The timestamp of the last received line continues the log with `after`, so a reconnecting
+    client never downloads the same lines again. Without follow only the lines available now are sent.
+    """
+    log_stream = await client.io_executor.run(client.get_workflow_log_stream,
+                                              service_id=service_id,
+                                              workflow_id=workflow_id,
+                                              after=after,
+                                              follow=follow,
+                                              tail_lines=tail_lines)
+
+    return StreamingResponse(log_stream,
+                             media_type="text/plain",
+                             headers={"Cache-Control": "no-cache",
+                                      "X-Accel-Buffering": "no"})
+
+
+@service_api.get("/services/{service_id}/workflow/poll/{workflow_id}")
+async def poll_service_workflow_status(service_id: str, workflow_id: str, request: Request, timeout: float = None):
+    """
+    long-poll variant of the workflow status.
+    Waits up to timeout seconds until the state differs from the version in the If-None-Match header,
+    responds with 304 if the state did not change.
+    """
+    event = await client.io_executor.run(client.get_workflow_event, service_id, workflow_id)
+
+    if timeout is None or timeout > WORKFLOW_API_LONG_POLL_TIMEOUT:
+        timeout = WORKFLOW_API_LONG_POLL_TIMEOUT
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        changed = await client.event_hub.wait(workflow_id,
+                                              after_version=client.event_hub.get_version(if_none_match),
+                                              timeout=timeout)
+        if changed is None:
+            return Response(status_code=HTTP_304_NOT_MODIFIED,
+                            headers={"ETag": event.etag})
+        event = changed
+
+    return Response(content=event.data,
+                    media_type="application/json",
+                    headers={"ETag": event.etag,
+                             "Cache-Control": "no-cache"})
+
+
+@service_api.get("/services/{service_id}/workflow/events/{workflow_id}")
+async def get_service_workflow_events(service_id: str, workflow_id: str, request: Request):
+    """
+    server-sent events with every phase and container state transition of the workflow.
+    The stream ends with the FINISHED or CANCELED state, a reconnecting client continues
+    after the Last-Event-ID.
+    """
+    event = await client.io_executor.run(client.get_workflow_event, service_id, workflow_id)
+    after_version = client.event_hub.get_version(request.headers.get("last-event-id"))
+
+    async def iter_events():
+        version = after_version
+        if event.phase in TERMINAL_PHASES and event.version <= version:
+            return
+        while True:
+            next_event = await client.event_hub.wait(workflow_id,
+                                                     after_version=version,
+                                                     timeout=WORKFLOW_API_EVENTS_KEEPALIVE)
+            if next_event is None:
+                yield b": keep-alive\n\n"
+                continue
+
+            version = next_event.version
+            yield next_event.to_sse()
+            if next_event.phase in TERMINAL_PHASES:
+                return
+
+    return StreamingResponse(iter_events(),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache",
+                                      "X-Accel-Buffering": "no"})
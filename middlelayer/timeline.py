@@ -0,0 +1,159 @@
+import sys
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Dict, List, Tuple, Union
+
+from opentelemetry import trace
+
+from middlelayer.models import WorkflowTimelineEntry, TimelineEntryKind
+from middlelayer.backend import WorkflowJobState
+from middlelayer.registry import TERMINAL_PHASES
+from middlelayer.k8sClient import K8sContainerStateDate
+
+formatter = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+stdout_handle = logging.StreamHandler(sys.stdout)
+stdout_handle.setFormatter(formatter)
+
+timeline_logger = logging.getLogger("workflow_timeline")
+timeline_logger.setLevel(level=logging.DEBUG)
+timeline_logger.addHandler(stdout_handle)
+
+# a no-op tracer until an opentelemetry sdk is configured, e.g. by opentelemetry-instrument
+tracer = trace.get_tracer("middlelayer.timeline")
+
+
+def to_nanoseconds(value: datetime) -> int:
+    return int(value.timestamp() * 1e9)
+
+
+def get_container_entries(kind: TimelineEntryKind,
+                          name: str,
+                          state: K8sContainerStateDate,
+                          now: datetime) -> List[WorkflowTimelineEntry]:
+    entries = []
+    if state.started_at is not None:
+        # also a container which terminated between two events of the monitor has been running
+        entries.append(WorkflowTimelineEntry(kind=kind, name=name, state="running", at=state.started_at))
+    if state.state == "terminated":
+        entries.append(WorkflowTimelineEntry(kind=kind, name=name, state="terminated", reason=state.reason,
+                                             at=state.finished_at or now))
+    elif state.state == "waiting":
+        entries.append(WorkflowTimelineEntry(kind=kind, name=name, state="waiting", reason=state.reason, at=now))
+    return entries
+
+
+def get_timeline_entries(job_state: WorkflowJobState, now: datetime) -> List[WorkflowTimelineEntry]:
+    """
+    the phase of the state, the true pod conditions and the container states
+    """
+    entries = [WorkflowTimelineEntry(kind=TimelineEntryKind.PHASE, name=job_state.phase.value, at=now)]
+    pod_state = job_state.worker_state
+    if pod_state is None:
+        return entries
+
+    for condition, at in (pod_state.condition_times or {}).items():
+        entries.append(WorkflowTimelineEntry(kind=TimelineEntryKind.CONDITION, name=condition, at=at))
+    for kind, statuses in ((TimelineEntryKind.INIT_CONTAINER, pod_state.init_container_statuses),
+                           (TimelineEntryKind.CONTAINER, pod_state.container_statuses)):
+        for name, state in (statuses or {}).items():
+            entries.extend(get_container_entries(kind, name, state, now))
+    return entries
+
+
+class WorkflowTimelineRecorder():
+    """
+    Records when a workflow entered each phase, when the conditions of its pod became true and when its containers
+    changed their state (e.g. waiting for the image, input download of data-input-init, running, terminated).
+
+    Every transition is recorded once with its first time, the times of the pod are taken from the kubernetes
+    api. When the workflow reaches a terminal phase its timeline is emitted as trace spans: one span per
+    workflow with a child span per phase and per container state, the pod conditions are events of the workflow span.
+    The timelines of the last max_workflows workflows are kept for the status response.
+    """
+
+    def __init__(self, max_workflows: int = 10000):
+        self.max_workflows = max_workflows
+        self.lock = Lock()
+        self.timelines: Dict[str, Dict[Tuple, WorkflowTimelineEntry]] = OrderedDict()
+        # e.g. the service_id of the workflow, added to its spans
+        self.attributes: Dict[str, Dict[str, str]] = {}
+
+    def set_attributes(self, workflow_id: str, **attributes: str):
+        with self.lock:
+            self.attributes[workflow_id] = attributes
+
+    def record(self, workflow_id: str, job_state: WorkflowJobState):
+        now = datetime.now(timezone.utc)
+        entries = get_timeline_entries(job_state, now)
+
+        with self.lock:
+            timeline = self.timelines.get(workflow_id)
+            if timeline is None:
+                timeline = self.timelines[workflow_id] = {}
+                while len(self.timelines) > self.max_workflows:
+                    evicted, _ = self.timelines.popitem(last=False)
+                    self.attributes.pop(evicted, None)
+
+            terminal = any(x.kind is TimelineEntryKind.PHASE and x.name in TERMINAL_PHASES for x in timeline.values())
+            for entry in entries:
+                timeline.setdefault((entry.kind, entry.name, entry.state, entry.reason), entry)
+            if terminal or job_state.phase not in TERMINAL_PHASES:
+                return
+            finished_timeline = sorted(timeline.values(), key=lambda x: x.at)
+            attributes = self.attributes.pop(workflow_id, {})
+
+        try:
+            self.__emit_spans(workflow_id, finished_timeline, attributes)
+        except Exception:
+            timeline_logger.exception("spans of workflow %s not emitted", workflow_id)
+
+    def get(self, workflow_id: str) -> Union[List[WorkflowTimelineEntry], None]:
+        with self.lock:
+            timeline = self.timelines.get(workflow_id)
+            if timeline is None:
+                return None
+            return sorted(timeline.values(), key=lambda x: x.at)
+
+    @staticmethod
+    def __emit_spans(workflow_id: str, timeline: List[WorkflowTimelineEntry], attributes: Dict[str, str]):
+        phases = [x for x in timeline if x.kind is TimelineEntryKind.PHASE]
+        end = phases[-1].at
+
+        workflow_span = tracer.start_span("workflow",
+                                          start_time=to_nanoseconds(timeline[0].at),
+                                          attributes={"workflow.id": workflow_id,
+                                                      "workflow.phase": phases[-1].name,
+                                                      **attributes})
+        context = trace.set_span_in_context(workflow_span)
+
+        def add_span(name: str, start: WorkflowTimelineEntry, span_end: datetime, **span_attributes):
+            span = tracer.start_span(name,
+                                     context=context,
+                                     start_time=to_nanoseconds(start.at),
+                                     attributes={"workflow.id": workflow_id, **span_attributes})
+            span.end(end_time=to_nanoseconds(max(span_end, start.at)))
+
+        # a phase lasts until the next phase
+        for phase, next_phase in zip(phases, phases[1:]):
+            add_span(phase.name, phase, next_phase.at)
+
+        containers: Dict[Tuple, List[WorkflowTimelineEntry]] = {}
+        for entry in timeline:
+            if entry.kind is TimelineEntryKind.CONDITION:
+                workflow_span.add_event(entry.name, timestamp=to_nanoseconds(entry.at))
+            elif entry.kind is not TimelineEntryKind.PHASE:
+                containers.setdefault((entry.kind, entry.name), []).append(entry)
+
+        # a container state lasts until the next state of the container, a terminated container has no span
+        for (kind, name), states in containers.items():
+            for state, next_state in zip(states, states[1:] + [None]):
+                if state.state == "terminated":
+                    continue
+                add_span(f"{name} {state.state}", state, next_state.at if next_state else end,
+                         **{"container.kind": kind.value, "container.state.reason": state.reason or ""})
+
+        workflow_span.end(end_time=to_nanoseconds(end))
+        timeline_logger.debug("workflow %s: %d timeline entries emitted as spans", workflow_id, len(timeline))
@@ -0,0 +1,121 @@
+import sys
+import time
+import asyncio
+import hashlib
+import logging
+from typing import AsyncIterator, List
+
+from minio.datatypes import Part
+
+from middlelayer.imla_minio import ImlaMinio, MB
+from middlelayer.executor import BlockingIOExecutor
+from middlelayer.models import UploadResult
+
+formatter = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+stdout_handle = logging.StreamHandler(sys.stdout)
+stdout_handle.setFormatter(formatter)
+
+upload_logger = logging.getLogger("upload")
+upload_logger.setLevel(level=logging.DEBUG)
+upload_logger.addHandler(stdout_handle)
+
+# smallest part size allowed by s3 for all but the last part
+MIN_PART_SIZE = 5*MB
+
+
+class MultipartStreamUploader():
+    """
+    Streams a request body into a s3 multipart upload without spooling it to disk.
+
+    The body is cut into parts of part_size, up to max_parts_in_flight parts are
+    uploaded at once, so the memory per upload is bound by
+    part_size * (max_parts_in_flight + 1).
+    Bodies smaller than a single part are stored with one put request.
+    The SHA-256 of the body is computed while it streams through.
+    """
+
+    def __init__(self,
+                 storage: ImlaMinio,
+                 executor: BlockingIOExecutor,
+                 part_size: int = 16*MB,
+                 max_parts_in_flight: int = 4):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {MIN_PART_SIZE} bytes")
+        if max_parts_in_flight < 1:
+            raise ValueError("max_parts_in_flight must be at least 1")
+
+        self.storage = storage
+        self.executor = executor
+        self.part_size = part_size
+        self.max_parts_in_flight = max_parts_in_flight
+
+    async def upload(self, bucket: str, resource: str, chunks: AsyncIterator[bytes]) -> UploadResult:
+        started = time.perf_counter()
+        slots = asyncio.Semaphore(self.max_parts_in_flight)
+        buffer = bytearray()
+        size = 0
+        digest = hashlib.sha256()
+        upload_id = None
+        part_tasks: List[asyncio.Task] = []
+
+        async def upload_part(part_number: int, data: bytes) -> Part:
+            try:
+                etag = await self.executor.run(self.storage.upload_part,
+                                               bucket, resource, upload_id, part_number, data)
+                return Part(part_number, etag)
+            finally:
+                slots.release()
+
+        async def submit_part(data: bytes):
+            # blocks the body reader while max_parts_in_flight parts are uploading
+            await slots.acquire()
+            for task in part_tasks:
+                if task.done() and task.exception():
+                    slots.release()
+                    raise task.exception()
+            part_tasks.append(asyncio.ensure_future(upload_part(len(part_tasks) + 1, data)))
+
+        try:
+            async for chunk in chunks:
+                buffer += chunk
+                size += len(chunk)
+                digest.update(chunk)
+                while len(buffer) >= self.part_size:
+                    if upload_id is None:
+                        upload_id = await self.executor.run(self.storage.create_multipart_upload,
+                                                            bucket, resource)
+                    part = bytes(buffer[:self.part_size])
+                    del buffer[:self.part_size]
+                    await submit_part(part)
+
+            if upload_id is None:
+                await self.executor.run(self.storage.put_data, bucket, resource, bytes(buffer))
+            else:
+                if buffer:
+                    await submit_part(bytes(buffer))
+                buffer = bytearray()
+                parts = await asyncio.gather(*part_tasks)
+                await self.executor.run(self.storage.complete_multipart_upload,
+                                        bucket, resource, upload_id, parts)
+
+        except BaseException:
+            for task in part_tasks:
+                task.cancel()
+            await asyncio.gather(*part_tasks, return_exceptions=True)
+            if upload_id is not None:
+                upload_logger.warning("abort multipart upload of %s/%s", bucket, resource)
+                await self.executor.run(self.storage.abort_multipart_upload, bucket, resource, upload_id)
+            raise
+
+        duration = time.perf_counter() - started
+        result = UploadResult(upload_file=resource,
+                              size=size,
+                              parts=max(len(part_tasks), 1),
+                              duration=duration,
+                              throughput_mb_s=(size / MB) / duration if duration > 0 else 0.0,
+                              sha256=digest.hexdigest())
+
+        upload_logger.info("uploaded %s/%s: %d bytes in %d parts, %.3fs, %.2f MB/s",
+                           bucket, resource, result.size, result.parts, result.duration, result.throughput_mb_s)
+        return result
@@ -1,7 +1,14 @@
 
+import os
+import time
+import json
+import shutil
+import tempfile
 import unittest
+from unittest.mock import MagicMock
 
 from middlelayer.asset import StaticAssetLoader
+from middlelayer.backend import WorkflowBackend
 
 
 class TestStaticAssetLoader(unittest.TestCase):
@@ -28,3 +35,100 @@ class TestStaticAssetLoader(unittest.TestCase):
 
         self.assertIsNotNone(description)
         self.assertEqual("dummy", description.service_id, "asset description id not equal")
+
+    def test_asset_loaded_handle(self):
+        asset_loaded_handle = MagicMock()
+
+        testee = StaticAssetLoader(static_asset_directory="./config/assets",
+                                   asset_loaded_handle=asset_loaded_handle)
+
+        loaded = [x.args[0] for x in asset_loaded_handle.call_args_list]
+        self.assertEqual(loaded, list(testee.assets_descriptions.values()))
+
+    def test_asset_loaded_handle_of_base_backend(self):
+        # every backend can be passed, the base class ignores the loaded services
+        testee = StaticAssetLoader(static_asset_directory="./config/assets",
+                                   asset_loaded_handle=WorkflowBackend().prepare_service)
+
+        self.assertIsNotNone(testee.get_assets_description("dummy"))
+
+
+class TestAssetReload(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        with open("./config/assets/dummy.json") as json_file:
+            self.dummy = json.load(json_file)
+        self.write_asset("dummy", self.dummy)
+
+        self.asset_loaded_handle = MagicMock()
+        self.testee = StaticAssetLoader(static_asset_directory=self.directory,
+                                        asset_loaded_handle=self.asset_loaded_handle)
+
+    def write_asset(self, asset_id: str, data: dict):
+        file_path = os.path.join(self.directory, f"{asset_id}.json")
+        with open(file_path, "w") as json_file:
+            json.dump({**data, "service_id": asset_id}, json_file)
+        # the mtime has to differ from a previous write within the same tick
+        stat = os.stat(file_path)
+        os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    def test_unchanged(self):
+        catalog = self.testee.get_catalog()
+
+        self.assertFalse(self.testee.reload())
+
+        self.assertIs(self.testee.get_catalog(), catalog)
+        self.asset_loaded_handle.assert_called_once()
+
+    def test_added_changed_removed(self):
+        dummy = self.testee.get_assets_description("dummy")
+
+        self.write_asset("other", self.dummy)
+        self.assertTrue(self.testee.reload())
+
+        self.assertEqual(self.testee.get_catalog().version, 2)
+        self.assertIs(self.testee.get_assets_description("dummy"), dummy)
+        self.assertEqual(self.testee.get_assets_description("other").service_id, "other")
+        self.assertEqual(self.asset_loaded_handle.call_args.args[0].service_id, "other")
+
+        self.write_asset("dummy", {**self.dummy, "retention_seconds": 60})
+        os.remove(os.path.join(self.directory, "other.json"))
+        self.assertTrue(self.testee.reload())
+
+        self.assertEqual(self.testee.get_assets_description("dummy").retention_seconds, 60)
+        self.assertIsNone(self.testee.get_assets_description("other"))
+        self.assertEqual(self.asset_loaded_handle.call_count, 3)
+        # a previous catalog is not modified
+        self.assertIs(dummy.retention_seconds, None)
+
+    def test_invalid_file_keeps_previous_description(self):
+        dummy = self.testee.get_assets_description("dummy")
+        with open(os.path.join(self.directory, "dummy.json"), "w") as json_file:
+            json_file.write("{")
+
+        self.assertTrue(self.testee.reload())
+
+        self.assertIs(self.testee.get_assets_description("dummy"), dummy)
+        self.assertFalse(self.testee.reload())
+
+    def test_resource_lookups(self):
+        description = self.testee.get_assets_description("dummy")
+
+        self.assertEqual(description.input_names, frozenset(x.resource_name for x in description.inputs))
+        self.assertEqual(list(description.outputs_by_name), [x.resource_name for x in description.outputs])
+        self.assertIs(description.input_names, description.input_names)
+
+    def test_reload_thread(self):
+        self.testee.reload_interval = 0.01
+        self.testee.start()
+        self.addCleanup(self.testee.stop)
+
+        self.write_asset("other", self.dummy)
+
+        for _ in range(200):
+            if self.testee.get_assets_description("other"):
+                break
+            time.sleep(0.01)
+        self.assertIsNotNone(self.testee.get_assets_description("other"))
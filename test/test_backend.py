@@ -1,11 +1,14 @@
 import unittest
-import dotenv
-from io import StringIO
+import time
 from unittest.mock import MagicMock, patch
 
 from middlelayer.models import (ServiceResouce, InputServiceResource, ServiceResourceType,
-                                WorkflowResource, WorkflowStoreInfo, MinioStoreInfo, K8sBackendConfig, K8sStorageType)
-from middlelayer.backend import K8sWorkflowBackend, K8sJobData, Event, WorkflowJobState
+                                WorkflowResource, WorkflowStoreInfo, MinioStoreInfo, WorkflowInputResource,
+                                K8sBackendConfig, K8sStorageType, ServiceDescription, WorkflowCallbackInfo,
+                                WorkflowStoreProgress)
+from middlelayer.backend import K8sWorkflowBackend, K8sJobData, Event, WorkflowJobState, WorkflowJobPhase
+from middlelayer.registry import SqliteWorkflowRegistry, WorkflowRecord
+from middlelayer.k8sClient import K8sPodStateData, K8sContainerStateDate, k8s_create_pod_manifest_template
 
 
 WORKFLOW_ID = "wf_id"
@@ -19,7 +22,7 @@ SERVICE_RESOURCE = ServiceResouce(
     type=ServiceResourceType.environment,
     description="test"
 )
-SERVICE_DOTENV_DATA = "data=data"
+SERVICE_DOTENV_DATA = b"data=data"
 
 INPUT_CONFIG_ID = "input_config_id"
 DATA_INPUT_SERVICE_RESOURCE = InputServiceResource(
@@ -66,7 +69,7 @@ class TestK8sWorkflowBackend(unittest.TestCase):
 
         # setup
         mock_get_data_handle = MagicMock()
-        mock_get_data_handle.return_value = SERVICE_DOTENV_DATA
+        mock_get_data_handle.return_value = [SERVICE_DOTENV_DATA[:3], SERVICE_DOTENV_DATA[3:]]
         # testee = K8sWorkflowBackend(K8S_NAMESPACE)
 
         with patch("middlelayer.backend.uuid4", return_value=K8S_CONFIGMAP_ID):
@@ -80,12 +83,12 @@ class TestK8sWorkflowBackend(unittest.TestCase):
             self.assertEqual(
                 len(self.testee.dummy_db.data[self.workflow_id].config_maps), 1)
 
+            mock_get_data_handle.assert_called_once_with(max_bytes=1024*1024)
             mock_k8s_create_config_map.assert_called_once()
             mock_k8s_create_config_map.assert_called_with(
                 name=K8S_CONFIGMAP_ID,
                 namespace=self.k8s_namespace,
-                data=dict(dotenv.dotenv_values(
-                    stream=StringIO(SERVICE_DOTENV_DATA))),
+                data={"data": "data"},
                 labels={"app": "gx4ki-demo",
                         "workflow-id": self.workflow_id})
 
@@ -123,48 +126,190 @@ class TestK8sWorkflowBackend(unittest.TestCase):
 
             mock_k8s_create_config_map.assert_not_called()
 
-    @patch('middlelayer.backend.k8s_delete_config_map')
-    @patch('middlelayer.backend.k8s_delete_pod')
+    @patch('middlelayer.backend.k8s_list_resource_labels', return_value=[])
+    @patch('middlelayer.backend.k8s_delete_secrets')
+    @patch('middlelayer.backend.k8s_delete_persistent_volume_claims')
+    @patch('middlelayer.backend.k8s_delete_config_maps')
+    @patch('middlelayer.backend.k8s_delete_pods')
     def test_cleanup(self,
-                     mock_k8s_delete_pod: MagicMock,
-                     mock_delete_config_map: MagicMock):
+                     mock_k8s_delete_pods: MagicMock,
+                     mock_delete_config_maps: MagicMock,
+                     mock_delete_persistent_volume_claims: MagicMock,
+                     mock_delete_secrets: MagicMock,
+                     mock_list_resource_labels: MagicMock):
 
         # exercise
         self.testee.cleanup(WORKFLOW_ID)
-        mock_delete_config_map.assert_not_called()
+        mock_delete_config_maps.assert_not_called()
 
         self.testee.dummy_db.data[WORKFLOW_ID] = self.job_data
 
         self.testee.cleanup(WORKFLOW_ID)
         # verify
-        mock_delete_config_map.assert_called_once()
-        mock_delete_config_map.assert_called_with(
-            K8S_CONFIGMAP_ID,
-            self.k8s_namespace)
-
-        mock_k8s_delete_pod.assert_called_once_with(
-            name=self.job_data.job_id,
-            namespace=self.k8s_namespace)
+        label_selector = f"app=gx4ki-demo,workflow-id={WORKFLOW_ID}"
+        for mock_delete in (mock_k8s_delete_pods, mock_delete_config_maps, mock_delete_persistent_volume_claims,
+                            mock_delete_secrets):
+            mock_delete.assert_called_once_with(
+                namespace=self.k8s_namespace,
+                label_selector=label_selector)
 
         self.assertTrue(self.job_data.job_monitor_event.is_set())
         self.assertIsNotNone(self.testee.dummy_db.get_job_data(WORKFLOW_ID))
+        self.assertEqual(self.testee.dummy_db.get_workflow_state(WORKFLOW_ID).phase, WorkflowJobPhase.FINISHED)
+
+        self.wait_cleanup_confirmed()
+        self.assertIsNotNone(self.testee.dummy_db.get_workflow_state(WORKFLOW_ID).cleanup_seconds)
+        mock_list_resource_labels.assert_called_with(
+            namespace=self.k8s_namespace,
+            label_selector=f"app=gx4ki-demo,workflow-id in ({WORKFLOW_ID})")
+        self.testee.close()
+
+    @patch('middlelayer.backend.k8s_list_resource_labels', return_value=[])
+    @patch('middlelayer.backend.k8s_delete_secrets')
+    @patch('middlelayer.backend.k8s_delete_persistent_volume_claims')
+    @patch('middlelayer.backend.k8s_delete_config_maps')
+    @patch('middlelayer.backend.k8s_delete_pods')
+    def test_cleanup_keeps_canceled_phase(self, *_):
+
+        # setup
+        registry = SqliteWorkflowRegistry(":memory:")
+        registry.put(WorkflowRecord(workflow_id=WORKFLOW_ID, service_id="service", user_id="user",
+                                    phase=WorkflowJobPhase.RUNNING))
+        with patch("middlelayer.k8sClient.config"):
+            testee = K8sWorkflowBackend(self.k8s_namespace, workflow_registry=registry)
+        testee.dummy_db.data[WORKFLOW_ID] = self.job_data
+
+        # exercise, stopped by the api like ServiceApi.stop_workflow
+        testee.cleanup(WORKFLOW_ID, phase=WorkflowJobPhase.CANCELED)
+        registry.update(WORKFLOW_ID, phase=WorkflowJobPhase.CANCELED)
+        self.wait_cleanup_confirmed(testee)
+
+        # verify
+        self.assertIsNotNone(testee.dummy_db.get_workflow_state(WORKFLOW_ID).cleanup_seconds)
+        self.assertIsNotNone(registry.get(WORKFLOW_ID).backend_data["job_state"]["cleanup_seconds"])
+        self.assertEqual(registry.get(WORKFLOW_ID).phase, WorkflowJobPhase.CANCELED)
+        # the status agrees with the registry
+        self.assertEqual(testee.get_status(WORKFLOW_ID, verbose_level=0).phase, WorkflowJobPhase.CANCELED)
+        testee.close()
+        registry.close()
+
+    @patch('middlelayer.backend.k8s_delete_secrets')
+    @patch('middlelayer.backend.k8s_delete_persistent_volume_claims')
+    @patch('middlelayer.backend.k8s_delete_config_maps')
+    @patch('middlelayer.backend.k8s_delete_pods')
+    def test_cleanup_confirmed_when_resources_gone(self, *_):
+
+        # setup
+        self.testee.k8s_backend_config.cleanup_poll_interval = 0.01
+        remaining = [[{"workflow-id": WORKFLOW_ID}, {"workflow-id": "other"}], []]
+        self.testee.dummy_db.data[WORKFLOW_ID] = self.job_data
+
+        with patch('middlelayer.backend.k8s_list_resource_labels',
+                   side_effect=lambda **_: remaining.pop(0) if len(remaining) > 1 else remaining[0]) as mock_list:
+            # exercise
+            self.testee.cleanup(WORKFLOW_ID)
+            self.wait_cleanup_confirmed()
+
+        # verify
+        self.assertGreaterEqual(mock_list.call_count, 2)
+        self.assertIsNotNone(self.testee.dummy_db.get_workflow_state(WORKFLOW_ID).cleanup_seconds)
+        self.testee.close()
+
+    @patch('middlelayer.backend.k8s_list_resource_labels', return_value=[])
+    @patch('middlelayer.backend.k8s_delete_secrets')
+    @patch('middlelayer.backend.k8s_delete_persistent_volume_claims')
+    @patch('middlelayer.backend.k8s_delete_config_maps')
+    @patch('middlelayer.backend.k8s_delete_pods')
+    def test_cleanup_workflows(self, *mock_deletes):
+
+        # setup
+        for workflow_id in ["wf_b", "wf_a"]:
+            self.testee.dummy_db.data[workflow_id] = K8sJobData(job_id=f"job_{workflow_id}")
+
+        # exercise
+        self.testee.cleanup_workflows(["wf_b", "wf_a", "unknown"])
+
+        # verify
+        for mock_delete in mock_deletes[:4]:
+            mock_delete.assert_called_once_with(
+                namespace=self.k8s_namespace,
+                label_selector="app=gx4ki-demo,workflow-id in (wf_a,wf_b)")
+        for workflow_id in ["wf_a", "wf_b"]:
+            self.assertEqual(self.testee.dummy_db.get_workflow_state(workflow_id).phase, WorkflowJobPhase.FINISHED)
+        self.wait_cleanup_confirmed()
+        self.testee.close()
+
+    @patch('middlelayer.backend.LABEL_SELECTOR_CHUNK_SIZE', 2)
+    @patch('middlelayer.backend.k8s_list_resource_labels', return_value=[])
+    @patch('middlelayer.backend.k8s_delete_secrets')
+    @patch('middlelayer.backend.k8s_delete_persistent_volume_claims')
+    @patch('middlelayer.backend.k8s_delete_config_maps')
+    @patch('middlelayer.backend.k8s_delete_pods')
+    def test_cleanup_workflows_chunked(self, *mocks):
+
+        # setup
+        for workflow_id in ["wf_c", "wf_b", "wf_a"]:
+            self.testee.dummy_db.data[workflow_id] = K8sJobData(job_id=f"job_{workflow_id}")
+
+        # exercise
+        self.testee.cleanup_workflows(["wf_c", "wf_b", "wf_a"])
+        self.wait_cleanup_confirmed()
+
+        # verify
+        for mock_delete in mocks[:4]:
+            self.assertEqual([x.kwargs["label_selector"] for x in mock_delete.call_args_list],
+                             ["app=gx4ki-demo,workflow-id in (wf_a,wf_b)", "app=gx4ki-demo,workflow-id in (wf_c)"])
+        # the confirmation is chunked as well
+        for call in mocks[4].call_args_list:
+            self.assertLessEqual(call.kwargs["label_selector"].count("wf_"), 2)
+        self.testee.close()
+
+    def wait_cleanup_confirmed(self, testee: K8sWorkflowBackend = None):
+        testee = testee or self.testee
+        for _ in range(200):
+            with testee.cleanup_condition:
+                if not testee.pending_cleanups:
+                    return
+            time.sleep(0.01)
+        self.fail("cleanup not confirmed")
+
+    def test_prepare_service(self):
+        service_description = ServiceDescription(service_id="service",
+                                                 inputs=[DATA_INPUT_SERVICE_RESOURCE],
+                                                 outputs=[],
+                                                 workflow_resource=WORKFLOW_RESOURCE)
+
+        self.testee.prepare_service(service_description)
+
+        self.assertEqual(self.testee.manifest_templates["service"],
+                         k8s_create_pod_manifest_template(WORKFLOW_RESOURCE, [DATA_INPUT_SERVICE_RESOURCE]))
+
+        with patch("middlelayer.backend.k8s_render_pod_manifest") as mock_k8s_render_pod_manifest,\
+                patch("middlelayer.backend.k8s_create_pod"),\
+                patch.object(self.testee.informer, "add_handler"):
+            self.testee.commit_workflow(workflow_id=self.workflow_id,
+                                        workflow_resource=WORKFLOW_RESOURCE,
+                                        workflow_finished_handle=MagicMock(),
+                                        service_id="service")
+
+        self.assertIs(mock_k8s_render_pod_manifest.call_args.kwargs["template"],
+                      self.testee.manifest_templates["service"])
 
     def test_commit_workflow(self):
         # setup
         job_manifest = "manifest"
 
         with patch("middlelayer.backend.uuid4", return_value=self.job_id) as mock_uuid4,\
-                patch("middlelayer.backend.k8s_create_pod_manifest") as mock_k8s_create_pod_manifest,\
+                patch("middlelayer.backend.k8s_render_pod_manifest") as mock_k8s_render_pod_manifest,\
                 patch('middlelayer.backend.k8s_create_pod') as mock_k8s_create_pod,\
                 patch("middlelayer.backend.Event") as mock_event,\
-                patch("middlelayer.backend.Thread") as mock_thread:
+                patch.object(self.testee.informer, "add_handler") as mock_add_handler:
 
-            mock_thread_instance = mock_thread.return_value
             mock_event_instance = mock_event.return_value
 
             mock_workflow_finished_handle = MagicMock()
 
-            mock_k8s_create_pod_manifest.return_value = job_manifest
+            mock_k8s_render_pod_manifest.return_value = job_manifest
 
             # exercise
             self.testee.commit_workflow(
@@ -175,9 +320,9 @@ class TestK8sWorkflowBackend(unittest.TestCase):
             # verify
             mock_uuid4.assert_called_once()
 
-            mock_k8s_create_pod_manifest.assert_called_once_with(
+            mock_k8s_render_pod_manifest.assert_called_once_with(
+                template=k8s_create_pod_manifest_template(WORKFLOW_RESOURCE),
                 job_uuid=self.job_id,
-                job_config=WORKFLOW_RESOURCE,
                 config_map_ref=[],
                 input_config_ref=None,
                 input_resources=None,
@@ -185,35 +330,85 @@ class TestK8sWorkflowBackend(unittest.TestCase):
                 persistent_volume_claim_id=None,
                 labels={"app": "gx4ki-demo",
                         "workflow-id": self.workflow_id,
-                        "job-id": self.job_id})
+                        "job-id": self.job_id},
+                store_secret_ref=None)
 
             mock_k8s_create_pod.assert_called_once_with(
                 manifest=job_manifest,
                 namespace=self.k8s_namespace)
 
-            mock_thread.assert_called_once()
-            mock_thread_instance.start.assert_called_once()
+            mock_add_handler.assert_called_once()
+            self.assertEqual(mock_add_handler.call_args.args[0], self.job_id)
 
             mock_event.assert_called_once()
             assert self.testee.dummy_db.get_job_monitor_event(
                 self.workflow_id) == mock_event_instance
 
+    def test_commit_workflow_with_callback(self):
+        # setup
+        store_info = WorkflowStoreInfo(minio=MinioStoreInfo(endpoint="minio:9000",
+                                                            access_key="access",
+                                                            secret_key="secret",
+                                                            secure=False),
+                                       destination_bucket="bucket",
+                                       destination_path="service/outputs",
+                                       result_files=["result"])
+        callback_info = WorkflowCallbackInfo(url="http://api/callbacks/workflows/wf", token="token")
+
+        with patch("middlelayer.backend.uuid4", side_effect=[self.job_id, "secret_id"]),\
+                patch("middlelayer.backend.k8s_create_secret") as mock_k8s_create_secret,\
+                patch("middlelayer.backend.k8s_render_pod_manifest") as mock_k8s_render_pod_manifest,\
+                patch('middlelayer.backend.k8s_create_pod'),\
+                patch.object(self.testee.informer, "add_handler"):
+
+            # exercise
+            self.testee.commit_workflow(
+                workflow_id=self.workflow_id,
+                workflow_resource=WORKFLOW_RESOURCE,
+                workflow_finished_handle=MagicMock(),
+                workflow_store_info=store_info,
+                callback_info=callback_info)
+
+            # verify
+            mock_k8s_create_secret.assert_called_once_with(
+                name="secret_id",
+                namespace=self.k8s_namespace,
+                data={"WORKFLOW_STORE_INFO": store_info.json(),
+                      "WORKFLOW_CALLBACK_URL": "http://api/callbacks/workflows/wf",
+                      "WORKFLOW_CALLBACK_TOKEN": "token"},
+                labels=self.k8s_metadata_labels)
+            self.assertEqual(mock_k8s_render_pod_manifest.call_args.kwargs["store_secret_ref"], "secret_id")
+
+    def test_set_store_progress(self):
+        # setup
+        self.testee.workflow_state_handle = MagicMock()
+        self.testee.dummy_db.data[self.workflow_id] = self.job_data
+        store_progress = WorkflowStoreProgress(stored_files=1, total_files=2, stored_bytes=1024)
+
+        # exercise
+        job_state = self.testee.set_store_progress(self.workflow_id, store_progress)
+
+        # verify
+        self.assertEqual(job_state.phase, WorkflowJobPhase.STORING)
+        self.assertEqual(job_state.store_progress, store_progress)
+        self.testee.workflow_state_handle.assert_called_once_with(self.workflow_id, job_state)
+        self.assertIsNone(self.testee.set_store_progress("unknown", store_progress))
+
     def test_commit_workflow_with_config_maps(self):
         # setup
         job_manifest = "manifest"
 
         with patch("middlelayer.backend.uuid4", return_value=self.job_id) as mock_uuid4,\
-                patch("middlelayer.backend.k8s_create_pod_manifest") as mock_k8s_create_pod_manifest,\
+                patch("middlelayer.backend.k8s_render_pod_manifest") as mock_k8s_render_pod_manifest,\
                 patch('middlelayer.backend.k8s_create_pod') as mock_k8s_create_pod,\
                 patch("middlelayer.backend.Event") as mock_event,\
-                patch("middlelayer.backend.Thread") as mock_thread:
+                patch.object(self.testee.informer, "add_handler") as mock_add_handler:
 
-            mock_thread_instance = mock_thread.return_value
             mock_event_instance = mock_event.return_value
 
             mock_workflow_finished_handle = MagicMock()
 
-            mock_k8s_create_pod_manifest.return_value = job_manifest
+            mock_k8s_render_pod_manifest.return_value = job_manifest
 
             self.testee.dummy_db.append_config_map(
                 self.workflow_id, K8S_CONFIGMAP_ID)
@@ -227,9 +422,9 @@ class TestK8sWorkflowBackend(unittest.TestCase):
             # verify
             mock_uuid4.assert_called_once()
 
-            mock_k8s_create_pod_manifest.assert_called_once_with(
+            mock_k8s_render_pod_manifest.assert_called_once_with(
+                template=k8s_create_pod_manifest_template(WORKFLOW_RESOURCE),
                 job_uuid=self.job_id,
-                job_config=WORKFLOW_RESOURCE,
                 config_map_ref=[K8S_CONFIGMAP_ID],
                 input_config_ref=None,
                 input_resources=None,
@@ -237,14 +432,15 @@ class TestK8sWorkflowBackend(unittest.TestCase):
                 persistent_volume_claim_id=None,
                 labels={"app": "gx4ki-demo",
                         "workflow-id": self.workflow_id,
-                        "job-id": self.job_id})
+                        "job-id": self.job_id},
+                store_secret_ref=None)
 
             mock_k8s_create_pod.assert_called_once_with(
                 manifest=job_manifest,
                 namespace=self.k8s_namespace)
 
-            mock_thread.assert_called_once()
-            mock_thread_instance.start.assert_called_once()
+            mock_add_handler.assert_called_once()
+            self.assertEqual(mock_add_handler.call_args.args[0], self.job_id)
 
             mock_event.assert_called_once()
             assert self.testee.dummy_db.get_job_monitor_event(
@@ -255,20 +451,19 @@ class TestK8sWorkflowBackend(unittest.TestCase):
         job_manifest = "manifest"
 
         with patch("middlelayer.backend.uuid4") as mock_uuid4,\
-                patch("middlelayer.backend.k8s_create_pod_manifest") as mock_k8s_create_pod_manifest,\
+                patch("middlelayer.backend.k8s_render_pod_manifest") as mock_k8s_render_pod_manifest,\
                 patch("middlelayer.backend.k8s_create_pod") as mock_k8s_create_pod,\
                 patch("middlelayer.backend.k8s_create_config_map") as mock_k8s_create_config_map,\
                 patch("middlelayer.backend.Event") as mock_event,\
-                patch("middlelayer.backend.Thread") as mock_thread:
+                patch.object(self.testee.informer, "add_handler") as mock_add_handler:
 
             mock_uuid4.side_effect = [INPUT_CONFIG_ID, self.job_id]
 
-            mock_thread_instance = mock_thread.return_value
             mock_event_instance = mock_event.return_value
 
             mock_workflow_finished_handle = MagicMock()
 
-            mock_k8s_create_pod_manifest.return_value = job_manifest
+            mock_k8s_render_pod_manifest.return_value = job_manifest
 
             self.testee.dummy_db.append_config_map(
                 self.workflow_id, K8S_CONFIGMAP_ID)
@@ -290,9 +485,9 @@ class TestK8sWorkflowBackend(unittest.TestCase):
 
             mock_k8s_create_config_map.assert_called_once()
 
-            mock_k8s_create_pod_manifest.assert_called_once_with(
+            mock_k8s_render_pod_manifest.assert_called_once_with(
+                template=k8s_create_pod_manifest_template(WORKFLOW_RESOURCE),
                 job_uuid=self.job_id,
-                job_config=WORKFLOW_RESOURCE,
                 config_map_ref=[K8S_CONFIGMAP_ID],
                 input_config_ref=INPUT_CONFIG_ID,
                 input_resources=[DATA_INPUT_SERVICE_RESOURCE],
@@ -300,14 +495,15 @@ class TestK8sWorkflowBackend(unittest.TestCase):
                 persistent_volume_claim_id=None,
                 labels={"app": "gx4ki-demo",
                         "workflow-id": self.workflow_id,
-                        "job-id": self.job_id})
+                        "job-id": self.job_id},
+                store_secret_ref=None)
 
             mock_k8s_create_pod.assert_called_once_with(
                 manifest=job_manifest,
                 namespace=self.k8s_namespace)
 
-            mock_thread.assert_called_once()
-            mock_thread_instance.start.assert_called_once()
+            mock_add_handler.assert_called_once()
+            self.assertEqual(mock_add_handler.call_args.args[0], self.job_id)
 
             mock_event.assert_called_once()
             assert self.testee.dummy_db.get_job_monitor_event(
@@ -318,22 +514,21 @@ class TestK8sWorkflowBackend(unittest.TestCase):
         job_manifest = "manifest"
 
         with patch("middlelayer.backend.uuid4") as mock_uuid4,\
-                patch("middlelayer.backend.k8s_create_pod_manifest") as mock_k8s_create_pod_manifest,\
+                patch("middlelayer.backend.k8s_render_pod_manifest") as mock_k8s_render_pod_manifest,\
                 patch("middlelayer.backend.k8s_create_pod") as mock_k8s_create_pod,\
                 patch("middlelayer.backend.k8s_create_config_map") as mock_k8s_create_config_map,\
                 patch("middlelayer.backend.k8s_create_persistent_volume_claim") as mock_k8s_create_persistent_volume_claim,\
                 patch("middlelayer.backend.Event") as mock_event,\
-                patch("middlelayer.backend.Thread") as mock_thread:
+                patch.object(self.testee.informer, "add_handler") as mock_add_handler:
 
             persistent_volume_claim_id = "pvc_id"
             mock_uuid4.side_effect = [INPUT_CONFIG_ID, self.job_id, persistent_volume_claim_id]
 
-            mock_thread_instance = mock_thread.return_value
             mock_event_instance = mock_event.return_value
 
             mock_workflow_finished_handle = MagicMock()
 
-            mock_k8s_create_pod_manifest.return_value = job_manifest
+            mock_k8s_render_pod_manifest.return_value = job_manifest
 
             self.testee.dummy_db.append_config_map(
                 self.workflow_id, K8S_CONFIGMAP_ID)
@@ -368,22 +563,23 @@ class TestK8sWorkflowBackend(unittest.TestCase):
 
             mock_k8s_create_config_map.assert_called_once()
 
-            mock_k8s_create_pod_manifest.assert_called_once_with(
+            mock_k8s_render_pod_manifest.assert_called_once_with(
+                template=k8s_create_pod_manifest_template(WORKFLOW_RESOURCE),
                 job_uuid=self.job_id,
-                job_config=WORKFLOW_RESOURCE,
                 config_map_ref=[K8S_CONFIGMAP_ID],
                 input_config_ref=INPUT_CONFIG_ID,
                 input_resources=[DATA_INPUT_SERVICE_RESOURCE],
                 job_namespace=self.k8s_namespace,
                 persistent_volume_claim_id=persistent_volume_claim_id,
-                labels=self.k8s_metadata_labels)
+                labels=self.k8s_metadata_labels,
+                store_secret_ref=None)
 
             mock_k8s_create_pod.assert_called_once_with(
                 manifest=job_manifest,
                 namespace=self.k8s_namespace)
 
-            mock_thread.assert_called_once()
-            mock_thread_instance.start.assert_called_once()
+            mock_add_handler.assert_called_once()
+            self.assertEqual(mock_add_handler.call_args.args[0], self.job_id)
 
             mock_event.assert_called_once()
             assert self.testee.dummy_db.get_job_monitor_event(
@@ -404,6 +600,115 @@ class TestK8sWorkflowBackend(unittest.TestCase):
         self.assertTrue(
             self.testee.dummy_db.data[WORKFLOW_ID].job_monitor_event.is_set())
 
+    def test_get_monitor_metrics(self):
+        self.testee.informer.handlers[self.job_id] = lambda pod_state: False
+        self.testee.pending_cleanups[self.workflow_id] = time.perf_counter()
+        started, release = Event(), Event()
+        self.testee.monitor_executor.submit(lambda: started.set() or release.wait(5))
+        started.wait(5)
+
+        metrics = self.testee.get_monitor_metrics()
+        release.set()
+
+        self.assertEqual(metrics.monitored_workflows, 1)
+        self.assertEqual(metrics.pending_cleanups, 1)
+        self.assertEqual(metrics.monitor_threads, 1)
+        self.assertEqual(metrics.monitor_queue_depth, 0)
+
+    @patch('middlelayer.backend.k8s_create_config_map')
+    def test_job_data_restored_from_registry(self, mock_k8s_create_config_map: MagicMock):
+
+        # setup
+        registry = SqliteWorkflowRegistry(":memory:")
+        registry.put(WorkflowRecord(workflow_id=WORKFLOW_ID, service_id="service", user_id="user"))
+        with patch("middlelayer.k8sClient.config"):
+            testee = K8sWorkflowBackend(self.k8s_namespace, workflow_registry=registry)
+
+        testee.handle_input(workflow_id=WORKFLOW_ID,
+                            input_resource=WorkflowInputResource(resource_name="data",
+                                                                 type=ServiceResourceType.data,
+                                                                 storage_source="bucket/data",
+                                                                 mount_path="/data/test",
+                                                                 description="data"),
+                            get_data_handle=None)
+        testee.dummy_db.insert_job_id(WORKFLOW_ID, self.job_id)
+        testee.dummy_db.insert_job_monitor_event(WORKFLOW_ID, Event())
+
+        # exercise
+        with patch("middlelayer.k8sClient.config"):
+            restarted = K8sWorkflowBackend(self.k8s_namespace, workflow_registry=registry)
+        job_data = restarted.dummy_db.get_job_data(WORKFLOW_ID)
+
+        # verify
+        self.assertEqual(job_data.job_id, self.job_id)
+        self.assertIsNone(job_data.job_monitor_event)
+        self.assertEqual(job_data.input_config.id,
+                         testee.dummy_db.get_input_config(WORKFLOW_ID).id)
+        # the phase is set by the api, not by the job data
+        self.assertEqual(registry.get(WORKFLOW_ID).phase, WorkflowJobPhase.QUEUED)
+        registry.close()
+
+    @patch('middlelayer.backend.k8s_pod_exists')
+    def test_recover_workflow(self, mock_k8s_pod_exists: MagicMock):
+
+        # setup
+        self.testee.dummy_db.data[WORKFLOW_ID] = K8sJobData(job_id=self.job_id)
+        mock_k8s_pod_exists.return_value = True
+
+        # exercise
+        with patch.object(self.testee.informer, "add_handler") as mock_add_handler:
+            recovered = self.testee.recover_workflow(WORKFLOW_ID, MagicMock())
+
+        # verify
+        self.assertTrue(recovered)
+        mock_k8s_pod_exists.assert_called_once_with(name=self.job_id,
+                                                    namespace=self.k8s_namespace)
+        mock_add_handler.assert_called_once()
+        self.assertEqual(mock_add_handler.call_args.args[0], self.job_id)
+        self.assertIsNotNone(self.testee.dummy_db.get_job_monitor_event(WORKFLOW_ID))
+
+    @patch('middlelayer.backend.k8s_pod_exists')
+    def test_recover_workflow_without_pod(self, mock_k8s_pod_exists: MagicMock):
+
+        # setup
+        self.testee.dummy_db.data[WORKFLOW_ID] = K8sJobData(job_id=self.job_id)
+        mock_k8s_pod_exists.return_value = False
+
+        # exercise / verify
+        self.assertFalse(self.testee.recover_workflow(WORKFLOW_ID, MagicMock()))
+        self.assertFalse(self.testee.recover_workflow("unknown", MagicMock()))
+
+    def test_monitor_pod_state_handle(self):
+
+        # setup
+        workflow_finished_handle = MagicMock()
+        workflow_state_handle = MagicMock()
+        self.testee.workflow_state_handle = workflow_state_handle
+        self.testee.dummy_db.data[WORKFLOW_ID] = K8sJobData(job_id=self.job_id)
+
+        with patch.object(self.testee.informer, "add_handler") as mock_add_handler:
+            with patch('middlelayer.backend.k8s_pod_exists', return_value=True):
+                self.testee.recover_workflow(WORKFLOW_ID, workflow_finished_handle)
+        pod_state_handle = mock_add_handler.call_args.args[1]
+
+        def pod_state(worker_state):
+            return K8sPodStateData(event_type="MODIFIED",
+                                   pod_phase="Running",
+                                   pod_state_condition=[],
+                                   container_statuses={"worker": K8sContainerStateDate(state=worker_state,
+                                                                                       details="")})
+
+        # exercise / verify
+        self.assertFalse(pod_state_handle(pod_state("running")))
+        self.assertEqual(self.testee.dummy_db.get_workflow_state(WORKFLOW_ID).phase, WorkflowJobPhase.RUNNING)
+
+        self.assertTrue(pod_state_handle(pod_state("terminated")))
+        self.assertEqual(self.testee.dummy_db.get_workflow_state(WORKFLOW_ID).phase, WorkflowJobPhase.STORING)
+        self.assertEqual(workflow_state_handle.call_count, 2)
+
+        self.testee.monitor_executor.shutdown(wait=True)
+        workflow_finished_handle.assert_called_once()
+
     def test_store_result(self):
 
         # setup
@@ -428,16 +733,19 @@ class TestK8sWorkflowBackend(unittest.TestCase):
         workflow_id = self.workflow_id
         self.testee.dummy_db.data[self.workflow_id] = self.job_data
 
-        with patch("middlelayer.backend.k8s_portforward", return_value=200) as mock_k8s_portforward:
+        with patch.object(self.testee.port_forward_pool, "request", return_value=(200, b"")) as mock_request:
 
             self.testee.store_result(
                 workflow_id=workflow_id,
                 workflow_store_info=workflow_store_info)
 
-        mock_k8s_portforward.assert_called_once_with(
-            data=workflow_store_info.json(),
-            name=self.job_data.job_id,
-            namespace=self.k8s_namespace)
+        mock_request.assert_called_once_with(
+            method="POST",
+            pod_name=self.job_data.job_id,
+            namespace=self.k8s_namespace,
+            port=9999,
+            path="/store",
+            body=workflow_store_info.json().encode())
 
     def test_getJobStateName(self):
         state = WorkflowJobState()
@@ -0,0 +1,83 @@
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+from middlelayer.models import WorkflowJobPhase
+from middlelayer.registry import SqliteWorkflowRegistry, WorkflowRecord
+from middlelayer.cleanup import DeferredCleanupScheduler
+
+
+class TestDeferredCleanupScheduler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.registry = SqliteWorkflowRegistry(":memory:")
+        self.addCleanup(self.registry.close)
+        for workflow_id in ["wf1", "wf2", "wf3"]:
+            self.registry.put(WorkflowRecord(workflow_id=workflow_id,
+                                             service_id="service",
+                                             user_id="user",
+                                             phase=WorkflowJobPhase.FINISHED))
+
+        self.cleanup_handle = MagicMock()
+        self.testee = DeferredCleanupScheduler(workflow_registry=self.registry,
+                                               cleanup_handle=self.cleanup_handle,
+                                               batch_window=0.5,
+                                               retry_delay=0.05)
+        self.addCleanup(self.testee.stop)
+
+    def wait_cleaned(self, *workflow_ids: str):
+        for _ in range(200):
+            if all(self.registry.get(x).cleanup_at is None and not self.testee.is_scheduled(x)
+                   for x in workflow_ids) and self.cleanup_handle.called:
+                return [x for call in self.cleanup_handle.call_args_list for x in call.args[0]]
+            time.sleep(0.01)
+        self.fail("cleanup not called")
+
+    def test_due_workflows_cleaned_in_one_batch(self):
+        self.testee.schedule("wf1", 0.1)
+        self.testee.schedule("wf2", 0.2)
+        self.testee.schedule("wf3", 60)
+
+        self.testee.start()
+
+        self.assertEqual(sorted(self.wait_cleaned("wf1", "wf2")), ["wf1", "wf2"])
+        self.cleanup_handle.assert_called_once()
+        self.assertIsNotNone(self.registry.get("wf3").cleanup_at)
+        self.assertTrue(self.testee.is_scheduled("wf3"))
+
+    def test_cancel(self):
+        self.testee.start()
+        self.testee.schedule("wf1", 0.1)
+
+        self.assertTrue(self.testee.cancel("wf1"))
+        self.assertFalse(self.testee.cancel("wf1"))
+        time.sleep(0.2)
+
+        self.cleanup_handle.assert_not_called()
+        self.assertIsNone(self.registry.get("wf1").cleanup_at)
+
+    def test_restored_after_restart(self):
+        self.registry.update("wf1", cleanup_at=datetime.now() - timedelta(minutes=1))
+        self.registry.update("wf2", cleanup_at=datetime.now() + timedelta(hours=1))
+
+        self.testee.start()
+
+        self.assertEqual(self.wait_cleaned("wf1"), ["wf1"])
+        self.assertTrue(self.testee.is_scheduled("wf2"))
+
+    def test_failed_batch_retried(self):
+        self.cleanup_handle.side_effect = [ConnectionError(), None]
+        self.testee.start()
+
+        self.testee.schedule("wf1", 0)
+
+        for _ in range(200):
+            if self.cleanup_handle.call_count == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.wait_cleaned("wf1"), ["wf1", "wf1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+import dotenv
+from io import StringIO
+
+from middlelayer.env_parser import EnvStreamParser, EnvironmentInputError, parse_env_stream
+
+ENV_FILE = """# comment
+export HOST=localhost
+PORT = 8080  # inline comment
+EMPTY=
+URL=http://${HOST}:${PORT}/path#anchor
+SINGLE='${HOST} too'
+DOUBLE="line\\nbreak ${MISSING:-default}"
+MULTI="first
+second"
+UMLAUT=grüße
+"""
+
+
+def chunked(data: bytes, size: int):
+    return [data[i:i+size] for i in range(0, len(data), size)]
+
+
+class TestEnvStreamParser(unittest.TestCase):
+
+    def test_same_as_dotenv(self):
+        expected = dict(dotenv.dotenv_values(stream=StringIO(ENV_FILE)))
+
+        # every chunk size, also splitting multi-byte characters and lines
+        for size in [1, 2, 7, 64, len(ENV_FILE.encode())]:
+            with self.subTest(size=size):
+                self.assertEqual(parse_env_stream(chunked(ENV_FILE.encode(), size)), expected)
+
+    def test_environment_not_expanded(self):
+        self.assertEqual(parse_env_stream([b"A=${PATH}"]), {"A": ""})
+
+    def test_too_large(self):
+        with self.assertRaisesRegex(EnvironmentInputError, "exceeds 16 bytes"):
+            parse_env_stream(chunked(b"KEY=" + b"x" * 64, 8), max_bytes=16)
+
+    def test_config_map_data_too_large(self):
+        parser = EnvStreamParser(max_bytes=40)
+        parser.feed(b"A=123456789012\n")
+        # references grow the data beyond the read bytes
+        with self.assertRaisesRegex(EnvironmentInputError, "line 2: config map data exceeds 40 bytes"):
+            parser.feed(b"B=${A}${A}${A}\n")
+
+    def test_malformed(self):
+        cases = {b"A=1\nNOVALUE\n": "line 2: expected KEY=VALUE",
+                 b"KEY WITH SPACE=1": "invalid key",
+                 b"A=\"not closed\nB=2": "quoted value is not closed",
+                 b"A='value' trailing": "unexpected characters",
+                 b"A=\xff": "not utf-8"}
+        for data, message in cases.items():
+            with self.subTest(data=data):
+                with self.assertRaisesRegex(EnvironmentInputError, message):
+                    parse_env_stream([data], name="env")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import asyncio
+import json
+from threading import Thread
+from unittest import IsolatedAsyncioTestCase
+
+from middlelayer.backend import WorkflowJobState, WorkflowJobPhase
+from middlelayer.k8sClient import K8sPodStateData, K8sContainerStateDate
+from middlelayer.events import WorkflowEventHub
+
+
+def pod_state(worker_state: str, condition: str = "") -> K8sPodStateData:
+    return K8sPodStateData(event_type="MODIFIED",
+                           pod_phase="Running",
+                           pod_state_condition=[condition],
+                           container_statuses={"worker": K8sContainerStateDate(state=worker_state, details="")})
+
+
+class TestWorkflowEventHub(IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.testee = WorkflowEventHub()
+
+    async def test_publish_transitions_only(self):
+        first = self.testee.publish("wf", WorkflowJobState(phase=WorkflowJobPhase.RUNNING,
+                                                           worker_state=pod_state("running", "a")))
+        # condition changes are no transition
+        self.assertIsNone(self.testee.publish("wf", WorkflowJobState(phase=WorkflowJobPhase.RUNNING,
+                                                                     worker_state=pod_state("running", "b"))))
+        second = self.testee.publish("wf", WorkflowJobState(phase=WorkflowJobPhase.RUNNING,
+                                                            worker_state=pod_state("terminated")))
+
+        self.assertEqual(first.version, 1)
+        self.assertEqual(second.version, 2)
+        self.assertEqual(self.testee.get("wf"), second)
+        self.assertEqual(json.loads(second.data)["workflow_status"]["phase"], "RUNNING")
+        self.assertEqual(self.testee.get_version(second.etag), 2)
+        self.assertEqual(self.testee.get_version("\"other-2\""), 0)
+        self.assertEqual(self.testee.get_version(None), 0)
+
+    async def test_wait(self):
+        self.testee.publish("wf", WorkflowJobState(phase=WorkflowJobPhase.QUEUED))
+
+        # a newer version is returned at once
+        self.assertEqual((await self.testee.wait("wf", after_version=0, timeout=1)).version, 1)
+        self.assertIsNone(await self.testee.wait("wf", after_version=1, timeout=0.01))
+
+        # published by a monitor thread
+        publisher = Thread(target=lambda: self.testee.publish(
+            "wf", WorkflowJobState(phase=WorkflowJobPhase.PREPARING)))
+        waiter = asyncio.ensure_future(self.testee.wait("wf", after_version=1, timeout=5))
+        await asyncio.sleep(0.01)
+        publisher.start()
+        event = await waiter
+        publisher.join()
+
+        self.assertEqual(event.version, 2)
+        self.assertEqual(event.phase, WorkflowJobPhase.PREPARING)
+        self.assertEqual(self.testee.waiters, {})
+
+    async def test_eviction(self):
+        testee = WorkflowEventHub(max_workflows=2)
+        for workflow_id in ["wf1", "wf2", "wf3"]:
+            testee.publish(workflow_id, WorkflowJobState(phase=WorkflowJobPhase.QUEUED))
+
+        self.assertIsNone(testee.get("wf1"))
+        self.assertIsNotNone(testee.get("wf3"))
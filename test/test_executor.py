@@ -0,0 +1,64 @@
+import asyncio
+import time
+from threading import Event
+from unittest import IsolatedAsyncioTestCase
+
+from middlelayer.executor import BlockingIOExecutor
+
+
+class TestBlockingIOExecutor(IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.testee = BlockingIOExecutor(max_workers=2, name="test-io")
+
+    def tearDown(self) -> None:
+        self.testee.shutdown()
+
+    async def test_run_returns_result(self):
+
+        result = await self.testee.run(lambda x, y=0: x + y, 1, y=2)
+
+        self.assertEqual(result, 3)
+        stats = self.testee.get_stats()
+        self.assertEqual(stats["submitted"], 1)
+        self.assertEqual(stats["completed"], 1)
+        self.assertEqual(stats["failed"], 0)
+
+    async def test_run_raises_exception(self):
+
+        def fail():
+            raise KeyError("fail")
+
+        with self.assertRaises(KeyError):
+            await self.testee.run(fail)
+
+        self.assertEqual(self.testee.get_stats()["failed"], 1)
+
+    async def test_blocking_call_does_not_block_loop(self):
+        """
+        a blocking call in the pool must not stall other coroutines on the loop
+        """
+        release = Event()
+        blocking_call = asyncio.ensure_future(self.testee.run(release.wait, 5))
+
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertFalse(blocking_call.done())
+
+        release.set()
+        self.assertTrue(await blocking_call)
+
+    async def test_pool_is_bounded(self):
+
+        release = Event()
+        calls = [asyncio.ensure_future(self.testee.run(release.wait, 5)) for _ in range(4)]
+        await asyncio.sleep(0.05)
+
+        stats = self.testee.get_stats()
+        self.assertEqual(stats["running"], 2)
+        self.assertEqual(stats["queued"], 2)
+
+        release.set()
+        await asyncio.gather(*calls)
+        self.assertEqual(self.testee.get_stats()["completed"], 4)
@@ -0,0 +1,70 @@
+import unittest
+from datetime import datetime, timezone
+
+from middlelayer.http_range import (ByteRange, RangeNotSatisfiable, parse_range_header, if_range_matches,
+                                    if_none_match, format_etag, multipart_byteranges)
+
+
+class TestHttpRange(unittest.TestCase):
+
+    def test_parse_single_range(self):
+        self.assertEqual(parse_range_header("bytes=0-99", 1000), [ByteRange(0, 99)])
+        self.assertEqual(parse_range_header("bytes=900-", 1000), [ByteRange(900, 999)])
+        self.assertEqual(parse_range_header("bytes=-100", 1000), [ByteRange(900, 999)])
+        self.assertEqual(parse_range_header("bytes=990-2000", 1000), [ByteRange(990, 999)])
+        self.assertEqual(parse_range_header("bytes=-2000", 1000), [ByteRange(0, 999)])
+
+    def test_parse_multiple_ranges(self):
+        self.assertEqual(parse_range_header("bytes=0-9, 20-29", 1000),
+                         [ByteRange(0, 9), ByteRange(20, 29)])
+        # overlapping and adjacent ranges are merged
+        self.assertEqual(parse_range_header("bytes=20-29,0-10,5-19", 1000),
+                         [ByteRange(0, 29)])
+
+    def test_parse_ignored_header(self):
+        self.assertIsNone(parse_range_header("items=0-9", 1000))
+        self.assertIsNone(parse_range_header("bytes=a-9", 1000))
+        self.assertIsNone(parse_range_header("bytes=9-1", 1000))
+        self.assertIsNone(parse_range_header("bytes=", 1000))
+        self.assertIsNone(parse_range_header("bytes=" + ",".join(["0-1"] * 17), 1000))
+
+    def test_parse_not_satisfiable(self):
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range_header("bytes=1000-", 1000)
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range_header("bytes=-10", 0)
+
+    def test_if_range(self):
+        last_modified = datetime(2023, 7, 26, 7, 38, 18, tzinfo=timezone.utc)
+
+        self.assertTrue(if_range_matches("\"abc\"", "abc", last_modified))
+        self.assertFalse(if_range_matches("\"abd\"", "abc", last_modified))
+        self.assertFalse(if_range_matches("W/\"abc\"", "abc", last_modified))
+        self.assertTrue(if_range_matches("Wed, 26 Jul 2023 07:38:18 GMT", "abc", last_modified))
+        self.assertFalse(if_range_matches("Wed, 26 Jul 2023 07:38:19 GMT", "abc", last_modified))
+        self.assertEqual(format_etag("\"abc\""), "\"abc\"")
+
+    def test_if_none_match(self):
+        self.assertTrue(if_none_match("\"abc\"", "abc"))
+        self.assertTrue(if_none_match("\"xyz\", W/\"abc\"", "\"abc\""))
+        self.assertTrue(if_none_match("*", "abc"))
+        self.assertFalse(if_none_match("\"abd\"", "abc"))
+        self.assertFalse(if_none_match(None, "abc"))
+
+    def test_multipart_byteranges(self):
+        data = b"0123456789abcdefghij"
+        ranges = [ByteRange(0, 1), ByteRange(10, 12)]
+
+        content_length, body = multipart_byteranges(
+            ranges=ranges,
+            size=len(data),
+            content_type="text/plain",
+            boundary="BOUNDARY",
+            read_range=lambda byte_range: iter([data[byte_range.start:byte_range.end + 1]]))
+
+        content = b"".join(body)
+        self.assertEqual(len(content), content_length)
+        self.assertEqual(content,
+                         b"--BOUNDARY\r\nContent-Type: text/plain\r\nContent-Range: bytes 0-1/20\r\n\r\n01"
+                         b"\r\n--BOUNDARY\r\nContent-Type: text/plain\r\nContent-Range: bytes 10-12/20\r\n\r\nabc"
+                         b"\r\n--BOUNDARY--\r\n")
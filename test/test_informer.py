@@ -0,0 +1,125 @@
+import time
+import unittest
+from threading import Event
+from unittest.mock import MagicMock
+
+from kubernetes.client.exceptions import ApiException
+
+from middlelayer.informer import PodInformer
+
+
+def pod(name: str, resource_version: str, worker_state: str = "running"):
+    pod_mock = MagicMock()
+    pod_mock.metadata.name = name
+    pod_mock.metadata.resource_version = resource_version
+    pod_mock.status.phase = "Running"
+    pod_mock.status.conditions = []
+    container_status = MagicMock()
+    container_status.name = "worker"
+    container_status.state.running = MagicMock() if worker_state == "running" else None
+    container_status.state.terminated = MagicMock() if worker_state == "terminated" else None
+    for state in [container_status.state.running, container_status.state.terminated]:
+        if state is not None:
+            state.to_str.return_value = "{}"
+            state.started_at = state.finished_at = state.reason = None
+    pod_mock.status.container_statuses = [container_status]
+    pod_mock.status.init_container_statuses = None
+    return pod_mock
+
+
+def pod_list(resource_version: str, *pods):
+    list_mock = MagicMock()
+    list_mock.items = list(pods)
+    list_mock.metadata.resource_version = resource_version
+    return list_mock
+
+
+class TestPodInformer(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.watch_calls = []
+        self.watch_events = []
+        self.watch_done = Event()
+        self.list_handle = MagicMock(return_value=pod_list("1", pod("pod-a", "1")))
+
+        def watch_handle(**kwargs):
+            self.watch_calls.append(kwargs)
+            events, self.watch_events = self.watch_events, []
+            yield from events
+            self.watch_done.set()
+            time.sleep(0.01)
+
+        self.testee = PodInformer(namespace="ns",
+                                  label_selector="app=gx4ki-demo",
+                                  retry_delay=0.01,
+                                  list_handle=self.list_handle,
+                                  watch_handle=watch_handle)
+
+    def tearDown(self) -> None:
+        self.testee.stop()
+
+    def wait_watch(self):
+        self.watch_done.clear()
+        self.assertTrue(self.watch_done.wait(2))
+
+    def test_cached_state_dispatched_on_add_handler(self):
+        self.testee.start()
+        self.wait_watch()
+
+        handle = MagicMock(return_value=False)
+        self.testee.add_handler("pod-a", handle)
+
+        handle.assert_called_once()
+        self.assertEqual(handle.call_args.args[0].container_statuses["worker"].state, "running")
+        self.list_handle.assert_called_once_with(namespace="ns", label_selector="app=gx4ki-demo")
+        self.assertEqual(self.watch_calls[0]["resource_version"], "1")
+
+    def test_dispatch_until_done(self):
+        handle = MagicMock(side_effect=lambda pod_state: pod_state.container_statuses["worker"].state == "terminated")
+        other = MagicMock(return_value=False)
+        self.watch_events = [{"type": "MODIFIED", "object": pod("pod-b", "2")},
+                             {"type": "MODIFIED", "object": pod("pod-a", "3", "terminated")},
+                             {"type": "MODIFIED", "object": pod("pod-a", "4", "terminated")}]
+
+        self.testee.handlers["pod-a"] = handle
+        self.testee.handlers["pod-b"] = other
+        self.testee.start()
+        self.wait_watch()
+
+        # cached state from the list, the terminated event, no event after the handler is done
+        self.assertEqual(handle.call_count, 2)
+        other.assert_called_once()
+        self.assertEqual(self.testee.get_handler_count(), 1)
+        self.assertEqual(self.testee.resource_version, "4")
+
+    def test_relist_after_expired_resource_version(self):
+
+        def watch_handle(**kwargs):
+            self.watch_calls.append(kwargs)
+            if len(self.watch_calls) == 1:
+                raise ApiException(status=410)
+            self.watch_done.set()
+            time.sleep(0.01)
+            yield from []
+
+        self.testee.watch_handle = watch_handle
+        handle = MagicMock(return_value=False)
+        self.testee.handlers["pod-a"] = handle
+        self.testee.start()
+        self.wait_watch()
+        # listed again after the expired watch
+        self.assertEqual(self.list_handle.call_count, 2)
+        self.assertEqual(self.testee.get_pod_state("pod-a").event_type, "MODIFIED")
+
+        # pod-a was deleted while the watch was disconnected
+        self.list_handle.return_value = pod_list("5")
+        self.testee.resource_version = None
+        for _ in range(200):
+            if self.testee.get_handler_count() == 0:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(self.list_handle.call_count, 3)
+        self.assertIsNone(self.testee.get_pod_state("pod-a"))
+        self.assertEqual(handle.call_args.args[0].event_type, "DELETED")
+        self.assertEqual(self.testee.get_handler_count(), 0)
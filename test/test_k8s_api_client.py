@@ -0,0 +1,47 @@
+import unittest
+from unittest.mock import patch
+
+from kubernetes import client
+
+import middlelayer.k8sClient as k8s_client_mod
+from middlelayer.models import K8sBackendConfig
+
+
+class TestK8sApiClient(unittest.TestCase):
+
+    def setUp(self) -> None:
+        k8s_client_mod.k8s_close_api_client()
+        self.addCleanup(k8s_client_mod.k8s_close_api_client)
+
+    def test_shared_client(self):
+        with patch.object(k8s_client_mod, "K8S_BACKEND_CONFIG",
+                          K8sBackendConfig(api_connection_pool_size=7, api_keep_alive=True)):
+            api = k8s_client_mod.k8s_core_api()
+
+        self.assertIs(api, k8s_client_mod.k8s_core_api())
+        self.assertIs(api.api_client, k8s_client_mod.k8s_api_client())
+        self.assertEqual(api.api_client.configuration.connection_pool_maxsize, 7)
+        self.assertTrue(api.api_client.configuration.keep_alive)
+
+    def test_close_creates_new_client(self):
+        api = k8s_client_mod.k8s_core_api()
+        k8s_client_mod.k8s_close_api_client()
+        self.assertIsNot(api, k8s_client_mod.k8s_core_api())
+
+    def test_stream_api_has_own_client(self):
+        stream_api = k8s_client_mod.k8s_stream_core_api()
+        self.assertIsInstance(stream_api, client.CoreV1Api)
+        self.assertIsNot(stream_api.api_client, k8s_client_mod.k8s_api_client())
+        self.assertIs(stream_api.api_client.configuration, k8s_client_mod.k8s_api_client().configuration)
+
+    def test_portforward_closes_stream_client(self):
+        with patch.object(k8s_client_mod, "k8s_stream_core_api") as mock_stream_api,\
+                patch.object(k8s_client_mod, "portforward") as mock_portforward:
+            port_forward = k8s_client_mod.k8s_open_portforward("pod", "namespace")
+
+        self.assertIs(port_forward, mock_portforward.return_value)
+        mock_stream_api.return_value.api_client.close.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,15 @@
 from time import sleep
+from copy import deepcopy
 from threading import Thread
 from unittest import TestCase
 from middlelayer.k8sClient import K8sPodStateData
 from middlelayer.k8sClient import k8s_setup_config, k8s_get_healthz,\
     k8s_create_config_map, k8s_delete_config_map, k8s_list_config_maps_names, \
-    k8s_create_pod_manifest, k8s_create_pod, k8s_delete_pod, k8s_list_pod_names,\
+    k8s_create_pod_manifest_template, k8s_render_pod_manifest, k8s_create_pod, k8s_delete_pod, k8s_list_pod_names,\
     k8s_create_service, k8s_delte_service,\
-    k8s_watch_pod_events, k8s_get_pod_log,\
-    k8s_portforward,\
+    k8s_watch_pods, k8s_get_pod_state, k8s_get_pod_log,\
     k8s_create_persistent_volume_claim, k8s_delete_persistent_volume_claim
+from middlelayer.portforward import PodPortForwardPool
 
 
 from middlelayer.backend import WorkflowResource
@@ -95,19 +96,20 @@ class TestK8sClient(TestCase):
             "for i in $(seq 1 5); do sleep 1; echo $i; done"
         ]
 
-        pod_manifest = k8s_create_pod_manifest(
-            job_uuid=job_id,
-            job_config=self.workflow_resource)
+        # the rendered manifest shares parts with the template, it is copied before the changes
+        pod_manifest = deepcopy(k8s_render_pod_manifest(
+            k8s_create_pod_manifest_template(job_config=self.workflow_resource),
+            job_uuid=job_id))
 
-        pod_manifest.spec.containers[0].args = worker_image_args
+        pod_manifest["spec"]["containers"][0]["args"] = worker_image_args
 
-        self.assertEqual(job_id, pod_manifest.metadata.name)
+        self.assertEqual(job_id, pod_manifest["metadata"]["name"])
         self.assertEqual(worker_image_args,
-                         pod_manifest.spec.containers[0].args)
+                         pod_manifest["spec"]["containers"][0]["args"])
 
         # change image of data-side-car
-        pod_manifest.spec.containers[1].image = "ubuntu:20.04"
-        pod_manifest.spec.containers[1].args = worker_image_args
+        pod_manifest["spec"]["containers"][1]["image"] = "ubuntu:20.04"
+        pod_manifest["spec"]["containers"][1]["args"] = worker_image_args
         k8s_create_pod(pod_manifest)
 
         sleep(15)
@@ -138,27 +140,30 @@ class TestK8sClient(TestCase):
         # NOTE TEST WILL FAIL
         # TODO make test standalone
 
-        k8s_portforward(
-            data="test",
-            name="TODO",
-            namespace="gx4ki-demo")
+        PodPortForwardPool().request(
+            method="POST",
+            pod_name="TODO",
+            namespace="gx4ki-demo",
+            port=9999,
+            path="/store",
+            body=b"test")
 
     def test_watch_pod_events(self):
 
         k8s_create_pod(POD_MANIFEST)
 
-        def pod_state_handle(pod_state: K8sPodStateData):
-            # print(pod_state)
+        def watch_pod_events():
+            for event in k8s_watch_pods(namespace=POD_NAMESPACE,
+                                        label_selector=f"app={POD_NAME}"):
+                pod_state: K8sPodStateData = k8s_get_pod_state(event["type"], event["object"])
+                # print(pod_state)
 
-            if pod_state.container_statuses is None:
-                return False
-            if pod_state.container_statuses[POD_NAME].state == "terminated":
-                return True
+                if pod_state.container_statuses is None:
+                    continue
+                if pod_state.container_statuses[POD_NAME].state == "terminated":
+                    return
 
-            return False
-
-        event_thread = Thread(target=k8s_watch_pod_events,
-                              args=[POD_NAME, pod_state_handle, POD_NAMESPACE])
+        event_thread = Thread(target=watch_pod_events)
         event_thread.start()
 
         sleep(10)
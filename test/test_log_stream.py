@@ -0,0 +1,146 @@
+import asyncio
+from threading import Event
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import MagicMock
+
+from middlelayer.log_stream import PodLogStreamer, LogStreamLimitReached, normalize_timestamp
+
+
+LINES = [b"2023-07-26T07:38:18.1Z first\n",
+         b"2023-07-26T07:38:18.2Z second\n",
+         b"2023-07-26T07:38:19Z third\n"]
+
+
+class FakeLogResponse():
+
+    def __init__(self, lines, follow_event: Event = None):
+        self.lines = lines
+        self.follow_event = follow_event
+        self.closed = False
+
+    def stream(self, amt):
+        for line in self.lines:
+            # lines split across chunks
+            yield line[:5]
+            yield line[5:]
+        if self.follow_event is not None:
+            self.follow_event.wait(5)
+
+    def close(self):
+        self.closed = True
+        if self.follow_event is not None:
+            self.follow_event.set()
+
+
+class TestPodLogStreamer(IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.follow_event = Event()
+        self.open_handle = MagicMock()
+        self.open_handle.side_effect = lambda follow, **kwargs: \
+            FakeLogResponse(LINES, self.follow_event if follow else None)
+        self.testee = PodLogStreamer(buffer_lines=10, open_handle=self.open_handle)
+
+    def tearDown(self) -> None:
+        self.testee.close()
+
+    async def collect(self, iterator, count: int):
+        lines = []
+        async for line in iterator:
+            lines.append(line)
+            if len(lines) == count:
+                break
+        await iterator.aclose()
+        return lines
+
+    def test_normalize_timestamp(self):
+        self.assertEqual(normalize_timestamp("2023-07-26T07:38:18.1Z"), "2023-07-26T07:38:18.100000000Z")
+        self.assertEqual(normalize_timestamp("2023-07-26T07:38:18Z"), "2023-07-26T07:38:18.000000000Z")
+        self.assertLess(normalize_timestamp("2023-07-26T07:38:18.1234Z"),
+                        normalize_timestamp("2023-07-26T07:38:18.12345Z"))
+
+    async def test_read_once(self):
+        lines = [x async for x in self.testee.read("pod", "worker", "ns", follow=False, tail_lines=3)]
+
+        self.assertEqual(lines, LINES)
+        self.assertEqual(self.open_handle.call_args.kwargs["tail_lines"], 3)
+        # the open and one read per chunk of complete lines run in the read executor
+        self.assertEqual(self.testee.read_executor.get_stats()["completed"], 5)
+        self.assertEqual(self.testee.follow_executor.get_stats()["completed"], 0)
+
+    async def test_resume_after_token(self):
+        lines = [x async for x in self.testee.read("pod", "worker", "ns",
+                                                   after="2023-07-26T07:38:18.1Z", follow=False)]
+
+        self.assertEqual(lines, LINES[1:])
+        self.assertIsNotNone(self.open_handle.call_args.kwargs["since_seconds"])
+
+    async def test_shared_follow_stream(self):
+        first = self.testee.read("pod", "worker", "ns")
+        await self.collect_first(first)
+        second = self.testee.read("pod", "worker", "ns", tail_lines=1)
+
+        self.assertEqual(await self.collect(second, 1), LINES[2:])
+        self.assertEqual(await self.collect(first, 2), LINES[1:])
+
+        # one upstream request for both readers, closed with the last reader
+        self.open_handle.assert_called_once()
+        self.assertTrue(self.open_handle.call_args.kwargs["follow"])
+        self.assertEqual(self.testee.get_stream_count(), 0)
+
+    async def test_follow_limit(self):
+        testee = PodLogStreamer(buffer_lines=10, max_follows=1, open_handle=self.open_handle)
+        follower = testee.read("pod", "worker", "ns")
+        await follower.__anext__()
+
+        # the followed container is shared, a further container is rejected, reads without follow are served
+        joined = testee.read("pod", "worker", "ns")
+        with self.assertRaises(LogStreamLimitReached):
+            testee.read("other", "worker", "ns")
+        lines = [x async for x in testee.read("other", "worker", "ns", follow=False)]
+
+        self.assertEqual(lines, LINES)
+        await joined.aclose()
+        await follower.aclose()
+        self.assertIsNotNone(testee.read("other", "worker", "ns"))
+        testee.close()
+
+    async def test_close(self):
+        follower = self.testee.read("pod", "worker", "ns")
+        await self.collect_first(follower)
+
+        self.testee.close()
+
+        self.assertEqual([x async for x in follower], LINES[1:])
+        self.assertEqual(self.testee.get_stream_count(), 0)
+
+    async def test_follow_ends_with_container(self):
+        self.follow_event.set()
+
+        lines = [x async for x in self.testee.read("pod", "worker", "ns")]
+
+        self.assertEqual(lines, LINES)
+
+    async def test_follow_after_token_catches_up(self):
+        # a running stream which holds only the last line
+        running = self.testee.read("pod", "worker", "ns")
+        await self.collect_first(running)
+        stream = self.testee.streams[("ns", "pod", "worker")]
+        stream.lines.popleft()
+        stream.lines.popleft()
+        stream.offset = 2
+
+        resumed = self.testee.read("pod", "worker", "ns", after="2023-07-26T07:38:18.1Z")
+
+        self.assertEqual(await self.collect(resumed, 2), LINES[1:])
+        await running.aclose()
+        self.assertEqual(self.open_handle.call_count, 2)
+        self.assertFalse(self.open_handle.call_args.kwargs["follow"])
+
+    async def collect_first(self, iterator):
+        await iterator.__anext__()
+        # the reader thread fills the buffer
+        for _ in range(100):
+            if len(self.testee.streams[("ns", "pod", "worker")].lines) == 3:
+                return
+            await asyncio.sleep(0.01)
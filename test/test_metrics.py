@@ -0,0 +1,92 @@
+from unittest import TestCase
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import CollectorRegistry, Histogram, REGISTRY
+
+from middlelayer.decorators import timed
+from middlelayer.metrics import (StateCollector, RequestMetricsMiddleware, DOWNLOAD, count_transfer, gauge,
+                                 get_metrics)
+
+
+def get_sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TestTimed(TestCase):
+
+    def setUp(self) -> None:
+        self.registry = CollectorRegistry()
+        self.histogram = Histogram("test_call_seconds", "test", ["function"], registry=self.registry)
+
+    def test_observes_calls(self):
+
+        @timed(self.histogram)
+        def k8s_call(value):
+            return value
+
+        @timed(self.histogram, "failing")
+        def fail():
+            raise KeyError("fail")
+
+        self.assertEqual(k8s_call(1), 1)
+        self.assertEqual(k8s_call.__name__, "k8s_call")
+        with self.assertRaises(KeyError):
+            fail()
+
+        self.assertEqual(self.registry.get_sample_value("test_call_seconds_count", {"function": "k8s_call"}), 1)
+        self.assertEqual(self.registry.get_sample_value("test_call_seconds_count", {"function": "failing"}), 1)
+
+
+class TestMetrics(TestCase):
+
+    def test_count_transfer(self):
+        transferred = get_sample("workflow_api_transfer_bytes_total", direction=DOWNLOAD)
+        observed = get_sample("workflow_api_transfer_throughput_bytes_per_second_count", direction=DOWNLOAD)
+
+        self.assertEqual(b"".join(count_transfer(DOWNLOAD, [b"abc", b"de"])), b"abcde")
+
+        self.assertEqual(get_sample("workflow_api_transfer_bytes_total", direction=DOWNLOAD), transferred + 5)
+        self.assertEqual(get_sample("workflow_api_transfer_throughput_bytes_per_second_count", direction=DOWNLOAD),
+                         observed + 1)
+
+    def test_state_collector(self):
+        registry = CollectorRegistry()
+        collector = StateCollector()
+        registry.register(collector)
+        self.assertEqual(list(registry.collect()), [])
+
+        collector.collect_handle = lambda: [gauge("test_queue_depth", "test", 3),
+                                            gauge("test_workflows", "test", {"QUEUED": 1, "RUNNING": 2}, "phase")]
+
+        self.assertEqual(registry.get_sample_value("test_queue_depth"), 3)
+        self.assertEqual(registry.get_sample_value("test_workflows", {"phase": "RUNNING"}), 2)
+
+    def test_request_middleware(self):
+        app = FastAPI()
+
+        @app.get("/services/{service_id}/info")
+        async def get_info(service_id: str):
+            return {"service_id": service_id}
+
+        @app.get("/fail")
+        async def fail():
+            raise KeyError("fail")
+
+        app.add_middleware(RequestMetricsMiddleware)
+        labels = {"method": "GET", "route": "/services/{service_id}/info", "status": "200"}
+        requests = get_sample("workflow_api_http_request_seconds_count", **labels)
+
+        with TestClient(app, raise_server_exceptions=False) as client:
+            client.get("/services/a/info")
+            client.get("/services/b/info")
+            self.assertEqual(client.get("/unknown").status_code, 404)
+            self.assertEqual(client.get("/fail").status_code, 500)
+
+        # one series per route, not per path
+        self.assertEqual(get_sample("workflow_api_http_request_seconds_count", **labels), requests + 2)
+        self.assertGreater(get_sample("workflow_api_http_request_seconds_count",
+                                      method="GET", route="unmatched", status="404"), 0)
+        self.assertGreater(get_sample("workflow_api_http_request_seconds_count",
+                                      method="GET", route="/fail", status="500"), 0)
+        self.assertIn(b"workflow_api_http_request_seconds_bucket", get_metrics())
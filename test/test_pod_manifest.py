@@ -0,0 +1,107 @@
+import unittest
+from itertools import product
+
+from kubernetes import client
+
+import middlelayer.k8sClient as k8s_client_mod
+from middlelayer.k8sClient import k8s_create_pod_manifest_template, k8s_render_pod_manifest
+from middlelayer.models import (WorkflowResource, WorkflowInputResource, InputServiceResource, ServiceResourceType,
+                                K8sBackendConfig)
+
+INPUT_RESOURCES = [
+    WorkflowInputResource(resource_name="data", type=ServiceResourceType.data, storage_source="s3",
+                          mount_path="/data/in", description="data"),
+    WorkflowInputResource(resource_name="archive", type=ServiceResourceType.data_zip, storage_source="s3",
+                          mount_path="/data/archive", description="zip"),
+    WorkflowInputResource(resource_name="env", type=ServiceResourceType.environment, storage_source="s3",
+                          description="env")]
+
+SERVICE_INPUTS = [InputServiceResource(resource_name="data", type=ServiceResourceType.data,
+                                       mount_path="/data/in", description="data")]
+
+
+class TestPodManifestTemplate(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.backend_config = k8s_client_mod.K8S_BACKEND_CONFIG
+        k8s_client_mod.K8S_BACKEND_CONFIG = K8sBackendConfig()
+        self.api_client = client.ApiClient()
+
+    def tearDown(self) -> None:
+        k8s_client_mod.K8S_BACKEND_CONFIG = self.backend_config
+
+    def test_rendered_manifest(self):
+        for gpu, output_directory, command, config_map_ref, input_config_ref, volume_claim_id, store_secret_ref \
+                in product([True, False], ["/output", None], [None, ["python3", "run.py"]],
+                           [None, ["cm-1", "cm-2"]], [None, "input-config"], [None, "pvc"], [None, "store-secret"]):
+            job_config = WorkflowResource(worker_image="worker",
+                                          worker_image_output_directory=output_directory,
+                                          worker_image_command=command,
+                                          worker_image_args=command,
+                                          gpu=gpu)
+            template = k8s_create_pod_manifest_template(job_config, SERVICE_INPUTS)
+
+            manifest = k8s_render_pod_manifest(template,
+                                               job_uuid="job",
+                                               config_map_ref=config_map_ref,
+                                               input_config_ref=input_config_ref,
+                                               input_resources=INPUT_RESOURCES,
+                                               job_namespace="ns",
+                                               persistent_volume_claim_id=volume_claim_id,
+                                               labels={"app": "gx4ki-demo"},
+                                               store_secret_ref=store_secret_ref)
+
+            with self.subTest(gpu=gpu, output_directory=output_directory, command=command,
+                              config_map_ref=config_map_ref, input_config_ref=input_config_ref,
+                              volume_claim_id=volume_claim_id, store_secret_ref=store_secret_ref):
+                # the dict is a valid pod in the format the kubernetes client sends
+                self.assertEqual(self.api_client.sanitize_for_serialization(client.V1Pod.model_validate(manifest)),
+                                 manifest)
+                self.assertEqual(manifest["metadata"], {"name": "job", "namespace": "ns",
+                                                        "labels": {"app": "gx4ki-demo"}})
+
+                spec = manifest["spec"]
+                *side_cars, worker = spec["containers"]
+                self.assertEqual(worker["name"], "worker")
+                self.assertEqual(worker.get("command"), command)
+                self.assertEqual("resources" in worker, gpu)
+                self.assertEqual(worker.get("envFrom"),
+                                 [{"configMapRef": {"name": x}} for x in config_map_ref] if config_map_ref else None)
+                self.assertEqual([x["name"] for x in side_cars], ["data-side-car"] if output_directory else [])
+                for side_car in side_cars:
+                    self.assertEqual(side_car.get("envFrom"),
+                                     [{"secretRef": {"name": store_secret_ref}}] if store_secret_ref else None)
+
+                self.assertEqual([x["name"] for x in spec["initContainers"]],
+                                 ["data-input-init"] if input_config_ref else [])
+                mount_paths = [x["mountPath"] for x in worker["volumeMounts"]]
+                self.assertEqual(mount_paths,
+                                 (["/data/in/data", "/data/archive"] if input_config_ref else [])
+                                 + ([output_directory] if output_directory else []))
+
+                volumes = spec["volumes"]
+                self.assertEqual(volumes[0], {"name": "workflow-job-volume",
+                                              "persistentVolumeClaim": {"claimName": "pvc"}}
+                                 if volume_claim_id else template.empty_dir_volume)
+                self.assertEqual([x["name"] for x in volumes[1:]],
+                                 ["workflow-api-config", "input-init-config"] if input_config_ref else [])
+
+    def test_template_not_modified(self):
+        template = k8s_create_pod_manifest_template(
+            WorkflowResource(worker_image="worker", worker_image_output_directory="/output", gpu=False))
+        before = template.model_dump()
+
+        first = k8s_render_pod_manifest(template, job_uuid="a", config_map_ref=["cm"], input_config_ref="ic",
+                                        input_resources=INPUT_RESOURCES)
+        second = k8s_render_pod_manifest(template, job_uuid="b")
+
+        self.assertEqual(template.model_dump(), before)
+        self.assertEqual(first["metadata"]["name"], "a")
+        self.assertEqual(second["metadata"]["name"], "b")
+        self.assertNotIn("envFrom", second["spec"]["containers"][-1])
+        self.assertNotIn("envFrom", second["spec"]["containers"][0])
+        self.assertEqual(second["spec"]["initContainers"], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
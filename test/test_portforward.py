@@ -0,0 +1,125 @@
+import time
+import socket
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+from unittest.mock import MagicMock
+
+from middlelayer.portforward import PodPortForwardPool
+
+
+class StoreHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    close_connection_after_response = False
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        if self.close_connection_after_response:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeForward():
+    """
+    stands in for kubernetes.stream.ws_client.PortForward, the socket is a tcp connection to a local server
+    """
+
+    def __init__(self, address):
+        self.sock = socket.create_connection(address)
+        self.connected = True
+
+    def socket(self, port):
+        return self.sock
+
+    def close(self):
+        self.connected = False
+        self.sock.close()
+
+
+class TestPodPortForwardPool(unittest.TestCase):
+
+    def setUp(self) -> None:
+        StoreHandler.close_connection_after_response = False
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StoreHandler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.open_handle = MagicMock(side_effect=lambda **_: FakeForward(self.server.server_address))
+        self.testee = PodPortForwardPool(connect_timeout=1,
+                                         read_timeout=5,
+                                         retries=1,
+                                         retry_delay=0.01,
+                                         open_handle=self.open_handle)
+        self.addCleanup(self.testee.close)
+
+    def store(self, pod_name="pod-a", body=b"{}"):
+        return self.testee.request("POST", pod_name, "ns", 9999, "/store", body=body)
+
+    def test_channel_reused(self):
+        self.assertEqual(self.store(body=b"first"), (200, b"first"))
+        self.assertEqual(self.store(body=b"second"), (200, b"second"))
+        self.store(pod_name="pod-b")
+
+        self.assertEqual(self.open_handle.call_count, 2)
+        self.open_handle.assert_any_call(name="pod-a", namespace="ns", port=9999)
+        self.assertEqual(self.testee.get_idle_count(), 2)
+
+    def test_closed_by_server(self):
+        StoreHandler.close_connection_after_response = True
+
+        self.store()
+        self.store()
+
+        self.assertEqual(self.open_handle.call_count, 2)
+        self.assertEqual(self.testee.get_idle_count(), 0)
+
+    def test_stale_channel_replaced(self):
+        self.store()
+        # the server dropped the idle connection
+        self.testee.idle[("ns", "pod-a", 9999)][0].forward.sock.shutdown(socket.SHUT_RDWR)
+
+        self.assertEqual(self.store(body=b"again"), (200, b"again"))
+        self.assertEqual(self.open_handle.call_count, 2)
+
+    def test_idle_timeout(self):
+        self.testee.idle_timeout = 0
+        self.store()
+        self.store()
+
+        self.assertEqual(self.open_handle.call_count, 2)
+
+    def test_connect_timeout(self):
+        self.testee.connect_timeout = 0.05
+        self.testee.retries = 0
+        self.open_handle.side_effect = lambda **_: time.sleep(0.5)
+
+        with self.assertRaises(TimeoutError):
+            self.store()
+
+    def test_open_retried(self):
+        forward = FakeForward(self.server.server_address)
+        self.open_handle.side_effect = [ConnectionRefusedError(), forward]
+
+        self.assertEqual(self.store(), (200, b"{}"))
+        self.assertEqual(self.open_handle.call_count, 2)
+
+    def test_close_pod(self):
+        self.store(pod_name="pod-a")
+        self.store(pod_name="pod-b")
+        forward = self.testee.idle[("ns", "pod-a", 9999)][0].forward
+
+        self.testee.close_pod("pod-a", "ns")
+
+        self.assertFalse(forward.connected)
+        self.assertEqual(self.testee.get_idle_count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
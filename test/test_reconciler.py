@@ -0,0 +1,225 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+from kubernetes import client
+
+from middlelayer.models import WorkflowJobPhase
+from middlelayer.registry import SqliteWorkflowRegistry, WorkflowRecord
+from middlelayer.reconciler import ResourceReconciler
+
+OLD = datetime.now(timezone.utc) - timedelta(hours=2)
+
+
+def pod(name: str, workflow_id: str, created_at: datetime = OLD, gpu: bool = False):
+    limits = {"nvidia.com/gpu": "1"} if gpu else None
+    return client.V1Pod(
+        metadata=client.V1ObjectMeta(name=name,
+                                     labels={"app": "gx4ki-demo", "workflow-id": workflow_id},
+                                     creation_timestamp=created_at),
+        spec=client.V1PodSpec(containers=[
+            client.V1Container(name="worker",
+                               resources=client.V1ResourceRequirements(requests={"cpu": "500m"},
+                                                                       limits=limits))]))
+
+
+def volume_claim(name: str, workflow_id: str, created_at: datetime = OLD):
+    return client.V1PersistentVolumeClaim(
+        metadata=client.V1ObjectMeta(name=name,
+                                     labels={"app": "gx4ki-demo", "workflow-id": workflow_id},
+                                     creation_timestamp=created_at),
+        spec=client.V1PersistentVolumeClaimSpec(resources=client.V1VolumeResourceRequirements(
+            requests={"storage": "5Gi"})))
+
+
+def config_map(name: str, workflow_id: str = None, created_at: datetime = OLD):
+    labels = {"app": "gx4ki-demo"}
+    if workflow_id:
+        labels["workflow-id"] = workflow_id
+    return client.V1ConfigMap(metadata=client.V1ObjectMeta(name=name,
+                                                           labels=labels,
+                                                           creation_timestamp=created_at))
+
+
+def secret(name: str, workflow_id: str, created_at: datetime = OLD):
+    return client.V1Secret(metadata=client.V1ObjectMeta(name=name,
+                                                        labels={"app": "gx4ki-demo", "workflow-id": workflow_id},
+                                                        creation_timestamp=created_at))
+
+
+def page(items, continue_token=None):
+    return MagicMock(items=items, metadata=MagicMock(_continue=continue_token))
+
+
+class TestResourceReconciler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.registry = SqliteWorkflowRegistry(":memory:")
+        self.addCleanup(self.registry.close)
+        self.pages = {"pod": [], "config_map": [], "persistent_volume_claim": [], "secret": []}
+
+        def list_handle(kind, continue_token, **_):
+            pages = self.pages[kind]
+            index = int(continue_token) if continue_token else 0
+            if index >= len(pages):
+                return page([])
+            return page(pages[index], str(index + 1) if index + 1 < len(pages) else None)
+
+        self.list_handle = MagicMock(side_effect=list_handle)
+        self.delete_handle = MagicMock()
+        self.adopt_handle = MagicMock(return_value=True)
+        self.is_monitored_handle = MagicMock(return_value=False)
+
+        self.testee = ResourceReconciler(namespace="ns",
+                                         label_selector="app=gx4ki-demo",
+                                         workflow_registry=self.registry,
+                                         delete_handle=self.delete_handle,
+                                         adopt_handle=self.adopt_handle,
+                                         is_monitored_handle=self.is_monitored_handle,
+                                         orphan_grace_period=600,
+                                         finished_grace_period=600,
+                                         page_size=1,
+                                         list_handle=self.list_handle)
+
+    def put_record(self, workflow_id: str, phase: WorkflowJobPhase, updated_at: datetime = None):
+        self.registry.put(WorkflowRecord(workflow_id=workflow_id,
+                                         service_id="service",
+                                         user_id="user",
+                                         phase=phase))
+        self.registry.flush()
+        if updated_at:
+            self.registry.pending[workflow_id] = self.registry.get(workflow_id).model_copy(
+                update={"updated_at": updated_at})
+
+    def test_orphans_reclaimed_from_all_pages(self):
+
+        # setup
+        self.pages["pod"] = [[pod("pod-a", "unknown", gpu=True)], [pod("pod-b", "other")]]
+        self.pages["persistent_volume_claim"] = [[volume_claim("pvc-a", "unknown")]]
+        self.pages["config_map"] = [[config_map("cm-a", "unknown")], [config_map("cm-unlabelled")]]
+        self.pages["secret"] = [[secret("secret-a", "unknown")]]
+
+        # exercise
+        self.testee.reconcile()
+
+        # verify
+        self.assertEqual(sorted(x.args[0] for x in self.delete_handle.call_args_list), ["other", "unknown"])
+        self.assertEqual(self.list_handle.call_count, 6)
+        metrics = self.testee.get_metrics()
+        self.assertEqual(metrics.runs, 1)
+        self.assertEqual(metrics.orphaned_workflows, 2)
+        self.assertEqual(metrics.reclaimed_workflows, 2)
+        self.assertEqual(metrics.reclaimed_pods, 2)
+        self.assertEqual(metrics.reclaimed_config_maps, 1)
+        self.assertEqual(metrics.reclaimed_persistent_volume_claims, 1)
+        self.assertEqual(metrics.reclaimed_secrets, 1)
+        self.assertEqual(metrics.reclaimed_cpu, 1.0)
+        self.assertEqual(metrics.reclaimed_gpu, 1.0)
+        self.assertEqual(metrics.reclaimed_storage_bytes, 5 * 1024 ** 3)
+
+    def test_grace_period(self):
+
+        # setup
+        self.pages["pod"] = [[pod("pod-a", "unknown", created_at=datetime.now(timezone.utc))]]
+        self.put_record("finished", WorkflowJobPhase.FINISHED)
+        self.pages["config_map"] = [[config_map("cm-a", "finished")]]
+
+        # exercise
+        self.testee.reconcile()
+
+        # verify
+        self.delete_handle.assert_not_called()
+        self.assertEqual(self.testee.get_metrics().orphaned_workflows, 2)
+
+    def test_leaked_resources_of_finished_workflow(self):
+
+        # setup
+        self.put_record("finished", WorkflowJobPhase.FINISHED, updated_at=datetime.now() - timedelta(hours=1))
+        self.pages["persistent_volume_claim"] = [[volume_claim("pvc-a", "finished")]]
+
+        # exercise
+        self.testee.reconcile()
+
+        # verify
+        self.delete_handle.assert_called_once_with("finished")
+
+    def test_retained_workflow_untouched(self):
+
+        # setup
+        self.put_record("finished", WorkflowJobPhase.FINISHED, updated_at=datetime.now() - timedelta(hours=1))
+        self.registry.update("finished", cleanup_at=datetime.now() + timedelta(minutes=5))
+        self.pages["pod"] = [[pod("pod-a", "finished")]]
+
+        # exercise
+        self.testee.reconcile()
+
+        # verify
+        self.delete_handle.assert_not_called()
+        self.assertEqual(self.testee.get_metrics().orphaned_workflows, 0)
+
+    def test_overdue_retained_workflow_reclaimed(self):
+
+        # setup, naive and aware deadlines are compared in utc
+        self.put_record("finished", WorkflowJobPhase.FINISHED, updated_at=datetime.now() - timedelta(hours=1))
+        self.registry.pending["finished"] = self.registry.get("finished").model_copy(
+            update={"cleanup_at": datetime.now(timezone.utc) - timedelta(minutes=5)})
+        self.pages["pod"] = [[pod("pod-a", "finished")]]
+
+        # exercise
+        self.testee.reconcile()
+
+        # verify
+        self.delete_handle.assert_called_once_with("finished")
+
+    def test_monitored_workflow_untouched(self):
+
+        # setup
+        self.put_record("running", WorkflowJobPhase.RUNNING, updated_at=datetime.now() - timedelta(hours=1))
+        self.pages["pod"] = [[pod("pod-a", "running")]]
+        self.is_monitored_handle.return_value = True
+
+        # exercise
+        self.testee.reconcile()
+
+        # verify
+        self.adopt_handle.assert_not_called()
+        self.delete_handle.assert_not_called()
+        self.assertEqual(self.testee.get_metrics().orphaned_workflows, 0)
+
+    def test_unmonitored_workflow_adopted(self):
+
+        # setup
+        self.put_record("running", WorkflowJobPhase.RUNNING, updated_at=datetime.now() - timedelta(hours=1))
+        self.pages["pod"] = [[pod("pod-a", "running")]]
+
+        # exercise
+        self.testee.reconcile()
+
+        # verify
+        self.adopt_handle.assert_called_once()
+        self.assertEqual(self.adopt_handle.call_args.args[0].workflow_id, "running")
+        self.delete_handle.assert_not_called()
+        self.assertEqual(self.testee.get_metrics().adopted_workflows, 1)
+
+    def test_unmonitored_workflow_not_adoptable(self):
+
+        # setup
+        self.put_record("running", WorkflowJobPhase.RUNNING, updated_at=datetime.now() - timedelta(hours=1))
+        self.pages["pod"] = [[pod("pod-a", "running")]]
+        self.adopt_handle.return_value = False
+
+        # exercise
+        self.testee.reconcile()
+
+        # verify
+        self.delete_handle.assert_called_once_with("running")
+        self.assertEqual(self.testee.get_metrics().reclaimed_pods, 1)
+
+    def test_disabled(self):
+        self.testee.interval = 0
+        self.testee.start()
+        self.assertIsNone(self.testee.worker)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from threading import Event, Thread
+from unittest.mock import patch
+
+from middlelayer.models import WorkflowJobPhase
+from middlelayer.registry import SqliteWorkflowRegistry, WorkflowRecord
+
+WRITE_BATCH = "_SqliteWorkflowRegistry__write_batch"
+
+
+def record(workflow_id: str, service_id: str = "service", user_id: str = "user", **fields) -> WorkflowRecord:
+    return WorkflowRecord(workflow_id=workflow_id, service_id=service_id, user_id=user_id, **fields)
+
+
+class TestSqliteWorkflowRegistry(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.testee = SqliteWorkflowRegistry(":memory:", flush_interval=60)
+
+    def tearDown(self) -> None:
+        self.testee.close()
+
+    def test_put_get(self):
+        self.testee.put(record("wf1", backend_data={"job_id": "job"}))
+
+        # pending writes are visible before they are flushed
+        self.assertEqual(self.testee.get("wf1").backend_data, {"job_id": "job"})
+        self.testee.flush()
+        restored = self.testee.get("wf1")
+
+        self.assertEqual(restored.service_id, "service")
+        self.assertEqual(restored.phase, WorkflowJobPhase.QUEUED)
+        self.assertIsNotNone(restored.created_at)
+        self.assertIsNone(self.testee.get("unknown"))
+
+    def test_update(self):
+        self.testee.put(record("wf1"))
+        self.testee.flush()
+
+        updated = self.testee.update("wf1", phase=WorkflowJobPhase.RUNNING)
+        self.testee.flush()
+
+        self.assertEqual(updated.phase, WorkflowJobPhase.RUNNING)
+        self.assertEqual(self.testee.get("wf1").phase, WorkflowJobPhase.RUNNING)
+        self.assertEqual(self.testee.get("wf1").created_at, updated.created_at)
+        self.assertIsNone(self.testee.update("unknown", phase=WorkflowJobPhase.RUNNING))
+
+    def test_delete(self):
+        self.testee.put(record("wf1"))
+        self.testee.flush()
+
+        self.testee.delete("wf1")
+
+        self.assertIsNone(self.testee.get("wf1"))
+        self.testee.flush()
+        self.assertIsNone(self.testee.get("wf1"))
+
+    def test_list(self):
+        self.testee.put(record("wf1", service_id="a", user_id="u1"))
+        self.testee.put(record("wf2", service_id="b", user_id="u1", phase=WorkflowJobPhase.RUNNING))
+        self.testee.put(record("wf3", service_id="a", user_id="u2", phase=WorkflowJobPhase.FINISHED))
+
+        self.assertEqual([x.workflow_id for x in self.testee.list_by_user("u1")], ["wf1", "wf2"])
+        self.assertEqual([x.workflow_id for x in self.testee.list_by_service("a")], ["wf1", "wf3"])
+        self.assertEqual([x.workflow_id for x in self.testee.list_by_service(
+            "a", phases=[WorkflowJobPhase.QUEUED])], ["wf1"])
+        self.assertEqual([x.workflow_id for x in self.testee.list_by_phase(
+            [WorkflowJobPhase.RUNNING, WorkflowJobPhase.FINISHED])], ["wf2", "wf3"])
+
+    def test_count_by_phase(self):
+        self.testee.put(record("wf1"))
+        self.testee.put(record("wf2", phase=WorkflowJobPhase.RUNNING))
+        self.testee.put(record("wf3", phase=WorkflowJobPhase.RUNNING))
+
+        counts = self.testee.count_by_phase()
+
+        self.assertEqual(counts[WorkflowJobPhase.QUEUED], 1)
+        self.assertEqual(counts[WorkflowJobPhase.RUNNING], 2)
+        self.assertEqual(counts[WorkflowJobPhase.FINISHED], 0)
+
+    def test_list_pending_cleanups(self):
+        now = datetime.now()
+        self.testee.put(record("wf1", phase=WorkflowJobPhase.FINISHED, cleanup_at=now + timedelta(minutes=10)))
+        self.testee.put(record("wf2", phase=WorkflowJobPhase.FINISHED, cleanup_at=now + timedelta(minutes=5)))
+        self.testee.put(record("wf3", phase=WorkflowJobPhase.FINISHED))
+
+        self.assertEqual([x.workflow_id for x in self.testee.list_pending_cleanups()], ["wf2", "wf1"])
+
+        self.testee.update("wf2", cleanup_at=None)
+        self.assertEqual([x.workflow_id for x in self.testee.list_pending_cleanups()], ["wf1"])
+
+    def test_schema_of_previous_version(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "registry.db")
+            with sqlite3.connect(path) as connection:
+                connection.execute("""
+                    CREATE TABLE workflows (
+                        workflow_id TEXT PRIMARY KEY,
+                        service_id TEXT NOT NULL,
+                        user_id TEXT NOT NULL,
+                        phase TEXT NOT NULL,
+                        priority INTEGER NOT NULL DEFAULT 0,
+                        created_at TEXT,
+                        updated_at TEXT,
+                        record TEXT NOT NULL)""")
+            connection.close()
+
+            testee = SqliteWorkflowRegistry(path)
+            testee.put(record("wf1", cleanup_at=datetime.now()))
+            self.assertEqual([x.workflow_id for x in testee.list_pending_cleanups()], ["wf1"])
+            testee.close()
+
+    def test_batch_size_triggers_write(self):
+        testee = SqliteWorkflowRegistry(":memory:", flush_interval=60, batch_size=2)
+        testee.put(record("wf1"))
+        testee.put(record("wf2"))
+
+        for _ in range(100):
+            with testee.condition:
+                if not testee.pending:
+                    break
+            testee.writer.join(0.01)
+        self.assertEqual(testee.pending, {})
+        testee.close()
+
+    def test_failed_write_kept_pending(self):
+        write_batch = getattr(SqliteWorkflowRegistry, WRITE_BATCH)
+
+        def failing_write_batch(registry, batch):
+            # written while the batch is committed
+            registry.put(record("wf1", phase=WorkflowJobPhase.RUNNING))
+            raise sqlite3.OperationalError("database is locked")
+
+        self.testee.put(record("wf1"))
+        self.testee.put(record("wf2"))
+        with patch.object(SqliteWorkflowRegistry, WRITE_BATCH, failing_write_batch):
+            with self.assertRaises(sqlite3.Error):
+                self.testee.flush()
+
+        # the newer write is kept, the failed batch is written with it
+        self.assertEqual(self.testee.get("wf1").phase, WorkflowJobPhase.RUNNING)
+        with patch.object(SqliteWorkflowRegistry, WRITE_BATCH, write_batch):
+            self.testee.flush()
+        self.assertEqual(sorted((x.workflow_id, x.phase) for x in self.testee.list_by_phase([])),
+                         [("wf1", WorkflowJobPhase.RUNNING), ("wf2", WorkflowJobPhase.QUEUED)])
+
+    def test_writer_retries_failed_write(self):
+        write_batch = getattr(SqliteWorkflowRegistry, WRITE_BATCH)
+        failures = [sqlite3.OperationalError("database is locked")]
+
+        def flaky_write_batch(registry, batch):
+            if failures:
+                raise failures.pop()
+            return write_batch(registry, batch)
+
+        with patch.object(SqliteWorkflowRegistry, WRITE_BATCH, flaky_write_batch):
+            testee = SqliteWorkflowRegistry(":memory:", flush_interval=0.01, max_retry_interval=0.05)
+            testee.put(record("wf1"))
+            for _ in range(200):
+                with testee.condition:
+                    if not failures and not testee.pending and not testee.in_flight:
+                        break
+                testee.writer.join(0.01)
+
+            self.assertTrue(testee.writer.is_alive())
+            with testee.db_lock:
+                rows = testee.connection.execute("SELECT workflow_id FROM workflows").fetchall()
+            self.assertEqual(rows, [("wf1",)])
+            testee.close()
+
+    def test_get_during_commit(self):
+        write_batch = getattr(SqliteWorkflowRegistry, WRITE_BATCH)
+        committing, release = Event(), Event()
+
+        def slow_write_batch(registry, batch):
+            committing.set()
+            release.wait(5)
+            return write_batch(registry, batch)
+
+        self.testee.put(record("wf1"))
+        with patch.object(SqliteWorkflowRegistry, WRITE_BATCH, slow_write_batch):
+            flush = Thread(target=self.testee.flush)
+            flush.start()
+            committing.wait(5)
+
+            # neither blocked by the commit nor missing the record in flight
+            self.testee.put(record("wf2"))
+            self.assertIsNotNone(self.testee.get("wf1"))
+            release.set()
+            flush.join()
+
+    def test_durable(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "registry.db")
+
+            testee = SqliteWorkflowRegistry(path)
+            testee.put(record("wf1", phase=WorkflowJobPhase.RUNNING))
+            testee.close()
+
+            restored = SqliteWorkflowRegistry(path)
+            self.assertEqual(restored.get("wf1").phase, WorkflowJobPhase.RUNNING)
+            restored.close()
@@ -0,0 +1,159 @@
+import unittest
+from threading import Event
+from unittest.mock import MagicMock
+
+from middlelayer.scheduler import WorkflowScheduler, WorkflowQueueEntry
+
+
+class TestWorkflowScheduler(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.dispatched = []
+        self.dispatch_event = Event()
+
+        def dispatch_handle(entry):
+            self.dispatched.append(entry.workflow_id)
+            self.dispatch_event.set()
+
+        self.dispatch_handle = dispatch_handle
+
+    def wait_dispatched(self, testee: WorkflowScheduler, count: int):
+        for _ in range(100):
+            if len(self.dispatched) >= count:
+                return
+            self.dispatch_event.wait(0.05)
+            self.dispatch_event.clear()
+        self.fail(f"expected {count} dispatched workflows, got {self.dispatched}")
+
+    def test_priority_and_fifo_order(self):
+        testee = WorkflowScheduler(dispatch_handle=self.dispatch_handle)
+
+        self.assertEqual(testee.submit("wf1", "service", "user"), 1)
+        self.assertEqual(testee.submit("wf2", "service", "user"), 2)
+        self.assertEqual(testee.submit("wf3", "service", "user", priority=1), 1)
+
+        self.assertEqual([x.workflow_id for x in testee.get_queued_entries()],
+                         ["wf3", "wf1", "wf2"])
+        self.assertEqual(testee.get_queue_position("wf2"), 3)
+        self.assertIsNone(testee.get_queue_position("unknown"))
+
+    def test_global_limit(self):
+        testee = WorkflowScheduler(dispatch_handle=self.dispatch_handle,
+                                   max_workflows=1)
+        testee.submit("wf1", "service", "user")
+        testee.submit("wf2", "service", "user")
+        testee.start()
+
+        self.wait_dispatched(testee, 1)
+        self.assertEqual(self.dispatched, ["wf1"])
+        self.assertEqual(testee.get_queue_position("wf2"), 1)
+
+        testee.release("wf1")
+        self.wait_dispatched(testee, 2)
+        self.assertEqual(self.dispatched, ["wf1", "wf2"])
+        self.assertEqual(testee.get_queue_depth(), 0)
+        testee.stop()
+
+    def test_service_limit_does_not_block_other_services(self):
+        service_limit_handle = MagicMock(side_effect=lambda service_id: 1 if service_id == "limited" else None)
+        testee = WorkflowScheduler(dispatch_handle=self.dispatch_handle,
+                                   service_limit_handle=service_limit_handle)
+        testee.submit("wf1", "limited", "user")
+        testee.submit("wf2", "limited", "user")
+        testee.submit("wf3", "other", "user")
+        testee.start()
+
+        self.wait_dispatched(testee, 2)
+        self.assertEqual(self.dispatched, ["wf1", "wf3"])
+        self.assertTrue(testee.is_queued("wf2"))
+        testee.stop()
+
+    def test_user_limit(self):
+        testee = WorkflowScheduler(dispatch_handle=self.dispatch_handle,
+                                   max_workflows_per_user=1)
+        testee.submit("wf1", "service", "user1")
+        testee.submit("wf2", "service", "user1")
+        testee.submit("wf3", "service", "user2")
+        testee.start()
+
+        self.wait_dispatched(testee, 2)
+        self.assertEqual(self.dispatched, ["wf1", "wf3"])
+        testee.stop()
+
+    def test_cancel(self):
+        testee = WorkflowScheduler(dispatch_handle=self.dispatch_handle)
+        testee.submit("wf1", "service", "user")
+
+        self.assertTrue(testee.cancel("wf1"))
+        self.assertFalse(testee.cancel("wf1"))
+        self.assertEqual(testee.get_queue_depth(), 0)
+
+    def test_failed_dispatch_releases_slot(self):
+        def dispatch_handle(entry):
+            self.dispatched.append(entry.workflow_id)
+            self.dispatch_event.set()
+            raise RuntimeError("commit failed")
+
+        testee = WorkflowScheduler(dispatch_handle=dispatch_handle,
+                                   max_workflows=1)
+        testee.submit("wf1", "service", "user")
+        testee.submit("wf2", "service", "user")
+        testee.start()
+
+        for _ in range(100):
+            if len(self.dispatched) == 2:
+                break
+            self.dispatch_event.wait(0.05)
+            self.dispatch_event.clear()
+        self.assertEqual(self.dispatched, ["wf1", "wf2"])
+        testee.stop()
+
+    def test_dispatch_workers_bounded(self):
+        release = Event()
+
+        def dispatch_handle(entry):
+            self.dispatched.append(entry.workflow_id)
+            self.dispatch_event.set()
+            release.wait(5)
+
+        testee = WorkflowScheduler(dispatch_handle=dispatch_handle,
+                                   max_workflows=0,
+                                   dispatch_workers=1)
+        testee.submit("wf1", "service", "user")
+        testee.submit("wf2", "service", "user")
+        testee.start()
+        self.wait_dispatched(testee, 1)
+
+        # both are admitted, the second dispatch waits for the only worker
+        self.dispatch_event.clear()
+        self.dispatch_event.wait(0.1)
+        self.assertEqual(self.dispatched, ["wf1"])
+        self.assertEqual(testee.get_active_count(), 2)
+        release.set()
+        self.wait_dispatched(testee, 2)
+        testee.stop()
+
+    def test_restore(self):
+        testee = WorkflowScheduler(dispatch_handle=self.dispatch_handle,
+                                   max_workflows=1)
+
+        testee.restore(queued=[WorkflowQueueEntry(workflow_id="wf1", service_id="service", user_id="user",
+                                                  sequence=0),
+                               WorkflowQueueEntry(workflow_id="wf2", service_id="service", user_id="user",
+                                                  priority=2, sequence=1)],
+                       active=[WorkflowQueueEntry(workflow_id="wf0", service_id="service", user_id="user")])
+
+        self.assertEqual([x.workflow_id for x in testee.get_queued_entries()],
+                         ["wf2", "wf1"])
+        self.assertEqual(testee.get_active_count(), 1)
+        self.assertEqual(testee.submit("wf3", "service", "user"), 3)
+
+        # the restored running workflow holds the only slot
+        testee.start()
+        self.dispatch_event.wait(0.2)
+        self.assertEqual(self.dispatched, [])
+
+        testee.release("wf0")
+        self.wait_dispatched(testee, 1)
+        self.assertEqual(self.dispatched, ["wf2"])
+        testee.stop()
@@ -1,15 +1,27 @@
+import hashlib
 from unittest import TestCase
 from unittest.mock import patch, MagicMock, Mock
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 
 from fastapi.testclient import TestClient
 
 
-from middlelayer.models import ServiceDescription, InputServiceResource, ServiceResouce, WorkflowResource
+from minio.error import S3Error
+
+from middlelayer.models import (ServiceDescription, InputServiceResource, ServiceResouce, WorkflowResource,
+                                DataPlaneMode, MinioStoreInfo)
 import middlelayer.service_api as testee_mod
 from middlelayer.service_api import service_api, ServiceApi
 
-from middlelayer.backend import WorkflowJobState
+from middlelayer.backend import WorkflowJobState, WorkflowJobPhase, MonitorMetrics, K8sWorkflowBackend
+from middlelayer.registry import WorkflowRecord
+from middlelayer.reconciler import ReconcilerMetrics
+from middlelayer.env_parser import EnvironmentInputError
+from middlelayer.log_stream import LogStreamLimitReached
+from middlelayer.asset import AssetCatalog
+
+MINIO_STORE_INFO = MinioStoreInfo(endpoint="minio:9000", access_key="access", secret_key="secret", secure=False)
 
 
 class TestServiceApi(TestCase):
@@ -22,6 +34,10 @@ class TestServiceApi(TestCase):
         # testee_mod.SERVICES["test_service"] = {"test_id": "service_info"}
         testee_mod.WORKFLOW_API_ACCESS_TOKEN = "pass"
 
+        registry_path_patcher = patch("middlelayer.service_api.WORKFLOW_API_REGISTRY_PATH", ":memory:")
+        registry_path_patcher.start()
+        self.addCleanup(registry_path_patcher.stop)
+
         self.storage_bucket = "test_bucket"
 
         self.test_service_id = "test_id"
@@ -55,6 +71,10 @@ class TestServiceApi(TestCase):
             self.mock_asset_loader_instance = mock_asset_loader.return_value
             self.mock_asset_loader_instance.get_assets.return_value = {self.test_service_id: self.test_service}
             self.mock_asset_loader_instance.get_assets_description.side_effect = side_effect
+            self.mock_asset_loader_instance.get_catalog.return_value = AssetCatalog(
+                version=1,
+                descriptions={self.test_service_id: self.test_service},
+                asset_info={self.test_service_id: {"id": self.test_service_id}})
 
             self.mock_workflow_backend = mock_workflow_backend
             self.mock_workflow_storage = mock_storage_backend
@@ -72,8 +92,14 @@ class TestServiceApi(TestCase):
         response = self.testee.get("/services/", headers=self.headers)
         self.assertFalse(response.is_error)
         self.assertIsNotNone(response.json())
-        self.assertEqual(response.json(),
-                         {self.test_service_id: self.test_service.model_dump()})
+        self.assertEqual(response.json(), [{"id": self.test_service_id}])
+        self.assertIn("max-age=", response.headers["Cache-Control"])
+
+        # the client holds the current version
+        response = self.testee.get("/services/", headers={**self.headers,
+                                                          "If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, testee_mod.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
 
     def test_get_service_desciption(self):
 
@@ -90,6 +116,21 @@ class TestServiceApi(TestCase):
         self.assertEqual(
             ServiceDescription(**response.json()),
             self.test_service)
+        etag = response.headers["ETag"]
+
+        response = self.testee.get(
+            f"/services/{self.test_service_id}/info/", headers={**self.headers, "If-None-Match": etag})
+        self.assertEqual(response.status_code, testee_mod.HTTP_304_NOT_MODIFIED)
+
+        # a new version of the description has a new etag
+        self.mock_asset_loader_instance.get_catalog.return_value = AssetCatalog(
+            version=2,
+            descriptions={self.test_service_id: self.test_service.model_copy(update={"retention_seconds": 60})})
+        response = self.testee.get(
+            f"/services/{self.test_service_id}/info/", headers={**self.headers, "If-None-Match": etag})
+        self.assertEqual(response.status_code, testee_mod.HTTP_200_OK)
+        self.assertEqual(response.json()["retention_seconds"], 60)
+        self.assertNotEqual(response.headers["ETag"], etag)
 
         response = self.testee.get(
             "/services/fake/info/", headers=self.headers)
@@ -98,6 +139,14 @@ class TestServiceApi(TestCase):
                         testee_mod.HTTP_400_BAD_REQUEST)
         self.assertTrue(response.is_client_error)
 
+    def test_get_service_desciption_schema(self):
+
+        responses = service_api.openapi()["paths"]["/services/{service_id}/info"]["get"]["responses"]
+
+        self.assertEqual(responses["200"]["content"]["application/json"]["schema"],
+                         {"$ref": "#/components/schemas/ServiceDescription"})
+        self.assertIn("304", responses)
+
     def test_get_service_input_info_missing_auth(self):
 
         response = self.testee.put(
@@ -122,9 +171,18 @@ class TestServiceApi(TestCase):
         self.assertEqual(response.status_code,
                          testee_mod.HTTP_400_BAD_REQUEST)
 
+    def assert_input_reference(self, mock_storage_instance: MagicMock, sha256: str, size: int):
+        mock_storage_instance.put_data.assert_any_call(
+            bucket=testee_mod.WORKFLOW_API_USER_STORAGE,
+            resource=f"{self.test_service_id}/inputs/test_res_in",
+            data=f'{{"sha256":"{sha256}","size":{size}}}'.encode(),
+            metadata={"blob-sha256": sha256})
+
     def test_put_valid_resource(self):
 
         mock_storage_instance: MagicMock = self.mock_workflow_storage.return_value
+        mock_storage_instance.object_exists.return_value = False
+        sha256 = hashlib.sha256(b"data").hexdigest()
 
         response = self.testee.put(
             f"/services/{self.test_service_id}/input/test_res_in",
@@ -133,7 +191,149 @@ class TestServiceApi(TestCase):
             files={"input_file": b"data"})
 
         self.assertEqual(response.status_code, testee_mod.HTTP_200_OK, f"status_code was {response.status_code}")
+        self.assertEqual(response.json()["sha256"], sha256)
+        self.assertFalse(response.json()["deduplicated"])
         mock_storage_instance.put_file.assert_called_once()
+        self.assertEqual(mock_storage_instance.put_file.call_args.kwargs["resource"], f"blobs/sha256/{sha256}")
+        self.assert_input_reference(mock_storage_instance, sha256, 4)
+
+    def test_put_resource_presigned(self):
+
+        with patch("middlelayer.service_api.WORKFLOW_API_DATA_PLANE", DataPlaneMode.PRESIGNED):
+            response = self.testee.put(
+                f"/services/{self.test_service_id}/input/test_res_in",
+                headers=self.headers,
+                files={"input_file": b"data"})
+
+        # the upload does not pass through the api
+        self.assertEqual(response.status_code, testee_mod.HTTP_400_BAD_REQUEST)
+        self.mock_workflow_storage.return_value.put_file.assert_not_called()
+
+    def test_put_resource_without_file(self):
+
+        response = self.testee.put(
+            f"/services/{self.test_service_id}/input/test_res_in",
+            headers=self.headers,
+            files={"other": b"data"})
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_400_BAD_REQUEST)
+        # one route per method and path
+        path = "/services/{service_id}/input/{resource}"
+        routes = [x for x in service_api.routes if getattr(x, "path", None) == path]
+        self.assertEqual([x.methods for x in routes], [{"PUT"}])
+
+    def test_put_known_resource(self):
+
+        mock_storage_instance: MagicMock = self.mock_workflow_storage.return_value
+        mock_storage_instance.object_exists.return_value = True
+
+        response = self.testee.put(
+            f"/services/{self.test_service_id}/input/test_res_in",
+            headers=self.headers,
+            files={"input_file": b"data"})
+
+        self.assertTrue(response.json()["deduplicated"])
+        mock_storage_instance.put_file.assert_not_called()
+        self.assert_input_reference(mock_storage_instance, hashlib.sha256(b"data").hexdigest(), 4)
+
+    def test_put_valid_resource_stream(self):
+
+        mock_storage_instance: MagicMock = self.mock_workflow_storage.return_value
+        mock_storage_instance.object_exists.return_value = False
+        sha256 = hashlib.sha256(b"KEY=VALUE").hexdigest()
+
+        response = self.testee.put(
+            f"/services/{self.test_service_id}/input/test_res_in/stream",
+            headers=self.headers,
+            content=b"KEY=VALUE")
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_200_OK, f"status_code was {response.status_code}")
+        self.assertEqual(response.json()["size"], 9)
+        self.assertEqual(response.json()["sha256"], sha256)
+
+        # staged, copied to its blob and removed
+        (bucket, staging_name, data) = mock_storage_instance.put_data.call_args_list[0].args
+        self.assertEqual(bucket, testee_mod.WORKFLOW_API_USER_STORAGE)
+        self.assertTrue(staging_name.startswith("blobs/staging/"))
+        self.assertEqual(data, b"KEY=VALUE")
+        mock_storage_instance.copy_file.assert_called_once_with(
+            bucket=testee_mod.WORKFLOW_API_USER_STORAGE,
+            source=staging_name,
+            resource=f"blobs/sha256/{sha256}")
+        mock_storage_instance.remove_file.assert_called_once_with(testee_mod.WORKFLOW_API_USER_STORAGE, staging_name)
+        self.assert_input_reference(mock_storage_instance, sha256, 9)
+
+    def test_put_resource_stream_hash_first(self):
+
+        mock_storage_instance: MagicMock = self.mock_workflow_storage.return_value
+        mock_storage_instance.stat_file_if_exists.return_value = MagicMock(size=9)
+        sha256 = hashlib.sha256(b"KEY=VALUE").hexdigest()
+
+        response = self.testee.put(
+            f"/services/{self.test_service_id}/input/test_res_in/stream",
+            params={"sha256": sha256},
+            headers=self.headers,
+            content=b"KEY=VALUE")
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_200_OK)
+        self.assertTrue(response.json()["deduplicated"])
+        # only the reference is written, the body is not uploaded
+        mock_storage_instance.put_data.assert_called_once()
+        self.assert_input_reference(mock_storage_instance, sha256, 9)
+
+    def test_put_resource_stream_hash_mismatch(self):
+
+        mock_storage_instance: MagicMock = self.mock_workflow_storage.return_value
+        mock_storage_instance.stat_file_if_exists.return_value = None
+
+        response = self.testee.put(
+            f"/services/{self.test_service_id}/input/test_res_in/stream",
+            params={"sha256": "0" * 64},
+            headers=self.headers,
+            content=b"KEY=VALUE")
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_400_BAD_REQUEST)
+        mock_storage_instance.copy_file.assert_not_called()
+        mock_storage_instance.remove_file.assert_called_once()
+        self.assertEqual(mock_storage_instance.put_data.call_count, 1)
+
+    def test_link_input(self):
+
+        mock_storage_instance: MagicMock = self.mock_workflow_storage.return_value
+        mock_storage_instance.stat_file_if_exists.return_value = None
+        sha256 = "A" * 64
+
+        response = self.testee.post(f"/services/{self.test_service_id}/input/test_res_in/link",
+                                    params={"sha256": sha256},
+                                    headers=self.headers)
+        self.assertEqual(response.status_code, testee_mod.HTTP_404_NOT_FOUND)
+
+        mock_storage_instance.stat_file_if_exists.return_value = MagicMock(size=42)
+        response = self.testee.post(f"/services/{self.test_service_id}/input/test_res_in/link",
+                                    params={"sha256": sha256},
+                                    headers=self.headers)
+        self.assertEqual(response.status_code, testee_mod.HTTP_200_OK)
+        mock_storage_instance.stat_file_if_exists.assert_called_with(
+            bucket=testee_mod.WORKFLOW_API_USER_STORAGE,
+            resource=f"blobs/sha256/{'a' * 64}")
+        self.assert_input_reference(mock_storage_instance, "a" * 64, 42)
+
+        response = self.testee.post(f"/services/{self.test_service_id}/input/test_res_in/link",
+                                    params={"sha256": "invalid"},
+                                    headers=self.headers)
+        self.assertEqual(response.status_code, testee_mod.HTTP_400_BAD_REQUEST)
+
+    def test_put_invalid_resource_stream(self):
+
+        mock_storage_instance: MagicMock = self.mock_workflow_storage.return_value
+
+        response = self.testee.put(
+            f"/services/{self.test_service_id}/input/invalid/stream",
+            headers=self.headers,
+            content=b"KEY=VALUE")
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_400_BAD_REQUEST)
+        mock_storage_instance.put_data.assert_not_called()
 
     def test_get_output_resource_missing_auth(self):
 
@@ -159,7 +359,7 @@ class TestServiceApi(TestCase):
     def test_get_output_resource_valid_resource_not_exists(self):
 
         mock_storage_instance = self.mock_workflow_storage.return_value
-        mock_storage_instance.get_objects_list.return_value = []
+        mock_storage_instance.stat_file_if_exists.return_value = None
 
         response = self.testee.get(
             f"/services/{self.test_service_id}/output",
@@ -178,11 +378,7 @@ class TestServiceApi(TestCase):
         mock_response.headers = {'Content-Type': 'text/plain', "Content-Length": "4", 'Custom-Header': 'Mocked'}
         mock_response.stream = lambda: (x for x in ["test"])
 
-        test_resource_storage_name = "test_res_out"
-
         mock_storage_instance = self.mock_workflow_storage.return_value
-        mock_storage_instance.get_objects_list.return_value = [
-            test_resource_storage_name]
         mock_storage_instance.get_file.return_value = mock_response
 
         response = self.testee.get(
@@ -193,10 +389,170 @@ class TestServiceApi(TestCase):
         self.assertTrue(response.is_success)
         self.assertEqual(response.content, b"test")
 
+    def setup_output_resource_range(self, data: bytes):
+        mock_storage_instance = self.mock_workflow_storage.return_value
+        mock_storage_instance.stat_file_if_exists.return_value = MagicMock(
+            size=len(data), etag="etag", content_type="text/plain", last_modified=None)
+
+        def get_file(bucket, resource, offset=0, length=0):
+            mock_response = MagicMock()
+            mock_response.headers = {"Content-Type": "text/plain", "Content-Length": str(len(data))}
+            mock_response.stream = lambda: (x for x in [data[offset:offset + length or len(data)]])
+            return mock_response
+
+        mock_storage_instance.get_file.side_effect = get_file
+        return mock_storage_instance
+
+    def test_get_output_resource_single_range(self):
+
+        mock_storage_instance = self.setup_output_resource_range(b"0123456789")
+
+        response = self.testee.get(
+            f"/services/{self.test_service_id}/output",
+            params={"resource": "test_res_out"},
+            headers={**self.headers, "Range": "bytes=2-5"})
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response.content, b"2345")
+        self.assertEqual(response.headers["content-range"], "bytes 2-5/10")
+        self.assertEqual(response.headers["etag"], "\"etag\"")
+        mock_storage_instance.get_file.assert_called_once_with(
+            bucket=testee_mod.WORKFLOW_API_USER_STORAGE,
+            resource=f"{self.test_service_id}/outputs/test_res_out",
+            offset=2,
+            length=4)
+
+    def test_get_output_resource_multiple_ranges(self):
+
+        self.setup_output_resource_range(b"0123456789")
+
+        response = self.testee.get(
+            f"/services/{self.test_service_id}/output",
+            params={"resource": "test_res_out"},
+            headers={**self.headers, "Range": "bytes=0-1,-2"})
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_206_PARTIAL_CONTENT)
+        self.assertTrue(response.headers["content-type"].startswith("multipart/byteranges; boundary="))
+        self.assertEqual(int(response.headers["content-length"]), len(response.content))
+        self.assertIn(b"Content-Range: bytes 0-1/10\r\n\r\n01", response.content)
+        self.assertIn(b"Content-Range: bytes 8-9/10\r\n\r\n89", response.content)
+
+    def test_get_output_resource_range_not_satisfiable(self):
+
+        self.setup_output_resource_range(b"0123456789")
+
+        response = self.testee.get(
+            f"/services/{self.test_service_id}/output",
+            params={"resource": "test_res_out"},
+            headers={**self.headers, "Range": "bytes=20-"})
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response.headers["content-range"], "bytes */10")
+
+    def test_get_output_resource_if_range_changed(self):
+
+        mock_storage_instance = self.setup_output_resource_range(b"0123456789")
+
+        response = self.testee.get(
+            f"/services/{self.test_service_id}/output",
+            params={"resource": "test_res_out"},
+            headers={**self.headers, "Range": "bytes=2-5", "If-Range": "\"other\""})
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_200_OK)
+        mock_storage_instance.get_file.assert_called_once_with(
+            bucket=testee_mod.WORKFLOW_API_USER_STORAGE,
+            resource=f"{self.test_service_id}/outputs/test_res_out")
+
+    def test_get_input_upload_url_disabled(self):
+
+        response = self.testee.get(
+            f"/services/{self.test_service_id}/input/test_res_in/upload-url",
+            headers=self.headers)
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()["detail"], "presigned data plane not enabled")
+
+    def test_get_input_upload_url(self):
+
+        mock_storage_instance = self.mock_workflow_storage.return_value
+        mock_storage_instance.get_upload_url.return_value = "http://storage/upload"
+
+        with patch("middlelayer.service_api.WORKFLOW_API_DATA_PLANE", DataPlaneMode.PRESIGNED):
+            response = self.testee.get(
+                f"/services/{self.test_service_id}/input/test_res_in/upload-url",
+                headers=self.headers)
+            invalid_response = self.testee.get(
+                f"/services/{self.test_service_id}/input/invalid/upload-url",
+                headers=self.headers)
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_200_OK)
+        self.assertEqual(response.json()["url"], "http://storage/upload")
+        self.assertEqual(response.json()["method"], "PUT")
+        mock_storage_instance.get_upload_url.assert_called_once_with(
+            bucket_name=testee_mod.WORKFLOW_API_USER_STORAGE,
+            response_name=f"{self.test_service_id}/inputs/test_res_in",
+            expires=testee_mod.WORKFLOW_API_PRESIGNED_URL_EXPIRY)
+
+        self.assertEqual(invalid_response.status_code, testee_mod.HTTP_400_BAD_REQUEST)
+
+    def test_put_resource_stream_redirect(self):
+
+        mock_storage_instance = self.mock_workflow_storage.return_value
+        mock_storage_instance.get_upload_url.return_value = "http://storage/upload"
+
+        with patch("middlelayer.service_api.WORKFLOW_API_DATA_PLANE", DataPlaneMode.PRESIGNED):
+            response = self.testee.put(
+                f"/services/{self.test_service_id}/input/test_res_in/stream",
+                headers=self.headers,
+                follow_redirects=False,
+                content=b"KEY=VALUE")
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_307_TEMPORARY_REDIRECT)
+        self.assertEqual(response.headers["location"], "http://storage/upload")
+        mock_storage_instance.put_data.assert_not_called()
+
+    def test_commit_input(self):
+
+        mock_storage_instance = self.mock_workflow_storage.return_value
+        mock_storage_instance.stat_file.return_value = MagicMock(size=9, etag="etag")
+
+        response = self.testee.post(
+            f"/services/{self.test_service_id}/input/test_res_in/commit",
+            headers=self.headers)
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_200_OK)
+        self.assertEqual(response.json(), {"upload_file": "test_res_in", "size": 9, "etag": "etag"})
+
+        mock_storage_instance.stat_file.side_effect = S3Error(
+            None, "NoSuchKey", "not found", "resource", "request_id", "host_id")
+
+        response = self.testee.post(
+            f"/services/{self.test_service_id}/input/test_res_in/commit",
+            headers=self.headers)
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_404_NOT_FOUND)
+
+    def test_get_output_resource_redirect(self):
+
+        mock_storage_instance = self.mock_workflow_storage.return_value
+        mock_storage_instance.get_download_url.return_value = "http://storage/download"
+
+        with patch("middlelayer.service_api.WORKFLOW_API_DATA_PLANE", DataPlaneMode.PRESIGNED):
+            response = self.testee.get(
+                f"/services/{self.test_service_id}/output",
+                params={"resource": "test_res_out"},
+                follow_redirects=False,
+                headers=self.headers)
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_307_TEMPORARY_REDIRECT)
+        self.assertEqual(response.headers["location"], "http://storage/download")
+        mock_storage_instance.get_file.assert_not_called()
+
     def test_post_start_service_workflow_with_insufficient_resource(self):
 
         mock_storage_instance = self.mock_workflow_storage.return_value
-        mock_storage_instance.get_objects_list.return_value = []
+        mock_storage_instance.copy_file.side_effect = S3Error(
+            None, "NoSuchKey", "not found", "resource", "request_id", "host_id")
 
         response = self.testee.post(
             f"/services/{self.test_service_id}/workflow/execute",
@@ -208,36 +564,405 @@ class TestServiceApi(TestCase):
         self.assertEqual(response.json()["detail"],
                          "service input not fulfilled")
 
-        mock_storage_instance.get_objects_list.assert_called_once()
+        mock_storage_instance.copy_file.assert_called_once()
+        mock_storage_instance.remove_files.assert_called_once()
 
     def test_post_start_service_workflow_with_resource(self):
-        test_resource_storage_name = "test_res_in"
-
         with patch("middlelayer.service_api.uuid4",
                    return_value="fake_workflow_id"),\
-                patch("middlelayer.service_api.Thread") as mock_thread:
+                patch.object(testee_mod.client.scheduler, "submit", return_value=1) as mock_submit:
 
             mock_storage_instance = self.mock_workflow_storage.return_value
-            mock_storage_instance.get_objects_list.return_value = [
-                test_resource_storage_name]
 
             mock_workflow_instance = self.mock_workflow_backend.return_value
             mock_workflow_instance.handle_input.return_value = None
 
-            mock_thread_instance = mock_thread.return_value
-
             response = self.testee.post(
                 f"/services/{self.test_service_id}/workflow/execute",
-                headers=self.headers)
+                headers=self.headers,
+                params={"priority": 5})
 
             self.assertTrue(response.is_success, "request not succeeded")
             self.assertEqual(response.status_code,
                              testee_mod.HTTP_200_OK)
-            self.assertEqual(response.json()["workflow_id"],
-                             "fake_workflow_id")
+            self.assertEqual(response.json(),
+                             {"workflow_id": "fake_workflow_id", "queue_position": 1})
+
+            mock_submit.assert_called_once_with(workflow_id="fake_workflow_id",
+                                                service_id=self.test_service_id,
+                                                user_id=testee_mod.WORKFLOW_API_USER,
+                                                priority=5)
+            # server side snapshot of the inputs for the workflow
+            mock_storage_instance.copy_file.assert_called_once_with(
+                bucket=testee_mod.WORKFLOW_API_USER_STORAGE,
+                source=f"{self.test_service_id}/inputs/test_res_in",
+                resource=f"{self.test_service_id}/workflows/fake_workflow_id/inputs/test_res_in")
+
+    def test_get_service_workflow_status_queued(self):
+        testee_mod.client.publish_workflow_state("fake_workflow_id", WorkflowJobState(phase=WorkflowJobPhase.QUEUED))
+
+        with patch.object(ServiceApi, "workflow_exists", return_value=True),\
+                patch.object(testee_mod.client.scheduler, "get_queue_position", return_value=3):
+
+            response = self.testee.get(
+                f"/services/{self.test_service_id}/workflow/status/fake_workflow_id",
+                headers=self.headers)
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_200_OK)
+        self.assertEqual(response.json()["workflow_status"]["phase"], "QUEUED")
+        self.assertEqual(response.json()["workflow_status"]["queue_position"], 3)
+        self.assertEqual([x["name"] for x in response.json()["workflow_status"]["timeline"]], ["QUEUED"])
+        self.mock_workflow_backend.return_value.get_status.assert_not_called()
+
+    def test_post_stop_queued_service_workflow(self):
 
-            mock_thread.assert_called_once()
-            mock_thread_instance.start.assert_called_once()
+        with patch.object(testee_mod.client.scheduler, "cancel", return_value=True):
+            testee_mod.client.commit_workflow(self.test_service_id, "fake_workflow_id")
+
+            response = self.testee.post(
+                f"/services/{self.test_service_id}/workflow/stop/fake_workflow_id",
+                headers=self.headers)
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_200_OK)
+        self.assertEqual(testee_mod.client.workflow_registry.get("fake_workflow_id").phase,
+                         WorkflowJobPhase.CANCELED)
+        self.mock_workflow_backend.return_value.cleanup.assert_not_called()
+
+    def test_get_service_workflow_status_canceled_while_queued(self):
+        with patch("middlelayer.k8sClient.config"):
+            workflow_backend = K8sWorkflowBackend("namespace", workflow_registry=testee_mod.client.workflow_registry)
+
+        with patch.object(testee_mod.client, "workflow_backend", workflow_backend),\
+                patch.object(testee_mod.client.scheduler, "cancel", return_value=True):
+            testee_mod.client.commit_workflow(self.test_service_id, "fake_workflow_id")
+            testee_mod.client.stop_workflow(self.test_service_id, "fake_workflow_id")
+
+            response = self.testee.get(
+                f"/services/{self.test_service_id}/workflow/status/fake_workflow_id",
+                headers=self.headers)
+
+        # no job data in the backend, the phase of the registry is returned
+        self.assertEqual(response.status_code, testee_mod.HTTP_200_OK)
+        self.assertEqual(response.json()["workflow_status"]["phase"], "CANCELED")
+        workflow_backend.close()
+
+    def test_workflow_exists(self):
+
+        with patch.object(testee_mod.client.scheduler, "submit", return_value=1):
+            testee_mod.client.commit_workflow(self.test_service_id, "fake_workflow_id")
+
+        self.assertTrue(testee_mod.client.workflow_exists(self.test_service, "fake_workflow_id"))
+        self.assertFalse(testee_mod.client.workflow_exists(self.test_service, "unknown_workflow_id"))
+        self.assertFalse(testee_mod.client.workflow_exists(
+            ServiceDescription.model_validate({**self.test_service.model_dump(), "service_id": "other"}),
+            "fake_workflow_id"))
+
+        response = self.testee.get(f"/services/{self.test_service_id}/workflow/",
+                                   headers=self.headers)
+        self.assertEqual(response.json(), ["fake_workflow_id"])
+
+    def test_poll_service_workflow_status(self):
+
+        with patch.object(testee_mod.client.scheduler, "submit", return_value=1):
+            testee_mod.client.commit_workflow(self.test_service_id, "fake_workflow_id")
+        url = f"/services/{self.test_service_id}/workflow/poll/fake_workflow_id"
+
+        response = self.testee.get(url, headers=self.headers)
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_200_OK)
+        self.assertEqual(response.json()["workflow_status"]["phase"], "QUEUED")
+        etag = response.headers["etag"]
+
+        response = self.testee.get(url,
+                                   headers={**self.headers, "If-None-Match": etag},
+                                   params={"timeout": 0.01})
+        self.assertEqual(response.status_code, testee_mod.HTTP_304_NOT_MODIFIED)
+
+        testee_mod.client.set_workflow_phase("fake_workflow_id", WorkflowJobPhase.PREPARING)
+        response = self.testee.get(url,
+                                   headers={**self.headers, "If-None-Match": etag},
+                                   params={"timeout": 0.01})
+        self.assertEqual(response.status_code, testee_mod.HTTP_200_OK)
+        self.assertEqual(response.json()["workflow_status"]["phase"], "PREPARING")
+        self.assertNotEqual(response.headers["etag"], etag)
+
+    def test_get_service_workflow_events(self):
+
+        with patch.object(testee_mod.client.scheduler, "submit", return_value=1):
+            testee_mod.client.commit_workflow(self.test_service_id, "fake_workflow_id")
+        testee_mod.client.set_workflow_phase("fake_workflow_id", WorkflowJobPhase.CANCELED)
+
+        response = self.testee.get(f"/services/{self.test_service_id}/workflow/events/fake_workflow_id",
+                                   headers=self.headers)
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_200_OK)
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        # only the latest state is stored, the stream ends with the terminal phase
+        events = [x for x in response.text.split("\n\n") if x]
+        self.assertEqual(len(events), 1)
+        self.assertIn("\"phase\": \"CANCELED\"", events[0])
+
+        response = self.testee.get(f"/services/{self.test_service_id}/workflow/events/fake_workflow_id",
+                                   headers={**self.headers,
+                                            "Last-Event-ID": testee_mod.client.event_hub.get("fake_workflow_id").etag})
+        self.assertEqual(response.text, "")
+
+    def test_get_service_workflow_logs(self):
+
+        async def log_lines():
+            yield b"2023-07-26T07:38:18.1Z first\n"
+            yield b"2023-07-26T07:38:18.2Z second\n"
+
+        mock_workflow_instance = self.mock_workflow_backend.return_value
+        mock_workflow_instance.stream_log.return_value = log_lines()
+
+        with patch.object(ServiceApi, "workflow_exists", return_value=True):
+            response = self.testee.get(f"/services/{self.test_service_id}/workflow/logs/fake_workflow_id",
+                                       headers=self.headers,
+                                       params={"after": "2023-07-26T07:38:18Z"})
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_200_OK)
+        self.assertEqual(response.text, "2023-07-26T07:38:18.1Z first\n2023-07-26T07:38:18.2Z second\n")
+        mock_workflow_instance.stream_log.assert_called_once_with(workflow_id="fake_workflow_id",
+                                                                  after="2023-07-26T07:38:18Z",
+                                                                  follow=True,
+                                                                  tail_lines=None)
+
+    def test_get_service_workflow_logs_not_started(self):
+
+        self.mock_workflow_backend.return_value.stream_log.side_effect = KeyError("fake_workflow_id")
+
+        with patch.object(ServiceApi, "workflow_exists", return_value=True):
+            response = self.testee.get(f"/services/{self.test_service_id}/workflow/logs/fake_workflow_id",
+                                       headers=self.headers)
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_404_NOT_FOUND)
+
+    def test_get_service_workflow_logs_follow_limit(self):
+
+        self.mock_workflow_backend.return_value.stream_log.side_effect = LogStreamLimitReached()
+
+        with patch.object(ServiceApi, "workflow_exists", return_value=True):
+            response = self.testee.get(f"/services/{self.test_service_id}/workflow/logs/fake_workflow_id",
+                                       headers=self.headers)
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_recover_workflows(self):
+        registry = testee_mod.client.workflow_registry
+        registry.put(WorkflowRecord(workflow_id="queued", service_id=self.test_service_id, user_id="test"))
+        registry.put(WorkflowRecord(workflow_id="running", service_id=self.test_service_id, user_id="test",
+                                    phase=WorkflowJobPhase.RUNNING))
+        registry.put(WorkflowRecord(workflow_id="lost", service_id=self.test_service_id, user_id="test",
+                                    phase=WorkflowJobPhase.PREPARING))
+
+        mock_workflow_instance = self.mock_workflow_backend.return_value
+        mock_workflow_instance.recover_workflow.side_effect = lambda workflow_id, workflow_finished_handle: \
+            workflow_id == "running"
+
+        with patch.object(testee_mod.client.scheduler, "restore") as mock_restore:
+            testee_mod.client.recover_workflows()
+
+        queued = mock_restore.call_args.kwargs["queued"]
+        active = mock_restore.call_args.kwargs["active"]
+        self.assertEqual([x.workflow_id for x in queued], ["queued"])
+        self.assertEqual([x.workflow_id for x in active], ["running"])
+        mock_workflow_instance.cleanup.assert_called_once_with(workflow_id="lost", phase=WorkflowJobPhase.CANCELED)
+        self.assertEqual(registry.get("lost").phase, WorkflowJobPhase.CANCELED)
+
+    def test_adopt_workflow(self):
+        registry = testee_mod.client.workflow_registry
+        for workflow_id in ["running", "lost"]:
+            registry.put(WorkflowRecord(workflow_id=workflow_id, service_id=self.test_service_id, user_id="test",
+                                        phase=WorkflowJobPhase.RUNNING))
+
+        mock_workflow_instance = self.mock_workflow_backend.return_value
+        mock_workflow_instance.recover_workflow.side_effect = lambda workflow_id, workflow_finished_handle: \
+            workflow_id == "running"
+
+        self.assertTrue(testee_mod.client.adopt_workflow(registry.get("running")))
+        self.assertFalse(testee_mod.client.adopt_workflow(registry.get("lost")))
+
+        self.assertIn("running", testee_mod.client.scheduler.active)
+        self.assertEqual(registry.get("running").phase, WorkflowJobPhase.RUNNING)
+        self.assertEqual(registry.get("lost").phase, WorkflowJobPhase.CANCELED)
+
+    def test_get_reconciler_metrics(self):
+        mock_workflow_instance = self.mock_workflow_backend.return_value
+        mock_workflow_instance.get_reconciler_metrics.return_value = ReconcilerMetrics(reclaimed_gpu=2)
+
+        response = self.testee.get("/reconciler/metrics", headers=self.headers)
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_200_OK)
+        self.assertEqual(response.json()["reclaimed_gpu"], 2)
+
+        mock_workflow_instance.get_reconciler_metrics.return_value = None
+        response = self.testee.get("/reconciler/metrics", headers=self.headers)
+        self.assertEqual(response.status_code, testee_mod.HTTP_404_NOT_FOUND)
+
+    def test_get_prometheus_metrics(self):
+        registry = testee_mod.client.workflow_registry
+        registry.put(WorkflowRecord(workflow_id="wf", service_id=self.test_service_id, user_id="test",
+                                    phase=WorkflowJobPhase.RUNNING))
+        mock_workflow_instance = self.mock_workflow_backend.return_value
+        mock_workflow_instance.get_monitor_metrics.return_value = MonitorMetrics(monitored_workflows=3)
+        mock_workflow_instance.get_reconciler_metrics.return_value = ReconcilerMetrics(reclaimed_pods=2)
+        testee_mod.STATE_COLLECTOR.collect_handle = testee_mod.client.collect_metrics
+        self.addCleanup(setattr, testee_mod.STATE_COLLECTOR, "collect_handle", None)
+
+        self.testee.get(f"/services/{self.test_service_id}/info", headers=self.headers)
+        response = self.testee.get("/metrics", headers=self.headers)
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_200_OK)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        self.assertIn('workflow_api_workflows{phase="RUNNING"} 1.0', response.text)
+        self.assertIn("workflow_api_backend_monitored_workflows 3.0", response.text)
+        self.assertIn("workflow_api_reconciler_reclaimed_pods 2.0", response.text)
+        self.assertIn('route="/services/{service_id}/info",status="200"', response.text)
+
+        response = self.testee.get("/metrics")
+        self.assertEqual(response.status_code, testee_mod.HTTP_403_FORBIDDEN)
+
+    def test_workflow_store_callbacks(self):
+        registry = testee_mod.client.workflow_registry
+        registry.put(WorkflowRecord(workflow_id="wf", service_id=self.test_service_id, user_id="test",
+                                    phase=WorkflowJobPhase.STORING))
+        mock_workflow_instance = self.mock_workflow_backend.return_value
+        mock_workflow_instance.set_store_progress.return_value = WorkflowJobState(phase=WorkflowJobPhase.STORING)
+
+        with patch("middlelayer.service_api.WORKFLOW_API_CALLBACK_URL", "http://api:8000/"):
+            callback_info = testee_mod.client.create_callback_info("wf")
+        self.assertEqual(callback_info.url, "http://api:8000/callbacks/workflows/wf")
+        self.assertNotEqual(registry.get("wf").callback_token_hash, callback_info.token)
+
+        # the access-token is not valid for callbacks
+        for headers in [self.headers, {"callback-token": "wrong"}]:
+            response = self.testee.post("/callbacks/workflows/wf/progress", json={}, headers=headers)
+            self.assertEqual(response.status_code, testee_mod.HTTP_403_FORBIDDEN)
+
+        headers = {"callback-token": callback_info.token}
+        response = self.testee.post("/callbacks/workflows/wf/progress",
+                                    json={"stored_files": 1, "total_files": 2},
+                                    headers=headers)
+        self.assertEqual(response.status_code, testee_mod.HTTP_200_OK)
+        self.assertEqual(response.json()["phase"], "STORING")
+        self.assertEqual(mock_workflow_instance.set_store_progress.call_args.args[1].stored_files, 1)
+
+        # the shutdown of the TestClient in setUp stopped the executor
+        testee_mod.client.callback_executor = ThreadPoolExecutor(max_workers=1)
+        with patch("middlelayer.service_api.WORKFLOW_API_INSTANT_REMOVAL", True):
+            response = self.testee.post("/callbacks/workflows/wf/completed", json={}, headers=headers)
+            testee_mod.client.callback_executor.shutdown(wait=True)
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_202_ACCEPTED)
+        mock_workflow_instance.store_result.assert_not_called()
+        mock_workflow_instance.cleanup.assert_called_once_with(workflow_id="wf")
+        self.assertEqual(registry.get("wf").phase, WorkflowJobPhase.FINISHED)
+
+        # the token expires with the workflow
+        response = self.testee.post("/callbacks/workflows/wf/completed", json={}, headers=headers)
+        self.assertEqual(response.status_code, testee_mod.HTTP_403_FORBIDDEN)
+
+    def test_workflow_finished_without_callback(self):
+        registry = testee_mod.client.workflow_registry
+        registry.put(WorkflowRecord(workflow_id="wf", service_id=self.test_service_id, user_id="test",
+                                    phase=WorkflowJobPhase.STORING))
+        mock_workflow_instance = self.mock_workflow_backend.return_value
+        self.mock_workflow_storage.return_value.get_store_info.return_value = MINIO_STORE_INFO
+
+        with patch("middlelayer.service_api.WORKFLOW_API_INSTANT_REMOVAL", True):
+            testee_mod.client.workflow_finished_handle(self.test_service, "wf")
+
+        mock_workflow_instance.store_result.assert_called_once()
+        mock_workflow_instance.cleanup.assert_called_once_with(workflow_id="wf")
+        self.assertEqual(registry.get("wf").phase, WorkflowJobPhase.FINISHED)
+
+    def test_workflow_finished_with_retention(self):
+        registry = testee_mod.client.workflow_registry
+        registry.put(WorkflowRecord(workflow_id="wf", service_id=self.test_service_id, user_id="test",
+                                    phase=WorkflowJobPhase.STORING))
+        mock_workflow_instance = self.mock_workflow_backend.return_value
+        self.test_service.retention_seconds = 600
+
+        testee_mod.client.finish_workflow("wf")
+
+        # the result is available, the resources are kept until the deferred cleanup
+        mock_workflow_instance.cleanup.assert_not_called()
+        self.assertEqual(registry.get("wf").phase, WorkflowJobPhase.FINISHED)
+        self.assertIsNotNone(registry.get("wf").cleanup_at)
+        self.assertTrue(testee_mod.client.cleanup_scheduler.is_scheduled("wf"))
+
+        # stopped during the retention
+        response = self.testee.post(f"/services/{self.test_service_id}/workflow/stop/wf", headers=self.headers)
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_200_OK)
+        mock_workflow_instance.cleanup.assert_called_once_with(workflow_id="wf")
+        self.assertEqual(registry.get("wf").phase, WorkflowJobPhase.FINISHED)
+        self.assertIsNone(registry.get("wf").cleanup_at)
+
+    def test_result_manifest(self):
+        registry = testee_mod.client.workflow_registry
+        registry.put(WorkflowRecord(workflow_id="wf", service_id=self.test_service_id, user_id="test",
+                                    phase=WorkflowJobPhase.STORING))
+        mock_storage_instance = self.mock_workflow_storage.return_value
+        mock_storage_instance.get_store_info.return_value = MINIO_STORE_INFO
+        mock_storage_instance.stat_file_if_exists.return_value = MagicMock(
+            size=4, etag="etag", metadata={"x-amz-meta-sha256": "abc"}, last_modified=None)
+
+        with patch("middlelayer.service_api.WORKFLOW_API_INSTANT_REMOVAL", True):
+            testee_mod.client.finish_workflow("wf")
+
+        # one stat per output file, no listing of the outputs of other workflows
+        mock_storage_instance.stat_file_if_exists.assert_called_once_with(
+            bucket=testee_mod.WORKFLOW_API_USER_STORAGE,
+            resource=f"{self.test_service_id}/outputs/test_res_out")
+        mock_storage_instance.get_objects_list.assert_not_called()
+        manifests = {x.kwargs["resource"]: x.kwargs["data"] for x in mock_storage_instance.put_data.call_args_list}
+        self.assertEqual(sorted(manifests), [f"{self.test_service_id}/manifests/latest.json",
+                                             f"{self.test_service_id}/manifests/wf.json"])
+
+        mock_storage_instance.get_resource_data.return_value = manifests[f"{self.test_service_id}/manifests/wf.json"]
+        response = self.testee.get(f"/services/{self.test_service_id}/workflow/manifest/wf", headers=self.headers)
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_200_OK)
+        self.assertEqual(response.json()["workflow_id"], "wf")
+        self.assertEqual(response.json()["files"],
+                         [{"name": "test_res_out", "size": 4, "etag": "etag", "checksum_sha256": "abc",
+                           "last_modified": None}])
+        self.assertEqual(testee_mod.client.list_workflow_results(self.test_service_id, "wf"), ["test_res_out"])
+
+    def test_result_manifest_not_exists(self):
+        mock_storage_instance = self.mock_workflow_storage.return_value
+        mock_storage_instance.get_resource_data.side_effect = S3Error(
+            None, "NoSuchKey", "not found", "resource", "request_id", "host_id")
+
+        response = self.testee.get(f"/services/{self.test_service_id}/output/manifest", headers=self.headers)
+
+        self.assertEqual(response.status_code, testee_mod.HTTP_404_NOT_FOUND)
+        mock_storage_instance.get_resource_data.assert_called_once_with(
+            bucket=testee_mod.WORKFLOW_API_USER_STORAGE,
+            resource=f"{self.test_service_id}/manifests/latest.json")
+
+    def test_workflow_finished_callback_timeout(self):
+        registry = testee_mod.client.workflow_registry
+        registry.put(WorkflowRecord(workflow_id="wf", service_id=self.test_service_id, user_id="test",
+                                    phase=WorkflowJobPhase.STORING, callback_token_hash="hash"))
+        mock_workflow_instance = self.mock_workflow_backend.return_value
+        self.mock_workflow_storage.return_value.get_store_info.return_value = MINIO_STORE_INFO
+
+        with patch("middlelayer.service_api.WORKFLOW_API_INSTANT_REMOVAL", True),\
+                patch("middlelayer.service_api.WORKFLOW_API_CALLBACK_TIMEOUT", 0.05):
+            testee_mod.client.workflow_finished_handle(self.test_service, "wf")
+            # the data-side-car reports the result itself
+            mock_workflow_instance.store_result.assert_not_called()
+
+            timer = testee_mod.client.store_timeouts["wf"]
+            timer.join(timeout=5)
+
+        # no callback within the timeout, the result is requested through the backend
+        mock_workflow_instance.store_result.assert_called_once()
+        mock_workflow_instance.cleanup.assert_called_once_with(workflow_id="wf")
+        self.assertEqual(registry.get("wf").phase, WorkflowJobPhase.FINISHED)
 
     def test_get_service_workflow_status_missing_auth(self):
 
@@ -391,7 +1116,8 @@ class TestServiceApi(TestCase):
             self.mock_workflow_storage.assert_called_once()
 
             mock_workflow_instance.cleanup.assert_called_once_with(
-                workflow_id=workflow_id)
+                workflow_id=workflow_id,
+                phase=WorkflowJobPhase.CANCELED)
 
     def test_service_api_commit_workflow(self):
 
@@ -405,7 +1131,9 @@ class TestServiceApi(TestCase):
 
             mock_workflow_instance = mock_workflow_backend.return_value
 
-            mock_storage_instance = self.mock_workflow_storage.return_value
+            mock_storage_instance = mock_storage_backend.return_value
+            mock_storage_instance.stat_file_if_exists.return_value = MagicMock(
+                metadata={"x-amz-meta-blob-sha256": "abc"})
 
             service_id = self.test_service_id
             workflow_id = "fake_workflow_id"
@@ -415,9 +1143,43 @@ class TestServiceApi(TestCase):
                                workflow_id=workflow_id)
 
             mock_workflow_instance.handle_input.assert_called_once()
+            # the snapshot of the input refers to its blob
+            mock_storage_instance.stat_file_if_exists.assert_called_once_with(
+                bucket=testee_mod.WORKFLOW_API_USER_STORAGE,
+                resource=f"{service_id}/workflows/{workflow_id}/inputs/test_res_in")
+            self.assertEqual(mock_workflow_instance.handle_input.call_args.kwargs["input_resource"].storage_source,
+                             f"{testee_mod.WORKFLOW_API_USER_STORAGE}/blobs/sha256/abc")
 
             mock_workflow_instance.commit_workflow.assert_called_once()
 
+    def test_environment_input_rejected_by_stat(self):
+        mock_storage_instance = self.mock_workflow_storage.return_value
+        mock_storage_instance.stat_file.return_value = MagicMock(size=2*1024*1024)
+
+        with self.assertRaisesRegex(EnvironmentInputError, "at most 1048576 bytes"):
+            list(testee_mod.client.iter_environment_input("test_id/inputs/env", max_bytes=1024*1024))
+        mock_storage_instance.get_file.assert_not_called()
+
+        mock_storage_instance.stat_file.return_value = MagicMock(size=9)
+        mock_storage_instance.get_file.return_value.stream.return_value = iter([b"KEY=", b"VALUE"])
+        self.assertEqual(list(testee_mod.client.iter_environment_input("test_id/inputs/env", max_bytes=1024)),
+                         [b"KEY=", b"VALUE"])
+        mock_storage_instance.get_file.return_value.release_conn.assert_called_once()
+
+    def test_snapshot_removed(self):
+        mock_storage_instance = self.mock_workflow_storage.return_value
+        mock_storage_instance.remove_files.return_value = []
+        registry = testee_mod.client.workflow_registry
+        registry.put(WorkflowRecord(workflow_id="wf", service_id=self.test_service_id, user_id="test",
+                                    phase=WorkflowJobPhase.STORING))
+
+        with patch("middlelayer.service_api.WORKFLOW_API_INSTANT_REMOVAL", True):
+            testee_mod.client.finish_workflow("wf")
+
+        mock_storage_instance.remove_files.assert_called_once_with(
+            bucket=testee_mod.WORKFLOW_API_USER_STORAGE,
+            resources=[f"{self.test_service_id}/workflows/wf/inputs/test_res_in"])
+
     def test_get_workflow_status(self):
         """
         test to get the status of the workflow
@@ -0,0 +1,111 @@
+from datetime import datetime, timezone, timedelta
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+from kubernetes import client
+
+from middlelayer.backend import WorkflowJobState, WorkflowJobPhase
+from middlelayer.k8sClient import k8s_get_pod_state
+from middlelayer.models import TimelineEntryKind
+from middlelayer.timeline import WorkflowTimelineRecorder, to_nanoseconds
+
+STARTED = datetime(2024, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+
+def at(seconds: float) -> datetime:
+    return STARTED + timedelta(seconds=seconds)
+
+
+def pod(init_state: client.V1ContainerState, worker_state: client.V1ContainerState, conditions=None) -> client.V1Pod:
+    return client.V1Pod(status=client.V1PodStatus(
+        phase="Running",
+        conditions=conditions or [],
+        init_container_statuses=[client.V1ContainerStatus(name="data-input-init", image="init", image_id="",
+                                                          ready=False, restart_count=0, state=init_state)],
+        container_statuses=[client.V1ContainerStatus(name="worker", image="worker", image_id="",
+                                                     ready=False, restart_count=0, state=worker_state)]))
+
+
+def waiting(reason: str) -> client.V1ContainerState:
+    return client.V1ContainerState(waiting=client.V1ContainerStateWaiting(reason=reason))
+
+
+def running(started: float) -> client.V1ContainerState:
+    return client.V1ContainerState(running=client.V1ContainerStateRunning(started_at=at(started)))
+
+
+def terminated(started: float, finished: float) -> client.V1ContainerState:
+    return client.V1ContainerState(terminated=client.V1ContainerStateTerminated(
+        exit_code=0, reason="Completed", started_at=at(started), finished_at=at(finished)))
+
+
+def condition(condition_type: str, seconds: float, status: str = "True") -> client.V1PodCondition:
+    return client.V1PodCondition(type=condition_type, status=status, last_transition_time=at(seconds))
+
+
+class TestWorkflowTimeline(TestCase):
+
+    def setUp(self) -> None:
+        self.testee = WorkflowTimelineRecorder(max_workflows=2)
+
+    def test_pod_state(self):
+        pod_state = k8s_get_pod_state("MODIFIED", pod(terminated(2, 5), waiting("ContainerCreating"),
+                                                      [condition("PodScheduled", 1), condition("Ready", 6, "False")]))
+
+        self.assertEqual(pod_state.condition_times, {"PodScheduled": at(1)})
+        init_state = pod_state.init_container_statuses["data-input-init"]
+        self.assertEqual((init_state.state, init_state.reason, init_state.started_at, init_state.finished_at),
+                         ("terminated", "Completed", at(2), at(5)))
+        self.assertEqual(pod_state.container_statuses["worker"].reason, "ContainerCreating")
+
+    def test_record(self):
+        self.testee.record("wf", WorkflowJobState(phase=WorkflowJobPhase.QUEUED))
+        self.testee.record("wf", WorkflowJobState(phase=WorkflowJobPhase.PREPARING))
+        for worker_state in [waiting("ContainerCreating"), running(7), running(7)]:
+            pod_state = k8s_get_pod_state("MODIFIED", pod(terminated(2, 5), worker_state,
+                                                          [condition("PodScheduled", 1), condition("Initialized", 6)]))
+            phase = WorkflowJobPhase.RUNNING if worker_state.running else WorkflowJobPhase.PREPARING
+            self.testee.record("wf", WorkflowJobState(phase=phase, worker_state=pod_state))
+
+        timeline = self.testee.get("wf")
+
+        # every transition once, ordered by its time
+        self.assertEqual([(x.kind, x.name, x.state) for x in timeline if x.at < STARTED + timedelta(days=1)],
+                         [(TimelineEntryKind.CONDITION, "PodScheduled", None),
+                          (TimelineEntryKind.INIT_CONTAINER, "data-input-init", "running"),
+                          (TimelineEntryKind.INIT_CONTAINER, "data-input-init", "terminated"),
+                          (TimelineEntryKind.CONDITION, "Initialized", None),
+                          (TimelineEntryKind.CONTAINER, "worker", "running")])
+        self.assertEqual([x.name for x in timeline if x.kind is TimelineEntryKind.PHASE],
+                         ["QUEUED", "PREPARING", "RUNNING"])
+        self.assertEqual(len([x for x in timeline if x.state == "waiting"]), 1)
+        self.assertIsNone(self.testee.get("unknown"))
+
+    def test_evicted(self):
+        for workflow_id in ["wf1", "wf2", "wf3"]:
+            self.testee.record(workflow_id, WorkflowJobState(phase=WorkflowJobPhase.QUEUED))
+
+        self.assertIsNone(self.testee.get("wf1"))
+        self.assertIsNotNone(self.testee.get("wf3"))
+
+    def test_spans_emitted_once(self):
+        tracer = MagicMock()
+        self.testee.set_attributes("wf", **{"service.id": "service"})
+        self.testee.record("wf", WorkflowJobState(phase=WorkflowJobPhase.QUEUED))
+        pod_state = k8s_get_pod_state("MODIFIED", pod(terminated(2, 5), terminated(7, 9),
+                                                      [condition("PodScheduled", 1)]))
+        self.testee.record("wf", WorkflowJobState(phase=WorkflowJobPhase.STORING, worker_state=pod_state))
+
+        with patch("middlelayer.timeline.tracer", tracer):
+            self.testee.record("wf", WorkflowJobState(phase=WorkflowJobPhase.FINISHED))
+            self.testee.record("wf", WorkflowJobState(phase=WorkflowJobPhase.FINISHED))
+
+        names = [x.args[0] for x in tracer.start_span.call_args_list]
+        self.assertEqual(names, ["workflow", "QUEUED", "STORING", "data-input-init running", "worker running"])
+        workflow_span = tracer.start_span.return_value
+        self.assertEqual(tracer.start_span.call_args_list[0].kwargs["attributes"]["service.id"], "service")
+        workflow_span.add_event.assert_called_once_with("PodScheduled", timestamp=to_nanoseconds(at(1)))
+        worker_span = tracer.start_span.call_args_list[4]
+        self.assertEqual(worker_span.kwargs["start_time"], to_nanoseconds(at(7)))
+        # the running worker ends with its termination
+        workflow_span.end.assert_any_call(end_time=to_nanoseconds(at(9)))
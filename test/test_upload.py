@@ -0,0 +1,85 @@
+import asyncio
+import hashlib
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import MagicMock
+
+from middlelayer.executor import BlockingIOExecutor
+from middlelayer.imla_minio import MB
+from middlelayer.upload import MultipartStreamUploader
+
+
+PART_SIZE = 5*MB
+
+
+async def body(data: bytes, chunk_size: int = 1*MB):
+    for i in range(0, len(data), chunk_size):
+        yield data[i:i+chunk_size]
+        await asyncio.sleep(0)
+
+
+class TestMultipartStreamUploader(IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.executor = BlockingIOExecutor(max_workers=4)
+        self.storage = MagicMock()
+        self.storage.create_multipart_upload.return_value = "upload_id"
+        self.storage.upload_part.side_effect = lambda bucket, resource, upload_id, part_number, data: \
+            f"etag-{part_number}"
+
+        self.testee = MultipartStreamUploader(storage=self.storage,
+                                              executor=self.executor,
+                                              part_size=PART_SIZE,
+                                              max_parts_in_flight=2)
+
+    def tearDown(self) -> None:
+        self.executor.shutdown()
+
+    async def test_small_body_single_put(self):
+
+        result = await self.testee.upload("bucket", "resource", body(b"KEY=VALUE"))
+
+        self.storage.put_data.assert_called_once_with("bucket", "resource", b"KEY=VALUE")
+        self.storage.create_multipart_upload.assert_not_called()
+        self.assertEqual(result.size, 9)
+        self.assertEqual(result.parts, 1)
+        self.assertEqual(result.sha256, hashlib.sha256(b"KEY=VALUE").hexdigest())
+
+    async def test_multipart_upload(self):
+
+        data = bytes(range(256)) * (12*MB // 256)
+
+        result = await self.testee.upload("bucket", "resource", body(data))
+
+        self.storage.create_multipart_upload.assert_called_once_with("bucket", "resource")
+        self.assertEqual(self.storage.upload_part.call_count, 3)
+
+        uploaded = {call.args[3]: call.args[4] for call in self.storage.upload_part.call_args_list}
+        self.assertEqual(b"".join(uploaded[i] for i in sorted(uploaded)), data)
+        self.assertEqual(len(uploaded[1]), PART_SIZE)
+
+        (_, _, upload_id, parts) = self.storage.complete_multipart_upload.call_args.args
+        self.assertEqual(upload_id, "upload_id")
+        self.assertEqual([(p.part_number, p.etag) for p in parts],
+                         [(1, "etag-1"), (2, "etag-2"), (3, "etag-3")])
+
+        self.assertEqual(result.size, len(data))
+        self.assertEqual(result.sha256, hashlib.sha256(data).hexdigest())
+        self.assertEqual(result.parts, 3)
+        self.assertGreater(result.throughput_mb_s, 0)
+
+    async def test_failed_part_aborts_upload(self):
+
+        self.storage.upload_part.side_effect = IOError("part failed")
+
+        with self.assertRaises(IOError):
+            await self.testee.upload("bucket", "resource", body(b"x" * 12*MB))
+
+        self.storage.abort_multipart_upload.assert_called_once_with("bucket", "resource", "upload_id")
+        self.storage.complete_multipart_upload.assert_not_called()
+
+    def test_invalid_part_size(self):
+
+        with self.assertRaises(ValueError):
+            MultipartStreamUploader(storage=self.storage,
+                                    executor=self.executor,
+                                    part_size=1*MB)